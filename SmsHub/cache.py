@@ -0,0 +1,208 @@
+"""
+Two-tier cache for hot rows read on every request.
+
+Each process keeps an LRU of up to ``max_size`` entries for ``ttl`` seconds (L1) in front of
+Redis, which keeps them for ``l2_ttl`` seconds (L2), so a hit costs a dict lookup and a miss
+in this process costs one Redis round trip before the database is read. ``invalidate`` deletes
+the L2 entry, bumps its version and publishes the key on ``cache:invalidate``; every process
+listens on a background thread and drops its L1 entry within milliseconds. A miss only stores
+what it loaded in L2 if the version it read with the lookup is unchanged, so a load racing an
+invalidation never leaves the old value in Redis. A process that loses the
+subscription clears its L1 when it subscribes again, and the L1 TTL bounds what it may serve
+meanwhile. Values must be JSON serializable.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+from django_redis import get_redis_connection
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+CHANNEL = "cache:invalidate"
+KEY_TEMPLATE = "cache:{name}:{key}"
+VERSION_KEY_TEMPLATE = "cache_version:{name}:{key}"
+# Longest wait between attempts to subscribe again
+MAX_RECONNECT_SECONDS = 30
+
+CACHE_REQUESTS = Counter(
+    "smshub_cache_requests",
+    "Two-tier cache lookups by the tier that answered them (l1, l2 or miss).",
+    ["cache", "result"],
+)
+
+_store_script = redis_conn.register_script(
+    """
+    if (redis.call('GET', KEYS[2]) or '0') == ARGV[3] then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    end
+    return 1
+    """
+)
+
+_caches: dict[str, "TwoTierCache"] = {}
+_listener_lock = threading.Lock()
+_listener_started = False
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[Hashable], object | None],
+        max_size: int,
+        ttl: float,
+        l2_ttl: int,
+    ):
+        """``loader(key)`` reads a value from the database; None is not cached."""
+        self.name = name
+        self.loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+        self.l2_ttl = l2_ttl
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a load that raced one is not stored in L1
+        self._generation = 0
+        _caches[name] = self
+
+    def _redis_key(self, key: str) -> str:
+        return KEY_TEMPLATE.format(name=self.name, key=key)
+
+    def _version_key(self, key: str) -> str:
+        return VERSION_KEY_TEMPLATE.format(name=self.name, key=key)
+
+    def get(self, key: Hashable) -> object | None:
+        key = str(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.labels(self.name, "l1").inc()
+                return entry[1]
+            generation = self._generation
+        _start_listener()
+
+        redis_keys = [self._redis_key(key), self._version_key(key)]
+        try:
+            cached, version = redis_conn.mget(redis_keys)
+        except RedisError:
+            logger.warning("Cache %s skipped Redis for %s", self.name, key, exc_info=True)
+            cached = version = None
+        if cached is not None:
+            value = json.loads(cached)
+            CACHE_REQUESTS.labels(self.name, "l2").inc()
+        else:
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
+            value = self.loader(key)
+            if value is None:
+                return None
+            try:
+                _store_script(
+                    keys=redis_keys,
+                    args=[json.dumps(value), self.l2_ttl, int(version or 0)],
+                )
+            except RedisError:
+                logger.warning("Cache %s could not store %s", self.name, key, exc_info=True)
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def discard(self, key: Hashable) -> None:
+        """Drop ``key`` from the L1 of this process."""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(str(key), None)
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop ``key`` from Redis and from the L1 of every process; call it after commit."""
+        key = str(key)
+        self.discard(key)
+        try:
+            pipe = redis_conn.pipeline(transaction=False)
+            pipe.delete(self._redis_key(key))
+            # Outlives any load in flight, which compares it before storing
+            pipe.incr(self._version_key(key))
+            pipe.expire(self._version_key(key), self.l2_ttl)
+            pipe.publish(CHANNEL, f"{self.name}:{key}")
+            pipe.execute()
+        except RedisError:
+            logger.warning("Cache %s could not invalidate %s", self.name, key, exc_info=True)
+
+
+def _clear_all_local() -> None:
+    for cache in list(_caches.values()):
+        cache.clear_local()
+
+
+def _handle_message(data: bytes | str) -> None:
+    if isinstance(data, bytes):
+        data = data.decode()
+    name, _, key = data.partition(":")
+    cache = _caches.get(name)
+    if cache is not None:
+        cache.discard(key)
+
+
+def _listen() -> None:
+    delay = 1
+    while True:
+        pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CHANNEL)
+            # Invalidations published while unsubscribed were missed
+            _clear_all_local()
+            delay = 1
+            for message in pubsub.listen():
+                _handle_message(message["data"])
+        except RedisError as e:
+            logger.warning("Cache invalidation listener disconnected: %s", e)
+        finally:
+            pubsub.close()
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_RECONNECT_SECONDS)
+
+
+def _start_listener() -> None:
+    global _listener_started
+
+    if _listener_started:
+        return
+    with _listener_lock:
+        if not _listener_started:
+            threading.Thread(target=_listen, name="cache-invalidation", daemon=True).start()
+            _listener_started = True
+
+
+def _after_fork_in_child() -> None:
+    # Threads do not survive fork, and the parent's entries get no invalidations in the child.
+    # Locks are replaced, as another thread of the parent may have held them.
+    global _listener_lock, _listener_started
+
+    _listener_lock = threading.Lock()
+    _listener_started = False
+    for cache in _caches.values():
+        cache._lock = threading.Lock()
+        cache._entries = OrderedDict()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
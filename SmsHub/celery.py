@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmsHub.settings")
@@ -9,3 +10,22 @@ app = Celery("SmsHub")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def start_worker_metrics_server(**kwargs):
+    # Runs in the parent process before the pool forks, so children share one exporter
+    from django.conf import settings
+
+    from SmsHub.metrics import reset_multiprocess_dir, start_metrics_server
+
+    if settings.METRICS_WORKER_PORT:
+        reset_multiprocess_dir()
+        start_metrics_server(settings.METRICS_WORKER_PORT)
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    from SmsHub.metrics import mark_process_dead
+
+    mark_process_dead(pid)
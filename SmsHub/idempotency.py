@@ -0,0 +1,197 @@
+"""
+``Idempotency-Key`` support for POST views that charge or send.
+
+Keys are scoped to the ``user_id`` of the request body, so two users never share one. The first
+request with a key claims it with one ``SET NX`` holding a pending marker for ``LOCK_SECONDS``,
+runs the view and stores its response for ``TTL_SECONDS``. While the view runs, a background
+thread extends the claim every third of ``LOCK_SECONDS``, so a slow view keeps it and only a
+request whose process died loses it. A repeated key
+gets the stored response back from Redis, marked with ``Idempotent-Replayed: true``, without
+reaching the view. A duplicate that arrives while the first request is still running polls for
+its response for up to ``WAIT_SECONDS`` and gets a 409 if it is not ready by then; when the
+first request fails instead, the key is released and the duplicate runs the view. Reusing a
+key with a different body is a 422. Server errors and 429s are not stored, so the client can
+retry them with the same key. Redis failures let the request through unprotected.
+"""
+
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from drf_spectacular.utils import OpenApiParameter
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+HEADER = "Idempotency-Key"
+KEY_TEMPLATE = "idempotency:{scope}:{user_id}:{key}"
+MAX_KEY_LENGTH = 255
+PENDING = "pending"
+DONE = "done"
+
+# Extends the claim only while it still holds this request's pending marker
+_refresh_claim_script = redis_conn.register_script(
+    """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+)
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    HEADER,
+    str,
+    OpenApiParameter.HEADER,
+    description="Unique key per logical request; a retry with the same key replays the response.",
+)
+
+
+def _fingerprint(data) -> str:
+    body = json.dumps(data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _error(message: str, status_code: int, retry_after: int | None = None) -> Response:
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+    return Response({"error": message}, status=status_code, headers=headers)
+
+
+def _replay(record: dict, fingerprint: str) -> Response:
+    if record["fingerprint"] != fingerprint:
+        return _error(
+            f"{HEADER} was already used with a different request body",
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record["data"], status=record["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _wait_for_record(redis_key: str, fingerprint: str) -> Response | None:
+    """The response stored under ``redis_key``; None when the first request released the key."""
+    options = settings.IDEMPOTENCY
+    deadline = time.monotonic() + options["WAIT_SECONDS"]
+    while True:
+        cached = redis_conn.get(redis_key)
+        if cached is None:
+            return None
+        record = json.loads(cached)
+        if record["state"] == DONE or record["fingerprint"] != fingerprint:
+            return _replay(record, fingerprint)
+        if time.monotonic() >= deadline:
+            return _error(
+                "A request with this key is still in progress",
+                status.HTTP_409_CONFLICT,
+                max(1, round(options["WAIT_SECONDS"])),
+            )
+        time.sleep(options["POLL_INTERVAL"])
+
+
+def _refresh_claim(redis_key: str, pending: str, lock_seconds: int, stop: threading.Event) -> None:
+    while not stop.wait(lock_seconds / 3):
+        try:
+            if not _refresh_claim_script(keys=[redis_key], args=[pending, lock_seconds]):
+                return
+        except RedisError:
+            logger.warning("Idempotency key %s not refreshed", redis_key, exc_info=True)
+
+
+@contextlib.contextmanager
+def _claim_kept(redis_key: str, pending: str):
+    """Keep the pending claim on ``redis_key`` alive for as long as the block runs."""
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_refresh_claim,
+        args=(redis_key, pending, settings.IDEMPOTENCY["LOCK_SECONDS"], stop),
+        name="idempotency-claim",
+        daemon=True,
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _store(redis_key: str, fingerprint: str, response: Response) -> None:
+    try:
+        if response.status_code >= 500 or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            redis_conn.delete(redis_key)
+            return
+        record = {
+            "state": DONE,
+            "fingerprint": fingerprint,
+            "status": response.status_code,
+            "data": response.data,
+        }
+        redis_conn.set(
+            redis_key, json.dumps(record, default=str), ex=settings.IDEMPOTENCY["TTL_SECONDS"]
+        )
+    except RedisError:
+        logger.warning("Idempotent response for %s not stored", redis_key, exc_info=True)
+
+
+def idempotent(scope: str):
+    """Make a view method replay its response for a repeated ``Idempotency-Key``."""
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            # A body that is not an object has no user_id to scope the key; the view rejects it
+            if not key or not isinstance(request.data, Mapping):
+                return view_method(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _error(
+                    f"{HEADER} must be at most {MAX_KEY_LENGTH} characters",
+                    status.HTTP_400_BAD_REQUEST,
+                )
+
+            redis_key = KEY_TEMPLATE.format(
+                scope=scope, user_id=request.data.get("user_id"), key=key
+            )
+            fingerprint = _fingerprint(request.data)
+            pending = json.dumps(
+                {"state": PENDING, "fingerprint": fingerprint, "claim": uuid.uuid4().hex}
+            )
+            try:
+                # A key released by a failed first request is claimed again, so it runs once more
+                while not redis_conn.set(
+                    redis_key, pending, nx=True, ex=settings.IDEMPOTENCY["LOCK_SECONDS"]
+                ):
+                    response = _wait_for_record(redis_key, fingerprint)
+                    if response is not None:
+                        return response
+            except RedisError:
+                logger.warning("Idempotency check skipped for %s", redis_key, exc_info=True)
+                return view_method(self, request, *args, **kwargs)
+
+            try:
+                with _claim_kept(redis_key, pending):
+                    response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                try:
+                    redis_conn.delete(redis_key)
+                except RedisError:
+                    logger.warning("Idempotency key %s not released", redis_key, exc_info=True)
+                raise
+            _store(redis_key, fingerprint, response)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,56 @@
+"""
+Prometheus exposition for the web and worker processes.
+
+Gunicorn and Celery prefork serve from several processes. With ``PROMETHEUS_MULTIPROC_DIR``
+set, every process writes its samples to files in that directory and the registry below
+merges them on each scrape, so any process can answer for all of them. The directory is
+emptied by the parent process before its children start (see ``gunicorn.conf.py`` and
+``SmsHub.celery``).
+"""
+
+import os
+import shutil
+
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+
+def _multiprocess_dir() -> str | None:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+def get_registry() -> CollectorRegistry:
+    if not _multiprocess_dir():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def reset_multiprocess_dir() -> None:
+    """Remove the samples of a previous run; call it before any child process starts."""
+    directory = _multiprocess_dir()
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def mark_process_dead(pid: int) -> None:
+    if _multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve ``/metrics`` from a background thread, for processes without a web server."""
+    start_http_server(port, registry=get_registry())
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
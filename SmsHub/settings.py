@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "account",
     "sms",
     "billing",
+    "webhooks",
     "django_filters",
 ]
 
@@ -157,6 +158,24 @@ CACHES = {
         "TIMEOUT": 300,  # Default timeout in seconds (5 minutes)
     }
 }
+# Users read on the send path (account.cache): each process keeps up to L1_MAX_SIZE of them for
+# L1_TTL_SECONDS in front of Redis, which keeps them for L2_TTL_SECONDS. Changes reach every
+# process through Redis pub/sub; the TTLs only bound staleness while Redis is unreachable.
+USER_CACHE = {
+    "L1_MAX_SIZE": int(os.environ.get("USER_CACHE_L1_MAX_SIZE", 10000)),
+    "L1_TTL_SECONDS": float(os.environ.get("USER_CACHE_L1_TTL_SECONDS", 30)),
+    "L2_TTL_SECONDS": int(os.environ.get("USER_CACHE_L2_TTL_SECONDS", 600)),
+}
+# Idempotency-Key on the send and charge APIs (SmsHub.idempotency): responses are kept for
+# TTL_SECONDS; a duplicate of a request still running polls every POLL_INTERVAL for up to
+# WAIT_SECONDS, and a key whose first request died is freed after LOCK_SECONDS (a running
+# request keeps extending it)
+IDEMPOTENCY = {
+    "TTL_SECONDS": int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 86400)),
+    "LOCK_SECONDS": int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", 30)),
+    "WAIT_SECONDS": float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", 5)),
+    "POLL_INTERVAL": float(os.environ.get("IDEMPOTENCY_POLL_INTERVAL", 0.05)),
+}
 
 
 RABBITMQ_USER = os.environ.get("RABBITMQ_USER", "guest")
@@ -184,6 +203,9 @@ CELERY_TASK_ACKS_ON_FAILURE_OR_TIMEOUT = True
 
 standard_exchange = Exchange("standard_sms_sender", type="direct")
 express_exchange = Exchange("express_sms_sender", type="direct")
+# Periodic upkeep (status reconciliation, partition rotation) runs on its own worker, so it
+# neither waits behind queued SMS nor runs inside the batch sender
+maintenance_exchange = Exchange("maintenance", type="direct")
 
 CELERY_TASK_QUEUES = (
     Queue(
@@ -198,6 +220,12 @@ CELERY_TASK_QUEUES = (
         routing_key="express_sms_sender",
         durable=True,
     ),
+    Queue(
+        "maintenance",
+        exchange=maintenance_exchange,
+        routing_key="maintenance",
+        durable=True,
+    ),
 )
 
 CELERY_TASK_DEFAULT_QUEUE = "standard_sms_sender"
@@ -208,6 +236,21 @@ CELERY_TASK_DEFAULT_EXCHANGE_TYPE = "direct"
 CELERY_TASK_ROUTES = {
     "sms.tasks.send_normal_sms": {"queue": "standard_sms_sender"},
     "sms.tasks.send_express_sms": {"queue": "express_sms_sender"},
+    "sms.tasks.send_normal_sms_batch": {"queue": "standard_sms_sender"},
+    "sms.tasks.send_express_sms_batch": {"queue": "express_sms_sender"},
+    "sms.tasks.check_sent_sms_status_for_magfa": {"queue": "maintenance"},
+    "sms.tasks.rotate_sms_partitions": {"queue": "maintenance"},
+}
+
+CELERY_BEAT_SCHEDULE = {
+    "check-sent-sms-status-for-magfa": {
+        "task": "sms.tasks.check_sent_sms_status_for_magfa",
+        "schedule": 10 * 60,
+    },
+    "rotate-sms-partitions": {
+        "task": "sms.tasks.rotate_sms_partitions",
+        "schedule": 6 * 60 * 60,
+    },
 }
 
 CELERY_BROKER_TRANSPORT_OPTIONS = {
@@ -231,6 +274,210 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+BILLING_FAST_LEDGER_ENABLED = (
+    os.environ.get("BILLING_FAST_LEDGER_ENABLED", "false").lower() == "true"
+)
+BILLING_FAST_LEDGER_FLUSH_BATCH_SIZE = int(
+    os.environ.get("BILLING_FAST_LEDGER_FLUSH_BATCH_SIZE", 5000)
+)
+BILLING_FAST_LEDGER_FLUSH_INTERVAL = float(os.environ.get("BILLING_FAST_LEDGER_FLUSH_INTERVAL", 1))
+BILLING_FAST_LEDGER_ORPHAN_GRACE_SECONDS = int(
+    os.environ.get("BILLING_FAST_LEDGER_ORPHAN_GRACE_SECONDS", 300)
+)
+BILLING_FAST_LEDGER_LOCK_TIMEOUT = int(os.environ.get("BILLING_FAST_LEDGER_LOCK_TIMEOUT", 60))
+
+# Sender number of users without a sender pool; its prefix picks the provider account
+SMS_DEFAULT_SENDER = os.environ.get("SMS_DEFAULT_SENDER", "100002")
+# Sender pools (sms.sender_pools): every process checks for pool changes each REFRESH_SECONDS,
+# and a worker waits up to MAX_WAIT_SECONDS for a line under its cap before re-queueing the SMS
+SMS_SENDER_POOL = {
+    "REFRESH_SECONDS": float(os.environ.get("SMS_SENDER_POOL_REFRESH_SECONDS", 5)),
+    "MAX_WAIT_SECONDS": float(os.environ.get("SMS_SENDER_POOL_MAX_WAIT_SECONDS", 5)),
+}
+# Prices of receivers that match no Tariff prefix, per segment in Rial (billing.tariffs).
+# COUNTRY_CODE replaces the leading 0 of national numbers; every process checks for tariff
+# changes each REFRESH_SECONDS.
+SMS_TARIFF = {
+    "DEFAULT_PRICE": int(os.environ.get("SMS_TARIFF_DEFAULT_PRICE", 1000)),
+    "DEFAULT_EXPRESS_MULTIPLIER": float(
+        os.environ.get("SMS_TARIFF_DEFAULT_EXPRESS_MULTIPLIER", 1.5)
+    ),
+    "COUNTRY_CODE": os.environ.get("SMS_TARIFF_COUNTRY_CODE", "98"),
+    "REFRESH_SECONDS": float(os.environ.get("SMS_TARIFF_REFRESH_SECONDS", 5)),
+}
+SMS_BULK_MAX_MESSAGES = int(os.environ.get("SMS_BULK_MAX_MESSAGES", 5000))
+SMS_BULK_TASK_BATCH_SIZE = int(os.environ.get("SMS_BULK_TASK_BATCH_SIZE", 100))
+# With the outbox enabled the send APIs write their tasks to sms_outbox in the SMS transaction
+# and relay_sms_outbox publishes them, RELAY_BATCH_SIZE rows per broker connection
+SMS_OUTBOX_ENABLED = os.environ.get("SMS_OUTBOX_ENABLED", "false").lower() == "true"
+SMS_OUTBOX_RELAY_BATCH_SIZE = int(os.environ.get("SMS_OUTBOX_RELAY_BATCH_SIZE", 500))
+SMS_OUTBOX_RELAY_INTERVAL = float(os.environ.get("SMS_OUTBOX_RELAY_INTERVAL", 0.2))
+# run_sms_batch_sender sends up to MAX_SIZE queued SMS per provider call, waiting at most
+# MAX_WAIT_MS for a batch to fill
+SMS_BATCH_SENDER_MAX_SIZE = int(os.environ.get("SMS_BATCH_SENDER_MAX_SIZE", 100))
+SMS_BATCH_SENDER_MAX_WAIT_MS = int(os.environ.get("SMS_BATCH_SENDER_MAX_WAIT_MS", 200))
+# A batch is split over more provider calls when its SMS add up to more segments than this
+SMS_PROVIDER_MAX_SEGMENTS_PER_CALL = int(os.environ.get("SMS_PROVIDER_MAX_SEGMENTS_PER_CALL", 500))
+# run_async_sms_sender keeps up to this many sends in flight on one event loop
+SMS_ASYNC_SENDER_CONCURRENCY = int(os.environ.get("SMS_ASYNC_SENDER_CONCURRENCY", 200))
+# Rows fetched per server-side cursor round trip by the streaming report export
+SMS_REPORT_EXPORT_CHUNK_SIZE = int(os.environ.get("SMS_REPORT_EXPORT_CHUNK_SIZE", 2000))
+
+# Delivery status reconciliation (sms.reconciliation): SMS still SENT after WINDOW_HOURS are
+# failed and refunded; statuses are fetched BATCH_SIZE message ids per provider call with
+# CONCURRENCY calls in flight.
+SMS_STATUS_CHECK_WINDOW_HOURS = int(os.environ.get("SMS_STATUS_CHECK_WINDOW_HOURS", 24))
+SMS_STATUS_CHECK_BATCH_SIZE = int(os.environ.get("SMS_STATUS_CHECK_BATCH_SIZE", 100))
+SMS_STATUS_CHECK_CONCURRENCY = int(os.environ.get("SMS_STATUS_CHECK_CONCURRENCY", 8))
+
+# Pushed delivery reports (sms.dlr): at most MAX_BATCH_SIZE reports per callback, applied
+# BATCH_SIZE at a time by consume_delivery_reports; reports for messages not written back yet
+# are retried for UNMATCHED_TTL_SECONDS.
+SMS_DLR_MAX_BATCH_SIZE = int(os.environ.get("SMS_DLR_MAX_BATCH_SIZE", 1000))
+SMS_DLR_BATCH_SIZE = int(os.environ.get("SMS_DLR_BATCH_SIZE", 1000))
+SMS_DLR_UNMATCHED_TTL_SECONDS = int(os.environ.get("SMS_DLR_UNMATCHED_TTL_SECONDS", 300))
+SMS_DLR_LOCK_TIMEOUT = int(os.environ.get("SMS_DLR_LOCK_TIMEOUT", 60))
+SMS_DLR_POLL_INTERVAL = float(os.environ.get("SMS_DLR_POLL_INTERVAL", 1))
+
+# Outgoing status webhooks (webhooks.dispatcher): one POST carries up to BATCH_SIZE events of
+# a user, CONCURRENCY endpoints are called at once, and a failing batch is retried with
+# exponential backoff capped at RETRY_BACKOFF_MAX seconds until MAX_ATTEMPTS.
+WEBHOOK_DISPATCHER_CONCURRENCY = int(os.environ.get("WEBHOOK_DISPATCHER_CONCURRENCY", 32))
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", 100))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", 10))
+WEBHOOK_RETRY_BACKOFF_MAX = int(os.environ.get("WEBHOOK_RETRY_BACKOFF_MAX", 600))
+WEBHOOK_POLL_INTERVAL = float(os.environ.get("WEBHOOK_POLL_INTERVAL", 0.5))
+# Longer than one request can take, so a crashed dispatcher releases its users
+WEBHOOK_LOCK_TIMEOUT = int(os.environ.get("WEBHOOK_LOCK_TIMEOUT", 60))
+# Webhook URLs resolving to private, loopback or link-local addresses are refused unless this
+# is set, e.g. for a receiver on the local docker network in development
+WEBHOOK_ALLOW_PRIVATE_URLS = os.environ.get("WEBHOOK_ALLOW_PRIVATE_URLS", "false").lower() == "true"
+# The dispatcher retries failed batches itself, so the session never repeats a POST. KEEP_ALIVE
+# stays on: its adapter is the one that pins connections to the address the SSRF check approved
+WEBHOOK_HTTP = {
+    "KEEP_ALIVE": True,
+    "CONNECT_TIMEOUT": float(os.environ.get("WEBHOOK_CONNECT_TIMEOUT", 3.05)),
+    "READ_TIMEOUT": float(os.environ.get("WEBHOOK_READ_TIMEOUT", 5)),
+    "MAX_RETRIES": 0,
+}
+
+# Prometheus metrics (SmsHub.metrics): gunicorn serves /metrics itself; Celery workers and the
+# sender commands serve it on WORKER_PORT (0 disables it). Multi-process servers also need
+# PROMETHEUS_MULTIPROC_DIR in their environment.
+METRICS_WORKER_PORT = int(os.environ.get("METRICS_WORKER_PORT", 0))
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # Every process writes its samples there, management commands run before gunicorn included
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# benchmarks.run reads the number of SQL queries of each request from a response header
+if os.environ.get("BENCHMARK_QUERY_COUNT", "false").lower() == "true":
+    MIDDLEWARE.insert(0, "benchmarks.middleware.QueryCountMiddleware")
+
+# PostgreSQL range partitions of the SMS table (sms.partitions): "day" or "week" per
+# partition, how many future partitions to keep ready, and after how many days old partitions
+# are detached (0 keeps them) and whether detached partitions are dropped. Lookups without a
+# created_at bound probe every attached partition, so the retention keeps that number bounded.
+SMS_PARTITION_INTERVAL = os.environ.get("SMS_PARTITION_INTERVAL", "day")
+SMS_PARTITION_PREMAKE = int(os.environ.get("SMS_PARTITION_PREMAKE", 7))
+SMS_PARTITION_RETENTION_DAYS = int(os.environ.get("SMS_PARTITION_RETENTION_DAYS", 365))
+SMS_PARTITION_DROP_DETACHED = (
+    os.environ.get("SMS_PARTITION_DROP_DETACHED", "false").lower() == "true"
+)
+
+
 MAGFA_USERNAME = os.environ.get("MAGFA_USERNAME")
 MAGFA_PASSWORD = os.environ.get("MAGFA_PASSWORD")
 MAGFA_DOMAIN = os.environ.get("MAGFA_DOMAIN")
+MAGFA_ENDPOINT = os.environ.get("MAGFA_ENDPOINT", "https://sms.magfa.com/api/http/sms/v2/")
+MAGFA_DLR_TOKEN = os.environ.get("MAGFA_DLR_TOKEN")
+
+# HTTP settings shared by every provider client. Clients are kept per worker process
+# (sms.sms_provider_clients.registry), so connections are reused across messages.
+SMS_PROVIDER_HTTP = {
+    "POOL_CONNECTIONS": int(os.environ.get("SMS_PROVIDER_POOL_CONNECTIONS", 4)),
+    "POOL_MAXSIZE": int(os.environ.get("SMS_PROVIDER_POOL_MAXSIZE", 16)),
+    "KEEP_ALIVE": os.environ.get("SMS_PROVIDER_KEEP_ALIVE", "true").lower() == "true",
+    "KEEP_ALIVE_IDLE": int(os.environ.get("SMS_PROVIDER_KEEP_ALIVE_IDLE", 30)),
+    "CONNECT_TIMEOUT": float(os.environ.get("SMS_PROVIDER_CONNECT_TIMEOUT", 3.05)),
+    "READ_TIMEOUT": float(os.environ.get("SMS_PROVIDER_READ_TIMEOUT", 10)),
+    "MAX_RETRIES": int(os.environ.get("SMS_PROVIDER_MAX_RETRIES", 2)),
+    "BACKOFF_FACTOR": float(os.environ.get("SMS_PROVIDER_BACKOFF_FACTOR", 0.3)),
+    "ASYNC_MAX_CONNECTIONS": int(os.environ.get("SMS_PROVIDER_ASYNC_MAX_CONNECTIONS", 200)),
+}
+
+# Provider accounts. STATUS_MAPPER maps the delivery statuses of an account to SMS statuses;
+# SMS of accounts without one are never polled nor expired. DLR_TOKEN is the shared secret the
+# account sends in the X-DLR-Token header of its delivery callbacks.
+SMS_PROVIDER_ACCOUNTS = {
+    "magfa": {
+        "CLASS": "sms.sms_provider_clients.magfa.MagfaProvider",
+        "ASYNC_CLASS": "sms.sms_provider_clients.magfa.AsyncMagfaProvider",
+        "STATUS_MAPPER": "sms.reconciliation.map_magfa_status",
+        "DLR_TOKEN": MAGFA_DLR_TOKEN,
+        "OPTIONS": {
+            "username": MAGFA_USERNAME,
+            "password": MAGFA_PASSWORD,
+            "domain": MAGFA_DOMAIN,
+            "endpoint": MAGFA_ENDPOINT,
+        },
+    },
+}
+
+# A second Magfa account with its own sender line, used as a fallback of "magfa"
+if os.environ.get("MAGFA_BACKUP_USERNAME"):
+    SMS_PROVIDER_ACCOUNTS["magfa_backup"] = {
+        "CLASS": "sms.sms_provider_clients.magfa.MagfaProvider",
+        "ASYNC_CLASS": "sms.sms_provider_clients.magfa.AsyncMagfaProvider",
+        "STATUS_MAPPER": "sms.reconciliation.map_magfa_status",
+        "DLR_TOKEN": os.environ.get("MAGFA_BACKUP_DLR_TOKEN"),
+        "OPTIONS": {
+            "username": os.environ.get("MAGFA_BACKUP_USERNAME"),
+            "password": os.environ.get("MAGFA_BACKUP_PASSWORD"),
+            "domain": os.environ.get("MAGFA_BACKUP_DOMAIN"),
+            "endpoint": os.environ.get("MAGFA_BACKUP_ENDPOINT", MAGFA_ENDPOINT),
+            "sender": os.environ.get("MAGFA_BACKUP_SENDER"),
+        },
+    }
+
+# Accounts that take over, in order, while the circuit breaker of an account is open
+SMS_PROVIDER_FALLBACKS = {
+    "magfa": [
+        name for name in os.environ.get("MAGFA_FALLBACK_ACCOUNTS", "").split(",") if name.strip()
+    ],
+}
+
+# Circuit breakers of provider accounts (sms.sms_provider_clients.circuit_breaker), shared by
+# all workers through Redis. A breaker opens for OPEN_SECONDS once, among at least MIN_CALLS
+# calls in the last WINDOW_SECONDS, ERROR_RATE failed or SLOW_RATE took SLOW_CALL_SECONDS or
+# more. Accounts with fallbacks always have breakers.
+SMS_CIRCUIT_BREAKER_ENABLED = (
+    os.environ.get("SMS_CIRCUIT_BREAKER_ENABLED", "false").lower() == "true"
+)
+SMS_CIRCUIT_BREAKER = {
+    "WINDOW_SECONDS": int(os.environ.get("SMS_CIRCUIT_BREAKER_WINDOW_SECONDS", 10)),
+    "MIN_CALLS": int(os.environ.get("SMS_CIRCUIT_BREAKER_MIN_CALLS", 20)),
+    "ERROR_RATE": float(os.environ.get("SMS_CIRCUIT_BREAKER_ERROR_RATE", 0.5)),
+    "SLOW_CALL_SECONDS": float(os.environ.get("SMS_CIRCUIT_BREAKER_SLOW_CALL_SECONDS", 5)),
+    "SLOW_RATE": float(os.environ.get("SMS_CIRCUIT_BREAKER_SLOW_RATE", 0.5)),
+    "OPEN_SECONDS": int(os.environ.get("SMS_CIRCUIT_BREAKER_OPEN_SECONDS", 30)),
+    "PROBE_TIMEOUT_SECONDS": int(os.environ.get("SMS_CIRCUIT_BREAKER_PROBE_TIMEOUT", 15)),
+    "STATE_CACHE_SECONDS": float(os.environ.get("SMS_CIRCUIT_BREAKER_STATE_CACHE_SECONDS", 1)),
+}
+
+# Weighted routing (sms.sms_provider_clients.routing): an account and its fallbacks share the
+# traffic by success_rate ** SUCCESS / p95_latency ** LATENCY, computed per traffic class from
+# the calls and delivery reports of the last WINDOW_SECONDS. Each account keeps MIN_SHARE.
+SMS_WEIGHTED_ROUTING_ENABLED = (
+    os.environ.get("SMS_WEIGHTED_ROUTING_ENABLED", "false").lower() == "true"
+)
+SMS_ROUTING = {
+    "WINDOW_SECONDS": int(os.environ.get("SMS_ROUTING_WINDOW_SECONDS", 60)),
+    "BUCKET_SECONDS": int(os.environ.get("SMS_ROUTING_BUCKET_SECONDS", 5)),
+    "REFRESH_SECONDS": float(os.environ.get("SMS_ROUTING_REFRESH_SECONDS", 5)),
+    "MIN_SHARE": float(os.environ.get("SMS_ROUTING_MIN_SHARE", 0.05)),
+    "PRIOR_LATENCY_SECONDS": float(os.environ.get("SMS_ROUTING_PRIOR_LATENCY_SECONDS", 0.5)),
+    "EXPONENTS": {
+        "express": {"LATENCY": 2, "SUCCESS": 1},
+        "standard": {"LATENCY": 1, "SUCCESS": 2},
+    },
+}
@@ -23,10 +23,14 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from SmsHub.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("billing/", include("billing.urls")),
     path("sms/", include("sms.urls")),
+    path("webhooks/", include("webhooks.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path("api/schema/", SpectacularAPIView.as_view(), name="api-schema"),
     path(
         "api/docs/",
@@ -0,0 +1,61 @@
+"""
+Users as read on the send path, through the two-tier cache of ``SmsHub.cache``.
+
+Only the columns the send path needs are cached; ``balance`` is left deferred, since it is
+read under a row lock whenever it matters. Saving a cached column invalidates the user in every
+process after commit.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from account.models import User
+from SmsHub.cache import TwoTierCache
+
+CACHED_FIELDS = (
+    "id",
+    "username",
+    "is_active",
+    "rate_limit_per_minute",
+    "balance_shard_count",
+    "sender_pool_id",
+)
+# save(update_fields=...) may name a foreign key by its field name too
+_WATCHED_FIELDS = frozenset(CACHED_FIELDS) | {"sender_pool"}
+
+
+def _load_user(user_id: str) -> list | None:
+    row = User.objects.filter(id=user_id).values_list(*CACHED_FIELDS).first()
+    return list(row) if row is not None else None
+
+
+user_cache = TwoTierCache(
+    "user",
+    _load_user,
+    max_size=settings.USER_CACHE["L1_MAX_SIZE"],
+    ttl=settings.USER_CACHE["L1_TTL_SECONDS"],
+    l2_ttl=settings.USER_CACHE["L2_TTL_SECONDS"],
+)
+
+
+def get_cached_user(user_id: int) -> User:
+    """The user with only ``CACHED_FIELDS`` loaded; raises ``User.DoesNotExist``."""
+    values = user_cache.get(user_id)
+    if values is None:
+        raise User.DoesNotExist(f"User {user_id} does not exist")
+    return User.from_db("default", CACHED_FIELDS, values)
+
+
+def invalidate_user(user_id: int) -> None:
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Balance updates save only the balance, which is not cached
+    if update_fields is not None and not _WATCHED_FIELDS.intersection(update_fields):
+        return
+    invalidate_user(instance.pk)
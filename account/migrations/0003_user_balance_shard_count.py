@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("account", "0002_user_balance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="balance_shard_count",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("account", "0003_user_balance_shard_count"),
+        ("sms", "0009_sender_pools"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="sender_pool",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="users",
+                to="sms.senderpool",
+            ),
+        ),
+    ]
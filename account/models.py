@@ -5,3 +5,13 @@ from django.db import models
 class User(AbstractUser):
     rate_limit_per_minute = models.PositiveIntegerField(default=2000)
     balance = models.BigIntegerField(default=0)
+    # 0 keeps the whole balance on this row; N > 1 spreads it over N billing.BalanceShard rows
+    balance_shard_count = models.PositiveSmallIntegerField(default=0)
+    # Lines the user's SMS are sent from; None uses the shared pool (sms.sender_pools)
+    sender_pool = models.ForeignKey(
+        "sms.SenderPool",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="users",
+    )
@@ -0,0 +1,220 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, TestCase
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from account.cache import get_cached_user, user_cache
+from account.models import User
+from SmsHub.cache import CHANNEL, TwoTierCache, _handle_message
+
+
+def _sample(cache: str, result: str) -> float:
+    return (
+        REGISTRY.get_sample_value("smshub_cache_requests_total", {"cache": cache, "result": result})
+        or 0
+    )
+
+
+@patch("SmsHub.cache._start_listener")
+@patch("SmsHub.cache._store_script")
+@patch("SmsHub.cache.redis_conn")
+class TwoTierCacheTestCase(SimpleTestCase):
+    def _cache(self, name, ttl=60, max_size=100):
+        self.loader = MagicMock(side_effect=lambda key: {"key": key})
+        return TwoTierCache(name, self.loader, max_size=max_size, ttl=ttl, l2_ttl=300)
+
+    def test_miss_fills_both_tiers(self, mock_redis_conn, mock_store_script, mock_start_listener):
+        """Test a miss loads once, stores in Redis and answers later lookups from memory"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = self._cache("test_miss")
+
+        self.assertEqual(cache.get(1), {"key": "1"})
+        self.assertEqual(cache.get(1), {"key": "1"})
+
+        self.loader.assert_called_once_with("1")
+        mock_redis_conn.mget.assert_called_once_with(
+            ["cache:test_miss:1", "cache_version:test_miss:1"]
+        )
+        mock_store_script.assert_called_once_with(
+            keys=["cache:test_miss:1", "cache_version:test_miss:1"],
+            args=[json.dumps({"key": "1"}), 300, 0],
+        )
+        self.assertEqual(_sample("test_miss", "miss"), 1)
+        self.assertEqual(_sample("test_miss", "l1"), 1)
+
+    def test_redis_hit_skips_loader(self, mock_redis_conn, mock_store_script, mock_start_listener):
+        """Test a value found in Redis is not loaded from the database"""
+        mock_redis_conn.mget.return_value = [json.dumps({"key": "cached"}), None]
+        cache = self._cache("test_l2")
+
+        self.assertEqual(cache.get(1), {"key": "cached"})
+
+        self.loader.assert_not_called()
+        self.assertEqual(_sample("test_l2", "l2"), 1)
+
+    def test_expired_entries_are_reloaded(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test an entry older than the L1 TTL is looked up again"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = self._cache("test_ttl", ttl=0)
+
+        cache.get(1)
+        cache.get(1)
+
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_least_recently_used_is_evicted(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test the L1 keeps at most max_size entries, dropping the least recently used"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = self._cache("test_lru", max_size=2)
+
+        cache.get(1)
+        cache.get(2)
+        cache.get(1)
+        cache.get(3)
+        self.loader.reset_mock()
+        cache.get(1)
+        cache.get(2)
+
+        self.loader.assert_called_once_with("2")
+
+    def test_missing_values_are_not_cached(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test a key the loader does not find is neither stored nor remembered"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = TwoTierCache("test_none", lambda key: None, max_size=10, ttl=60, l2_ttl=300)
+
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(1))
+
+        mock_store_script.assert_not_called()
+
+    def test_invalidate_publishes_key(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test invalidating drops the Redis entry and tells every process"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = self._cache("test_invalidate")
+        cache.get(1)
+
+        cache.invalidate(1)
+        cache.get(1)
+
+        pipe = mock_redis_conn.pipeline.return_value
+        pipe.delete.assert_called_once_with("cache:test_invalidate:1")
+        pipe.incr.assert_called_once_with("cache_version:test_invalidate:1")
+        pipe.publish.assert_called_once_with(CHANNEL, "test_invalidate:1")
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_published_key_is_dropped(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test an invalidation from another process drops only the named entry"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = self._cache("test_message")
+        cache.get(1)
+        cache.get(2)
+
+        _handle_message(b"test_message:1")
+        cache.get(1)
+        cache.get(2)
+
+        self.assertEqual([call.args[0] for call in self.loader.call_args_list], ["1", "2", "1"])
+
+    def test_load_racing_invalidation_is_not_kept(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test a value loaded while its key was invalidated is not kept in memory"""
+        mock_redis_conn.mget.return_value = [None, None]
+        cache = self._cache("test_race")
+        self.loader.side_effect = lambda key: cache.discard(key) or {"key": key}
+
+        cache.get(1)
+        cache.get(1)
+
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_store_keeps_version_read_with_lookup(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test a miss stores its value only against the version it read before loading"""
+        mock_redis_conn.mget.return_value = [None, b"3"]
+        cache = self._cache("test_version")
+
+        cache.get(1)
+
+        self.assertEqual(mock_store_script.call_args.kwargs["args"][2], 3)
+
+    def test_redis_failure_falls_back_to_loader(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test lookups keep working from the database while Redis is down"""
+        mock_redis_conn.mget.side_effect = RedisConnectionError()
+        mock_store_script.side_effect = RedisConnectionError()
+        cache = self._cache("test_down")
+
+        self.assertEqual(cache.get(1), {"key": "1"})
+        self.assertEqual(cache.get(1), {"key": "1"})
+
+        self.loader.assert_called_once_with("1")
+
+
+@patch("SmsHub.cache._start_listener")
+@patch("SmsHub.cache._store_script")
+@patch("SmsHub.cache.redis_conn")
+class CachedUserTestCase(TestCase):
+    def setUp(self):
+        user_cache.clear_local()
+        self.addCleanup(user_cache.clear_local)
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 5000
+        self.user.save()
+
+    def test_cached_user_fields(self, mock_redis_conn, mock_store_script, mock_start_listener):
+        """Test the cached user carries the send path columns and defers the balance"""
+        mock_redis_conn.mget.return_value = [None, None]
+
+        user = get_cached_user(self.user.id)
+
+        self.assertEqual(user.pk, self.user.id)
+        self.assertEqual(user.rate_limit_per_minute, 2000)
+        self.assertIsNone(user.sender_pool_id)
+        self.assertIn("balance", user.get_deferred_fields())
+        self.assertEqual(user.balance, 5000)
+
+    def test_missing_user(self, mock_redis_conn, mock_store_script, mock_start_listener):
+        """Test an unknown id raises DoesNotExist"""
+        mock_redis_conn.mget.return_value = [None, None]
+
+        with self.assertRaises(User.DoesNotExist):
+            get_cached_user(99999)
+
+    def test_saving_user_invalidates(self, mock_redis_conn, mock_store_script, mock_start_listener):
+        """Test saving a cached column invalidates the user after commit"""
+        mock_redis_conn.mget.return_value = [None, None]
+        get_cached_user(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.rate_limit_per_minute = 10
+            self.user.save(update_fields=["rate_limit_per_minute"])
+
+        self.assertEqual(get_cached_user(self.user.id).rate_limit_per_minute, 10)
+        mock_redis_conn.pipeline.return_value.publish.assert_called_once_with(
+            CHANNEL, f"user:{self.user.id}"
+        )
+
+    def test_balance_updates_keep_cache(
+        self, mock_redis_conn, mock_store_script, mock_start_listener
+    ):
+        """Test saving only the balance does not invalidate the user"""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.balance = 100
+            self.user.save(update_fields=["balance"])
+
+        self.assertEqual(callbacks, [])
@@ -0,0 +1,78 @@
+"""
+Compare benchmark results written by ``benchmarks.run``.
+
+    python -m benchmarks.compare benchmarks/results/baseline.json benchmarks/results/new.json
+
+Every run after the first is shown next to the first one, with the relative change.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+SCENARIO_COLUMNS = (
+    ("ok/s", ("throughput_per_second",)),
+    ("p50 ms", ("latency_ms", "p50")),
+    ("p95 ms", ("latency_ms", "p95")),
+    ("p99 ms", ("latency_ms", "p99")),
+    ("queries", ("queries_per_request", "mean")),
+)
+PIPELINE_COLUMNS = (
+    ("SMS/s", ("send_throughput_per_second",)),
+    ("p50 ms", ("created_to_sent_ms", "p50")),
+    ("p95 ms", ("created_to_sent_ms", "p95")),
+    ("p99 ms", ("created_to_sent_ms", "p99")),
+)
+
+
+def _get(data: dict | None, path: tuple):
+    for key in path:
+        if data is None:
+            return None
+        data = data.get(key)
+    return data
+
+
+def _cell(value, baseline) -> str:
+    if value is None:
+        return "-"
+    if baseline in (None, 0) or value == baseline:
+        return f"{value}"
+    return f"{value} ({(value - baseline) / baseline:+.0%})"
+
+
+def _print_table(title: str, columns: tuple, rows: list[tuple[str, dict | None]]) -> None:
+    print(title)
+    print(f"  {'run':<32}" + "".join(f"{name:>20}" for name, _ in columns))
+    baseline = rows[0][1]
+    for name, data in rows:
+        cells = [_cell(_get(data, path), _get(baseline, path)) for _, path in columns]
+        print(f"  {name[:32]:<32}" + "".join(f"{cell:>20}" for cell in cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("results", nargs="+", type=Path)
+    options = parser.parse_args()
+
+    runs = [(path.stem, json.loads(path.read_text())) for path in options.results]
+    scenario_names = dict.fromkeys(
+        scenario["scenario"] for _, run in runs for scenario in run["scenarios"]
+    )
+    for scenario_name in scenario_names:
+        rows = [
+            (
+                name,
+                next((s for s in run["scenarios"] if s["scenario"] == scenario_name), None),
+            )
+            for name, run in runs
+        ]
+        _print_table(scenario_name, SCENARIO_COLUMNS, rows)
+    if any(run.get("pipeline") for _, run in runs):
+        _print_table(
+            "pipeline", PIPELINE_COLUMNS, [(name, run.get("pipeline")) for name, run in runs]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Local stand-in for the Magfa HTTP API v2, for load tests.
+
+Implements ``send``, ``statuses/<mids>``, ``mid/<uid>`` and ``balance`` with the response
+shapes ``MagfaProvider`` parses. Every request waits ``latency_ms`` (plus up to
+``jitter_ms``) and fails with HTTP 500 with probability ``error_rate``; message ids count up
+from ``first_message_id``. Credentials are not checked.
+
+    python -m benchmarks.fake_magfa --port 8081 --latency-ms 50 --error-rate 0.01
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAGFA_DELIVERED = 1
+MAGFA_FAILED = -1
+MAGFA_PENDING = 0
+
+
+class FakeMagfaState:
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        first_message_id: int = 1,
+        delivered_rate: float = 1,
+        failed_rate: float = 0,
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.delivered_rate = delivered_rate
+        self.failed_rate = failed_rate
+        self.random = random.Random(seed)
+        self.message_ids = itertools.count(first_message_id)
+        self.mids_by_uid = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.messages = 0
+
+    def delay(self) -> float:
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+        return (self.latency_ms + jitter) / 1000
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def send(self, payload: dict) -> dict:
+        recipients = payload.get("recipients") or []
+        uids = payload.get("uids") or [None] * len(recipients)
+        messages = []
+        with self.lock:
+            for recipient, uid in zip(recipients, uids, strict=False):
+                mid = next(self.message_ids)
+                if uid is not None:
+                    self.mids_by_uid[int(uid)] = mid
+                messages.append(
+                    {"status": 0, "id": mid, "userId": uid, "parts": 1, "recipient": recipient}
+                )
+            self.messages += len(messages)
+        return {"status": 0, "messages": messages}
+
+    def statuses(self, mids: list[str]) -> dict:
+        dlrs = []
+        with self.lock:
+            for mid in mids:
+                draw = self.random.random()
+                if draw < self.failed_rate:
+                    dlr_status = MAGFA_FAILED
+                elif draw < self.failed_rate + self.delivered_rate:
+                    dlr_status = MAGFA_DELIVERED
+                else:
+                    dlr_status = MAGFA_PENDING
+                dlrs.append({"mid": int(mid), "status": dlr_status, "date": None})
+        return {"status": 0, "dlrs": dlrs}
+
+    def mid(self, uid: str) -> dict:
+        with self.lock:
+            mid = self.mids_by_uid.get(int(uid))
+        if mid is None:
+            return {"status": 20, "mid": None}
+        return {"status": 0, "mid": mid}
+
+
+class FakeMagfaHandler(BaseHTTPRequestHandler):
+    server_version = "FakeMagfa/1.0"
+    # Keep-alive, so pooled provider sessions reuse their connections as they do in production
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> FakeMagfaState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status_code: int, body: dict | None) -> None:
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        time.sleep(self.state.delay())
+        if self.state.should_fail():
+            self._reply(500, None)
+            return
+
+        # Anything before the last known endpoint name is the configured base path
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        for i in range(len(parts) - 1, -1, -1):
+            endpoint, args = parts[i], parts[i + 1 :]
+            if method == "POST" and endpoint == "send" and not args:
+                self._reply(200, self.state.send(json.loads(raw_body or b"{}")))
+                return
+            if method == "GET" and endpoint == "statuses" and len(args) == 1:
+                self._reply(200, self.state.statuses(args[0].split(",")))
+                return
+            if method == "GET" and endpoint == "mid" and len(args) == 1:
+                self._reply(200, self.state.mid(args[0]))
+                return
+            if method == "GET" and endpoint == "balance" and not args:
+                self._reply(200, {"status": 0, "balance": 10**12})
+                return
+        self._reply(404, {"status": -1, "error": "Not Found"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+
+class FakeMagfaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], state: FakeMagfaState):
+        super().__init__(address, FakeMagfaHandler)
+        self.state = state
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/http/sms/v2/"
+
+    def start_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="fake-magfa", daemon=True)
+        thread.start()
+        return thread
+
+
+def add_fake_magfa_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--magfa-latency-ms", type=float, default=50)
+    parser.add_argument("--magfa-jitter-ms", type=float, default=0)
+    parser.add_argument("--magfa-error-rate", type=float, default=0)
+    parser.add_argument("--magfa-first-message-id", type=int, default=1)
+    parser.add_argument("--magfa-delivered-rate", type=float, default=1)
+    parser.add_argument("--magfa-failed-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def state_from_arguments(options: argparse.Namespace) -> FakeMagfaState:
+    return FakeMagfaState(
+        latency_ms=options.magfa_latency_ms,
+        jitter_ms=options.magfa_jitter_ms,
+        error_rate=options.magfa_error_rate,
+        first_message_id=options.magfa_first_message_id,
+        delivered_rate=options.magfa_delivered_rate,
+        failed_rate=options.magfa_failed_rate,
+        seed=options.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_fake_magfa_arguments(parser)
+    options = parser.parse_args()
+
+    server = FakeMagfaServer((options.host, options.port), state_from_arguments(options))
+    print(f"Fake Magfa listening on {server.endpoint}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Open-loop HTTP load driver.
+
+Requests are started on a fixed schedule of ``rate`` per second whether or not earlier ones
+have finished, and each latency is measured from the time the request was due. A server that
+falls behind therefore shows up in the percentiles instead of silently lowering the rate.
+"""
+
+import math
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    # Called with the request number; returns the JSON body or the query parameters
+    build: Callable[[int], dict]
+
+
+@dataclass
+class Sample:
+    latency: float
+    status_code: int
+    queries: int | None
+
+
+def percentile(sorted_values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def to_ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    latencies = sorted(sample.latency for sample in samples)
+    ok = sum(1 for sample in samples if 200 <= sample.status_code < 300)
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    status_codes = {}
+    for sample in samples:
+        status_codes[str(sample.status_code)] = status_codes.get(str(sample.status_code), 0) + 1
+
+    return {
+        "requests": len(samples),
+        "ok": ok,
+        "errors": len(samples) - ok,
+        "status_codes": status_codes,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(ok / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "mean": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": to_ms(percentile(latencies, 50)),
+            "p95": to_ms(percentile(latencies, 95)),
+            "p99": to_ms(percentile(latencies, 99)),
+            "max": to_ms(latencies[-1]) if latencies else None,
+        },
+        "queries_per_request": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "max": max(queries) if queries else None,
+        },
+    }
+
+
+class LoadDriver:
+    def __init__(self, base_url: str, concurrency: int = 64, timeout: float = 30):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _call(self, scenario: Scenario, number: int, due: float) -> Sample:
+        url = f"{self.base_url}{scenario.path}"
+        data = scenario.build(number)
+        try:
+            if scenario.method == "GET":
+                response = self.session.get(url, params=data, timeout=self.timeout)
+            else:
+                response = self.session.request(
+                    scenario.method, url, json=data, timeout=self.timeout
+                )
+            # Read the whole body, so streaming endpoints are timed to their last byte
+            _ = response.content
+            status_code = response.status_code
+            queries = response.headers.get(QUERY_COUNT_HEADER)
+        except requests.RequestException:
+            status_code, queries = 0, None
+        return Sample(
+            latency=time.perf_counter() - due,
+            status_code=status_code,
+            queries=int(queries) if queries is not None else None,
+        )
+
+    def request(self, scenario: Scenario, number: int = 0) -> Sample:
+        return self._call(scenario, number, time.perf_counter())
+
+    def run(self, scenario: Scenario, rate: float, duration: float) -> dict:
+        """Send ``rate`` requests per second for ``duration`` seconds and summarize them."""
+        total = max(int(rate * duration), 1)
+        samples = []
+        samples_lock = threading.Lock()
+
+        def record(future):
+            with samples_lock:
+                samples.append(future.result())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for number in range(total):
+                due = start + number / rate
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                executor.submit(self._call, scenario, number, due).add_done_callback(record)
+        elapsed = time.perf_counter() - start
+        return {"scenario": scenario.name, "target_rate": rate, **summarize(samples, elapsed)}
@@ -0,0 +1,30 @@
+from contextlib import ExitStack
+
+from django.db import connections
+
+from benchmarks.load import QUERY_COUNT_HEADER
+
+
+class QueryCountMiddleware:
+    """Report the number of SQL queries of each request in the ``X-DB-Queries`` header.
+
+    Only installed with ``BENCHMARK_QUERY_COUNT=true``; see ``benchmarks.run``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        response[QUERY_COUNT_HEADER] = str(count)
+        return response
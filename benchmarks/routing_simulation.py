@@ -0,0 +1,193 @@
+"""
+Simulation of provider routing when one provider degrades.
+
+Two fake Magfa servers stand in for two accounts that reach the same destinations. A pool of
+closed-loop workers (like Celery processes) sends through each strategy in turn: fixed-order
+failover, then weighted routing. After ``--degrade-after`` seconds the first provider becomes
+slow and starts failing. The run reports throughput before and after that point and where the
+traffic went, and saves it to ``benchmarks/results``:
+
+    python -m benchmarks.routing_simulation --duration 30 --degrade-after 10
+
+Circuit breakers and routing stats live in the Redis of the current settings, under keys
+unique to the run.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.fake_magfa import FakeMagfaServer, FakeMagfaState
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+STRATEGIES = ("failover", "weighted")
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--degrade-after", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32, help="Sending workers.")
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--degraded-latency-ms", type=float, default=400)
+    parser.add_argument("--degraded-error-rate", type=float, default=0.2)
+    parser.add_argument("--traffic", choices=("standard", "express"), default="standard")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="routing")
+    parser.add_argument("--output-dir", type=Path, default=RESULTS_DIR)
+    return parser.parse_args()
+
+
+def _build_provider(strategy: str, endpoints: dict[str, str], run_id: str, options):
+    from sms.sms_provider_clients.circuit_breaker import CircuitBreaker
+    from sms.sms_provider_clients.failover import FailoverProvider, ProviderRoute
+    from sms.sms_provider_clients.magfa import MagfaProvider
+    from sms.sms_provider_clients.routing import ProviderStats, WeightedRouter
+
+    routes = [
+        ProviderRoute(
+            name=name,
+            client=MagfaProvider(
+                "user",
+                "pass",
+                "domain",
+                endpoint=endpoint,
+                http_options={
+                    "POOL_MAXSIZE": options.concurrency,
+                    "MAX_RETRIES": 0,
+                    "READ_TIMEOUT": 5,
+                },
+            ),
+            breaker=CircuitBreaker(f"{run_id}-{strategy}-{name}"),
+        )
+        for name, endpoint in endpoints.items()
+    ]
+    if strategy == "failover":
+        return FailoverProvider(routes)
+    stats = ProviderStats(
+        prefix=f"routing:{run_id}",
+        # A short window so the simulation reacts within its duration
+        options={"WINDOW_SECONDS": 10, "BUCKET_SECONDS": 1, "REFRESH_SECONDS": 1},
+    )
+    return WeightedRouter(routes, stats).for_traffic(options.traffic)
+
+
+def _simulate(strategy: str, run_id: str, options) -> dict:
+    servers = {
+        name: FakeMagfaServer(
+            ("127.0.0.1", 0),
+            FakeMagfaState(
+                latency_ms=options.latency_ms,
+                jitter_ms=options.jitter_ms,
+                seed=options.seed + i,
+            ),
+        )
+        for i, name in enumerate(("provider_a", "provider_b"))
+    }
+    for server in servers.values():
+        server.start_in_background()
+    provider = _build_provider(
+        strategy, {name: server.endpoint for name, server in servers.items()}, run_id, options
+    )
+
+    lock = threading.Lock()
+    counts = {phase: {"ok": 0, "failed": 0, "by_provider": {}} for phase in ("before", "after")}
+    start = time.monotonic()
+    degrade_at = start + options.degrade_after
+    deadline = start + options.duration
+    degraded = threading.Event()
+
+    def worker(worker_id: int) -> None:
+        uid = worker_id * 10**9
+        while time.monotonic() < deadline:
+            uid += 1
+            phase = "after" if degraded.is_set() else "before"
+            try:
+                response = provider.send_sms("3000100", "09120000000", "Simulation", uid)
+                ok = response.get("status") == 0
+                served_by = response.get("provider")
+            except Exception:
+                ok, served_by = False, None
+            with lock:
+                counts[phase]["ok" if ok else "failed"] += 1
+                if served_by:
+                    by_provider = counts[phase]["by_provider"]
+                    by_provider[served_by] = by_provider.get(served_by, 0) + 1
+
+    threads = [
+        threading.Thread(target=worker, args=(i,), daemon=True) for i in range(options.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(max(degrade_at - time.monotonic(), 0))
+    degraded_state = servers["provider_a"].state
+    degraded_state.latency_ms = options.degraded_latency_ms
+    degraded_state.error_rate = options.degraded_error_rate
+    degraded.set()
+    for thread in threads:
+        thread.join()
+
+    provider.close()
+    for route in provider.routes:
+        route.breaker.reset()
+    for server in servers.values():
+        server.shutdown()
+        server.server_close()
+
+    phase_seconds = {
+        "before": options.degrade_after,
+        "after": options.duration - options.degrade_after,
+    }
+    return {
+        "strategy": strategy,
+        **{
+            phase: {
+                **counts[phase],
+                "ok_per_second": round(counts[phase]["ok"] / phase_seconds[phase], 2),
+            }
+            for phase in counts
+        },
+    }
+
+
+def main() -> None:
+    options = _parse_arguments()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmsHub.settings")
+    import django
+
+    django.setup()
+
+    started_at = datetime.now()
+    run_id = f"sim-{started_at:%Y%m%d%H%M%S}-{os.getpid()}"
+    result = {
+        "label": options.label,
+        "started_at": started_at.isoformat(),
+        "options": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(options).items()
+        },
+        "strategies": [_simulate(strategy, run_id, options) for strategy in STRATEGIES],
+    }
+
+    print(
+        f"{'strategy':<10}{'ok/s before':>14}{'ok/s after':>14}{'failed after':>14}  served after"
+    )
+    for run in result["strategies"]:
+        print(
+            f"{run['strategy']:<10}{run['before']['ok_per_second']:>14}"
+            f"{run['after']['ok_per_second']:>14}{run['after']['failed']:>14}"
+            f"  {run['after']['by_provider']}"
+        )
+    options.output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = options.output_dir / f"{started_at:%Y%m%d-%H%M%S}-{options.label}.json"
+    output_path.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Reproducible load test of the SMS path.
+
+Starts the fake Magfa server, then the web server and SMS workers with ``MAGFA_ENDPOINT``
+pointed at it, funds a set of benchmark users through ``/billing/v1/charge`` and drives each
+scenario at a fixed rate. After the send scenario it waits for the workers to drain the queue
+and measures the time every SMS took from ``created_at`` to its provider call. The run is
+written as JSON to ``benchmarks/results`` so runs can be compared with ``benchmarks.compare``:
+
+    python -m benchmarks.run --rate 200 --duration 30 --label batch-sender
+
+The web server and workers use the database, broker and Redis of the current environment.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from benchmarks.fake_magfa import FakeMagfaServer, add_fake_magfa_arguments, state_from_arguments
+from benchmarks.load import LoadDriver, Scenario, percentile, to_ms
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+DEFAULT_PROCESSES = [
+    "gunicorn SmsHub.wsgi:application --bind 127.0.0.1:8000 --workers 4",
+    f"{sys.executable} manage.py run_sms_batch_sender",
+    "celery -A SmsHub.celery worker -l warning -Q express_sms_sender --concurrency 8",
+]
+SCENARIOS = ("charge", "send", "report")
+# Every benchmark user gets this balance before the run, in Rial
+FUNDING_AMOUNT = 10**10
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rate", type=float, default=100, help="Requests per second.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Client connections.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument(
+        "--scenario", action="append", dest="scenarios", choices=SCENARIOS, default=None
+    )
+    parser.add_argument("--express-ratio", type=float, default=0)
+    parser.add_argument(
+        "--sender",
+        default="3000100",
+        help="SMS_DEFAULT_SENDER of the web server; must map to the magfa account.",
+    )
+    parser.add_argument(
+        "--process",
+        action="append",
+        dest="processes",
+        default=None,
+        help="Command to start for the run; repeatable. Defaults to gunicorn and the workers.",
+    )
+    parser.add_argument(
+        "--no-processes", action="store_true", help="Use servers that are already running."
+    )
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--magfa-host", default="127.0.0.1")
+    parser.add_argument("--magfa-port", type=int, default=0, help="0 picks a free port.")
+    add_fake_magfa_arguments(parser)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output-dir", type=Path, default=RESULTS_DIR)
+    return parser.parse_args()
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_processes(commands: list[str], env: dict, log_file) -> list[subprocess.Popen]:
+    return [
+        subprocess.Popen(
+            shlex.split(command),
+            cwd=BASE_DIR,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        for command in commands
+    ]
+
+
+def _stop_processes(processes: list[subprocess.Popen]) -> None:
+    for process in processes:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def _wait_for_server(base_url: str, processes: list[subprocess.Popen], timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        exited = [process.args for process in processes if process.poll() is not None]
+        if exited:
+            raise RuntimeError(f"Processes exited during start up: {exited}")
+        try:
+            if requests.get(f"{base_url}/metrics", timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{base_url} did not answer within {timeout} seconds")
+
+
+def _prepare_users(count: int) -> list[int]:
+    from account.models import User
+
+    user_ids = []
+    for i in range(count):
+        user, _ = User.objects.update_or_create(
+            username=f"bench-{i}", defaults={"rate_limit_per_minute": 10**6}
+        )
+        user_ids.append(user.id)
+    return user_ids
+
+
+def _build_scenarios(user_ids: list[int], express_ratio: float) -> dict[str, Scenario]:
+    def user_id(n):
+        return user_ids[n % len(user_ids)]
+
+    return {
+        "charge": Scenario(
+            "charge", "POST", "/billing/v1/charge", lambda n: {"user_id": user_id(n), "amount": 1}
+        ),
+        "send": Scenario(
+            "send",
+            "POST",
+            "/sms/v1/send",
+            lambda n: {
+                "user_id": user_id(n),
+                "receiver": f"0912{n % 10**7:07d}",
+                "content": f"Benchmark message {n}",
+                "is_express": (n % 100) < express_ratio * 100,
+            },
+        ),
+        "report": Scenario("report", "GET", "/sms/v1/report", lambda n: {"user_id": user_id(n)}),
+    }
+
+
+def _last_sms_id() -> int:
+    from sms.models import SMS
+
+    return SMS.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def _measure_pipeline(user_ids: list[int], after_id: int, timeout: float) -> dict:
+    """Wait until the SMS created by the send scenario have left the queue and time them."""
+    from sms.models import SMS, SMSStatus
+
+    queryset = SMS.objects.filter(user_id__in=user_ids, id__gt=after_id)
+    queued_statuses = (SMSStatus.CREATED, SMSStatus.IN_QUEUE)
+    deadline = time.monotonic() + timeout
+    while queryset.filter(status__in=queued_statuses).exists() and time.monotonic() < deadline:
+        time.sleep(1)
+
+    rows = list(queryset.values_list("status", "created_at", "last_attempt_at"))
+    timed = [(created, sent) for _, created, sent in rows if sent is not None]
+    waits = sorted((sent - created).total_seconds() for created, sent in timed)
+    span = (max(s for _, s in timed) - min(c for c, _ in timed)).total_seconds() if timed else 0
+    statuses = {}
+    for sms_status, _, _ in rows:
+        statuses[sms_status] = statuses.get(sms_status, 0) + 1
+
+    return {
+        "sms": len(rows),
+        "statuses": statuses,
+        "send_throughput_per_second": round(len(timed) / span, 2) if span else 0,
+        "created_to_sent_ms": {
+            "p50": to_ms(percentile(waits, 50)),
+            "p95": to_ms(percentile(waits, 95)),
+            "p99": to_ms(percentile(waits, 99)),
+            "max": to_ms(waits[-1]) if waits else None,
+        },
+    }
+
+
+def _print_summary(result: dict) -> None:
+    print(f"{'scenario':<10}{'ok/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+    for scenario in result["scenarios"]:
+        latency = scenario["latency_ms"]
+        print(
+            f"{scenario['scenario']:<10}{scenario['throughput_per_second']:>10}"
+            f"{latency['p50']!s:>10}{latency['p95']!s:>10}{latency['p99']!s:>10}"
+            f"{scenario['queries_per_request']['mean']!s:>10}"
+        )
+    pipeline = result.get("pipeline")
+    if pipeline:
+        print(
+            f"pipeline: {pipeline['send_throughput_per_second']} SMS/s, "
+            f"created to sent p95 {pipeline['created_to_sent_ms']['p95']} ms, "
+            f"statuses {pipeline['statuses']}"
+        )
+
+
+def main() -> None:
+    options = _parse_arguments()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmsHub.settings")
+    import django
+
+    django.setup()
+
+    started_at = datetime.now()
+    options.output_dir.mkdir(parents=True, exist_ok=True)
+    name = started_at.strftime("%Y%m%d-%H%M%S") + (f"-{options.label}" if options.label else "")
+    output_path = options.output_dir / f"{name}.json"
+
+    magfa = FakeMagfaServer((options.magfa_host, options.magfa_port), state_from_arguments(options))
+    magfa.start_in_background()
+    env = {
+        **os.environ,
+        "MAGFA_ENDPOINT": magfa.endpoint,
+        "SMS_DEFAULT_SENDER": options.sender,
+        "BENCHMARK_QUERY_COUNT": "true",
+        "PYTHONUNBUFFERED": "1",
+    }
+    commands = [] if options.no_processes else options.processes or DEFAULT_PROCESSES
+    driver = LoadDriver(options.base_url, concurrency=options.concurrency)
+    processes = []
+    with open(options.output_dir / f"{name}.log", "w") as log_file:
+        try:
+            processes = _start_processes(commands, env, log_file)
+            _wait_for_server(options.base_url, processes)
+
+            user_ids = _prepare_users(options.users)
+            scenarios = _build_scenarios(user_ids, options.express_ratio)
+            for user_id in user_ids:
+                funding = Scenario(
+                    "fund",
+                    "POST",
+                    "/billing/v1/charge",
+                    lambda n, user_id=user_id: {"user_id": user_id, "amount": FUNDING_AMOUNT},
+                )
+                if not 200 <= driver.request(funding).status_code < 300:
+                    raise RuntimeError(f"Could not fund benchmark user {user_id}")
+
+            result = {
+                "label": options.label,
+                "started_at": started_at.isoformat(),
+                "git_commit": _git_commit(),
+                "options": {
+                    key: str(value) if isinstance(value, Path) else value
+                    for key, value in vars(options).items()
+                },
+                "processes": commands,
+                "scenarios": [],
+            }
+            for scenario_name in options.scenarios or SCENARIOS:
+                after_id = _last_sms_id()
+                result["scenarios"].append(
+                    driver.run(scenarios[scenario_name], options.rate, options.duration)
+                )
+                if scenario_name == "send":
+                    result["pipeline"] = _measure_pipeline(
+                        user_ids, after_id, options.drain_timeout
+                    )
+            result["provider"] = {
+                "requests": magfa.state.requests,
+                "messages": magfa.state.messages,
+            }
+        finally:
+            driver.close()
+            _stop_processes(processes)
+            magfa.shutdown()
+            magfa.server_close()
+
+    output_path.write_text(json.dumps(result, indent=2) + "\n")
+    _print_summary(result)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
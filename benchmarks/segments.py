@@ -0,0 +1,108 @@
+"""
+Micro-benchmark of SMS segment counting.
+
+Counts the segments of a mix of message contents (short and long, Latin and Persian, with
+GSM extension characters and emoji) with ``sms.segments.count_segments`` and with two plain
+approaches: a regex to detect GSM-7 plus ``encode("utf-16-le")`` for UCS-2, and a Python loop
+over the characters. Every approach must agree on every message before it is timed:
+
+    python -m benchmarks.segments --messages 200000
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+
+SAMPLES = [
+    "Your code is 482913",
+    "Hello {name}, your order #1234 ships today. Track it at https://example.com/t/abc~1",
+    "کد تایید شما ۴۸۲۹۱۳ است",
+    "مشتری گرامی، سفارش شما ثبت شد و تا دو روز کاری آینده ارسال می‌شود. با تشکر از خرید شما",
+    "Sale 😀 50% off today only!",
+]
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def _random_messages(count: int, rng: random.Random) -> list[str]:
+    # Up to the 480 characters the send API accepts
+    return [(rng.choice(SAMPLES) + " ") * rng.randint(1, 5) for _ in range(count)]
+
+
+def _baselines():
+    from sms.segments import GSM_7, GSM_ALPHABET, GSM_EXTENSION, SEGMENT_UNITS, UCS_2
+
+    gsm_re = re.compile("[" + re.escape("".join(sorted(GSM_ALPHABET))) + "]*")
+
+    def width(char: str, encoding: str) -> int:
+        if encoding == GSM_7:
+            return 2 if char in GSM_EXTENSION else 1
+        return 2 if char > "\uffff" else 1
+
+    def segments(text: str, encoding: str, units: int) -> int:
+        single_units, part_units = SEGMENT_UNITS[encoding]
+        if units <= single_units:
+            return 1
+        if units == len(text):
+            return -(-units // part_units)
+        count, used = 1, 0
+        for char in text:
+            char_width = width(char, encoding)
+            if used + char_width > part_units:
+                count += 1
+                used = 0
+            used += char_width
+        return count
+
+    def regex_encode(text: str) -> int:
+        if gsm_re.fullmatch(text):
+            units = len(text) + sum(text.count(char) for char in GSM_EXTENSION)
+            return segments(text, GSM_7, units)
+        return segments(text, UCS_2, len(text.encode("utf-16-le")) // 2)
+
+    def character_loop(text: str) -> int:
+        encoding = GSM_7 if all(char in GSM_ALPHABET for char in text) else UCS_2
+        return segments(text, encoding, sum(width(char, encoding) for char in text))
+
+    return {"regex + encode": regex_encode, "character loop": character_loop}
+
+
+def _time(count, messages: list[str]) -> float:
+    started = time.perf_counter()
+    for text in messages:
+        count(text)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    options = _parse_arguments()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmsHub.settings")
+    import django
+
+    django.setup()
+    from sms.segments import count_segments
+
+    messages = _random_messages(options.messages, random.Random(options.seed))
+    approaches = {"count_segments": count_segments, **_baselines()}
+    expected = [count_segments(text) for text in messages]
+    for name, count in approaches.items():
+        if [count(text) for text in messages] != expected:
+            raise SystemExit(f"{name} disagrees with count_segments")
+
+    mean_length = sum(map(len, messages)) / len(messages)
+    print(f"{len(messages)} messages, {mean_length:.0f} characters on average")
+    print(f"{'approach':<18}{'total s':>10}{'ns/message':>12}")
+    for name, count in approaches.items():
+        seconds = _time(count, messages)
+        print(f"{name:<18}{seconds:>10.3f}{seconds / len(messages) * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of tariff lookups on the send path.
+
+Builds a tariff table like a production one (every Iranian mobile operator prefix plus country
+codes and extra random prefixes) and prices a million random receivers, half national and half
+international. The trie of ``billing.tariffs`` is compared with probing a dict of prefixes from
+the longest length down:
+
+    python -m benchmarks.tariff_lookup --numbers 1000000 --prefixes 5000
+"""
+
+import argparse
+import os
+import random
+import time
+
+# Mobile prefixes of MCI, Irancell and Rightel, in international form
+IRAN_MOBILE_PREFIXES = {
+    "MCI": [f"98{p}" for p in (*range(910, 920), 990, 991, 992, 993, 994)],
+    "Irancell": [f"98{p}" for p in (901, 902, 903, 904, 905, 930, 933, 935, 936, 937, 938, 939)],
+    "Rightel": [f"98{p}" for p in (920, 921, 922)],
+}
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--numbers", type=int, default=1_000_000)
+    parser.add_argument("--prefixes", type=int, default=5000, help="Random extra prefixes.")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def _build_rates(extra: int, rng: random.Random) -> list:
+    from billing.tariffs import _rate
+
+    rates = [_rate("98", "", "IR", 900, 1.5)]
+    for operator, prefixes in IRAN_MOBILE_PREFIXES.items():
+        rates += [_rate(prefix, operator, "IR", 800, 1.5) for prefix in prefixes]
+    rates += [_rate(str(code), "", "XX", 20000, 1) for code in range(1, 1000) if code != 98]
+    for _ in range(extra):
+        prefix = str(rng.randrange(1, 10**7))[: rng.randint(3, 7)]
+        rates.append(_rate(prefix, "", "XX", rng.randrange(1000, 50000), 1))
+    return list({rate.prefix: rate for rate in rates}.values())
+
+
+def _random_numbers(count: int, rng: random.Random) -> list[str]:
+    mobile = [prefix[2:] for prefixes in IRAN_MOBILE_PREFIXES.values() for prefix in prefixes]
+    return [
+        f"0{rng.choice(mobile)}{rng.randrange(10**7):07d}"
+        if rng.random() < 0.5
+        else f"+{rng.randrange(1, 1000)}{rng.randrange(10**9):09d}"
+        for _ in range(count)
+    ]
+
+
+class PrefixDict:
+    """Baseline: one dict of every prefix, probed from the longest length down."""
+
+    def __init__(self, rates: list, default, normalize):
+        self.rates = {rate.prefix: rate for rate in rates}
+        self.lengths = sorted({len(prefix) for prefix in self.rates}, reverse=True)
+        self.default = default
+        self.normalize = normalize
+
+    def lookup(self, number: str):
+        number = self.normalize(number)
+        for length in self.lengths:
+            rate = self.rates.get(number[:length])
+            if rate is not None:
+                return rate
+        return self.default
+
+
+def _time(lookup, numbers: list[str]) -> float:
+    started = time.perf_counter()
+    for number in numbers:
+        lookup(number)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    options = _parse_arguments()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmsHub.settings")
+    import django
+
+    django.setup()
+    from billing.tariffs import TariffTable, _rate
+
+    rng = random.Random(options.seed)
+    rates = _build_rates(options.prefixes, rng)
+    default = _rate("", "", "", 1000, 1.5)
+
+    started = time.perf_counter()
+    table = TariffTable(rates, default, "98")
+    build_seconds = time.perf_counter() - started
+    baseline = PrefixDict(rates, default, table.normalize)
+    numbers = _random_numbers(options.numbers, rng)
+
+    mismatches = sum(
+        table.lookup(number) is not baseline.lookup(number) for number in numbers[:10000]
+    )
+    if mismatches:
+        raise SystemExit(f"Trie and baseline disagree on {mismatches} numbers")
+
+    print(f"{len(rates)} tariffs, trie built in {build_seconds * 1000:.1f} ms")
+    print(f"{'lookup':<16}{'total s':>10}{'ns/lookup':>12}{'lookups/s':>14}")
+    for name, lookup in (
+        ("trie", table.lookup),
+        ("trie price()", table.price),
+        ("prefix dict", baseline.lookup),
+    ):
+        seconds = _time(lookup, numbers)
+        print(
+            f"{name:<16}{seconds:>10.3f}{seconds / len(numbers) * 1e9:>12.0f}"
+            f"{len(numbers) / seconds:>14,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from account.models import User
+from benchmarks.fake_magfa import FakeMagfaServer, FakeMagfaState
+from benchmarks.load import QUERY_COUNT_HEADER, Sample, percentile, summarize
+from sms.sms_provider_clients.magfa import MagfaProvider
+
+
+class FakeMagfaServerTestCase(SimpleTestCase):
+    def start_server(self, **options) -> MagfaProvider:
+        server = FakeMagfaServer(("127.0.0.1", 0), FakeMagfaState(**options))
+        server.start_in_background()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = MagfaProvider(
+            "user",
+            "pass",
+            "domain",
+            endpoint=server.endpoint,
+            http_options={"MAX_RETRIES": 0},
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def test_send_statuses_and_mid(self):
+        """Test the fake server answers the calls MagfaProvider makes"""
+        client = self.start_server(first_message_id=500)
+
+        response = client.send_multiple_sms(
+            "3000100", ["09120000000", "09120000001"], ["a", "b"], [7, 8]
+        )
+
+        self.assertEqual(response["status"], 0)
+        self.assertEqual([message["id"] for message in response["messages"]], [500, 501])
+        self.assertEqual([message["userId"] for message in response["messages"]], [7, 8])
+        self.assertEqual(client.get_message_by_uid(8), {"status": 0, "mid": 501})
+        dlrs = client.get_statuses([500, 501])["dlrs"]
+        self.assertEqual([(dlr["mid"], dlr["status"]) for dlr in dlrs], [(500, 1), (501, 1)])
+
+    def test_error_rate(self):
+        """Test failing requests come back as HTTP errors the client reports"""
+        client = self.start_server(error_rate=1)
+
+        response = client.send_sms("3000100", "09120000000", "a", 1)
+
+        self.assertEqual(response["status"], -99)
+
+
+class LoadStatsTestCase(SimpleTestCase):
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize(self):
+        """Test only 2xx responses count towards throughput"""
+        samples = [Sample(0.010, 200, 3), Sample(0.020, 200, 5), Sample(0.5, 500, None)]
+
+        summary = summarize(samples, elapsed=2)
+
+        self.assertEqual(summary["ok"], 2)
+        self.assertEqual(summary["status_codes"], {"200": 2, "500": 1})
+        self.assertEqual(summary["throughput_per_second"], 1)
+        self.assertEqual(summary["latency_ms"]["p50"], 20)
+        self.assertEqual(summary["queries_per_request"], {"mean": 4, "max": 5})
+
+
+class QueryCountMiddlewareTestCase(TestCase):
+    @override_settings(
+        MIDDLEWARE=["benchmarks.middleware.QueryCountMiddleware"],
+    )
+    def test_query_count_header(self):
+        """Test each response reports the number of queries it ran"""
+        user = User.objects.create_user(username="testuser", password="testpass123")
+
+        response = self.client.get(reverse("sms:sms_report"), {"user_id": user.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response[QUERY_COUNT_HEADER]), 0)
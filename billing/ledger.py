@@ -0,0 +1,325 @@
+"""
+Fast ledger: SMS deductions are reserved in Redis and written to Postgres in batches.
+
+Invariant kept for every user while the mode is enabled:
+
+    user_balance:{id} == User.balance + sum(BalanceShard.balance) + ledger_pending:{id}
+
+The reservation script moves the cached balance and the pending counter together and appends
+a journal entry in the same atomic step. The flusher writes journal entries as
+``Transaction`` rows (idempotent on ``ledger_entry_id``) and only then releases them from the
+pending counter, so a crash at any point leaves the entries in Redis to be replayed.
+Charges and refunds commit to Postgres first; the cached balance is then recomputed from
+Postgres under the flush lock, never incremented, so a key seeded in between is not credited
+twice.
+"""
+
+import json
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from redis.exceptions import WatchError
+
+from account.models import User
+from billing.exceptions import InsufficientFundsError
+from billing.models import Transaction, TransactionType
+from billing.services import (
+    _get_balance_key,
+    _with_total_balance,
+    get_total_balance,
+    redis_conn,
+)
+from sms.models import SMS
+
+PENDING_KEY_TEMPLATE = "ledger_pending:{user_id}"
+JOURNAL_KEY = "ledger:journal"
+PROCESSING_KEY = "ledger:processing"
+FLUSH_LOCK_KEY = "ledger:flush_lock"
+
+_NOT_LOADED = -1
+_INSUFFICIENT = 0
+_APPLIED = 1
+
+_reserve_script = redis_conn.register_script(
+    """
+    local balance = redis.call('GET', KEYS[1])
+    if not balance then
+        return {-1, 0}
+    end
+    balance = tonumber(balance)
+    local amount = tonumber(ARGV[1])
+    if balance < amount then
+        return {0, balance}
+    end
+    local new_balance = redis.call('DECRBY', KEYS[1], amount)
+    redis.call('DECRBY', KEYS[2], amount)
+    for i = 2, #ARGV do
+        redis.call('RPUSH', KEYS[3], ARGV[i])
+    end
+    return {1, new_balance}
+    """
+)
+
+_credit_script = redis_conn.register_script(
+    """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('INCRBY', KEYS[1], ARGV[1])
+    end
+    if KEYS[2] then
+        redis.call('INCRBY', KEYS[2], ARGV[1])
+    end
+    return 1
+    """
+)
+
+_claim_script = redis_conn.register_script(
+    """
+    if redis.call('LLEN', KEYS[2]) == 0 then
+        local entries = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+        for i = 1, #entries do
+            redis.call('RPUSH', KEYS[2], entries[i])
+        end
+        if #entries > 0 then
+            redis.call('LTRIM', KEYS[1], #entries, -1)
+        end
+    end
+    return redis.call('LRANGE', KEYS[2], 0, -1)
+    """
+)
+
+
+def _get_pending_key(user_id: int) -> str:
+    return PENDING_KEY_TEMPLATE.format(user_id=user_id)
+
+
+def _flush_lock():
+    return redis_conn.lock(
+        FLUSH_LOCK_KEY,
+        timeout=settings.BILLING_FAST_LEDGER_LOCK_TIMEOUT,
+        blocking_timeout=settings.BILLING_FAST_LEDGER_LOCK_TIMEOUT,
+    )
+
+
+def _make_entry(user_id: int, sms_id: int, amount: int) -> str:
+    return json.dumps(
+        {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "sms_id": sms_id,
+            "amount": amount,
+            "ts": time.time(),
+        }
+    )
+
+
+def load_balance(user_id: int) -> int:
+    """Seed ``user_balance:{id}`` from Postgres plus the deductions not flushed yet."""
+    with _flush_lock():
+        balance = get_total_balance(user_id)
+        pending = int(redis_conn.get(_get_pending_key(user_id)) or 0)
+        redis_conn.set(_get_balance_key(user_id), balance + pending, nx=True)
+    return int(redis_conn.get(_get_balance_key(user_id)))
+
+
+def reserve_balance(user_id: int, items: list[tuple[int, int]]) -> int:
+    """Atomically deduct ``sum(amount)`` for ``(sms_id, amount)`` items and journal them."""
+    total_amount = sum(amount for _, amount in items)
+    if total_amount <= 0:
+        raise ValueError("Amount must be positive")
+
+    entries = [_make_entry(user_id, sms_id, amount) for sms_id, amount in items]
+    keys = [_get_balance_key(user_id), _get_pending_key(user_id), JOURNAL_KEY]
+    result, balance = _reserve_script(keys=keys, args=[total_amount, *entries])
+    if result == _NOT_LOADED:
+        load_balance(user_id)
+        result, balance = _reserve_script(keys=keys, args=[total_amount, *entries])
+    if result != _APPLIED:
+        raise InsufficientFundsError("Insufficient funds for this SMS.")
+    return balance
+
+
+def _resync_cached_balance(user_id: int) -> None:
+    """Reset a loaded cached balance to Postgres plus the pending deductions.
+
+    The caller holds the flush lock, so the pending counter only moves with reservations,
+    which WATCH catches.
+    """
+    balance_key = _get_balance_key(user_id)
+    pending_key = _get_pending_key(user_id)
+    with redis_conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(balance_key, pending_key)
+                cached, pending = pipe.mget(balance_key, pending_key)
+                if cached is None:
+                    pipe.unwatch()
+                    return
+                expected = get_total_balance(user_id) + int(pending or 0)
+                pipe.multi()
+                pipe.set(balance_key, expected)
+                pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+def sync_cached_balances(user_ids) -> None:
+    """Apply balance changes already committed to Postgres to the loaded cached balances.
+
+    The total is read again rather than the change added, as ``load_balance`` may have seeded
+    the key after the commit from a total that already includes it.
+    """
+    with _flush_lock():
+        for user_id in user_ids:
+            _resync_cached_balance(user_id)
+
+
+def _apply_entries(entries: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Write journal entries to Postgres; return ``(flushed, orphans)``.
+
+    Orphans are entries whose SMS row does not exist, either because the request that
+    reserved them has not committed yet or because it rolled back.
+    """
+    sms_ids = {entry["sms_id"] for entry in entries}
+    existing_sms_ids = set(SMS.objects.filter(id__in=sms_ids).values_list("id", flat=True))
+    flushed = [entry for entry in entries if entry["sms_id"] in existing_sms_ids]
+    orphans = [entry for entry in entries if entry["sms_id"] not in existing_sms_ids]
+
+    with transaction.atomic():
+        already_written = {
+            entry_id.hex
+            for entry_id in Transaction.objects.filter(
+                ledger_entry_id__in=[entry["id"] for entry in flushed]
+            ).values_list("ledger_entry_id", flat=True)
+        }
+        new_entries = [entry for entry in flushed if entry["id"] not in already_written]
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user_id=entry["user_id"],
+                    amount=-entry["amount"],
+                    type=TransactionType.SMS_DEDUCTION,
+                    sms_id=entry["sms_id"],
+                    ledger_entry_id=entry["id"],
+                )
+                for entry in new_entries
+            ]
+        )
+        deltas = defaultdict(int)
+        for entry in new_entries:
+            deltas[entry["user_id"]] -= entry["amount"]
+        for user_id, amount_delta in deltas.items():
+            User.objects.filter(id=user_id).update(balance=F("balance") + amount_delta)
+
+    return flushed, orphans
+
+
+def flush_journal(batch_size: int | None = None) -> int:
+    """Move one batch of journal entries to Postgres. Returns the number of entries written."""
+    batch_size = batch_size or settings.BILLING_FAST_LEDGER_FLUSH_BATCH_SIZE
+    with _flush_lock():
+        raw_entries = _claim_script(keys=[JOURNAL_KEY, PROCESSING_KEY], args=[batch_size])
+        if not raw_entries:
+            return 0
+        entries = [json.loads(raw_entry) for raw_entry in raw_entries]
+        flushed, orphans = _apply_entries(entries)
+
+        expired_before = time.time() - settings.BILLING_FAST_LEDGER_ORPHAN_GRACE_SECONDS
+        pipe = redis_conn.pipeline(transaction=True)
+        for entry in flushed:
+            pipe.incrby(_get_pending_key(entry["user_id"]), entry["amount"])
+        for entry in orphans:
+            if entry["ts"] < expired_before:
+                # The reserving request never committed: give the money back
+                _credit_script(
+                    keys=[_get_balance_key(entry["user_id"]), _get_pending_key(entry["user_id"])],
+                    args=[entry["amount"]],
+                    client=pipe,
+                )
+            else:
+                pipe.rpush(JOURNAL_KEY, json.dumps(entry))
+        pipe.delete(PROCESSING_KEY)
+        pipe.execute()
+    return len(flushed)
+
+
+def reconcile_balances(user_ids=None, repair: bool = False) -> list[dict]:
+    """Compare cached balances with the Postgres balance plus pending deductions.
+
+    Returns one item per drifted user. With ``repair`` the cached balance is reset to the
+    expected value, guarded with WATCH so concurrent reservations are never overwritten.
+    """
+    queryset = _with_total_balance(User.objects.order_by("id"))
+    if user_ids is not None:
+        queryset = queryset.filter(id__in=user_ids)
+
+    drifts = []
+    with _flush_lock():
+        for user_id, db_balance in queryset.values_list("id", "total_balance").iterator():
+            balance_key = _get_balance_key(user_id)
+            pending_key = _get_pending_key(user_id)
+            with redis_conn.pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(balance_key, pending_key)
+                        cached, pending = pipe.mget(balance_key, pending_key)
+                        if cached is None:
+                            pipe.unwatch()
+                            break
+                        if int(cached) != db_balance + int(pending or 0):
+                            # A charge or refund may have committed since the bulk read
+                            db_balance = get_total_balance(user_id)
+                        expected = db_balance + int(pending or 0)
+                        if int(cached) == expected:
+                            pipe.unwatch()
+                            break
+                        drifts.append(
+                            {"user_id": user_id, "expected": expected, "cached": int(cached)}
+                        )
+                        if repair:
+                            pipe.multi()
+                            pipe.set(balance_key, expected)
+                            pipe.execute()
+                        else:
+                            pipe.unwatch()
+                        break
+                    except WatchError:
+                        continue
+    return drifts
+
+
+def recover_unbilled_sms(since) -> int:
+    """Post deductions for SMS created after ``since`` whose journal entry was lost.
+
+    Meant to run after a Redis failure that dropped unflushed journal entries: every SMS
+    without a deduction transaction and without a pending entry is charged in Postgres.
+    """
+    recovered = 0
+    with _flush_lock():
+        pending_sms_ids = {
+            json.loads(raw_entry)["sms_id"]
+            for key in (JOURNAL_KEY, PROCESSING_KEY)
+            for raw_entry in redis_conn.lrange(key, 0, -1)
+        }
+        unbilled = (
+            SMS.objects.filter(created_at__gte=since)
+            .exclude(transactions__type=TransactionType.SMS_DEDUCTION)
+            .exclude(id__in=pending_sms_ids)
+            .values_list("id", "user_id", "cost")
+        )
+        for sms_id, user_id, cost in unbilled.iterator():
+            with transaction.atomic():
+                Transaction.objects.create(
+                    user_id=user_id,
+                    amount=-cost,
+                    type=TransactionType.SMS_DEDUCTION,
+                    sms_id=sms_id,
+                )
+                User.objects.filter(id=user_id).update(balance=F("balance") - cost)
+            _resync_cached_balance(user_id)
+            recovered += 1
+    return recovered
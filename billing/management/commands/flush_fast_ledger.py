@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from billing.ledger import flush_journal
+
+
+class Command(BaseCommand):
+    help = "Write fast ledger journal entries from Redis to Postgres in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep flushing until the process is stopped."
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_journal(options["batch_size"])
+            while flushed:
+                self.stdout.write(f"Flushed {flushed} ledger entries")
+                flushed = flush_journal(options["batch_size"])
+            if not options["loop"]:
+                return
+            time.sleep(settings.BILLING_FAST_LEDGER_FLUSH_INTERVAL)
@@ -0,0 +1,31 @@
+import csv
+from decimal import InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.tariffs import import_tariffs
+
+
+class Command(BaseCommand):
+    help = (
+        "Load SMS tariffs from a CSV file with prefix, operator, country, price and "
+        "express_multiplier columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--replace", action="store_true", help="Remove tariffs whose prefix is not in the file."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], newline="") as file:
+                count = import_tariffs(list(csv.DictReader(file)), replace=options["replace"])
+        except OSError as e:
+            raise CommandError(str(e)) from e
+        except KeyError as e:
+            raise CommandError(f"Missing column {e}") from e
+        except (ValueError, InvalidOperation) as e:
+            raise CommandError(f"Invalid row: {e}") from e
+        self.stdout.write(self.style.SUCCESS(f"Imported {count} tariffs"))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from billing.ledger import reconcile_balances, recover_unbilled_sms
+
+
+class Command(BaseCommand):
+    help = "Check cached balances against Postgres plus pending fast ledger deductions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user-id", type=int, action="append", dest="user_ids")
+        parser.add_argument("--repair", action="store_true", help="Reset drifted cached balances.")
+        parser.add_argument(
+            "--recover-hours",
+            type=int,
+            default=None,
+            help="Charge SMS of the last N hours whose journal entry was lost (after a Redis failure).",
+        )
+
+    def handle(self, *args, **options):
+        if options["recover_hours"] is not None:
+            since = now() - timedelta(hours=options["recover_hours"])
+            recovered = recover_unbilled_sms(since)
+            self.stdout.write(f"Recovered {recovered} unbilled SMS")
+
+        drifts = reconcile_balances(options["user_ids"], repair=options["repair"])
+        for drift in drifts:
+            self.stdout.write(
+                f"user {drift['user_id']}: cached={drift['cached']} expected={drift['expected']}"
+            )
+        if drifts and not options["repair"]:
+            self.stderr.write(self.style.ERROR(f"{len(drifts)} balances drifted"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Ledger reconciled"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import User
+from billing.services import set_balance_shard_count
+
+
+class Command(BaseCommand):
+    help = "Split a user's balance over N shard rows (N >= 2), or merge it back with 0."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", type=int)
+        parser.add_argument("shard_count", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options["user_id"])
+            set_balance_shard_count(user, options["shard_count"])
+        except User.DoesNotExist as e:
+            raise CommandError("User not found") from e
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        self.stdout.write(
+            self.style.SUCCESS(f"User {user.id} now uses {options['shard_count']} balance shards")
+        )
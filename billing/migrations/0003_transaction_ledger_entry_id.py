@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("billing", "0002_transaction_sms"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="ledger_entry_id",
+            field=models.UUIDField(
+                blank=True,
+                editable=False,
+                null=True,
+                unique=True,
+                verbose_name="شناسه ثبت در دفتر سریع",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("billing", "0003_transaction_ledger_entry_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BalanceShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("index", models.PositiveSmallIntegerField(verbose_name="شماره بخش")),
+                ("balance", models.BigIntegerField(default=0, verbose_name="موجودی")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balance_shards",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="کاربر",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "بخش موجودی",
+                "verbose_name_plural": "بخش\u200cهای موجودی",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "index"), name="unique_balance_shard_index"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("billing", "0004_balanceshard"),
+        ("sms", "0004_alter_sms_message_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="sms",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transactions",
+                to="sms.sms",
+                verbose_name="پیامک",
+            ),
+        ),
+    ]
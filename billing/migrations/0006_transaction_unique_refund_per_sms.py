@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("billing", "0005_alter_transaction_sms"),
+        ("sms", "0005_partition_sms"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="transaction",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("type", "refund")),
+                fields=("sms",),
+                name="unique_refund_per_sms",
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:22
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("billing", "0006_transaction_unique_refund_per_sms"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tariff",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "prefix",
+                    models.CharField(max_length=16, unique=True, verbose_name="پیش\u200cشماره"),
+                ),
+                ("operator", models.CharField(blank=True, max_length=32, verbose_name="اپراتور")),
+                ("country", models.CharField(max_length=2, verbose_name="کشور")),
+                ("price", models.BigIntegerField(verbose_name="قیمت هر بخش")),
+                (
+                    "express_multiplier",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("1.5"),
+                        max_digits=4,
+                        verbose_name="ضریب اکسپرس",
+                    ),
+                ),
+                (
+                    "modified_at",
+                    models.DateTimeField(auto_now=True, verbose_name="تاریخ آخرین تغییر"),
+                ),
+            ],
+            options={
+                "verbose_name": "تعرفه",
+                "verbose_name_plural": "تعرفه\u200cها",
+                "ordering": ["prefix"],
+            },
+        ),
+    ]
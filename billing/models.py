@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
@@ -28,6 +30,11 @@ class Transaction(models.Model):
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
+        # PostgreSQL cannot reference the partitioned SMS table by id alone
+        db_constraint=False,
+    )
+    ledger_entry_id = models.UUIDField(
+        verbose_name="شناسه ثبت در دفتر سریع", unique=True, null=True, blank=True, editable=False
     )
 
     class Meta:
@@ -38,6 +45,51 @@ class Transaction(models.Model):
             models.Index(fields=["user", "type"]),
             models.Index(fields=["created_at"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["sms"],
+                condition=models.Q(type=TransactionType.REFUND),
+                name="unique_refund_per_sms",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.get_type_display()} - {self.amount}"
+
+
+class BalanceShard(models.Model):
+    user = models.ForeignKey(
+        User, verbose_name="کاربر", on_delete=models.CASCADE, related_name="balance_shards"
+    )
+    index = models.PositiveSmallIntegerField(verbose_name="شماره بخش")
+    balance = models.BigIntegerField(verbose_name="موجودی", default=0)
+
+    class Meta:
+        verbose_name = "بخش موجودی"
+        verbose_name_plural = "بخش‌های موجودی"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "index"], name="unique_balance_shard_index"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.index} - {self.balance}"
+
+
+class Tariff(models.Model):
+    # International digits without "+", e.g. 98912 for MCI numbers; the longest match wins
+    prefix = models.CharField(verbose_name="پیش‌شماره", max_length=16, unique=True)
+    operator = models.CharField(verbose_name="اپراتور", max_length=32, blank=True)
+    country = models.CharField(verbose_name="کشور", max_length=2)
+    price = models.BigIntegerField(verbose_name="قیمت هر بخش")
+    express_multiplier = models.DecimalField(
+        verbose_name="ضریب اکسپرس", max_digits=4, decimal_places=2, default=Decimal("1.5")
+    )
+    modified_at = models.DateTimeField(verbose_name="تاریخ آخرین تغییر", auto_now=True)
+
+    class Meta:
+        ordering = ["prefix"]
+        verbose_name = "تعرفه"
+        verbose_name_plural = "تعرفه‌ها"
+
+    def __str__(self):
+        return f"{self.prefix} - {self.operator or self.country} - {self.price}"
@@ -1,10 +1,16 @@
+import random
+from collections import defaultdict
+
+from django.conf import settings
 from django.db import transaction
-from django.db.models import F
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django_redis import get_redis_connection
 
+from account.cache import invalidate_user
 from account.models import User
 from billing.exceptions import InsufficientFundsError
-from billing.models import Transaction, TransactionType
+from billing.models import BalanceShard, Transaction, TransactionType
 from sms.models import SMS
 
 redis_conn = get_redis_connection("default")
@@ -20,7 +26,105 @@ def _update_balance_cache(user_id: int, balance: int) -> None:
     redis_conn.set(key, balance)
 
 
+def _invalidate_balance_cache(user_id: int) -> None:
+    redis_conn.delete(_get_balance_key(user_id))
+
+
+def _sync_balance_cache(user: User) -> None:
+    if settings.BILLING_FAST_LEDGER_ENABLED:
+        # The cached balance is the source of truth in fast ledger mode, so bring it up to date
+        from billing.ledger import sync_cached_balances
+
+        sync_cached_balances([user.id])
+    elif user.balance_shard_count:
+        _invalidate_balance_cache(user.id)
+    else:
+        _update_balance_cache(user.id, user.balance)
+
+
+def _with_total_balance(queryset):
+    return queryset.annotate(
+        total_balance=F("balance") + Coalesce(Sum("balance_shards__balance"), 0)
+    )
+
+
+def get_total_balance(user_id: int) -> int:
+    return (
+        _with_total_balance(User.objects.filter(id=user_id))
+        .values_list("total_balance", flat=True)
+        .get()
+    )
+
+
+def _rebalance_shards(user: User, amount: int, error_message: str) -> BalanceShard | None:
+    user_to_check = User.objects.select_for_update().get(id=user.id)
+    shards = list(
+        BalanceShard.objects.select_for_update().filter(user_id=user.id).order_by("index")
+    )
+    if not shards:
+        return None
+
+    total_balance = user_to_check.balance + sum(shard.balance for shard in shards)
+    if total_balance < amount:
+        raise InsufficientFundsError(error_message)
+
+    share, remainder = divmod(total_balance, len(shards))
+    if share >= amount:
+        for shard in shards:
+            shard.balance = share
+        shards[0].balance += remainder
+        target = random.choice(shards)
+    else:
+        # Funds are too fragmented for an even split, so gather them on one shard
+        for shard in shards:
+            shard.balance = 0
+        target = shards[0]
+        target.balance = total_balance
+    BalanceShard.objects.bulk_update(shards, ["balance"])
+    if user_to_check.balance:
+        User.objects.filter(id=user.id).update(balance=F("balance") - user_to_check.balance)
+    return target
+
+
+def _withdraw_from_shards(user: User, amount: int, error_message: str) -> bool:
+    funded_shards = BalanceShard.objects.filter(user_id=user.id, balance__gte=amount).order_by("?")
+    shard = funded_shards.select_for_update(skip_locked=True).first()
+    if shard is None:
+        shard = funded_shards.select_for_update().first()
+    if shard is None:
+        shard = _rebalance_shards(user, amount, error_message)
+    if shard is None:
+        return False
+    BalanceShard.objects.filter(id=shard.id).update(balance=F("balance") - amount)
+    return True
+
+
+def _deposit_to_shards(user: User, amount: int) -> bool:
+    shards = BalanceShard.objects.filter(user_id=user.id).order_by("balance")
+    shard = shards.select_for_update(skip_locked=True).first() or shards.first()
+    if shard is None:
+        return False
+    BalanceShard.objects.filter(id=shard.id).update(balance=F("balance") + amount)
+    return True
+
+
+def _withdraw_user_balance(user: User, amount: int, error_message: str) -> User:
+    if user.balance_shard_count and _withdraw_from_shards(user, amount, error_message):
+        return user
+
+    user_to_check = User.objects.select_for_update().get(id=user.id)
+    if user_to_check.balance < amount:
+        raise InsufficientFundsError(error_message)
+    user_to_check.balance = F("balance") - amount
+    user_to_check.save(update_fields=["balance"])
+    user_to_check.refresh_from_db(fields=["balance"])
+    return user_to_check
+
+
 def _update_user_balance(user: User, amount_delta: int) -> User:
+    if user.balance_shard_count and _deposit_to_shards(user, amount_delta):
+        return user
+
     user_to_update = User.objects.select_for_update().get(id=user.id)
     user_to_update.balance = F("balance") + amount_delta
     user_to_update.save(update_fields=["balance"])
@@ -50,7 +154,7 @@ def create_charge_transaction(user: User, amount: int) -> Transaction:
     user_updated = _update_user_balance(user, amount)
     tx = create_transaction(user_updated, amount, TransactionType.CHARGE)
 
-    transaction.on_commit(lambda: _update_balance_cache(user_updated.id, user_updated.balance))
+    transaction.on_commit(lambda: _sync_balance_cache(user_updated))
     return tx
 
 
@@ -62,7 +166,7 @@ def create_refund_transaction(user: User, amount: int, sms: SMS) -> Transaction:
     user_updated = _update_user_balance(user, amount)
     tx = create_transaction(user_updated, amount, TransactionType.REFUND, sms)
 
-    transaction.on_commit(lambda: _update_balance_cache(user_updated.id, user_updated.balance))
+    transaction.on_commit(lambda: _sync_balance_cache(user_updated))
     return tx
 
 
@@ -71,18 +175,96 @@ def create_deduct_transaction(user: User, amount: int) -> Transaction:
     if amount <= 0:
         raise ValueError("Amount must be positive")
 
-    user_to_check = User.objects.select_for_update().get(id=user.id)
-    if user_to_check.balance < amount:
-        raise InsufficientFundsError("Insufficient funds for this SMS.")
-    user_to_check.balance = F("balance") - amount
-    user_to_check.save(update_fields=["balance"])
-    user_to_check.refresh_from_db(fields=["balance"])
+    user_to_check = _withdraw_user_balance(user, amount, "Insufficient funds for this SMS.")
     tx = create_transaction(user_to_check, -amount, TransactionType.SMS_DEDUCTION)
 
-    transaction.on_commit(lambda: _update_balance_cache(user_to_check.id, user_to_check.balance))
+    transaction.on_commit(lambda: _sync_balance_cache(user_to_check))
     return tx
 
 
+@transaction.atomic
+def create_bulk_deduct_transactions(user: User, sms_list: list[SMS]) -> list[Transaction]:
+    total_amount = sum(sms.cost for sms in sms_list)
+    if total_amount <= 0:
+        raise ValueError("Amount must be positive")
+
+    user_to_check = _withdraw_user_balance(user, total_amount, "Insufficient funds for these SMS.")
+    transactions = Transaction.objects.bulk_create(
+        [
+            Transaction(
+                user=user_to_check,
+                amount=-sms.cost,
+                type=TransactionType.SMS_DEDUCTION,
+                sms=sms,
+            )
+            for sms in sms_list
+        ]
+    )
+
+    transaction.on_commit(lambda: _sync_balance_cache(user_to_check))
+    return transactions
+
+
+def _sync_balance_caches(users: list[User]) -> None:
+    """Apply ``_sync_balance_cache`` to every user in ``users`` at once."""
+    if settings.BILLING_FAST_LEDGER_ENABLED:
+        from billing.ledger import sync_cached_balances
+
+        sync_cached_balances([user.id for user in users])
+        return
+
+    pipe = redis_conn.pipeline(transaction=False)
+    for user in users:
+        if user.balance_shard_count:
+            pipe.delete(_get_balance_key(user.id))
+        else:
+            pipe.set(_get_balance_key(user.id), user.balance)
+    pipe.execute()
+
+
+@transaction.atomic
+def create_bulk_refund_transactions(items: list[tuple[SMS, int]]) -> list[Transaction]:
+    """Refund ``(sms, amount)`` pairs with one balance update per user.
+
+    SMS that already have a refund are skipped, so retrying a batch never refunds twice.
+    """
+    if any(amount <= 0 for _, amount in items):
+        raise ValueError("Amount must be positive")
+
+    amounts = {sms.id: (sms, amount) for sms, amount in items}
+    user_ids = sorted({sms.user_id for sms, _ in amounts.values()})
+    # Locking the users first serializes concurrent refunds of the same SMS
+    users = {user.id: user for user in User.objects.select_for_update().filter(id__in=user_ids)}
+    refunded_sms_ids = set(
+        Transaction.objects.filter(type=TransactionType.REFUND, sms_id__in=amounts).values_list(
+            "sms_id", flat=True
+        )
+    )
+    new_items = [item for sms_id, item in amounts.items() if sms_id not in refunded_sms_ids]
+    if not new_items:
+        return []
+
+    transactions = Transaction.objects.bulk_create(
+        [
+            Transaction(user_id=sms.user_id, amount=amount, type=TransactionType.REFUND, sms=sms)
+            for sms, amount in new_items
+        ]
+    )
+    deltas = defaultdict(int)
+    for sms, amount in new_items:
+        deltas[sms.user_id] += amount
+    for user_id, amount_delta in deltas.items():
+        user = users[user_id]
+        if not (user.balance_shard_count and _deposit_to_shards(user, amount_delta)):
+            User.objects.filter(id=user_id).update(balance=F("balance") + amount_delta)
+
+    for user_id, balance in User.objects.filter(id__in=deltas).values_list("id", "balance"):
+        users[user_id].balance = balance
+    refunded_users = [users[user_id] for user_id in deltas]
+    transaction.on_commit(lambda: _sync_balance_caches(refunded_users))
+    return transactions
+
+
 def update_transaction_sms_field(tx: Transaction, sms: SMS) -> Transaction:
     tx.sms = sms
     tx.save(update_fields=["sms"])
@@ -94,8 +276,38 @@ def get_user_balance(user: User) -> int:
     balance = redis_conn.get(key)
 
     if balance is None:
-        user.refresh_from_db(fields=["balance"])
-        balance = user.balance
+        if settings.BILLING_FAST_LEDGER_ENABLED:
+            from billing.ledger import load_balance
+
+            return load_balance(user.id)
+        if user.balance_shard_count:
+            balance = get_total_balance(user.id)
+        else:
+            user.refresh_from_db(fields=["balance"])
+            balance = user.balance
         redis_conn.set(key, balance)
 
     return balance
+
+
+@transaction.atomic
+def set_balance_shard_count(user: User, shard_count: int) -> None:
+    """Spread the balance of ``user`` over ``shard_count`` shard rows, or merge it back with 0."""
+    if shard_count == 1 or shard_count < 0:
+        raise ValueError("Shard count must be 0 or at least 2")
+
+    user_to_update = User.objects.select_for_update().get(id=user.id)
+    shards = BalanceShard.objects.select_for_update().filter(user_id=user.id)
+    total_balance = user_to_update.balance + sum(shard.balance for shard in shards)
+    shards.delete()
+
+    share, remainder = divmod(total_balance, shard_count) if shard_count else (0, total_balance)
+    BalanceShard.objects.bulk_create(
+        [BalanceShard(user_id=user.id, index=index, balance=share) for index in range(shard_count)]
+    )
+    User.objects.filter(id=user.id).update(balance=remainder, balance_shard_count=shard_count)
+    user.balance_shard_count = shard_count
+
+    transaction.on_commit(lambda: _invalidate_balance_cache(user.id))
+    # The update above sends no post_save, and the send path caches the shard count
+    invalidate_user(user.id)
@@ -0,0 +1,191 @@
+"""
+Per-destination SMS prices, looked up in an in-memory prefix trie.
+
+Every process holds the whole ``Tariff`` table as a trie of digits and prices a receiver by
+its longest matching prefix in a handful of dict lookups, without touching the database.
+Changes to the table bump ``tariffs:version`` in Redis after commit; a process compares its
+version at most every ``REFRESH_SECONDS`` and swaps in a freshly built table when it differs,
+so a lookup always sees one complete table. Receivers without a matching prefix pay the
+default price.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from billing.models import Tariff
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+VERSION_KEY = "tariffs:version"
+# Key of the rate in a trie node; digits are the other keys
+_RATE = ""
+
+
+@dataclass(frozen=True, slots=True)
+class Rate:
+    prefix: str
+    operator: str
+    country: str
+    # Per segment, in Rial
+    price: int
+    express_price: int
+
+
+def _rate(prefix, operator, country, price, express_multiplier) -> Rate:
+    return Rate(
+        prefix=prefix,
+        operator=operator,
+        country=country,
+        price=price,
+        express_price=int((price * Decimal(str(express_multiplier))).to_integral_value()),
+    )
+
+
+class TariffTable:
+    def __init__(self, rates: list[Rate], default: Rate, country_code: str):
+        self.default = default
+        self.country_code = country_code
+        self.size = len(rates)
+        self._root = {}
+        for rate in rates:
+            node = self._root
+            for digit in rate.prefix:
+                node = node.setdefault(digit, {})
+            node[_RATE] = rate
+
+    def normalize(self, number: str) -> str:
+        """International digits of a receiver: 0912..., +98912... and 0098912... give 98912..."""
+        if number.startswith("+"):
+            return number[1:]
+        if number.startswith("00"):
+            return number[2:]
+        if number.startswith("0"):
+            return self.country_code + number[1:]
+        return number
+
+    def lookup(self, number: str) -> Rate:
+        node = self._root
+        rate = self.default
+        for digit in self.normalize(number):
+            node = node.get(digit)
+            if node is None:
+                break
+            rate = node.get(_RATE, rate)
+        return rate
+
+    def price(self, number: str, is_express: bool = False, segments: int = 1) -> int:
+        rate = self.lookup(number)
+        return (rate.express_price if is_express else rate.price) * segments
+
+
+def load_tariff_table() -> TariffTable:
+    options = settings.SMS_TARIFF
+    rates = [
+        _rate(*row)
+        for row in Tariff.objects.values_list(
+            "prefix", "operator", "country", "price", "express_multiplier"
+        )
+    ]
+    default = _rate("", "", "", options["DEFAULT_PRICE"], options["DEFAULT_EXPRESS_MULTIPLIER"])
+    return TariffTable(rates, default, options["COUNTRY_CODE"])
+
+
+_table: TariffTable | None = None
+_version = None
+_checked_until = 0.0
+_lock = threading.Lock()
+
+
+def get_tariff_table() -> TariffTable:
+    """The table of this process, reloaded when another process changed the tariffs."""
+    global _table, _version, _checked_until
+
+    table = _table
+    if table is not None and time.monotonic() < _checked_until:
+        return table
+    with _lock:
+        if _table is not None and time.monotonic() < _checked_until:
+            return _table
+        try:
+            # Read before the rows, so a change committed meanwhile is loaded again next time
+            version = redis_conn.get(VERSION_KEY)
+        except RedisError:
+            logger.warning("Tariff version check skipped", exc_info=True)
+            version = _version
+        if _table is None or version != _version:
+            _table = load_tariff_table()
+            _version = version
+            logger.info("Loaded %s tariffs (version %s)", _table.size, version)
+        _checked_until = time.monotonic() + settings.SMS_TARIFF["REFRESH_SECONDS"]
+        return _table
+
+
+def reset_tariff_table() -> None:
+    global _table, _version, _checked_until
+
+    with _lock:
+        _table = None
+        _version = None
+        _checked_until = 0.0
+
+
+def publish_tariff_change() -> None:
+    """Make every process reload the tariffs within ``REFRESH_SECONDS``; this one at once."""
+    global _checked_until
+
+    try:
+        redis_conn.incr(VERSION_KEY)
+    except RedisError:
+        logger.warning("Could not publish tariff change", exc_info=True)
+    with _lock:
+        _checked_until = 0.0
+
+
+@receiver(post_save, sender=Tariff)
+@receiver(post_delete, sender=Tariff)
+def tariff_changed(sender, **kwargs):
+    transaction.on_commit(publish_tariff_change)
+
+
+@transaction.atomic
+def import_tariffs(rows: list[dict], replace: bool = False) -> int:
+    """Insert or update tariffs by prefix; ``replace`` also removes prefixes not in ``rows``."""
+    tariffs = {}
+    for row in rows:
+        prefix = row["prefix"].strip().lstrip("+")
+        if not prefix.isdigit():
+            raise ValueError(f"Invalid prefix: {row['prefix']!r}")
+        tariffs[prefix] = Tariff(
+            prefix=prefix,
+            operator=row.get("operator") or "",
+            country=row["country"].strip().upper(),
+            price=int(row["price"]),
+            express_multiplier=Decimal(
+                str(
+                    row.get("express_multiplier")
+                    or settings.SMS_TARIFF["DEFAULT_EXPRESS_MULTIPLIER"]
+                )
+            ),
+        )
+    if replace:
+        Tariff.objects.exclude(prefix__in=list(tariffs)).delete()
+    Tariff.objects.bulk_create(
+        tariffs.values(),
+        update_conflicts=True,
+        unique_fields=["prefix"],
+        update_fields=["operator", "country", "price", "express_multiplier", "modified_at"],
+    )
+    transaction.on_commit(publish_tariff_change)
+    return len(tariffs)
@@ -0,0 +1,225 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+
+from account.models import User
+from billing.exceptions import InsufficientFundsError
+from billing.ledger import (
+    _apply_entries,
+    flush_journal,
+    reconcile_balances,
+    reserve_balance,
+    sync_cached_balances,
+)
+from billing.models import Transaction, TransactionType
+from sms.models import SMS, SMSStatus
+from sms.services import create_sms_and_deduct_balance
+
+
+def _entry(user_id, sms_id, amount, entry_id, ts=None):
+    return {
+        "id": entry_id,
+        "user_id": user_id,
+        "sms_id": sms_id,
+        "amount": amount,
+        "ts": ts if ts is not None else time.time(),
+    }
+
+
+class FastLedgerReserveTestCase(TestCase):
+    @patch("billing.ledger._reserve_script")
+    def test_reserve_balance(self, mock_script):
+        """Test that the reservation script gets the total and one journal entry per SMS"""
+        mock_script.return_value = [1, 7500]
+
+        balance = reserve_balance(7, [(1, 1000), (2, 1500)])
+
+        self.assertEqual(balance, 7500)
+        kwargs = mock_script.call_args.kwargs
+        self.assertEqual(kwargs["keys"], ["user_balance:7", "ledger_pending:7", "ledger:journal"])
+        self.assertEqual(kwargs["args"][0], 2500)
+        entries = [json.loads(raw_entry) for raw_entry in kwargs["args"][1:]]
+        self.assertEqual([(e["sms_id"], e["amount"]) for e in entries], [(1, 1000), (2, 1500)])
+        self.assertTrue(all(e["user_id"] == 7 for e in entries))
+
+    @patch("billing.ledger._reserve_script")
+    def test_reserve_balance_insufficient_funds(self, mock_script):
+        """Test that a rejected reservation raises InsufficientFundsError"""
+        mock_script.return_value = [0, 500]
+
+        with self.assertRaises(InsufficientFundsError):
+            reserve_balance(7, [(1, 1000)])
+
+    @patch("billing.ledger.load_balance")
+    @patch("billing.ledger._reserve_script")
+    def test_reserve_balance_loads_missing_balance(self, mock_script, mock_load_balance):
+        """Test that the balance is seeded from Postgres when it is not cached yet"""
+        mock_script.side_effect = [[-1, 0], [1, 9000]]
+
+        balance = reserve_balance(7, [(1, 1000)])
+
+        self.assertEqual(balance, 9000)
+        mock_load_balance.assert_called_once_with(7)
+        self.assertEqual(mock_script.call_count, 2)
+
+
+class FastLedgerFlushTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 10000
+        self.user.save()
+        self.sms = SMS.objects.create(
+            user=self.user,
+            sender="100002",
+            receiver="09120000001",
+            content="Test message",
+            cost=1000,
+            status=SMSStatus.CREATED,
+        )
+
+    def test_apply_entries(self):
+        """Test that journal entries become deduction transactions and a balance delta"""
+        entries = [_entry(self.user.id, self.sms.id, 1000, "a" * 32)]
+
+        flushed, orphans = _apply_entries(entries)
+
+        self.assertEqual(flushed, entries)
+        self.assertEqual(orphans, [])
+        tx = Transaction.objects.get(sms=self.sms)
+        self.assertEqual(tx.type, TransactionType.SMS_DEDUCTION)
+        self.assertEqual(tx.amount, -1000)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 9000)
+
+    def test_apply_entries_is_idempotent(self):
+        """Test that replaying a batch after a crash does not charge twice"""
+        entries = [_entry(self.user.id, self.sms.id, 1000, "b" * 32)]
+
+        _apply_entries(entries)
+        flushed, _ = _apply_entries(entries)
+
+        self.assertEqual(len(flushed), 1)
+        self.assertEqual(Transaction.objects.filter(sms=self.sms).count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 9000)
+
+    def test_apply_entries_returns_orphans(self):
+        """Test that entries without an SMS row are not written"""
+        entries = [_entry(self.user.id, 99999, 1000, "c" * 32)]
+
+        flushed, orphans = _apply_entries(entries)
+
+        self.assertEqual(flushed, [])
+        self.assertEqual(orphans, entries)
+        self.assertFalse(Transaction.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000)
+
+    @override_settings(BILLING_FAST_LEDGER_ORPHAN_GRACE_SECONDS=60)
+    @patch("billing.ledger._credit_script")
+    @patch("billing.ledger._claim_script")
+    @patch("billing.ledger.redis_conn", new_callable=MagicMock)
+    def test_flush_journal(self, mock_redis, mock_claim, mock_credit):
+        """Test that flushed entries release the pending counter and orphans are handled"""
+        flushed_entry = _entry(self.user.id, self.sms.id, 1000, "d" * 32)
+        young_orphan = _entry(self.user.id, 99998, 1000, "e" * 32)
+        old_orphan = _entry(self.user.id, 99999, 1500, "f" * 32, ts=time.time() - 120)
+        mock_claim.return_value = [
+            json.dumps(entry) for entry in (flushed_entry, young_orphan, old_orphan)
+        ]
+        pipe = mock_redis.pipeline.return_value
+
+        flushed = flush_journal()
+
+        self.assertEqual(flushed, 1)
+        pipe.incrby.assert_called_once_with(f"ledger_pending:{self.user.id}", 1000)
+        pipe.rpush.assert_called_once_with("ledger:journal", json.dumps(young_orphan))
+        mock_credit.assert_called_once_with(
+            keys=[f"user_balance:{self.user.id}", f"ledger_pending:{self.user.id}"],
+            args=[1500],
+            client=pipe,
+        )
+        pipe.delete.assert_called_once_with("ledger:processing")
+        pipe.execute.assert_called_once()
+
+    @patch("billing.ledger._claim_script")
+    @patch("billing.ledger.redis_conn", new_callable=MagicMock)
+    def test_flush_journal_empty(self, mock_redis, mock_claim):
+        """Test flushing an empty journal"""
+        mock_claim.return_value = []
+
+        self.assertEqual(flush_journal(), 0)
+        mock_redis.pipeline.assert_not_called()
+
+
+@patch("billing.ledger.redis_conn", new_callable=MagicMock)
+class FastLedgerCachedBalanceTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 10000
+        self.user.save()
+
+    def test_sync_recomputes_loaded_balance(self, mock_redis):
+        """Test a committed credit resets the cached balance instead of adding to it"""
+        pipe = mock_redis.pipeline.return_value.__enter__.return_value
+        # Seeded by load_balance after the credit committed, so it already includes it
+        pipe.mget.return_value = [b"9000", b"-1000"]
+
+        sync_cached_balances([self.user.id])
+
+        pipe.set.assert_called_once_with(f"user_balance:{self.user.id}", 9000)
+        mock_redis.lock.assert_called_once()
+
+    def test_sync_skips_unloaded_balance(self, mock_redis):
+        """Test a balance that is not cached is left for load_balance to seed"""
+        pipe = mock_redis.pipeline.return_value.__enter__.return_value
+        pipe.mget.return_value = [None, None]
+
+        sync_cached_balances([self.user.id])
+
+        pipe.set.assert_not_called()
+
+    def test_reconcile_rereads_database_after_watch(self, mock_redis):
+        """Test a charge committed after the bulk read is not reported as drift"""
+        pipe = mock_redis.pipeline.return_value.__enter__.return_value
+        pipe.mget.return_value = [b"15000", b"0"]
+
+        def charge_after_read(*keys):
+            User.objects.filter(id=self.user.id).update(balance=15000)
+
+        pipe.watch.side_effect = charge_after_read
+
+        drifts = reconcile_balances([self.user.id], repair=True)
+
+        self.assertEqual(drifts, [])
+        pipe.set.assert_not_called()
+
+
+@override_settings(BILLING_FAST_LEDGER_ENABLED=True)
+class FastLedgerSMSTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 10000
+        self.user.save()
+
+    @patch("sms.services.reserve_balance")
+    def test_create_sms_reserves_balance_in_redis(self, mock_reserve):
+        """Test that fast ledger mode reserves the cost without touching the user row"""
+        sms = create_sms_and_deduct_balance(self.user, "Test", "09120000001")
+
+        mock_reserve.assert_called_once_with(self.user.id, [(sms.id, 1000)])
+        self.assertFalse(Transaction.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000)
+
+    @patch("sms.services.reserve_balance")
+    def test_create_sms_insufficient_funds_rolls_back(self, mock_reserve):
+        """Test that a rejected reservation rolls back the SMS row"""
+        mock_reserve.side_effect = InsufficientFundsError("Insufficient funds for this SMS.")
+
+        with self.assertRaises(InsufficientFundsError):
+            create_sms_and_deduct_balance(self.user, "Test", "09120000001")
+
+        self.assertFalse(SMS.objects.exists())
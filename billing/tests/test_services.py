@@ -4,16 +4,20 @@ from django.test import TestCase, TransactionTestCase
 
 from account.models import User
 from billing.exceptions import InsufficientFundsError
-from billing.models import TransactionType
+from billing.models import BalanceShard, Transaction, TransactionType
 from billing.services import (
     _get_balance_key,
     _update_balance_cache,
     _update_user_balance,
+    create_bulk_deduct_transactions,
+    create_bulk_refund_transactions,
     create_charge_transaction,
     create_deduct_transaction,
     create_refund_transaction,
     create_transaction,
+    get_total_balance,
     get_user_balance,
+    set_balance_shard_count,
     update_transaction_sms_field,
 )
 from sms.models import SMS, SMSStatus
@@ -205,6 +209,50 @@ class BillingServicesTestCase(TestCase):
 
         self.assertIn("Amount must be positive", str(context.exception))
 
+    def test_create_bulk_deduct_transactions(self):
+        """Test deducting the total cost of several SMS in one ledger operation"""
+        sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender="100001",
+                receiver=f"0912000000{i}",
+                content="Test message",
+                cost=cost,
+                status=SMSStatus.CREATED,
+            )
+            for i, cost in enumerate([1000, 1500, 2000])
+        ]
+
+        transactions = create_bulk_deduct_transactions(self.user, sms_list)
+
+        self.assertEqual(len(transactions), 3)
+        self.assertEqual([tx.amount for tx in transactions], [-1000, -1500, -2000])
+        self.assertTrue(all(tx.type == TransactionType.SMS_DEDUCTION for tx in transactions))
+        self.assertEqual([tx.sms for tx in transactions], sms_list)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000 - 4500)
+
+    def test_create_bulk_deduct_transactions_insufficient_funds(self):
+        """Test that bulk deduction is rejected as a whole when the total exceeds the balance"""
+        sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender="100001",
+                receiver="09120000001",
+                content="Test message",
+                cost=6000,
+                status=SMSStatus.CREATED,
+            )
+            for _ in range(2)
+        ]
+
+        with self.assertRaises(InsufficientFundsError):
+            create_bulk_deduct_transactions(self.user, sms_list)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000)
+        self.assertFalse(self.user.transactions.exists())
+
     def test_update_transaction_sms_field(self):
         """Test updating transaction SMS field"""
         tx = create_transaction(
@@ -266,6 +314,181 @@ class BillingServicesTestCase(TestCase):
         mock_redis.set.assert_called_once_with(f"user_balance:{self.user.id}", 30000)
 
 
+class BalanceShardingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 10001
+        self.user.save()
+
+    def _shard_balances(self):
+        return list(
+            BalanceShard.objects.filter(user=self.user)
+            .order_by("index")
+            .values_list("balance", flat=True)
+        )
+
+    def test_set_balance_shard_count(self):
+        """Test that enabling sharding spreads the balance over the shard rows"""
+        set_balance_shard_count(self.user, 4)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance_shard_count, 4)
+        self.assertEqual(self._shard_balances(), [2500, 2500, 2500, 2500])
+        self.assertEqual(self.user.balance, 1)
+        self.assertEqual(get_total_balance(self.user.id), 10001)
+
+    def test_set_balance_shard_count_merges_back(self):
+        """Test that a shard count of 0 moves the whole balance back to the user row"""
+        set_balance_shard_count(self.user, 4)
+        set_balance_shard_count(self.user, 0)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance_shard_count, 0)
+        self.assertEqual(self.user.balance, 10001)
+        self.assertFalse(BalanceShard.objects.filter(user=self.user).exists())
+
+    def test_set_balance_shard_count_invalid(self):
+        """Test that a single shard is rejected"""
+        with self.assertRaises(ValueError):
+            set_balance_shard_count(self.user, 1)
+
+    def test_deduct_from_sharded_balance(self):
+        """Test that a deduction is taken from one shard without touching the user row"""
+        set_balance_shard_count(self.user, 4)
+
+        tx = create_deduct_transaction(self.user, 1000)
+
+        self.assertEqual(tx.amount, -1000)
+        self.assertEqual(sorted(self._shard_balances()), [1500, 2500, 2500, 2500])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 1)
+        self.assertEqual(get_total_balance(self.user.id), 9001)
+
+    def test_deduct_rebalances_dry_shards(self):
+        """Test that shards are rebalanced when no single shard can pay"""
+        set_balance_shard_count(self.user, 4)
+        BalanceShard.objects.filter(user=self.user).update(balance=1000)
+
+        create_deduct_transaction(self.user, 3000)
+
+        self.assertEqual(sorted(self._shard_balances()), [0, 0, 0, 1001])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 0)
+
+    def test_deduct_from_sharded_balance_insufficient_funds(self):
+        """Test that a sharded user cannot spend more than the sum of the shards"""
+        set_balance_shard_count(self.user, 4)
+
+        with self.assertRaises(InsufficientFundsError):
+            create_deduct_transaction(self.user, 10002)
+
+        self.assertEqual(get_total_balance(self.user.id), 10001)
+
+    def test_bulk_deduct_from_sharded_balance(self):
+        """Test that a bulk deduction is charged to the shards"""
+        set_balance_shard_count(self.user, 2)
+        sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender="100001",
+                receiver="09120000001",
+                content="Test message",
+                cost=1000,
+                status=SMSStatus.CREATED,
+            )
+            for _ in range(3)
+        ]
+
+        create_bulk_deduct_transactions(self.user, sms_list)
+
+        self.assertEqual(get_total_balance(self.user.id), 7001)
+
+    def test_charge_sharded_balance(self):
+        """Test that a charge is credited to the poorest shard"""
+        set_balance_shard_count(self.user, 2)
+        BalanceShard.objects.filter(user=self.user, index=1).update(balance=0)
+
+        create_charge_transaction(self.user, 500)
+
+        self.assertEqual(self._shard_balances(), [5000, 500])
+
+    @patch("billing.services.redis_conn")
+    def test_get_user_balance_sums_shards(self, mock_redis):
+        """Test that the balance of a sharded user is the sum of its shards"""
+        mock_redis.get.return_value = None
+        set_balance_shard_count(self.user, 3)
+
+        balance = get_user_balance(self.user)
+
+        self.assertEqual(balance, 10001)
+        mock_redis.set.assert_called_once_with(f"user_balance:{self.user.id}", 10001)
+
+
+class BulkRefundTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.other_user = User.objects.create_user(username="otheruser", password="testpass123")
+        self.sms_list = [
+            SMS.objects.create(
+                user=user,
+                sender="100002",
+                receiver="09120000000",
+                content="Test",
+                cost=1000,
+                status=SMSStatus.FAILED,
+            )
+            for user in (self.user, self.user, self.other_user)
+        ]
+
+    @patch("billing.services.redis_conn")
+    def test_bulk_refund_updates_each_user_once(self, mock_redis):
+        """Test refunds are written in bulk and the cache is synced in one pipeline"""
+        with self.captureOnCommitCallbacks(execute=True):
+            transactions = create_bulk_refund_transactions(
+                [(sms, sms.cost) for sms in self.sms_list]
+            )
+
+        self.assertEqual(len(transactions), 3)
+        self.user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.user.balance, 2000)
+        self.assertEqual(self.other_user.balance, 1000)
+        pipe = mock_redis.pipeline.return_value
+        pipe.set.assert_any_call(_get_balance_key(self.user.id), 2000)
+        pipe.set.assert_any_call(_get_balance_key(self.other_user.id), 1000)
+        pipe.execute.assert_called_once()
+
+    def test_bulk_refund_is_idempotent(self):
+        """Test a retried batch does not refund the same SMS twice"""
+        create_bulk_refund_transactions([(self.sms_list[0], 1000)])
+
+        transactions = create_bulk_refund_transactions([(sms, sms.cost) for sms in self.sms_list])
+
+        self.assertEqual(len(transactions), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 2000)
+        self.assertEqual(
+            Transaction.objects.filter(type=TransactionType.REFUND, sms=self.sms_list[0]).count(),
+            1,
+        )
+        self.assertEqual(create_bulk_refund_transactions([(self.sms_list[2], 1000)]), [])
+
+    def test_bulk_refund_sharded_user(self):
+        """Test the refund of a sharded user is credited to a shard"""
+        set_balance_shard_count(self.user, 2)
+
+        create_bulk_refund_transactions([(sms, sms.cost) for sms in self.sms_list[:2]])
+
+        self.assertEqual(get_total_balance(self.user.id), 2000)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 0)
+
+    def test_bulk_refund_rejects_non_positive_amount(self):
+        """Test refunds must be positive"""
+        with self.assertRaises(ValueError):
+            create_bulk_refund_transactions([(self.sms_list[0], 0)])
+
+
 class BillingServicesConcurrencyTestCase(TransactionTestCase):
     """Test cases for concurrent transaction scenarios"""
 
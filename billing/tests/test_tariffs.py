@@ -0,0 +1,142 @@
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from billing.models import Tariff
+from billing.tariffs import (
+    TariffTable,
+    _rate,
+    get_tariff_table,
+    import_tariffs,
+    reset_tariff_table,
+)
+from sms.services import _calculate_sms_cost
+
+DEFAULT_RATE = _rate("", "", "", 1000, 1.5)
+
+
+class TariffTableTestCase(SimpleTestCase):
+    def setUp(self):
+        self.table = TariffTable(
+            [
+                _rate("98", "", "IR", 900, 1.5),
+                _rate("98912", "MCI", "IR", 800, 1.5),
+                _rate("98935", "Irancell", "IR", 850, 2),
+                _rate("1", "", "US", 20000, 1),
+            ],
+            DEFAULT_RATE,
+            "98",
+        )
+
+    def test_longest_prefix_wins(self):
+        """Test a receiver is priced by its most specific prefix"""
+        self.assertEqual(self.table.lookup("989121234567").operator, "MCI")
+        self.assertEqual(self.table.lookup("989191234567").prefix, "98")
+        self.assertEqual(self.table.lookup("12025550123").country, "US")
+
+    def test_number_formats(self):
+        """Test national and international spellings of a number find the same tariff"""
+        for number in ("09121234567", "+989121234567", "00989121234567", "989121234567"):
+            self.assertEqual(self.table.lookup(number).prefix, "98912", number)
+
+    def test_unknown_destination_uses_default(self):
+        """Test receivers without a matching prefix pay the default price"""
+        self.assertIs(self.table.lookup("+447700900123"), DEFAULT_RATE)
+
+    def test_price(self):
+        """Test express traffic pays the multiplied price of every segment"""
+        self.assertEqual(self.table.price("09121234567"), 800)
+        self.assertEqual(self.table.price("09121234567", is_express=True), 1200)
+        self.assertEqual(self.table.price("09351234567", is_express=True, segments=3), 5100)
+
+
+class TariffReloadTestCase(TestCase):
+    def setUp(self):
+        reset_tariff_table()
+        self.addCleanup(reset_tariff_table)
+
+    @patch("billing.tariffs.redis_conn")
+    def test_table_is_loaded_once(self, mock_redis_conn):
+        """Test lookups reuse the table until the shared version changes"""
+        mock_redis_conn.get.return_value = b"1"
+        Tariff.objects.create(prefix="98912", operator="MCI", country="IR", price=800)
+        table = get_tariff_table()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_tariff_table(), table)
+        self.assertEqual(table.price("09121234567"), 800)
+
+    @patch("billing.tariffs.redis_conn")
+    def test_change_swaps_the_table(self, mock_redis_conn):
+        """Test a committed change is published and loaded as a new table"""
+        mock_redis_conn.get.return_value = b"1"
+        old_table = get_tariff_table()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tariff.objects.create(prefix="98912", operator="MCI", country="IR", price=800)
+        mock_redis_conn.get.return_value = b"2"
+        new_table = get_tariff_table()
+
+        mock_redis_conn.incr.assert_called_once_with("tariffs:version")
+        self.assertIsNot(new_table, old_table)
+        self.assertEqual(old_table.price("09121234567"), 1000)
+        self.assertEqual(new_table.price("09121234567"), 800)
+
+    @patch("billing.tariffs.redis_conn")
+    def test_sms_cost_follows_tariffs(self, mock_redis_conn):
+        """Test the send path prices SMS from the tariff table"""
+        mock_redis_conn.get.return_value = None
+        Tariff.objects.create(prefix="98935", operator="Irancell", country="IR", price=850)
+
+        self.assertEqual(_calculate_sms_cost("Hi", "09351234567", False), 850)
+        self.assertEqual(_calculate_sms_cost("Hi", "09351234567", True), 1275)
+        self.assertEqual(_calculate_sms_cost("Hi", "09121234567", True), 1500)
+
+
+@patch("billing.tariffs.redis_conn")
+class ImportTariffsTestCase(TestCase):
+    def test_import_upserts_by_prefix(self, mock_redis_conn):
+        """Test an import updates existing prefixes and publishes one change"""
+        Tariff.objects.create(prefix="98912", operator="MCI", country="IR", price=800)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            count = import_tariffs(
+                [
+                    {"prefix": "98912", "operator": "MCI", "country": "ir", "price": "750"},
+                    {"prefix": "+1", "country": "US", "price": "20000", "express_multiplier": "1"},
+                ]
+            )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            dict(Tariff.objects.values_list("prefix", "price")), {"98912": 750, "1": 20000}
+        )
+        self.assertEqual(Tariff.objects.get(prefix="98912").country, "IR")
+        mock_redis_conn.incr.assert_called_with("tariffs:version")
+
+    def test_replace_removes_missing_prefixes(self, mock_redis_conn):
+        """Test a replacing import drops tariffs that are not in the file"""
+        Tariff.objects.create(prefix="98912", operator="MCI", country="IR", price=800)
+
+        import_tariffs([{"prefix": "1", "country": "US", "price": "20000"}], replace=True)
+
+        self.assertEqual(list(Tariff.objects.values_list("prefix", flat=True)), ["1"])
+
+    def test_command(self, mock_redis_conn):
+        """Test the command loads a CSV file and rejects invalid rows"""
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write("prefix,operator,country,price,express_multiplier\n")
+            file.write("98912,MCI,IR,800,1.5\n")
+            file.flush()
+            out = StringIO()
+            call_command("import_tariffs", file.name, stdout=out)
+
+            file.write("98a,MCI,IR,800,1.5\n")
+            file.flush()
+            with self.assertRaises(CommandError):
+                call_command("import_tariffs", file.name, stdout=out)
+
+        self.assertIn("Imported 1 tariffs", out.getvalue())
@@ -8,6 +8,7 @@ from account.models import User
 from billing.serializers import ChargeResponseSerializer, ChargeSerializer
 from billing.services import create_charge_transaction, get_user_balance
 from sms.serializers import ErrorResponseSerializer
+from SmsHub.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
 
 
 class ChargeView(APIView):
@@ -19,9 +20,19 @@ class ChargeView(APIView):
                 response=ErrorResponseSerializer, description="Invalid charge request"
             ),
             404: OpenApiResponse(response=ErrorResponseSerializer, description="User not found"),
+            409: OpenApiResponse(
+                response=ErrorResponseSerializer,
+                description="A request with the same Idempotency-Key is still in progress",
+            ),
+            422: OpenApiResponse(
+                response=ErrorResponseSerializer,
+                description="Idempotency-Key reused with a different request body",
+            ),
         },
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
         description="Increase a user's balance and return the updated total.",
     )
+    @idempotent("charge")
     def post(self, request):
         serializer = ChargeSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -0,0 +1,12 @@
+"""Gunicorn settings, loaded from the working directory by default."""
+
+from SmsHub.metrics import mark_process_dead, reset_multiprocess_dir
+
+
+def on_starting(server):
+    # Samples of a previous run would otherwise be merged into /metrics
+    reset_multiprocess_dir()
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
@@ -0,0 +1,193 @@
+"""
+Asyncio sender for the SMS queues.
+
+A prefork Celery process holds one provider request open at a time. This worker keeps up to
+``concurrency`` sends in flight on a single event loop instead. The AMQP connection is not
+thread safe, so one thread owns it: it receives task messages and hands them to the loop, and
+runs the acks and retry publishes the loop queues back to it.
+Sends take the sender line cap and go through the same breakers, fallbacks and weighted
+routing as the Celery tasks, through ``AsyncFailoverProvider``.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from sms.batching import message_eta, parse_send_message, retry_send, run_other_task
+from sms.metrics import observe_queue_wait, time_provider_call
+from sms.models import SMS, SMSStatus
+from sms.sender_pools import await_line_capacity
+from sms.sms_provider_clients import EXPRESS_TRAFFIC, STANDARD_TRAFFIC, AsyncSmsProvider
+from sms.sms_provider_clients.registry import build_async_provider_client
+from sms.tasks import (
+    ALREADY_SENT_STATUSES,
+    _apply_send_result,
+    _write_send_result,
+    load_sms,
+)
+from sms.utils import get_provider_account
+
+logger = logging.getLogger(__name__)
+
+DRAIN_TIMEOUT_SECONDS = 0.1
+
+
+class AsyncSmsSender:
+    def __init__(self, app, queue_names: list[str], concurrency: int):
+        self.app = app
+        self.queues = [app.amqp.queues[queue_name] for queue_name in queue_names]
+        self.concurrency = concurrency
+        self.clients: dict[str, AsyncSmsProvider] = {}
+        self.actions = queue.SimpleQueue()  # callables to run on the connection thread
+        self.jobs = set()
+        self.stopping = threading.Event()
+        self.finished = threading.Event()
+        self.loop = None
+        self.semaphore = None
+        self.stopped = None
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    def _get_client(self, sender: str) -> AsyncSmsProvider | None:
+        account = get_provider_account(sender)
+        if account is None:
+            return None
+        if account not in self.clients:
+            self.clients[account] = build_async_provider_client(account)
+        return self.clients[account]
+
+    async def send(self, sms: SMS) -> None:
+        """Send one SMS and record the result the same way ``_send_sms_internal`` does."""
+        api = self._get_client(sms.sender)
+        if api is None:
+            # No account sends from this line; retrying cannot change that
+            sms.status = SMSStatus.FAILED
+            sms.service_error = f"No provider account sends from {sms.sender}"
+            sms.last_attempt_at = now()
+            await sync_to_async(_write_send_result)(sms)
+            return
+        api = api.for_traffic(EXPRESS_TRAFFIC if sms.is_express else STANDARD_TRAFFIC)
+        # Raises before the row changes, so a busy line only re-queues the SMS
+        await await_line_capacity(sms.sender, sms.segments)
+        observe_queue_wait([sms])
+
+        try:
+            with time_provider_call(sms.sender, "send_sms") as call:
+                response = await api.send_sms(
+                    sender=sms.sender,
+                    destination=sms.receiver,
+                    message=sms.content,
+                    uid=sms.id,
+                )
+                call["provider"] = response.get("provider")
+            messages_list = response.get("messages") or [None]
+            _apply_send_result(
+                sms,
+                response.get("status"),
+                messages_list[0],
+                response.get("provider"),
+                response.get("sender"),
+            )
+
+        except Exception as e:
+            sms.status = SMSStatus.FAILED
+            sms.service_error = str(e)
+            raise
+        finally:
+            sms.last_attempt_at = now()
+            await sync_to_async(_write_send_result)(sms)
+
+    async def _send_one(self, single_task, sms_id: int, retries: int) -> None:
+        async with self.semaphore:
+            try:
+                sms_list = await sync_to_async(load_sms)([sms_id])
+                if not sms_list:
+                    logger.warning("SMS %s no longer exists", sms_id)
+                elif sms_list[0].status not in ALREADY_SENT_STATUSES:
+                    await self.send(sms_list[0])
+            except Exception:
+                logger.exception("Sending SMS %s failed", sms_id)
+                self.actions.put(lambda: retry_send(single_task, sms_id, retries))
+
+    async def _handle(self, message, parsed: tuple, delay: float) -> None:
+        if delay > 0:
+            # Retries carry an ETA; hold them unacked until due, like a Celery worker does.
+            # On shutdown they stay unacked and the broker redelivers them.
+            try:
+                await asyncio.wait_for(self.stopped.wait(), delay)
+                return
+            except TimeoutError:
+                pass
+        single_task, sms_ids, retries = parsed
+        # Runs on the thread the ORM calls share, like the batch sender does per flush
+        await sync_to_async(close_old_connections)()
+        await asyncio.gather(*(self._send_one(single_task, sms_id, retries) for sms_id in sms_ids))
+        self.actions.put(message.ack)
+
+    def _start_job(self, message, parsed: tuple, delay: float) -> None:
+        job = self.loop.create_task(self._handle(message, parsed, delay))
+        self.jobs.add(job)
+        job.add_done_callback(self.jobs.discard)
+
+    def on_message(self, body, message) -> None:
+        # Runs on the connection thread
+        parsed = parse_send_message(body, message)
+        if parsed is None:
+            run_other_task(self.app, body, message)
+            return
+        eta = message_eta(message)
+        delay = eta - time.time() if eta else 0
+        self.loop.call_soon_threadsafe(self._start_job, message, parsed, delay)
+
+    def _run_actions(self) -> None:
+        while True:
+            try:
+                action = self.actions.get_nowait()
+            except queue.Empty:
+                return
+            action()
+
+    def _consume(self) -> None:
+        with self.app.connection_for_read() as connection:
+            with connection.Consumer(
+                self.queues, callbacks=[self.on_message], accept=["json"]
+            ) as consumer:
+                consumer.qos(prefetch_count=self.concurrency)
+                while not self.stopping.is_set():
+                    try:
+                        connection.drain_events(timeout=DRAIN_TIMEOUT_SECONDS)
+                    except TimeoutError:
+                        pass
+                    self._run_actions()
+                consumer.cancel()
+                # Keep acking until the loop has finished the messages already received
+                while not self.finished.is_set():
+                    self.finished.wait(DRAIN_TIMEOUT_SECONDS)
+                    self._run_actions()
+                self._run_actions()
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.stopped = asyncio.Event()
+        consumer_thread = threading.Thread(target=self._consume, name="sms-consumer")
+        consumer_thread.start()
+        try:
+            while not self.stopping.is_set() and consumer_thread.is_alive():
+                await asyncio.sleep(DRAIN_TIMEOUT_SECONDS)
+            self.stopping.set()
+            self.stopped.set()
+            while self.jobs:
+                await asyncio.gather(*self.jobs)
+        finally:
+            self.finished.set()
+            for client in self.clients.values():
+                await client.aclose()
+            await self.loop.run_in_executor(None, consumer_thread.join)
@@ -0,0 +1,189 @@
+"""
+Batching consumer for the ``standard_sms_sender`` queue.
+
+Celery runs ``send_normal_sms`` once per message, which costs one provider round trip per SMS.
+This consumer reads the same task messages, buffers up to ``max_size`` SMS ids or
+``max_wait_ms`` milliseconds, and sends them with one provider call per sender. Messages are
+acked only after their SMS rows are written back, so a crash redelivers them. A flush that
+raises re-queues each of its SMS with the retry policy of its task, like a failed provider call.
+"""
+
+import logging
+import time
+
+from celery.utils.time import get_exponential_backoff_interval
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+
+from sms.tasks import (
+    ALREADY_SENT_STATUSES,
+    load_sms,
+    send_express_sms,
+    send_express_sms_batch,
+    send_normal_sms,
+    send_normal_sms_batch,
+    send_sms_groups,
+)
+
+logger = logging.getLogger(__name__)
+
+IDLE_POLL_SECONDS = 1.0
+# Same cap Celery applies to ``retry_backoff``
+RETRY_BACKOFF_MAX = 600
+
+# Task name -> (single-message task that owns the retry policy, whether args hold a list of ids)
+SEND_TASKS = {
+    send_normal_sms.name: (send_normal_sms, False),
+    send_normal_sms_batch.name: (send_normal_sms, True),
+    send_express_sms.name: (send_express_sms, False),
+    send_express_sms_batch.name: (send_express_sms, True),
+}
+
+
+def parse_send_message(body, message) -> tuple | None:
+    """Return ``(single_task, sms_ids, retries)`` for an SMS send task message, else None."""
+    task_name = message.headers.get("task")
+    if task_name not in SEND_TASKS:
+        return None
+    single_task, is_batch = SEND_TASKS[task_name]
+    args, kwargs = body[0], body[1]
+    if is_batch:
+        sms_ids = list(kwargs["sms_ids"] if "sms_ids" in kwargs else args[0])
+    else:
+        sms_ids = [kwargs["sms_id"] if "sms_id" in kwargs else args[0]]
+    return single_task, sms_ids, message.headers.get("retries") or 0
+
+
+def message_eta(message) -> float | None:
+    eta = message.headers.get("eta")
+    return parse_datetime(eta).timestamp() if eta else None
+
+
+def run_other_task(app, body, message) -> None:
+    # Anything else routed to the queue runs in-process, as a Celery worker would
+    task = app.tasks.get(message.headers.get("task"))
+    if task is None:
+        logger.error("Rejecting unknown task %s", message.headers.get("task"))
+        message.reject()
+        return
+    task.apply(args=body[0], kwargs=body[1], task_id=message.headers.get("id"))
+    message.ack()
+
+
+def retry_send(single_task, sms_id: int, retries: int) -> None:
+    """Re-queue an SMS whose provider call raised, with the backoff of ``single_task``."""
+    if retries >= single_task.max_retries:
+        logger.error("Giving up on SMS %s after %s retries", sms_id, retries)
+        return
+    countdown = get_exponential_backoff_interval(
+        factor=1, retries=retries, maximum=RETRY_BACKOFF_MAX, full_jitter=True
+    )
+    single_task.apply_async((sms_id,), countdown=countdown, retries=retries + 1)
+
+
+class SmsBatchConsumer:
+    def __init__(self, app, queue_name: str, max_size: int, max_wait_ms: int):
+        self.app = app
+        self.queue = app.amqp.queues[queue_name]
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = []  # (message, (single_task, sms_ids, retries))
+        self.pending_sms_count = 0
+        self.first_pending_at = None
+        self.scheduled = []  # (eta, message, (single_task, sms_ids, retries))
+        self.consumer = None
+        self.should_stop = False
+
+    def on_message(self, body, message) -> None:
+        parsed = parse_send_message(body, message)
+        if parsed is None:
+            run_other_task(self.app, body, message)
+            return
+
+        eta = message_eta(message)
+        if eta and eta > time.time():
+            # Retries carry an ETA; hold them unacked until due, like a Celery worker does
+            self.scheduled.append((eta, message, parsed))
+            self._update_prefetch()
+            return
+        self._add_pending(message, parsed)
+
+    def _add_pending(self, message, parsed: tuple) -> None:
+        if self.first_pending_at is None:
+            self.first_pending_at = time.monotonic()
+        self.pending.append((message, parsed))
+        self.pending_sms_count += len(parsed[1])
+
+    def _update_prefetch(self) -> None:
+        if self.consumer is not None:
+            self.consumer.qos(prefetch_count=self.max_size + len(self.scheduled))
+
+    def _release_due(self) -> None:
+        now = time.time()
+        due = [item for item in self.scheduled if item[0] <= now]
+        if not due:
+            return
+        self.scheduled = [item for item in self.scheduled if item[0] > now]
+        for _, message, parsed in due:
+            self._add_pending(message, parsed)
+        self._update_prefetch()
+
+    def _batch_is_due(self) -> bool:
+        if not self.pending:
+            return False
+        if self.pending_sms_count >= self.max_size:
+            return True
+        return time.monotonic() - self.first_pending_at >= self.max_wait
+
+    def _drain_timeout(self) -> float:
+        if self.pending:
+            return max(self.first_pending_at + self.max_wait - time.monotonic(), 0.001)
+        if self.scheduled:
+            earliest = min(item[0] for item in self.scheduled)
+            return min(max(earliest - time.time(), 0.001), IDLE_POLL_SECONDS)
+        return IDLE_POLL_SECONDS
+
+    def flush(self) -> int:
+        batch, self.pending = self.pending, []
+        self.pending_sms_count = 0
+        self.first_pending_at = None
+        if not batch:
+            return 0
+
+        close_old_connections()
+        retry_policy = {}
+        for _, (single_task, sms_ids, retries) in batch:
+            for sms_id in sms_ids:
+                retry_policy[sms_id] = (single_task, retries)
+        try:
+            sms_list = [
+                sms for sms in load_sms(retry_policy) if sms.status not in ALREADY_SENT_STATUSES
+            ]
+            attempted, errored = send_sms_groups(sms_list)
+            errored_ids = [sms.id for sms in errored]
+        except Exception:
+            logger.exception("Sending batch of %s SMS failed", len(retry_policy))
+            attempted, errored_ids = [], list(retry_policy)
+        for sms_id in errored_ids:
+            single_task, retries = retry_policy[sms_id]
+            retry_send(single_task, sms_id, retries)
+        for message, _ in batch:
+            message.ack()
+        return len(attempted)
+
+    def run(self) -> None:
+        with self.app.connection_for_read() as connection:
+            with connection.Consumer(
+                [self.queue], callbacks=[self.on_message], accept=["json"]
+            ) as consumer:
+                self.consumer = consumer
+                self._update_prefetch()
+                while not self.should_stop:
+                    try:
+                        connection.drain_events(timeout=self._drain_timeout())
+                    except TimeoutError:
+                        pass
+                    self._release_due()
+                    if self._batch_is_due():
+                        self.flush()
+                self.flush()
@@ -0,0 +1,141 @@
+"""
+Pushed delivery reports (DLR).
+
+Providers call ``/sms/v1/dlr/<provider>`` with one report or a list of them. The view only
+appends them to a Redis list; ``process_delivery_reports`` claims a batch, finds the SMS of
+each report by ``(provider, message_id)``, or by sender prefix for SMS sent before the account
+was recorded, and applies them with ``apply_status_updates``, the
+same write path the status polling uses. A report that arrives before the send result is
+written back is kept in the buffer for ``SMS_DLR_UNMATCHED_TTL_SECONDS`` and then dropped.
+"""
+
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.timezone import now
+from django_redis import get_redis_connection
+
+from sms.models import SMS, SMSStatus
+from sms.reconciliation import apply_status_updates, get_status_mapper
+from sms.services import filter_by_provider_accounts
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+BUFFER_KEY = "dlr:buffer"
+PROCESSING_KEY = "dlr:processing"
+CONSUME_LOCK_KEY = "dlr:consume_lock"
+
+_claim_script = redis_conn.register_script(
+    """
+    if redis.call('LLEN', KEYS[2]) == 0 then
+        local entries = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+        for i = 1, #entries do
+            redis.call('RPUSH', KEYS[2], entries[i])
+        end
+        if #entries > 0 then
+            redis.call('LTRIM', KEYS[1], #entries, -1)
+        end
+    end
+    return redis.call('LRANGE', KEYS[2], 0, -1)
+    """
+)
+
+
+def buffer_delivery_reports(provider: str, reports: list[dict]) -> None:
+    """Append ``{"mid", "status"}`` reports of ``provider`` to the buffer in one call."""
+    if not reports:
+        return
+    received_at = time.time()
+    redis_conn.rpush(
+        BUFFER_KEY,
+        *[
+            json.dumps(
+                {
+                    "provider": provider,
+                    "mid": report["mid"],
+                    "status": report["status"],
+                    "ts": received_at,
+                }
+            )
+            for report in reports
+        ],
+    )
+
+
+def apply_delivery_reports(reports: list[dict]) -> tuple[dict, list[dict]]:
+    """Apply buffered reports; return the status counts and the reports matching no SMS."""
+    # SMS older than the check window are already expired, so partitions past it are skipped
+    created_after = now() - timedelta(hours=settings.SMS_STATUS_CHECK_WINDOW_HOURS)
+    reports_by_provider = defaultdict(list)
+    for report in reports:
+        reports_by_provider[report["provider"]].append(report)
+
+    updates = {}
+    unmatched = []
+    for provider, provider_reports in reports_by_provider.items():
+        map_status = get_status_mapper(provider)
+        # SMS sent before the account was recorded are found by their sender prefix
+        ids_by_mid = dict(
+            filter_by_provider_accounts(
+                SMS.objects.filter(
+                    message_id__in={report["mid"] for report in provider_reports},
+                    created_at__gte=created_after,
+                ),
+                [provider],
+            ).values_list("message_id", "id")
+        )
+        for report in provider_reports:
+            sms_id = ids_by_mid.get(report["mid"])
+            if sms_id is None:
+                unmatched.append(report)
+                continue
+            new_status = map_status(report["status"])
+            if new_status:
+                updates[sms_id] = new_status
+
+    return apply_status_updates(updates, created_after=created_after), unmatched
+
+
+def process_delivery_reports(batch_size: int | None = None) -> dict:
+    """Apply one batch of buffered reports; return how many were received, requeued and applied."""
+    batch_size = batch_size or settings.SMS_DLR_BATCH_SIZE
+    lock = redis_conn.lock(
+        CONSUME_LOCK_KEY,
+        timeout=settings.SMS_DLR_LOCK_TIMEOUT,
+        blocking_timeout=settings.SMS_DLR_LOCK_TIMEOUT,
+    )
+    with lock:
+        raw_reports = _claim_script(keys=[BUFFER_KEY, PROCESSING_KEY], args=[batch_size])
+        result = {
+            "received": len(raw_reports),
+            "requeued": 0,
+            SMSStatus.DELIVERED: 0,
+            SMSStatus.FAILED: 0,
+        }
+        if not raw_reports:
+            return result
+        reports = [json.loads(raw_report) for raw_report in raw_reports]
+        counts, unmatched = apply_delivery_reports(reports)
+        result.update(counts)
+
+        expired_before = time.time() - settings.SMS_DLR_UNMATCHED_TTL_SECONDS
+        pipe = redis_conn.pipeline(transaction=True)
+        for report in unmatched:
+            if report["ts"] < expired_before:
+                logger.warning(
+                    "Dropping %s delivery report for unknown message %s",
+                    report["provider"],
+                    report["mid"],
+                )
+            else:
+                pipe.rpush(BUFFER_KEY, json.dumps(report))
+                result["requeued"] += 1
+        pipe.delete(PROCESSING_KEY)
+        pipe.execute()
+    return result
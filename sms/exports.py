@@ -0,0 +1,50 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+REPORT_EXPORT_FIELDS = [
+    "id",
+    "message_id",
+    "receiver",
+    "sender",
+    "status",
+    "content",
+    "cost",
+    "segments",
+    "is_express",
+    "created_at",
+    "modified_at",
+]
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the value, so csv.writer yields lines."""
+
+    def write(self, value):
+        return value
+
+
+def _iter_rows(queryset):
+    # iterator() reads through a server-side cursor on PostgreSQL, so only one chunk of rows
+    # is held in memory at a time
+    return (
+        queryset.order_by("-created_at", "-id")
+        .values_list(*REPORT_EXPORT_FIELDS)
+        .iterator(chunk_size=settings.SMS_REPORT_EXPORT_CHUNK_SIZE)
+    )
+
+
+def iter_report_csv(queryset):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(REPORT_EXPORT_FIELDS)
+    for row in _iter_rows(queryset):
+        yield writer.writerow(
+            [value.isoformat() if hasattr(value, "isoformat") else value for value in row]
+        )
+
+
+def iter_report_ndjson(queryset):
+    for row in _iter_rows(queryset):
+        yield json.dumps(dict(zip(REPORT_EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from sms.reconciliation import expire_sent_sms, reconcile_statuses
+
+
+class Command(BaseCommand):
+    help = "Reconcile delivery statuses of sent SMS with every provider account and refund the failed ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--concurrency", type=int, default=None)
+
+    def handle(self, *args, **options):
+        for name, result in (
+            ("Expired", expire_sent_sms(batch_size=options["batch_size"])),
+            (
+                "Checked",
+                reconcile_statuses(
+                    batch_size=options["batch_size"], concurrency=options["concurrency"]
+                ),
+            ),
+        ):
+            self.stdout.write(
+                f"{name} {result['checked']} SMS: {result['delivered']} delivered, "
+                f"{result['failed']} failed, {len(result['errors'])} failed batches"
+            )
+            for error in result["errors"]:
+                self.stderr.write(f"SMS {error['first_id']}..{error['last_id']}: {error['error']}")
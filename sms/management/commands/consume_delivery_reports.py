@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sms.dlr import process_delivery_reports
+
+
+class Command(BaseCommand):
+    help = "Apply pushed delivery reports from the Redis buffer in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep consuming until the process is stopped."
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            result = process_delivery_reports(options["batch_size"])
+            # Stop once a batch holds nothing but reports waiting for their SMS
+            while result["received"] > result["requeued"]:
+                self.stdout.write(
+                    f"Applied {result['received']} delivery reports: "
+                    f"{result['delivered']} delivered, {result['failed']} failed, "
+                    f"{result['requeued']} requeued"
+                )
+                result = process_delivery_reports(options["batch_size"])
+            if not options["loop"]:
+                return
+            time.sleep(settings.SMS_DLR_POLL_INTERVAL)
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sms.outbox import relay_outbox
+
+
+class Command(BaseCommand):
+    help = "Publish SMS send tasks written to the outbox to RabbitMQ in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep relaying until the process is stopped."
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            relayed = relay_outbox(options["batch_size"])
+            while relayed:
+                self.stdout.write(f"Published {relayed} outbox tasks")
+                relayed = relay_outbox(options["batch_size"])
+            if not options["loop"]:
+                return
+            time.sleep(settings.SMS_OUTBOX_RELAY_INTERVAL)
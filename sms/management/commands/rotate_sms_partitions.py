@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from sms.partitions import create_partitions, is_partitioned, remove_old_partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming SMS partitions and detach (or drop) expired ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--premake", type=int, default=None)
+        parser.add_argument("--retention-days", type=int, default=None)
+        parser.add_argument(
+            "--drop", action="store_true", default=None, help="Drop detached partitions."
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("The SMS table is not partitioned; nothing to do")
+            return
+        for name in create_partitions(options["premake"]):
+            self.stdout.write(f"Created {name}")
+        for name in remove_old_partitions(options["retention_days"], options["drop"]):
+            self.stdout.write(f"Removed {name}")
@@ -0,0 +1,35 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sms.async_worker import AsyncSmsSender
+from SmsHub.celery import app
+from SmsHub.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = "Consume SMS queues and send many SMS concurrently on one asyncio event loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queue", action="append", dest="queues", help="Queue to consume; repeatable."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.SMS_ASYNC_SENDER_CONCURRENCY
+        )
+
+    def handle(self, *args, **options):
+        if settings.METRICS_WORKER_PORT:
+            start_metrics_server(settings.METRICS_WORKER_PORT)
+        queues = options["queues"] or ["standard_sms_sender"]
+        sender = AsyncSmsSender(app, queues, options["concurrency"])
+        self.stdout.write(f"Sending SMS from {', '.join(queues)} on one event loop")
+        asyncio.run(self._run(sender))
+
+    async def _run(self, sender):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, sender.stop)
+        loop.add_signal_handler(signal.SIGINT, sender.stop)
+        await sender.run()
@@ -0,0 +1,34 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sms.batching import SmsBatchConsumer
+from SmsHub.celery import app
+from SmsHub.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = "Consume the standard SMS queue and send queued SMS in batches, one call per sender."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", default="standard_sms_sender")
+        parser.add_argument("--max-size", type=int, default=settings.SMS_BATCH_SENDER_MAX_SIZE)
+        parser.add_argument(
+            "--max-wait-ms", type=int, default=settings.SMS_BATCH_SENDER_MAX_WAIT_MS
+        )
+
+    def handle(self, *args, **options):
+        if settings.METRICS_WORKER_PORT:
+            start_metrics_server(settings.METRICS_WORKER_PORT)
+        consumer = SmsBatchConsumer(
+            app, options["queue"], options["max_size"], options["max_wait_ms"]
+        )
+
+        def stop(signum, frame):
+            consumer.should_stop = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f"Batching SMS from {options['queue']}")
+        consumer.run()
@@ -0,0 +1,103 @@
+"""
+Prometheus metrics of the SMS path.
+
+Metrics are module level objects, so recording a sample is a dict lookup and a locked float
+add. Label values are small fixed sets (view, operation, provider account, status, express)
+and never SMS or user ids. Labels are only resolved when a sample is recorded: in multiprocess
+mode that creates the sample file, which must not happen at import.
+"""
+
+import contextlib
+import functools
+import time
+
+from prometheus_client import Counter, Histogram
+
+from sms.utils import get_provider_account
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUEUE_WAIT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+API_REQUEST_SECONDS = Histogram(
+    "smshub_api_request_seconds",
+    "Time spent handling an SMS API request.",
+    ["view"],
+    buckets=LATENCY_BUCKETS,
+)
+SERVICE_CALL_SECONDS = Histogram(
+    "smshub_service_call_seconds",
+    "Time spent in an SMS service function, including its commit.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "smshub_provider_request_seconds",
+    "Time spent waiting on an SMS provider API call.",
+    ["provider", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+SMS_QUEUE_WAIT_SECONDS = Histogram(
+    "smshub_sms_queue_wait_seconds",
+    "Time from SMS creation until a worker picks it up for sending.",
+    ["express"],
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+SMS_STATUS_CHANGES = Counter(
+    "smshub_sms_status_changes",
+    "SMS moved to a status by a send attempt or a delivery report.",
+    ["status", "provider", "express"],
+)
+
+
+def timed(histogram: Histogram, *label_values: str):
+    """Decorator recording the duration of every call in ``histogram``."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.labels(*label_values).time():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _express_label(is_express: bool) -> str:
+    return "true" if is_express else "false"
+
+
+def _provider_label(sms) -> str:
+    return sms.provider or get_provider_account(sms.sender) or "unknown"
+
+
+@contextlib.contextmanager
+def time_provider_call(sender: str, operation: str):
+    """Context manager timing one provider call made for ``sender``.
+
+    A failover client may serve the call from another account; setting ``"provider"`` in the
+    yielded dict to the account its response names labels the sample with it.
+    """
+    call = {}
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        provider = call.get("provider") or get_provider_account(sender) or "unknown"
+        PROVIDER_REQUEST_SECONDS.labels(provider, operation).observe(time.perf_counter() - started)
+
+
+def observe_queue_wait(sms_list) -> None:
+    picked_up_at = time.time()
+    for sms in sms_list:
+        if sms.created_at is not None:
+            SMS_QUEUE_WAIT_SECONDS.labels(_express_label(sms.is_express)).observe(
+                max(picked_up_at - sms.created_at.timestamp(), 0)
+            )
+
+
+def count_status_changes(sms_list) -> None:
+    for sms in sms_list:
+        SMS_STATUS_CHANGES.labels(
+            sms.status, _provider_label(sms), _express_label(sms.is_express)
+        ).inc()
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sms", "0003_sms_sender"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="sms",
+            name="message_id",
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+    ]
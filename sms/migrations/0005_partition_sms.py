@@ -0,0 +1,104 @@
+from django.db import migrations
+
+from sms.partitions import (
+    DEFAULT_PARTITION,
+    LEGACY_PARTITION,
+    TABLE_NAME,
+    create_partitions,
+    is_partitioned,
+    period_start,
+)
+
+SEQUENCE_NAME = "SMS_partitioned_id_seq"
+
+
+def partition_sms_table(apps, schema_editor):
+    """Turn "SMS" into a table range partitioned on created_at, keeping its rows.
+
+    The existing table is renamed to "SMS_legacy" and attached as the partition for every row
+    created before the current period, so no data is copied. Only PostgreSQL supports this; other
+    databases keep the plain table.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql" or is_partitioned(connection):
+        return
+
+    user_table = apps.get_model("account", "User")._meta.db_table
+    sms_model = apps.get_model("sms", "SMS")
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT (now() AT TIME ZONE 'UTC')::date")
+        # The legacy rows end where the first regular partition starts
+        cut_off = period_start(cursor.fetchone()[0])
+
+        cursor.execute(f'ALTER TABLE "{TABLE_NAME}" RENAME TO "{LEGACY_PARTITION}"')
+        # Free the index and constraint names for the partitioned table
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()",
+            [LEGACY_PARTITION],
+        )
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:56]}_legacy"')
+
+        # Partitioned tables cannot use identity columns before PostgreSQL 17, so ids come
+        # from a plain sequence that continues after the legacy rows
+        cursor.execute(f'CREATE SEQUENCE "{SEQUENCE_NAME}"')
+        cursor.execute(
+            f"SELECT setval('\"{SEQUENCE_NAME}\"', "
+            f'(SELECT COALESCE(MAX(id), 0) + 1 FROM "{LEGACY_PARTITION}"), false)',
+        )
+        cursor.execute(
+            f'CREATE TABLE "{TABLE_NAME}" (LIKE "{LEGACY_PARTITION}" INCLUDING DEFAULTS) '
+            "PARTITION BY RANGE (created_at)",
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE_NAME}" ALTER COLUMN id SET DEFAULT '
+            f"nextval('\"{SEQUENCE_NAME}\"')",
+        )
+        cursor.execute(f'ALTER SEQUENCE "{SEQUENCE_NAME}" OWNED BY "{TABLE_NAME}".id')
+        cursor.execute(f'ALTER TABLE "{TABLE_NAME}" ADD PRIMARY KEY (id, created_at)')
+        cursor.execute(
+            f'ALTER TABLE "{TABLE_NAME}" ADD CONSTRAINT "SMS_user_id_partitioned_fk" '
+            f'FOREIGN KEY (user_id) REFERENCES "{user_table}" (id) DEFERRABLE INITIALLY DEFERRED',
+        )
+
+        # Indexes declared on the model, created on the parent so every partition gets them
+        cursor.execute(f'CREATE INDEX "SMS_message_id_idx" ON "{TABLE_NAME}" (message_id)')
+        for index in sms_model._meta.indexes:
+            columns = ", ".join(
+                sms_model._meta.get_field(field_name).column for field_name in index.fields
+            )
+            cursor.execute(f'CREATE INDEX "{index.name}" ON "{TABLE_NAME}" ({columns})')
+
+        # A validated CHECK lets ATTACH skip its full scan while holding the strong lock
+        cursor.execute(f'ALTER TABLE "{LEGACY_PARTITION}" ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE "{LEGACY_PARTITION}" ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(
+            f'ALTER TABLE "{LEGACY_PARTITION}" ADD CONSTRAINT "SMS_legacy_created_at_check" '
+            f"CHECK (created_at IS NOT NULL AND created_at < '{cut_off.isoformat()} 00:00:00+00') "
+            "NOT VALID",
+        )
+        cursor.execute(
+            f'ALTER TABLE "{LEGACY_PARTITION}" VALIDATE CONSTRAINT "SMS_legacy_created_at_check"',
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE_NAME}" ATTACH PARTITION "{LEGACY_PARTITION}" '
+            f"FOR VALUES FROM (MINVALUE) TO ('{cut_off.isoformat()} 00:00:00+00')",
+        )
+        cursor.execute(
+            f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE_NAME}" DEFAULT',
+        )
+
+    create_partitions(today=cut_off, connection=connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("account", "0003_user_balance_shard_count"),
+        ("billing", "0005_alter_transaction_sms"),
+        ("sms", "0004_alter_sms_message_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_sms_table, elidable=False),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sms", "0005_partition_sms"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sms",
+            name="provider",
+            field=models.CharField(
+                blank=True, default="", max_length=32, verbose_name="سرویس\u200cدهنده"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sms",
+            index=models.Index(fields=["provider", "message_id"], name="sms_provider_message_idx"),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:59
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sms", "0006_sms_provider"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SMSOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.UUIDField(default=uuid.uuid4, unique=True, verbose_name="شناسه وظیفه"),
+                ),
+                ("sms_ids", models.JSONField(verbose_name="شناسه پیامک\u200cها")),
+                ("is_express", models.BooleanField(default=False, verbose_name="اکسپرس")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")),
+            ],
+            options={
+                "verbose_name": "صف خروجی پیامک",
+                "verbose_name_plural": "صف خروجی پیامک\u200cها",
+                "db_table": "sms_outbox",
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sms", "0007_smsoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sms",
+            name="segments",
+            field=models.PositiveSmallIntegerField(default=1, verbose_name="تعداد بخش"),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sms", "0008_sms_segments"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SenderPool",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("name", models.CharField(max_length=64, unique=True, verbose_name="نام")),
+                (
+                    "strategy",
+                    models.CharField(
+                        choices=[("round_robin", "نوبتی"), ("least_loaded", "کم\u200cبارترین خط")],
+                        default="round_robin",
+                        max_length=16,
+                        verbose_name="روش انتخاب خط",
+                    ),
+                ),
+                ("is_shared", models.BooleanField(default=False, verbose_name="مشترک")),
+            ],
+            options={
+                "verbose_name": "مجموعه خط ارسال",
+                "verbose_name_plural": "مجموعه\u200cهای خط ارسال",
+            },
+        ),
+        migrations.CreateModel(
+            name="SenderLine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("number", models.CharField(max_length=32, unique=True, verbose_name="شماره خط")),
+                (
+                    "max_per_second",
+                    models.PositiveIntegerField(default=10, verbose_name="حداکثر بخش در ثانیه"),
+                ),
+                ("is_active", models.BooleanField(default=True, verbose_name="فعال")),
+                (
+                    "pool",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lines",
+                        to="sms.senderpool",
+                        verbose_name="مجموعه",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "خط ارسال",
+                "verbose_name_plural": "خطوط ارسال",
+            },
+        ),
+    ]
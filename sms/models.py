@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
@@ -15,7 +17,9 @@ class SMSStatus(models.TextChoices):
 
 
 class SMS(models.Model):
-    message_id = models.IntegerField(unique=True, null=True, db_index=True)
+    # Not unique: a partitioned table can only enforce uniqueness together with created_at
+    message_id = models.IntegerField(null=True, db_index=True)
+    provider = models.CharField(max_length=32, blank=True, default="", verbose_name="سرویس‌دهنده")
     user = models.ForeignKey(
         User,
         verbose_name="کاربر",
@@ -38,6 +42,7 @@ class SMS(models.Model):
     content = models.TextField(verbose_name="محتوای پیام")
     cost = models.BigIntegerField(verbose_name="هزینه (ریال)")
     is_express = models.BooleanField(default=False, verbose_name="اکسپرس")
+    segments = models.PositiveSmallIntegerField(default=1, verbose_name="تعداد بخش")
 
     class Meta:
         ordering = ["-created_at"]
@@ -49,7 +54,68 @@ class SMS(models.Model):
             models.Index(fields=["user", "status"], name="sms_user_status_idx"),
             models.Index(fields=["user", "created_at"], name="sms_user_created_at_idx"),
             models.Index(fields=["receiver"], name="sms_receiver_idx"),
+            models.Index(fields=["provider", "message_id"], name="sms_provider_message_idx"),
         ]
 
     def __str__(self):
         return f"SMS {self.message_id} to {self.receiver} ({self.status})"
+
+
+class SMSOutbox(models.Model):
+    """A send task written in the transaction that created its SMS, published by the relay."""
+
+    task_id = models.UUIDField(default=uuid.uuid4, unique=True, verbose_name="شناسه وظیفه")
+    sms_ids = models.JSONField(verbose_name="شناسه پیامک‌ها")
+    is_express = models.BooleanField(default=False, verbose_name="اکسپرس")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")
+
+    class Meta:
+        db_table = "sms_outbox"
+        verbose_name = "صف خروجی پیامک"
+        verbose_name_plural = "صف خروجی پیامک‌ها"
+
+    def __str__(self):
+        return f"Outbox {self.task_id} ({len(self.sms_ids)} SMS)"
+
+
+class SenderPoolStrategy(models.TextChoices):
+    ROUND_ROBIN = "round_robin", "نوبتی"
+    LEAST_LOADED = "least_loaded", "کم‌بارترین خط"
+
+
+class SenderPool(models.Model):
+    """Sender lines one or more users send from; see ``sms.sender_pools``."""
+
+    name = models.CharField(max_length=64, unique=True, verbose_name="نام")
+    strategy = models.CharField(
+        max_length=16,
+        choices=SenderPoolStrategy.choices,
+        default=SenderPoolStrategy.ROUND_ROBIN,
+        verbose_name="روش انتخاب خط",
+    )
+    # Users without a pool of their own send from the shared pool
+    is_shared = models.BooleanField(default=False, verbose_name="مشترک")
+
+    class Meta:
+        verbose_name = "مجموعه خط ارسال"
+        verbose_name_plural = "مجموعه‌های خط ارسال"
+
+    def __str__(self):
+        return self.name
+
+
+class SenderLine(models.Model):
+    pool = models.ForeignKey(
+        SenderPool, on_delete=models.CASCADE, related_name="lines", verbose_name="مجموعه"
+    )
+    number = models.CharField(max_length=32, unique=True, verbose_name="شماره خط")
+    # Segments per second the provider accepts on this line
+    max_per_second = models.PositiveIntegerField(default=10, verbose_name="حداکثر بخش در ثانیه")
+    is_active = models.BooleanField(default=True, verbose_name="فعال")
+
+    class Meta:
+        verbose_name = "خط ارسال"
+        verbose_name_plural = "خطوط ارسال"
+
+    def __str__(self):
+        return f"{self.number} ({self.pool.name})"
@@ -0,0 +1,69 @@
+"""
+Transactional outbox for SMS send tasks.
+
+With ``SMS_OUTBOX_ENABLED`` the API writes an ``SMSOutbox`` row in the transaction that creates
+and charges the SMS instead of publishing to RabbitMQ, so a request never waits on the broker
+and a committed SMS is never left unqueued. ``relay_outbox`` publishes the rows in id order
+over one producer connection and deletes them in the same transaction. A relay that dies after
+publishing sends its batch again, so the tasks carry only SMS ids: workers load each SMS and
+skip the ones that were already sent.
+"""
+
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from sms.models import SMS, SMSOutbox
+
+
+def add_to_outbox(sms_list: list[SMS]) -> list[SMSOutbox]:
+    """Write the send tasks of ``sms_list``; call it in the transaction that created them."""
+    batch_size = settings.SMS_BULK_TASK_BATCH_SIZE
+    entries = []
+    for is_express in (False, True):
+        sms_ids = [
+            sms.id
+            for sms in sorted(sms_list, key=attrgetter("sender"))
+            if sms.is_express == is_express
+        ]
+        for i in range(0, len(sms_ids), batch_size):
+            entries.append(SMSOutbox(sms_ids=sms_ids[i : i + batch_size], is_express=is_express))
+    return SMSOutbox.objects.bulk_create(entries)
+
+
+def _get_task(entry: SMSOutbox) -> tuple:
+    from sms.tasks import (
+        send_express_sms,
+        send_express_sms_batch,
+        send_normal_sms,
+        send_normal_sms_batch,
+    )
+
+    if entry.is_express:
+        single_task, batch_task = send_express_sms, send_express_sms_batch
+    else:
+        single_task, batch_task = send_normal_sms, send_normal_sms_batch
+    if len(entry.sms_ids) == 1:
+        return single_task, (entry.sms_ids[0],)
+    return batch_task, (entry.sms_ids,)
+
+
+def relay_outbox(batch_size: int | None = None) -> int:
+    """Publish one batch of outbox rows and delete them. Returns the number published.
+
+    Rows are locked with SKIP LOCKED, so several relays can run side by side.
+    """
+    batch_size = batch_size or settings.SMS_OUTBOX_RELAY_BATCH_SIZE
+    with transaction.atomic():
+        entries = list(
+            SMSOutbox.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size]
+        )
+        if not entries:
+            return 0
+        tasks = [_get_task(entry) for entry in entries]
+        with tasks[0][0].app.producer_or_acquire() as producer:
+            for entry, (task, args) in zip(entries, tasks, strict=True):
+                task.apply_async(args, task_id=str(entry.task_id), producer=producer)
+        SMSOutbox.objects.filter(id__in=[entry.id for entry in entries]).delete()
+    return len(entries)
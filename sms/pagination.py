@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class SMSReportCursorPagination(CursorPagination):
+    # Seeks on (created_at, id) through sms_user_created_at_idx, so neither COUNT(*) nor OFFSET
+    # is needed. DRF's cursor only keeps the first ordering field and skips rows sharing it with
+    # an offset; this one keeps both, so a burst created in the same instant costs no OFFSET.
+    ordering = ("-created_at", "-id")
+    reverse_ordering = ("created_at", "id")
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f"{instance.created_at.isoformat()}|{instance.pk}"
+
+    def _seek(self, queryset, position: str, reverse: bool):
+        """Rows past ``position`` in the direction of the page being read."""
+        created_at, _, pk = position.rpartition("|")
+        try:
+            created_at, pk = datetime.fromisoformat(created_at), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message) from None
+        if reverse:
+            return queryset.filter(
+                Q(created_at__gt=created_at) | Q(id__gt=pk), created_at__gte=created_at
+            )
+        return queryset.filter(
+            Q(created_at__lt=created_at) | Q(id__lt=pk), created_at__lte=created_at
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor is not None else None
+
+        queryset = queryset.order_by(*(self.reverse_ordering if reverse else self.ordering))
+        if current_position is not None:
+            queryset = self._seek(queryset, current_position, reverse)
+
+        # One extra row tells whether another page follows
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = current_position is not None, current_position
+            self.has_previous, self.previous_position = (
+                following_position is not None,
+                following_position,
+            )
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = (
+                current_position is not None,
+                current_position,
+            )
+        self.display_page_controls = self.has_previous or self.has_next
+        return self.page
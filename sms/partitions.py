@@ -0,0 +1,170 @@
+"""
+Range partitions of the ``SMS`` table on ``created_at`` (PostgreSQL only).
+
+``sms/migrations/0005_partition_sms`` turns the table into a partitioned one. Partitions are
+named ``SMS_p<YYYYMMDD>`` after the first day they hold and cover one day or one ISO week,
+depending on ``SMS_PARTITION_INTERVAL``. Rows that fall outside every partition go to
+``SMS_default``, and are moved into the partition created for their range later on; the rows
+written before partitioning live in ``SMS_legacy``.
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "SMS"
+PARTITION_PREFIX = "SMS_p"
+DEFAULT_PARTITION = "SMS_default"
+LEGACY_PARTITION = "SMS_legacy"
+MOVING_TABLE = "SMS_moving"
+
+
+def is_partitioned(connection=default_connection) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())",
+            [TABLE_NAME],
+        )
+        return cursor.fetchone() is not None
+
+
+def period_start(day: date, interval: str | None = None) -> date:
+    interval = interval or settings.SMS_PARTITION_INTERVAL
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def period_bounds(day: date, interval: str | None = None) -> tuple[date, date]:
+    interval = interval or settings.SMS_PARTITION_INTERVAL
+    start = period_start(day, interval)
+    return start, start + timedelta(days=7 if interval == "week" else 1)
+
+
+def partition_name(start: date) -> str:
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def partition_start(name: str) -> date | None:
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX) :], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def list_partitions(connection=default_connection) -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname",
+            [TABLE_NAME],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _create_partition(
+    name: str, start: date, end: date, has_default: bool, connection=default_connection
+) -> None:
+    bounds = [f"{start.isoformat()} 00:00:00+00", f"{end.isoformat()} 00:00:00+00"]
+    create_sql = (
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE_NAME}" '
+        f"FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')"
+    )
+    with connection.cursor() as cursor:
+        if has_default:
+            cursor.execute(
+                f'SELECT 1 FROM "{DEFAULT_PARTITION}" '
+                "WHERE created_at >= %s AND created_at < %s LIMIT 1",
+                bounds,
+            )
+            has_default = cursor.fetchone() is not None
+        if not has_default:
+            cursor.execute(create_sql)
+            return
+        # PostgreSQL refuses a range the default partition holds rows of, so they are taken
+        # out first and inserted again through the parent once the partition exists
+        with transaction.atomic(using=connection.alias):
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE "{MOVING_TABLE}" (LIKE "{TABLE_NAME}") ON COMMIT DROP'
+            )
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+                "WHERE created_at >= %s AND created_at < %s RETURNING *) "
+                f'INSERT INTO "{MOVING_TABLE}" SELECT * FROM moved',
+                bounds,
+            )
+            cursor.execute(create_sql)
+            cursor.execute(f'INSERT INTO "{TABLE_NAME}" SELECT * FROM "{MOVING_TABLE}"')
+        logger.info("Moved SMS rows from %s to %s", DEFAULT_PARTITION, name)
+
+
+def create_partitions(
+    periods_ahead: int | None = None, today: date | None = None, connection=default_connection
+) -> list[str]:
+    """Create the partition of the current period and ``periods_ahead`` following ones."""
+    periods_ahead = settings.SMS_PARTITION_PREMAKE if periods_ahead is None else periods_ahead
+    today = today or now().date()
+    existing = set(list_partitions(connection))
+
+    created = []
+    start = period_start(today)
+    for _ in range(periods_ahead + 1):
+        start, end = period_bounds(start)
+        name = partition_name(start)
+        if name not in existing:
+            _create_partition(name, start, end, DEFAULT_PARTITION in existing, connection)
+            created.append(name)
+        start = end
+    return created
+
+
+def remove_old_partitions(
+    retention_days: int | None = None,
+    drop: bool | None = None,
+    today: date | None = None,
+    connection=default_connection,
+) -> list[str]:
+    """Detach, and with ``drop`` also drop, partitions wholly older than ``retention_days``.
+
+    A retention of 0 keeps every partition. ``SMS_legacy`` and ``SMS_default`` are never
+    touched here.
+    """
+    retention_days = (
+        settings.SMS_PARTITION_RETENTION_DAYS if retention_days is None else retention_days
+    )
+    drop = settings.SMS_PARTITION_DROP_DETACHED if drop is None else drop
+    if not retention_days:
+        return []
+    cut_off = (today or now().date()) - timedelta(days=retention_days)
+
+    removed = []
+    for name in list_partitions(connection):
+        start = partition_start(name)
+        if start is None or period_bounds(start)[1] > cut_off:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{TABLE_NAME}" DETACH PARTITION "{name}"')
+            if drop:
+                cursor.execute(f'DROP TABLE "{name}"')
+        logger.info("%s SMS partition %s", "Dropped" if drop else "Detached", name)
+        removed.append(name)
+    return removed
+
+
+def rotate_partitions() -> tuple[list[str], list[str]]:
+    """Create upcoming partitions and remove expired ones; no-op unless partitioned."""
+    if not is_partitioned():
+        return [], []
+    return create_partitions(), remove_old_partitions()
@@ -0,0 +1,115 @@
+import logging
+import math
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from account.models import User
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+BUCKET_KEY_TEMPLATE = "rate_limit_bucket:{user_id}"
+LIMIT_KEY_TEMPLATE = "rate_limit_per_minute:{user_id}"
+LIMIT_CACHE_TIMEOUT = 3600
+
+_LIMIT_NOT_LOADED = -1
+_OVER_CAPACITY = -2
+
+
+class OverCapacityError(Exception):
+    """A request needs more tokens than the user's bucket holds, so it can never be sent."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        super().__init__(f"Request exceeds the limit of {capacity} segments per minute")
+
+
+# Token bucket refilled continuously at rate_limit_per_minute tokens per minute. The limit is
+# read from Redis inside the script so the whole check is a single round trip.
+_token_bucket_script = redis_conn.register_script(
+    """
+    local capacity = tonumber(redis.call('GET', KEYS[2]))
+    if capacity == nil then
+        return {-1, 0}
+    end
+    local requested = tonumber(ARGV[1])
+    if requested > capacity then
+        return {-2, capacity}
+    end
+    local rate = capacity / 60000
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local retry_after_ms = 0
+    if tokens >= requested then
+        tokens = tokens - requested
+        allowed = 1
+    else
+        retry_after_ms = math.ceil((requested - tokens) / rate)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], 60000)
+    return {allowed, retry_after_ms}
+    """
+)
+
+
+def _get_bucket_key(user_id: int) -> str:
+    return BUCKET_KEY_TEMPLATE.format(user_id=user_id)
+
+
+def _get_limit_key(user_id: int) -> str:
+    return LIMIT_KEY_TEMPLATE.format(user_id=user_id)
+
+
+def _load_rate_limit(user_id: int) -> int | None:
+    rate_limit = (
+        User.objects.filter(id=user_id).values_list("rate_limit_per_minute", flat=True).first()
+    )
+    if rate_limit is not None:
+        redis_conn.set(_get_limit_key(user_id), rate_limit, ex=LIMIT_CACHE_TIMEOUT)
+    return rate_limit
+
+
+def consume_send_tokens(user_id: int, tokens: int = 1) -> tuple[bool, int | None]:
+    """Take ``tokens`` from the user's bucket; return ``(allowed, retry_after_seconds)``.
+
+    Raises ``OverCapacityError`` when the request can never fit in the bucket. Redis failures
+    let the request through: rate limiting must not take sending down with it.
+    """
+    keys = [_get_bucket_key(user_id), _get_limit_key(user_id)]
+    try:
+        result, retry_after_ms = _token_bucket_script(keys=keys, args=[tokens])
+        if result == _LIMIT_NOT_LOADED:
+            if _load_rate_limit(user_id) is None:
+                return True, None
+            result, retry_after_ms = _token_bucket_script(keys=keys, args=[tokens])
+    except RedisError:
+        logger.warning("Rate limit check skipped for user %s", user_id, exc_info=True)
+        return True, None
+
+    if result == _OVER_CAPACITY:
+        raise OverCapacityError(retry_after_ms)
+    return bool(result), math.ceil(retry_after_ms / 1000) if not result else None
+
+
+@receiver(post_save, sender=User)
+def invalidate_rate_limit(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "rate_limit_per_minute" not in update_fields:
+        return
+
+    def _invalidate():
+        try:
+            redis_conn.delete(_get_limit_key(instance.id))
+        except RedisError:
+            logger.warning("Could not invalidate rate limit of user %s", instance.id, exc_info=True)
+
+    transaction.on_commit(_invalidate)
@@ -0,0 +1,253 @@
+"""
+Batched delivery status reconciliation.
+
+SENT messages are paged by id (a keyset, so status changes never shift the pages), their
+statuses are fetched from the provider with a few requests in flight, and every response is
+applied with one UPDATE and one bulk refund. A failing batch is logged and reported in
+the run result without stopping the others. Every provider account is polled through its own
+client and maps statuses with the ``STATUS_MAPPER`` of its ``SMS_PROVIDER_ACCOUNTS`` entry;
+SMS of accounts without one are neither polled nor expired.
+"""
+
+import logging
+from collections import defaultdict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from billing.services import create_bulk_refund_transactions
+from sms.metrics import PROVIDER_REQUEST_SECONDS, count_status_changes
+from sms.models import SMS, SMSStatus
+from sms.services import filter_by_provider_accounts, get_sms_to_check_status
+from sms.sms_provider_clients.registry import get_provider_client
+from sms.sms_provider_clients.routing import record_delivery_reports
+from webhooks.services import emit_sms_status_events
+
+logger = logging.getLogger(__name__)
+
+MAGFA_FAILED_STATUSES = {-1}
+MAGFA_DELIVERED_STATUSES = {1, 2}
+
+
+def map_magfa_status(dlr_status) -> str | None:
+    """Map a Magfa delivery status to an SMS status; None while the message is pending."""
+    if dlr_status in MAGFA_FAILED_STATUSES:
+        return SMSStatus.FAILED
+    if dlr_status in MAGFA_DELIVERED_STATUSES:
+        return SMSStatus.DELIVERED
+    return None
+
+
+def get_status_mapper(account: str) -> Callable | None:
+    """Function mapping delivery statuses of ``account``; None if it cannot report them."""
+    path = settings.SMS_PROVIDER_ACCOUNTS.get(account, {}).get("STATUS_MAPPER")
+    return import_string(path) if path else None
+
+
+def get_reporting_accounts() -> list[str]:
+    """Provider accounts whose delivery statuses can be polled and pushed."""
+    return [
+        account
+        for account, config in settings.SMS_PROVIDER_ACCOUNTS.items()
+        if config.get("STATUS_MAPPER")
+    ]
+
+
+@transaction.atomic
+def apply_status_updates(
+    updates: dict[int, str], created_after=None, expired: bool = False
+) -> dict:
+    """Apply ``{sms_id: DELIVERED | FAILED}`` to SMS still in SENT and refund the failed ones.
+
+    ``created_after`` bounds the lookups by id to the partitions the SMS can be in. A webhook
+    event is emitted for every SMS that changed. Delivery reports count towards the
+    routing weights of their accounts; ``expired`` updates came from no report and do not.
+    Returns the number of SMS moved to each status.
+    """
+    counts = {SMSStatus.DELIVERED: 0, SMSStatus.FAILED: 0}
+    if not updates:
+        return counts
+
+    queryset = SMS.objects.all()
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gte=created_after)
+    sms_list = list(
+        queryset.select_for_update()
+        .filter(id__in=updates, status=SMSStatus.SENT)
+        .only("id", "user_id", "cost", "provider", "sender", "is_express")
+    )
+    if not sms_list:
+        return counts
+
+    ids_by_status = defaultdict(list)
+    for sms in sms_list:
+        ids_by_status[updates[sms.id]].append(sms.id)
+    queryset.filter(id__in=[sms.id for sms in sms_list]).update(
+        status=Case(
+            *[
+                When(id__in=sms_ids, then=Value(new_status))
+                for new_status, sms_ids in ids_by_status.items()
+            ]
+        ),
+        modified_at=now(),
+    )
+
+    refunds = [
+        (sms, sms.cost) for sms in sms_list if updates[sms.id] == SMSStatus.FAILED and sms.cost > 0
+    ]
+    if refunds:
+        create_bulk_refund_transactions(refunds)
+
+    for sms in sms_list:
+        sms.status = updates[sms.id]
+    emit_sms_status_events(sms_list)
+    transaction.on_commit(lambda: count_status_changes(sms_list))
+    if not expired:
+        transaction.on_commit(lambda: record_delivery_reports(_delivery_counts(sms_list)))
+
+    for new_status, sms_ids in ids_by_status.items():
+        counts[new_status] = len(sms_ids)
+    return counts
+
+
+def _delivery_counts(sms_list: list[SMS]) -> dict[str, tuple[int, int]]:
+    # Accounts whose reports are not ingested have no delivery rate to count
+    reporting_accounts = set(get_reporting_accounts())
+    counts = defaultdict(lambda: (0, 0))
+    for sms in sms_list:
+        if sms.provider in reporting_accounts:
+            delivered, undelivered = counts[sms.provider]
+            if sms.status == SMSStatus.DELIVERED:
+                counts[sms.provider] = (delivered + 1, undelivered)
+            else:
+                counts[sms.provider] = (delivered, undelivered + 1)
+    return counts
+
+
+def _iter_pages(queryset, batch_size: int, fields: tuple):
+    last_id = 0
+    while True:
+        page = list(
+            queryset.filter(id__gt=last_id).order_by("id").values_list(*fields)[:batch_size]
+        )
+        if not page:
+            return
+        last_id = page[-1][0]
+        yield page
+
+
+def _fetch_statuses(account: str, api, page: list[tuple]) -> dict:
+    with PROVIDER_REQUEST_SECONDS.labels(account, "get_statuses").time():
+        return api.get_statuses([message_id for _, message_id in page])
+
+
+def _updates_from_response(page: list[tuple], response: dict, map_status) -> dict[int, str]:
+    dlrs = response.get("dlrs")
+    if dlrs is None:
+        raise ValueError(f"Unexpected provider response with status {response.get('status')}")
+
+    ids_by_mid = {message_id: sms_id for sms_id, message_id in page}
+    updates = {}
+    for message_data in dlrs:
+        new_status = map_status(message_data.get("status"))
+        sms_id = ids_by_mid.get(int(message_data.get("mid") or 0))
+        if new_status and sms_id:
+            updates[sms_id] = new_status
+    return updates
+
+
+def _new_result() -> dict:
+    return {"checked": 0, SMSStatus.DELIVERED: 0, SMSStatus.FAILED: 0, "errors": []}
+
+
+def _record_batch(result: dict, page: list[tuple], apply) -> None:
+    try:
+        counts = apply()
+    except Exception as e:
+        logger.exception("Status reconciliation failed for SMS %s..%s", page[0][0], page[-1][0])
+        result["errors"].append({"first_id": page[0][0], "last_id": page[-1][0], "error": str(e)})
+        return
+    result["checked"] += len(page)
+    for new_status, count in counts.items():
+        result[new_status] += count
+
+
+def reconcile_account_statuses(
+    account: str, cut_off=None, batch_size=None, concurrency=None
+) -> dict:
+    """Check every SMS of provider ``account`` sent after ``cut_off`` that is still in SENT."""
+    cut_off = cut_off or now() - timedelta(hours=settings.SMS_STATUS_CHECK_WINDOW_HOURS)
+    batch_size = batch_size or settings.SMS_STATUS_CHECK_BATCH_SIZE
+    concurrency = concurrency or settings.SMS_STATUS_CHECK_CONCURRENCY
+    map_status = get_status_mapper(account)
+    api = get_provider_client(account)
+    queryset = get_sms_to_check_status(account, cut_off).exclude(message_id=None)
+    pages = _iter_pages(queryset, batch_size, ("id", "message_id"))
+
+    result = _new_result()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            in_flight = [
+                (page, executor.submit(_fetch_statuses, account, api, page))
+                for page in islice(pages, concurrency)
+            ]
+            if not in_flight:
+                break
+            for page, future in in_flight:
+                _record_batch(
+                    result,
+                    page,
+                    lambda page=page, future=future: apply_status_updates(
+                        _updates_from_response(page, future.result(), map_status),
+                        created_after=cut_off,
+                    ),
+                )
+    return result
+
+
+def reconcile_statuses(cut_off=None, batch_size=None, concurrency=None) -> dict:
+    """``reconcile_account_statuses`` for every account that can report statuses, summed."""
+    result = _new_result()
+    for account in get_reporting_accounts():
+        account_result = reconcile_account_statuses(account, cut_off, batch_size, concurrency)
+        for name, value in account_result.items():
+            result[name] += value
+    return result
+
+
+def expire_sent_sms(cut_off=None, batch_size=None) -> dict:
+    """Fail and refund SMS that got no delivery report within the check window.
+
+    Only the window before ``cut_off`` is scanned, so the task must run at least once per
+    ``SMS_STATUS_CHECK_WINDOW_HOURS``. SMS of accounts that cannot report statuses are left
+    in SENT, as the missing report says nothing about their delivery.
+    """
+    window = timedelta(hours=settings.SMS_STATUS_CHECK_WINDOW_HOURS)
+    cut_off = cut_off or now() - window
+    batch_size = batch_size or settings.SMS_STATUS_CHECK_BATCH_SIZE
+    queryset = filter_by_provider_accounts(
+        SMS.objects.filter(
+            status=SMSStatus.SENT, created_at__gte=cut_off - window, created_at__lt=cut_off
+        ),
+        get_reporting_accounts(),
+    )
+
+    result = _new_result()
+    for page in _iter_pages(queryset, batch_size, ("id",)):
+        _record_batch(
+            result,
+            page,
+            lambda page=page: apply_status_updates(
+                {sms_id: SMSStatus.FAILED for (sms_id,) in page},
+                created_after=cut_off - window,
+                expired=True,
+            ),
+        )
+    return result
@@ -0,0 +1,87 @@
+"""
+SMS segment counting.
+
+Text that fits the GSM 03.38 alphabet is sent as 7-bit GSM: 160 characters in one SMS, 153
+per part when concatenated, with the extension characters (``{}[]~^|\\€``) taking two.
+Anything else, Persian included, is sent as UCS-2: 70 UTF-16 code units in one SMS, 67 per
+part, with characters outside the BMP (most emoji) taking two. A two-unit character is never
+split between parts.
+
+The text is scanned by compiled regexes only; Python code runs once per two-unit character,
+and only for multipart messages (``benchmarks.segments`` compares the alternatives).
+"""
+
+import re
+from typing import NamedTuple
+
+GSM_7 = "gsm7"
+UCS_2 = "ucs2"
+
+GSM_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Sent as an escape plus a character, so each takes two septets
+GSM_EXTENSION = frozenset("\f^{}\\[~]|€")
+GSM_ALPHABET = GSM_BASIC | GSM_EXTENSION
+
+# Units of a single SMS and of each part of a concatenated one
+SEGMENT_UNITS = {GSM_7: (160, 153), UCS_2: (70, 67)}
+
+
+def _char_class(chars) -> str:
+    return "[" + re.escape("".join(sorted(chars))) + "]"
+
+
+_GSM_RE = re.compile(_char_class(GSM_ALPHABET) + "*")
+# Characters taking two units in each encoding
+_WIDE_RES = {
+    GSM_7: re.compile(_char_class(GSM_EXTENSION)),
+    UCS_2: re.compile("[\U00010000-\U0010ffff]"),
+}
+
+
+class SegmentInfo(NamedTuple):
+    encoding: str
+    # Septets for GSM-7, UTF-16 code units for UCS-2
+    units: int
+    segments: int
+
+
+def _split(text: str, wide_re: re.Pattern, part_units: int) -> int:
+    """Parts needed when two-unit characters must not straddle a part boundary."""
+    segments, used, position = 1, 0, 0
+    for match in wide_re.finditer(text):
+        used += match.start() - position
+        if used > part_units:
+            full_parts = (used - 1) // part_units
+            segments += full_parts
+            used -= full_parts * part_units
+        if used + 2 > part_units:
+            segments += 1
+            used = 0
+        used += 2
+        position = match.end()
+    used += len(text) - position
+    return segments + (used - 1) // part_units
+
+
+def segment_info(text: str) -> SegmentInfo:
+    encoding = GSM_7 if _GSM_RE.fullmatch(text) else UCS_2
+    wide_re = _WIDE_RES[encoding]
+    wide = len(wide_re.findall(text))
+    units = len(text) + wide
+
+    single_units, part_units = SEGMENT_UNITS[encoding]
+    if units <= single_units:
+        segments = 1
+    elif wide:
+        segments = _split(text, wide_re, part_units)
+    else:
+        segments = -(-units // part_units)
+    return SegmentInfo(encoding, units, segments)
+
+
+def count_segments(text: str) -> int:
+    """Number of SMS ``text`` is sent and charged as."""
+    return segment_info(text).segments
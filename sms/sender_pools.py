@@ -0,0 +1,293 @@
+"""
+Sender-number pools.
+
+A user sends from the lines of their ``SenderPool``, or of the shared pool when they have
+none; without any pool every SMS goes out on ``SMS_DEFAULT_SENDER`` as before. Each process
+keeps the active pools in memory and reloads them, like ``billing.tariffs``, when
+``sender_pools:version`` changes in Redis. Allocating senders for a request costs one Redis
+round trip:
+
+* ``round_robin`` pools take consecutive slots of a smooth weighted schedule through a shared
+  cursor, so every line gets traffic in proportion to its ``max_per_second``;
+* ``least_loaded`` pools give each message to the line with the lowest share of its cap
+  allocated in the current second.
+
+Workers hold each line to its ``max_per_second`` segments with a per-second counter before
+calling the provider, and re-queue the SMS when the line stays full for ``MAX_WAIT_SECONDS``.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from sms.models import SenderLine, SenderPool, SenderPoolStrategy
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+VERSION_KEY = "sender_pools:version"
+CURSOR_KEY_TEMPLATE = "sender_pool:{pool_id}:cursor"
+ALLOCATED_KEY_TEMPLATE = "sender_line:{number}:allocated:{second}"
+SENT_KEY_TEMPLATE = "sender_line:{number}:sent:{second}"
+# Longest round-robin schedule kept per pool; larger weights are scaled down to fit
+MAX_SCHEDULE_LENGTH = 1000
+
+# KEYS: the line's counter of the current second. ARGV: segments, cap.
+# Returns 1 when the segments fit in the line's cap for this second. A batch larger than the
+# cap is let through on an unused second, so it cannot wait forever.
+_take_line_capacity_script = redis_conn.register_script(
+    """
+    local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if used > 0 and used + tonumber(ARGV[1]) > tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('INCRBY', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], 2)
+    return 1
+    """
+)
+
+
+class SenderLineBusyError(Exception):
+    """A sender line stayed at its throughput cap; the SMS should be retried later."""
+
+
+@dataclass(frozen=True)
+class Line:
+    number: str
+    max_per_second: int
+
+
+@dataclass(frozen=True)
+class Pool:
+    id: int
+    strategy: str
+    lines: tuple[Line, ...]
+    # Line indexes in round-robin order
+    schedule: tuple[int, ...]
+
+
+def _weighted_schedule(weights: list[int]) -> tuple[int, ...]:
+    """Smooth weighted round-robin order, which interleaves lines instead of grouping them."""
+    divisor = reduce(math.gcd, weights)
+    weights = [weight // divisor for weight in weights]
+    if sum(weights) > MAX_SCHEDULE_LENGTH:
+        scale = MAX_SCHEDULE_LENGTH / sum(weights)
+        weights = [max(int(weight * scale), 1) for weight in weights]
+    total = sum(weights)
+    current = [0] * len(weights)
+    schedule = []
+    for _ in range(total):
+        for index, weight in enumerate(weights):
+            current[index] += weight
+        chosen = max(range(len(weights)), key=current.__getitem__)
+        current[chosen] -= total
+        schedule.append(chosen)
+    return tuple(schedule)
+
+
+class PoolTable:
+    def __init__(self, pools: list[Pool], shared_pool_id: int | None):
+        self.pools = {pool.id: pool for pool in pools}
+        self.shared_pool_id = shared_pool_id if shared_pool_id in self.pools else None
+        self.caps = {line.number: line.max_per_second for pool in pools for line in pool.lines}
+
+    def pool_for(self, pool_id: int | None) -> Pool | None:
+        return self.pools.get(pool_id) or self.pools.get(self.shared_pool_id)
+
+
+def load_pool_table() -> PoolTable:
+    lines_by_pool = {}
+    for line in (
+        SenderLine.objects.filter(is_active=True).select_related("pool").order_by("pool_id", "id")
+    ):
+        lines_by_pool.setdefault(line.pool, []).append(
+            Line(number=line.number, max_per_second=line.max_per_second)
+        )
+    pools = [
+        Pool(
+            id=pool.id,
+            strategy=pool.strategy,
+            lines=tuple(lines),
+            schedule=_weighted_schedule([line.max_per_second or 1 for line in lines]),
+        )
+        for pool, lines in lines_by_pool.items()
+    ]
+    shared_pool_id = (
+        SenderPool.objects.filter(is_shared=True).order_by("id").values_list("id", flat=True)
+    ).first()
+    return PoolTable(pools, shared_pool_id)
+
+
+_table: PoolTable | None = None
+_version = None
+_checked_until = 0.0
+_lock = threading.Lock()
+# Round-robin cursors of this process, used while Redis is unreachable
+_local_cursors: dict[int, int] = {}
+
+
+def get_pool_table() -> PoolTable:
+    """The pools of this process, reloaded when another process changed them."""
+    global _table, _version, _checked_until
+
+    table = _table
+    if table is not None and time.monotonic() < _checked_until:
+        return table
+    with _lock:
+        if _table is not None and time.monotonic() < _checked_until:
+            return _table
+        try:
+            version = redis_conn.get(VERSION_KEY)
+        except RedisError:
+            logger.warning("Sender pool version check skipped", exc_info=True)
+            version = _version
+        if _table is None or version != _version:
+            _table = load_pool_table()
+            _version = version
+        _checked_until = time.monotonic() + settings.SMS_SENDER_POOL["REFRESH_SECONDS"]
+        return _table
+
+
+def reset_pool_table() -> None:
+    global _table, _version, _checked_until
+
+    with _lock:
+        _table = None
+        _version = None
+        _checked_until = 0.0
+
+
+def publish_pool_change() -> None:
+    global _checked_until
+
+    try:
+        redis_conn.incr(VERSION_KEY)
+    except RedisError:
+        logger.warning("Could not publish sender pool change", exc_info=True)
+    with _lock:
+        _checked_until = 0.0
+
+
+@receiver(post_save, sender=SenderPool)
+@receiver(post_delete, sender=SenderPool)
+@receiver(post_save, sender=SenderLine)
+@receiver(post_delete, sender=SenderLine)
+def sender_pool_changed(sender, **kwargs):
+    transaction.on_commit(publish_pool_change)
+
+
+def _round_robin(pool: Pool, segments: list[int]) -> list[str]:
+    count = len(segments)
+    try:
+        start = redis_conn.incrby(CURSOR_KEY_TEMPLATE.format(pool_id=pool.id), count) - count
+    except RedisError:
+        logger.warning("Sender pool %s cursor unavailable", pool.id, exc_info=True)
+        with _lock:
+            start = _local_cursors.get(pool.id, 0)
+            _local_cursors[pool.id] = start + count
+    schedule = pool.schedule
+    return [pool.lines[schedule[(start + i) % len(schedule)]].number for i in range(count)]
+
+
+def _least_loaded(pool: Pool, segments: list[int]) -> list[str]:
+    second = int(time.time())
+    keys = [ALLOCATED_KEY_TEMPLATE.format(number=line.number, second=second) for line in pool.lines]
+    try:
+        allocated = [int(value or 0) for value in redis_conn.mget(keys)]
+    except RedisError:
+        logger.warning("Sender pool %s loads unavailable", pool.id, exc_info=True)
+        allocated = [0] * len(pool.lines)
+
+    caps = [line.max_per_second or 1 for line in pool.lines]
+    heap = [(allocated[index] / caps[index], index) for index in range(len(pool.lines))]
+    heapq.heapify(heap)
+    added = [0] * len(pool.lines)
+    senders = []
+    for message_segments in segments:
+        _, index = heapq.heappop(heap)
+        added[index] += message_segments
+        senders.append(pool.lines[index].number)
+        heapq.heappush(heap, ((allocated[index] + added[index]) / caps[index], index))
+
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        for key, amount in zip(keys, added, strict=True):
+            if amount:
+                pipe.incrby(key, amount)
+                pipe.expire(key, 2)
+        pipe.execute()
+    except RedisError:
+        logger.warning("Sender pool %s loads not recorded", pool.id, exc_info=True)
+    return senders
+
+
+def allocate_senders(user, segments: list[int]) -> list[str]:
+    """Sender numbers for messages of ``user`` with the given segment counts, in order."""
+    pool = get_pool_table().pool_for(user.sender_pool_id)
+    if pool is None:
+        return [settings.SMS_DEFAULT_SENDER] * len(segments)
+    if pool.strategy == SenderPoolStrategy.LEAST_LOADED:
+        return _least_loaded(pool, segments)
+    return _round_robin(pool, segments)
+
+
+def line_capacity(number: str) -> int | None:
+    """Segments per second a pool line accepts; None for numbers outside every pool."""
+    return get_pool_table().caps.get(number)
+
+
+def _take_line_capacity(number: str, segments: int, cap: int) -> float | None:
+    """Take ``segments`` of this second's cap; return the wait for the next second when full."""
+    now = time.time()
+    key = SENT_KEY_TEMPLATE.format(number=number, second=int(now))
+    try:
+        if _take_line_capacity_script(keys=[key], args=[segments, cap]):
+            return None
+    except RedisError:
+        logger.warning("Sender line %s cap check skipped", number, exc_info=True)
+        return None
+    return 1 - now % 1
+
+
+def wait_for_line_capacity(number: str, segments: int) -> None:
+    """Block until ``number`` can take ``segments`` more this second.
+
+    Raises ``SenderLineBusyError`` after ``MAX_WAIT_SECONDS``. Redis failures let the call
+    through: the cap must not stop sending by itself.
+    """
+    cap = line_capacity(number)
+    if not cap:
+        return
+    deadline = time.monotonic() + settings.SMS_SENDER_POOL["MAX_WAIT_SECONDS"]
+    while (wait := _take_line_capacity(number, segments, cap)) is not None:
+        if time.monotonic() + wait > deadline:
+            raise SenderLineBusyError(f"Sender line {number} is at its cap of {cap}/s")
+        time.sleep(wait)
+
+
+async def await_line_capacity(number: str, segments: int) -> None:
+    """``wait_for_line_capacity`` for an event loop: Redis runs in a thread, waits sleep."""
+    cap = await sync_to_async(line_capacity)(number)
+    if not cap:
+        return
+    take = sync_to_async(_take_line_capacity, thread_sensitive=False)
+    deadline = time.monotonic() + settings.SMS_SENDER_POOL["MAX_WAIT_SECONDS"]
+    while (wait := await take(number, segments, cap)) is not None:
+        if time.monotonic() + wait > deadline:
+            raise SenderLineBusyError(f"Sender line {number} is at its cap of {cap}/s")
+        await asyncio.sleep(wait)
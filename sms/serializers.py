@@ -1,11 +1,12 @@
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from sms.models import SMS
+from sms.segments import count_segments
 
 
-class SendSMSSerializer(serializers.Serializer):
-    user_id = serializers.IntegerField()
+class SMSMessageSerializer(serializers.Serializer):
     receiver = serializers.RegexField(
         label=_("Receiver Phone Number"),
         regex=r"^\d{9,15}$",
@@ -20,6 +21,15 @@ class SendSMSSerializer(serializers.Serializer):
         allow_blank=False,
         style={"base_template": "textarea.html"},
     )
+
+    def validate(self, attrs):
+        # Counted once here; rate limiting, pricing and the SMS row all use it
+        attrs["segments"] = count_segments(attrs["content"])
+        return attrs
+
+
+class SendSMSSerializer(SMSMessageSerializer):
+    user_id = serializers.IntegerField()
     is_express = serializers.BooleanField(default=False)
 
 
@@ -28,6 +38,28 @@ class SendSMSResponseSerializer(serializers.Serializer):
     task_id = serializers.CharField()
 
 
+class BulkSendSMSSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    messages = SMSMessageSerializer(
+        many=True, allow_empty=False, max_length=settings.SMS_BULK_MAX_MESSAGES
+    )
+    is_express = serializers.BooleanField(default=False)
+
+
+class BulkSendSMSResponseSerializer(serializers.Serializer):
+    sms_ids = serializers.ListField(child=serializers.IntegerField())
+    task_ids = serializers.ListField(child=serializers.CharField())
+
+
+class DeliveryReportSerializer(serializers.Serializer):
+    mid = serializers.IntegerField()
+    status = serializers.IntegerField()
+
+
+class DeliveryReportResponseSerializer(serializers.Serializer):
+    received = serializers.IntegerField()
+
+
 class ErrorResponseSerializer(serializers.Serializer):
     error = serializers.CharField()
 
@@ -43,6 +75,7 @@ class SMSReportSerializer(serializers.ModelSerializer):
             "status",
             "content",
             "cost",
+            "segments",
             "is_express",
             "created_at",
             "modified_at",
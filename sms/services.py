@@ -1,27 +1,39 @@
 from datetime import timedelta
+from operator import attrgetter
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Q
 from django.utils.timezone import now
 
 from account.models import User
+from billing.ledger import reserve_balance
 from billing.services import (
+    create_bulk_deduct_transactions,
     create_deduct_transaction,
     create_refund_transaction,
     update_transaction_sms_field,
 )
+from billing.tariffs import get_tariff_table
+from sms.metrics import SERVICE_CALL_SECONDS, timed
 from sms.models import SMS, SMSStatus
+from sms.outbox import add_to_outbox
+from sms.segments import count_segments
+from sms.sender_pools import allocate_senders
+from sms.utils import SENDER_PREFIX_ACCOUNTS
+from webhooks.services import emit_sms_status_events
 
 
-def _calculate_sms_cost(content: str, sender: str, receiver: str, is_express: bool) -> int:
-    # TODO calculate base on sender operator fee and content and receiver location (for international numbers)
-    if is_express:
-        return 1500  # in Rial
-    else:
-        return 1000  # in Rial
+def _calculate_sms_cost(
+    content: str, receiver: str, is_express: bool, segments: int | None = None
+) -> int:
+    if segments is None:
+        segments = count_segments(content)
+    return get_tariff_table().price(receiver, is_express, segments)  # in Rial
 
 
-def _get_sender_number(user: User) -> str:
-    return "100002"
+def _get_sender_number(user: User, segments: int = 1) -> str:
+    return allocate_senders(user, [segments])[0]
 
 
 def create_sms(
@@ -31,6 +43,8 @@ def create_sms(
     receiver: str,
     cost: int,
     is_express: bool = False,
+    status: str = SMSStatus.CREATED,
+    segments: int = 1,
 ) -> SMS:
     sms = SMS.objects.create(
         user=user,
@@ -38,38 +52,154 @@ def create_sms(
         receiver=receiver,
         content=content,
         cost=cost,
-        status=SMSStatus.CREATED,
+        status=status,
         is_express=is_express,
+        segments=segments,
     )
     return sms
 
 
+@timed(SERVICE_CALL_SECONDS, "create_sms_and_deduct_balance")
 @transaction.atomic
-def create_sms_and_deduct_balance(user, content, receiver, is_express=False) -> SMS:
-    sender_number = _get_sender_number(user)
-    cost = _calculate_sms_cost(content, sender_number, receiver, is_express)
+def create_sms_and_deduct_balance(
+    user, content, receiver, is_express=False, status=SMSStatus.CREATED, segments=None
+) -> SMS:
+    if segments is None:
+        segments = count_segments(content)
+    sender_number = _get_sender_number(user, segments)
+    cost = _calculate_sms_cost(content, receiver, is_express, segments)
+    sms_fields = {"is_express": is_express, "status": status, "segments": segments}
+    if settings.BILLING_FAST_LEDGER_ENABLED:
+        sms = create_sms(user, content, sender_number, receiver, cost, **sms_fields)
+        reserve_balance(user.id, [(sms.id, sms.cost)])
+        return sms
     tx = create_deduct_transaction(user=user, amount=cost)
-    sms = create_sms(user, content, sender_number, receiver, cost, is_express=is_express)
+    sms = create_sms(user, content, sender_number, receiver, cost, **sms_fields)
     update_transaction_sms_field(tx, sms)
     return sms
 
 
+@transaction.atomic
+def create_bulk_sms_and_deduct_balance(
+    user, messages, is_express=False, status=SMSStatus.CREATED
+) -> list[SMS]:
+    segments_list = [
+        message.get("segments") or count_segments(message["content"]) for message in messages
+    ]
+    # Spread over the user's sender lines, so the batch goes out on several lines in parallel
+    senders = allocate_senders(user, segments_list)
+    sms_list = []
+    for message, sender_number, segments in zip(messages, senders, segments_list, strict=True):
+        sms_list.append(
+            SMS(
+                user=user,
+                sender=sender_number,
+                receiver=message["receiver"],
+                content=message["content"],
+                cost=_calculate_sms_cost(
+                    message["content"], message["receiver"], is_express, segments
+                ),
+                status=status,
+                is_express=is_express,
+                segments=segments,
+            )
+        )
+    sms_list = SMS.objects.bulk_create(sms_list)
+    if settings.BILLING_FAST_LEDGER_ENABLED:
+        reserve_balance(user.id, [(sms.id, sms.cost) for sms in sms_list])
+    else:
+        create_bulk_deduct_transactions(user=user, sms_list=sms_list)
+    return sms_list
+
+
 def send_sms(sms: SMS, forced: bool = False):
-    from sms.tasks import send_express_sms, send_normal_sms
+    from sms.tasks import build_send_payload, send_express_sms, send_normal_sms
 
     if not forced and sms.status not in [SMSStatus.CREATED, SMSStatus.FAILED]:
         raise Exception(f"SMS status {sms.status} already added to queue")
     sms.status = SMSStatus.IN_QUEUE
     sms.save(update_fields=["status", "modified_at"])
-    if sms.is_express:
-        return send_express_sms.delay(sms.id)
-    return send_normal_sms.delay(sms.id)
-
-
-def get_magfa_sms_to_check_status():
-    cut_off = now() - timedelta(hours=24)
-    return SMS.objects.filter(
-        status=SMSStatus.SENT, created_at__gte=cut_off, sender__startswith="3000"
+    task = send_express_sms if sms.is_express else send_normal_sms
+    return task.delay(sms.id, payload=build_send_payload(sms))
+
+
+def send_bulk_sms(sms_list: list[SMS]) -> list:
+    from sms.tasks import send_express_sms_batch, send_normal_sms_batch
+
+    batch_size = settings.SMS_BULK_TASK_BATCH_SIZE
+    tasks = []
+    for is_express, batch_task in ((False, send_normal_sms_batch), (True, send_express_sms_batch)):
+        # Grouped by sender line, so each task mostly holds one line and lines send in parallel
+        sms_ids = [
+            sms.id
+            for sms in sorted(sms_list, key=attrgetter("sender"))
+            if sms.is_express == is_express
+        ]
+        for i in range(0, len(sms_ids), batch_size):
+            batch_ids = sms_ids[i : i + batch_size]
+            SMS.objects.filter(id__in=batch_ids, status=SMSStatus.CREATED).update(
+                status=SMSStatus.IN_QUEUE, modified_at=now()
+            )
+            tasks.append(batch_task.delay(batch_ids))
+    for sms in sms_list:
+        sms.status = SMSStatus.IN_QUEUE
+    return tasks
+
+
+def submit_sms(user, content, receiver, is_express=False, segments=None) -> tuple[SMS, str]:
+    """Create, charge and queue one SMS; return it with the id of its send task.
+
+    With ``SMS_OUTBOX_ENABLED`` the task is written to the outbox in the same transaction
+    instead of being published here.
+    """
+    if not settings.SMS_OUTBOX_ENABLED:
+        sms = create_sms_and_deduct_balance(
+            user, content, receiver, is_express=is_express, segments=segments
+        )
+        return sms, send_sms(sms).id
+    with transaction.atomic():
+        sms = create_sms_and_deduct_balance(
+            user,
+            content,
+            receiver,
+            is_express=is_express,
+            status=SMSStatus.IN_QUEUE,
+            segments=segments,
+        )
+        (entry,) = add_to_outbox([sms])
+    return sms, str(entry.task_id)
+
+
+def submit_bulk_sms(user, messages, is_express=False) -> tuple[list[SMS], list[str]]:
+    """Bulk counterpart of ``submit_sms``."""
+    if not settings.SMS_OUTBOX_ENABLED:
+        sms_list = create_bulk_sms_and_deduct_balance(user, messages, is_express=is_express)
+        return sms_list, [task.id for task in send_bulk_sms(sms_list)]
+    with transaction.atomic():
+        sms_list = create_bulk_sms_and_deduct_balance(
+            user, messages, is_express=is_express, status=SMSStatus.IN_QUEUE
+        )
+        entries = add_to_outbox(sms_list)
+    return sms_list, [str(entry.task_id) for entry in entries]
+
+
+def filter_by_provider_accounts(queryset, accounts):
+    """SMS sent through one of ``accounts``.
+
+    SMS without a recorded account belong to the account owning their sender number.
+    """
+    condition = Q(provider__in=accounts)
+    for prefix, account in SENDER_PREFIX_ACCOUNTS.items():
+        if account in accounts:
+            condition |= Q(provider="", sender__startswith=prefix)
+    return queryset.filter(condition)
+
+
+def get_sms_to_check_status(account: str, cut_off=None):
+    cut_off = cut_off or now() - timedelta(hours=24)
+    # Messages a fallback account took are only known to that account
+    return filter_by_provider_accounts(
+        SMS.objects.filter(status=SMSStatus.SENT, created_at__gte=cut_off), [account]
     )
 
 
@@ -84,12 +214,18 @@ def fail_sms(sms: SMS):
     sms.status = SMSStatus.FAILED
     sms.save(update_fields=["status", "modified_at"])
     create_refund_transaction(sms.user, sms.cost, sms)
+    emit_sms_status_events([sms])
 
 
 def deliver_sms(sms: SMS):
     sms.status = SMSStatus.DELIVERED
     sms.save(update_fields=["status", "modified_at"])
+    emit_sms_status_events([sms])
 
 
-def get_sms_by_mid(mid: int):
-    return SMS.objects.get(message_id=mid)
+def get_sms_by_mid(mid: int, created_after=None):
+    queryset = SMS.objects.all()
+    if created_after is not None:
+        # Lets PostgreSQL skip SMS partitions older than created_after
+        queryset = queryset.filter(created_at__gte=created_after)
+    return queryset.get(message_id=mid)
@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
 
+# Traffic classes a client can be asked to serve; weighted routing weighs them differently
+EXPRESS_TRAFFIC = "express"
+STANDARD_TRAFFIC = "standard"
+
 
 class SmsProvider(ABC):
     @abstractmethod
@@ -14,7 +18,58 @@ class SmsProvider(ABC):
         """Send bulk SMS"""
         pass
 
+    @abstractmethod
+    def send_multiple_sms(
+        self, sender: str, destinations: list[str], messages: list[str], uids: list[int]
+    ) -> dict:
+        """Send a different message to each destination in one request"""
+        pass
+
     @abstractmethod
     def check_status(self, batch_id: str) -> dict:
         """Check delivery status"""
         pass
+
+    def for_traffic(self, traffic: str) -> "SmsProvider":
+        """Client to use for ``EXPRESS_TRAFFIC`` or ``STANDARD_TRAFFIC``"""
+        return self
+
+    def close(self) -> None:
+        """Release pooled connections"""
+        pass
+
+
+class AsyncSmsProvider(ABC):
+    """Asyncio counterpart of ``SmsProvider``, for sending many SMS concurrently on one loop."""
+
+    @abstractmethod
+    async def send_sms(self, sender: str, destination: str, message: str, uid: int) -> dict:
+        """Send a single SMS"""
+        pass
+
+    @abstractmethod
+    async def send_bulk_sms(
+        self, sender: str, destinations: list[str], message: str, uids: list[int]
+    ) -> dict:
+        """Send bulk SMS"""
+        pass
+
+    @abstractmethod
+    async def send_multiple_sms(
+        self, sender: str, destinations: list[str], messages: list[str], uids: list[int]
+    ) -> dict:
+        """Send a different message to each destination in one request"""
+        pass
+
+    @abstractmethod
+    async def check_status(self, batch_id: str) -> dict:
+        """Check delivery status"""
+        pass
+
+    def for_traffic(self, traffic: str) -> "AsyncSmsProvider":
+        """Client to use for ``EXPRESS_TRAFFIC`` or ``STANDARD_TRAFFIC``"""
+        return self
+
+    async def aclose(self) -> None:
+        """Release pooled connections"""
+        pass
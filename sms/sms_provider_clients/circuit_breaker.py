@@ -0,0 +1,172 @@
+"""
+Circuit breakers for provider accounts, shared by every worker through Redis.
+
+Each call is counted in one-second buckets. When at least ``MIN_CALLS`` calls in the last
+``WINDOW_SECONDS`` include ``ERROR_RATE`` failures or ``SLOW_RATE`` calls slower than
+``SLOW_CALL_SECONDS``, the breaker opens for ``OPEN_SECONDS`` and callers move to a fallback
+account. It then lets a single probe call through; a good probe closes it, a bad one opens it
+again. Processes cache the state for ``STATE_CACHE_SECONDS``, so a closed breaker costs one
+Redis round trip per call (the count) and the fleet follows a change within seconds.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+KEY_PREFIX_TEMPLATE = "circuit:{name}"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Permit of the one call allowed through a half-open breaker
+PROBE = "probe"
+
+# KEYS: the window buckets (current one first), the open key, the tripped key.
+# Returns 1 when this call opened the breaker.
+_record_script = redis_conn.register_script(
+    """
+    local open_key = KEYS[#KEYS - 1]
+    local tripped_key = KEYS[#KEYS]
+    redis.call('HINCRBY', KEYS[1], 'calls', 1)
+    if ARGV[1] == '1' then
+        redis.call('HINCRBY', KEYS[1], 'errors', 1)
+    end
+    if ARGV[2] == '1' then
+        redis.call('HINCRBY', KEYS[1], 'slow', 1)
+    end
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[7]))
+    if redis.call('EXISTS', tripped_key) == 1 then
+        return 0
+    end
+
+    local calls, errors, slow = 0, 0, 0
+    for i = 1, #KEYS - 2 do
+        local bucket = redis.call('HMGET', KEYS[i], 'calls', 'errors', 'slow')
+        calls = calls + (tonumber(bucket[1]) or 0)
+        errors = errors + (tonumber(bucket[2]) or 0)
+        slow = slow + (tonumber(bucket[3]) or 0)
+    end
+    if calls < tonumber(ARGV[3]) then
+        return 0
+    end
+    if errors / calls < tonumber(ARGV[4]) and slow / calls < tonumber(ARGV[5]) then
+        return 0
+    end
+    redis.call('SET', open_key, 1, 'EX', tonumber(ARGV[6]))
+    redis.call('SET', tripped_key, 1)
+    redis.call('DEL', unpack(KEYS, 1, #KEYS - 2))
+    return 1
+    """
+)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, options: dict | None = None):
+        self.name = name
+        self.options = {**settings.SMS_CIRCUIT_BREAKER, **(options or {})}
+        self.prefix = KEY_PREFIX_TEMPLATE.format(name=name)
+        self.open_key = f"{self.prefix}:open"
+        self.tripped_key = f"{self.prefix}:tripped"
+        self.probe_key = f"{self.prefix}:probe"
+        self._cached_state = None
+        self._cached_until = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket_keys(self) -> list[str]:
+        current = int(time.time())
+        return [
+            f"{self.prefix}:bucket:{second}"
+            for second in range(current, current - self.options["WINDOW_SECONDS"], -1)
+        ]
+
+    def _cache(self, state: str) -> None:
+        with self._lock:
+            self._cached_state = state
+            self._cached_until = time.monotonic() + self.options["STATE_CACHE_SECONDS"]
+
+    def state(self) -> str:
+        with self._lock:
+            if self._cached_state is not None and time.monotonic() < self._cached_until:
+                return self._cached_state
+        is_open, is_tripped = redis_conn.mget(self.open_key, self.tripped_key)
+        if is_open:
+            state = OPEN
+        elif is_tripped:
+            state = HALF_OPEN
+        else:
+            state = CLOSED
+        self._cache(state)
+        return state
+
+    def allow_request(self) -> str | None:
+        """Return a permit to pass to ``record``, or None while the breaker is open.
+
+        Redis failures let every call through: the breaker must not stop sending by itself.
+        """
+        try:
+            state = self.state()
+            if state == CLOSED:
+                return CLOSED
+            if state == HALF_OPEN and redis_conn.set(
+                self.probe_key, 1, nx=True, ex=self.options["PROBE_TIMEOUT_SECONDS"]
+            ):
+                return PROBE
+            return None
+        except RedisError:
+            logger.warning("Circuit breaker %s check skipped", self.name, exc_info=True)
+            return CLOSED
+
+    def record(self, permit: str, failed: bool, duration: float) -> None:
+        """Count one call made with ``permit``; it failed or took ``duration`` seconds."""
+        slow = duration >= self.options["SLOW_CALL_SECONDS"]
+        try:
+            if permit == PROBE:
+                self._record_probe(failed or slow)
+                return
+            opened = _record_script(
+                keys=[*self._bucket_keys(), self.open_key, self.tripped_key],
+                args=[
+                    int(failed),
+                    int(slow),
+                    self.options["MIN_CALLS"],
+                    self.options["ERROR_RATE"],
+                    self.options["SLOW_RATE"],
+                    self.options["OPEN_SECONDS"],
+                    self.options["WINDOW_SECONDS"] + 1,
+                ],
+            )
+        except RedisError:
+            logger.warning("Circuit breaker %s could not record a call", self.name, exc_info=True)
+            return
+        if opened:
+            logger.warning(
+                "Circuit breaker %s opened for %ss", self.name, self.options["OPEN_SECONDS"]
+            )
+            self._cache(OPEN)
+
+    def _record_probe(self, failed: bool) -> None:
+        pipe = redis_conn.pipeline(transaction=True)
+        if failed:
+            pipe.set(self.open_key, 1, ex=self.options["OPEN_SECONDS"])
+        else:
+            pipe.delete(self.tripped_key)
+        pipe.delete(self.probe_key)
+        pipe.execute()
+        if failed:
+            logger.warning("Circuit breaker %s probe failed; open again", self.name)
+            self._cache(OPEN)
+        else:
+            logger.info("Circuit breaker %s closed", self.name)
+            self._cache(CLOSED)
+
+    def reset(self) -> None:
+        redis_conn.delete(self.open_key, self.tripped_key, self.probe_key, *self._bucket_keys())
+        self._cache(CLOSED)
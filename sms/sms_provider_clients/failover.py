@@ -0,0 +1,181 @@
+"""
+Provider client that routes each call to the first account whose circuit breaker is closed.
+
+A failed call is not repeated on the next account: a send that timed out may still have been
+delivered, so the task's own retry decides what happens next, by which time the breaker of a
+failing account has opened. Send responses carry the account that served them under
+``"provider"`` and the sender line it used under ``"sender"``. A fallback account sending
+from its own line waits for that line's per-second cap, as the caller only capped the SMS
+sender. ``AsyncFailoverProvider`` does the same over async clients for the asyncio sender.
+"""
+
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+
+from sms.segments import count_segments
+from sms.sender_pools import await_line_capacity, wait_for_line_capacity
+from sms.sms_provider_clients import AsyncSmsProvider, SmsProvider
+from sms.sms_provider_clients.circuit_breaker import CircuitBreaker
+
+
+class ProviderUnavailableError(Exception):
+    """Every account of a route has an open circuit breaker."""
+
+
+@dataclass
+class ProviderRoute:
+    name: str
+    client: SmsProvider | AsyncSmsProvider
+    breaker: CircuitBreaker
+    # Sender line of the account; None sends with the SMS sender
+    sender: str | None = None
+
+
+def _segments(kwargs: dict) -> int:
+    if "messages" in kwargs:
+        return sum(count_segments(message) for message in kwargs["messages"])
+    return count_segments(kwargs["message"]) * len(kwargs.get("destinations") or [None])
+
+
+class FailoverProvider(SmsProvider):
+    def __init__(self, routes: list[ProviderRoute]):
+        self.routes = routes
+
+    def _candidates(self) -> list[ProviderRoute]:
+        """Routes in the order they are tried."""
+        return self.routes
+
+    def _record(self, route: ProviderRoute, permit: str, failed: bool, duration: float) -> None:
+        route.breaker.record(permit, failed, duration)
+
+    def _call_route(self, route: ProviderRoute, permit: str, method: str, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            response = getattr(route.client, method)(*args, **kwargs)
+        except Exception:
+            self._record(route, permit, True, time.monotonic() - started)
+            raise
+        # Transport errors are reported by the clients with negative statuses
+        self._record(route, permit, response.get("status") != 0, time.monotonic() - started)
+        return response
+
+    def _call(self, method: str, sender: str, **kwargs) -> dict:
+        for route in self._candidates():
+            permit = route.breaker.allow_request()
+            if permit is None:
+                continue
+            if route.sender:
+                wait_for_line_capacity(route.sender, _segments(kwargs))
+            route_sender = route.sender or sender
+            response = self._call_route(route, permit, method, sender=route_sender, **kwargs)
+            return {**response, "provider": route.name, "sender": route_sender}
+        raise ProviderUnavailableError(
+            f"Circuit breakers of {', '.join(route.name for route in self.routes)} are open"
+        )
+
+    def close(self) -> None:
+        for route in self.routes:
+            route.client.close()
+
+    def send_sms(self, sender: str, destination: str, message: str, uid: int) -> dict:
+        return self._call("send_sms", sender, destination=destination, message=message, uid=uid)
+
+    def send_bulk_sms(
+        self, sender: str, destinations: list[str], message: str, uids: list[int]
+    ) -> dict:
+        return self._call(
+            "send_bulk_sms", sender, destinations=destinations, message=message, uids=uids
+        )
+
+    def send_multiple_sms(
+        self, sender: str, destinations: list[str], messages: list[str], uids: list[int]
+    ) -> dict:
+        return self._call(
+            "send_multiple_sms", sender, destinations=destinations, messages=messages, uids=uids
+        )
+
+    def check_status(self, batch_id: str) -> dict:
+        # Status lookups only make sense on the account that sent the message
+        return self._call_primary("check_status", batch_id)
+
+    def get_statuses(self, message_ids: list) -> dict:
+        return self._call_primary("get_statuses", message_ids)
+
+    def _call_primary(self, method: str, *args) -> dict:
+        route = self.routes[0]
+        permit = route.breaker.allow_request()
+        if permit is None:
+            raise ProviderUnavailableError(f"Circuit breaker of {route.name} is open")
+        return self._call_route(route, permit, method, *args)
+
+
+class AsyncFailoverProvider(AsyncSmsProvider):
+    """``FailoverProvider`` for routes of async clients.
+
+    ``router`` orders the routes and records each call, so breakers and weighted routing see
+    async sends like sync ones. Its calls only touch Redis and run in a thread off the loop.
+    """
+
+    def __init__(self, router: FailoverProvider):
+        self.router = router
+
+    def for_traffic(self, traffic: str) -> "AsyncFailoverProvider":
+        return AsyncFailoverProvider(self.router.for_traffic(traffic))
+
+    async def _call_route(self, route: ProviderRoute, permit: str, method: str, *args, **kwargs):
+        record = sync_to_async(self.router._record, thread_sensitive=False)
+        started = time.monotonic()
+        try:
+            response = await getattr(route.client, method)(*args, **kwargs)
+        except Exception:
+            await record(route, permit, True, time.monotonic() - started)
+            raise
+        await record(route, permit, response.get("status") != 0, time.monotonic() - started)
+        return response
+
+    async def _call(self, method: str, sender: str, **kwargs) -> dict:
+        routes = await sync_to_async(self.router._candidates, thread_sensitive=False)()
+        for route in routes:
+            permit = await sync_to_async(route.breaker.allow_request, thread_sensitive=False)()
+            if permit is None:
+                continue
+            if route.sender:
+                await await_line_capacity(route.sender, _segments(kwargs))
+            route_sender = route.sender or sender
+            response = await self._call_route(route, permit, method, sender=route_sender, **kwargs)
+            return {**response, "provider": route.name, "sender": route_sender}
+        raise ProviderUnavailableError(
+            f"Circuit breakers of {', '.join(route.name for route in routes)} are open"
+        )
+
+    async def aclose(self) -> None:
+        for route in self.router.routes:
+            await route.client.aclose()
+
+    async def send_sms(self, sender: str, destination: str, message: str, uid: int) -> dict:
+        return await self._call(
+            "send_sms", sender, destination=destination, message=message, uid=uid
+        )
+
+    async def send_bulk_sms(
+        self, sender: str, destinations: list[str], message: str, uids: list[int]
+    ) -> dict:
+        return await self._call(
+            "send_bulk_sms", sender, destinations=destinations, message=message, uids=uids
+        )
+
+    async def send_multiple_sms(
+        self, sender: str, destinations: list[str], messages: list[str], uids: list[int]
+    ) -> dict:
+        return await self._call(
+            "send_multiple_sms", sender, destinations=destinations, messages=messages, uids=uids
+        )
+
+    async def check_status(self, batch_id: str) -> dict:
+        route = self.router.routes[0]
+        permit = await sync_to_async(route.breaker.allow_request, thread_sensitive=False)()
+        if permit is None:
+            raise ProviderUnavailableError(f"Circuit breaker of {route.name} is open")
+        return await self._call_route(route, permit, "check_status", batch_id)
@@ -0,0 +1,93 @@
+import socket
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_HTTP_OPTIONS = {
+    "POOL_CONNECTIONS": 4,
+    "POOL_MAXSIZE": 16,
+    "KEEP_ALIVE": True,
+    "KEEP_ALIVE_IDLE": 30,
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    "MAX_RETRIES": 2,
+    "BACKOFF_FACTOR": 0.3,
+    "ASYNC_MAX_CONNECTIONS": 200,
+}
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive on pooled sockets so idle connections survive."""
+
+    def __init__(self, *args, keep_alive_idle: int | None = None, **kwargs):
+        self.keep_alive_idle = keep_alive_idle
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = [
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        if self.keep_alive_idle and hasattr(socket, "TCP_KEEPIDLE"):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keep_alive_idle))
+        kwargs["socket_options"] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def build_http_session(
+    http_options: dict | None = None,
+    adapter_class: type[KeepAliveHTTPAdapter] = KeepAliveHTTPAdapter,
+) -> tuple[requests.Session, tuple]:
+    """Return a pooled session and the ``(connect, read)`` timeout to use with it.
+
+    Retries cover connection errors for every method, but read errors and retryable status
+    codes only for GET, so a send that may have reached the provider is never repeated.
+    """
+    options = {**DEFAULT_HTTP_OPTIONS, **(http_options or {})}
+    retries = Retry(
+        total=options["MAX_RETRIES"],
+        connect=options["MAX_RETRIES"],
+        read=options["MAX_RETRIES"],
+        status=options["MAX_RETRIES"],
+        backoff_factor=options["BACKOFF_FACTOR"],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    if options["KEEP_ALIVE"]:
+        adapter = adapter_class(
+            pool_connections=options["POOL_CONNECTIONS"],
+            pool_maxsize=options["POOL_MAXSIZE"],
+            max_retries=retries,
+            keep_alive_idle=options["KEEP_ALIVE_IDLE"],
+        )
+    else:
+        adapter = HTTPAdapter(
+            pool_connections=options["POOL_CONNECTIONS"],
+            pool_maxsize=options["POOL_MAXSIZE"],
+            max_retries=retries,
+        )
+        session.headers["Connection"] = "close"
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session, (options["CONNECT_TIMEOUT"], options["READ_TIMEOUT"])
+
+
+def build_async_http_client(http_options: dict | None = None, **kwargs) -> httpx.AsyncClient:
+    """Return a pooled async client; ``kwargs`` are passed to ``httpx.AsyncClient``.
+
+    httpx only retries failed connection attempts, so sends are never repeated here either.
+    """
+    options = {**DEFAULT_HTTP_OPTIONS, **(http_options or {})}
+    max_connections = options["ASYNC_MAX_CONNECTIONS"]
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections if options["KEEP_ALIVE"] else 0,
+        keepalive_expiry=options["KEEP_ALIVE_IDLE"],
+    )
+    transport = httpx.AsyncHTTPTransport(limits=limits, retries=options["MAX_RETRIES"])
+    timeout = httpx.Timeout(options["READ_TIMEOUT"], connect=options["CONNECT_TIMEOUT"])
+    return httpx.AsyncClient(transport=transport, timeout=timeout, **kwargs)
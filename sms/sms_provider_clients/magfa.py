@@ -1,9 +1,25 @@
 import json
 
+import httpx
 import requests
 from requests.auth import HTTPBasicAuth
 
-from sms.sms_provider_clients import SmsProvider
+from sms.sms_provider_clients import AsyncSmsProvider, SmsProvider
+from sms.sms_provider_clients.http import build_async_http_client, build_http_session
+
+DEFAULT_ENDPOINT = "https://sms.magfa.com/api/http/sms/v2/"
+HEADERS = {"Accept": "application/json", "Content-Type": "application/json"}
+
+
+def _send_payload(
+    sender: str, destinations: list[str], messages: list[str], uids: list[int]
+) -> dict:
+    return {
+        "senders": [sender] * len(destinations),
+        "recipients": destinations,
+        "messages": messages,
+        "uids": uids,
+    }
 
 
 class MagfaProvider(SmsProvider):
@@ -13,26 +29,25 @@ class MagfaProvider(SmsProvider):
         password: str,
         domain: str,
         sender: str | None = None,
-        endpoint: str = "https://sms.magfa.com/api/http/sms/v2/",
+        endpoint: str = DEFAULT_ENDPOINT,
+        http_options: dict | None = None,
         *args,
         **kwargs,
     ):
-        self.base_url = endpoint
+        self.base_url = endpoint.rstrip("/")
         self.username = username
         self.password = password
         self.domain = domain
         self.sender = sender
         self.auth = HTTPBasicAuth(f"{username}/{domain}", password)
-        self.session = requests.Session()
+        self.session, self.timeout = build_http_session(http_options)
         self.session.auth = self.auth
-        self.session.headers.update(
-            {"Accept": "application/json", "Content-Type": "application/json"}
-        )
+        self.session.headers.update(HEADERS)
 
     def _request(self, method, endpoint, **kwargs):
         url = f"{self.base_url}/{endpoint}"
         try:
-            response = self.session.request(method, url, **kwargs)
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
             response.raise_for_status()
             return response.json()
 
@@ -46,6 +61,9 @@ class MagfaProvider(SmsProvider):
         except json.JSONDecodeError:
             return {"status": -101, "error": "JSON Decode Error", "message": ""}
 
+    def close(self) -> None:
+        self.session.close()
+
     def get_balance(self):
         return self._request("GET", "balance")
 
@@ -58,12 +76,15 @@ class MagfaProvider(SmsProvider):
     def send_bulk_sms(
         self, sender: str, destinations: list[str], message: str, uids: list[int]
     ) -> dict:
-        payload = {
-            "senders": [self.sender] * len(destinations),
-            "recipients": destinations,
-            "messages": [message] * len(destinations),
-            "uids": uids,
-        }
+        payload = _send_payload(
+            sender or self.sender, destinations, [message] * len(destinations), uids
+        )
+        return self._request("POST", "send", json=payload)
+
+    def send_multiple_sms(
+        self, sender: str, destinations: list[str], messages: list[str], uids: list[int]
+    ) -> dict:
+        payload = _send_payload(sender or self.sender, destinations, messages, uids)
         return self._request("POST", "send", json=payload)
 
     def get_message_by_uid(self, uid: int):
@@ -74,3 +95,62 @@ class MagfaProvider(SmsProvider):
         mids_str = ",".join(map(str, message_ids))
         endpoint = f"statuses/{mids_str}"
         return self._request("GET", endpoint)
+
+
+class AsyncMagfaProvider(AsyncSmsProvider):
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        domain: str,
+        sender: str | None = None,
+        endpoint: str = DEFAULT_ENDPOINT,
+        http_options: dict | None = None,
+        *args,
+        **kwargs,
+    ):
+        self.base_url = endpoint.rstrip("/")
+        self.sender = sender
+        self.client = build_async_http_client(
+            http_options, auth=(f"{username}/{domain}", password), headers=HEADERS
+        )
+
+    async def _request(self, method, endpoint, **kwargs):
+        url = f"{self.base_url}/{endpoint}"
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+
+        except httpx.HTTPStatusError as http_err:
+            try:
+                return response.json()
+            except json.JSONDecodeError:
+                return {"status": -99, "error": "HTTP Error", "message": str(http_err)}
+        except httpx.HTTPError as req_err:
+            return {"status": -100, "error": "Request Error", "message": str(req_err)}
+        except json.JSONDecodeError:
+            return {"status": -101, "error": "JSON Decode Error", "message": ""}
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def send_sms(self, sender: str, destination: str, message: str, uid: int) -> dict:
+        return await self.send_bulk_sms(sender, [destination], message, [uid])
+
+    async def check_status(self, mid: str) -> dict:
+        return await self._request("GET", f"statuses/{mid}")
+
+    async def send_bulk_sms(
+        self, sender: str, destinations: list[str], message: str, uids: list[int]
+    ) -> dict:
+        payload = _send_payload(
+            sender or self.sender, destinations, [message] * len(destinations), uids
+        )
+        return await self._request("POST", "send", json=payload)
+
+    async def send_multiple_sms(
+        self, sender: str, destinations: list[str], messages: list[str], uids: list[int]
+    ) -> dict:
+        payload = _send_payload(sender or self.sender, destinations, messages, uids)
+        return await self._request("POST", "send", json=payload)
@@ -0,0 +1,96 @@
+import os
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from sms.sms_provider_clients import AsyncSmsProvider, SmsProvider
+
+_clients: dict[str, SmsProvider] = {}
+_clients_pid = None
+_lock = threading.Lock()
+
+
+def _build_account_client(account: str) -> SmsProvider:
+    config = settings.SMS_PROVIDER_ACCOUNTS[account]
+    client_class = import_string(config["CLASS"])
+    return client_class(**config["OPTIONS"], http_options=settings.SMS_PROVIDER_HTTP)
+
+
+def _build_async_account_client(account: str) -> AsyncSmsProvider:
+    config = settings.SMS_PROVIDER_ACCOUNTS[account]
+    client_class = import_string(config["ASYNC_CLASS"])
+    return client_class(**config["OPTIONS"], http_options=settings.SMS_PROVIDER_HTTP)
+
+
+def _build_router(account: str, build_account_client):
+    """The failover or weighted router of ``account`` over clients from
+    ``build_account_client``; None when neither breakers nor fallbacks are configured."""
+    fallbacks = settings.SMS_PROVIDER_FALLBACKS.get(account) or []
+    if not settings.SMS_CIRCUIT_BREAKER_ENABLED and not fallbacks:
+        return None
+
+    from sms.sms_provider_clients.circuit_breaker import CircuitBreaker
+    from sms.sms_provider_clients.failover import FailoverProvider, ProviderRoute
+
+    routes = [
+        ProviderRoute(
+            name=name,
+            client=build_account_client(name),
+            breaker=CircuitBreaker(name),
+            # Fallback accounts send from their own line
+            sender=settings.SMS_PROVIDER_ACCOUNTS[name]["OPTIONS"].get("sender")
+            if name != account
+            else None,
+        )
+        for name in [account, *fallbacks]
+    ]
+    if settings.SMS_WEIGHTED_ROUTING_ENABLED and fallbacks:
+        from sms.sms_provider_clients.routing import ProviderStats, WeightedRouter
+
+        return WeightedRouter(routes, ProviderStats())
+    return FailoverProvider(routes)
+
+
+def _build_client(account: str) -> SmsProvider:
+    return _build_router(account, _build_account_client) or _build_account_client(account)
+
+
+def get_provider_client(account: str) -> SmsProvider:
+    """Return the client of a provider account, built once per process."""
+    global _clients_pid
+
+    if _clients_pid != os.getpid():
+        # Pooled sockets must not be shared with a forked child (Celery prefork, gunicorn)
+        with _lock:
+            _clients.clear()
+            _clients_pid = os.getpid()
+
+    client = _clients.get(account)
+    if client is None:
+        with _lock:
+            client = _clients.get(account)
+            if client is None:
+                client = _clients[account] = _build_client(account)
+    return client
+
+
+def reset_provider_clients() -> None:
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def build_async_provider_client(account: str) -> AsyncSmsProvider:
+    """Build the async client of a provider account; it belongs to the calling event loop.
+
+    Breakers, fallbacks and weighted routing wrap it as they wrap the sync client.
+    """
+    router = _build_router(account, _build_async_account_client)
+    if router is None:
+        return _build_async_account_client(account)
+
+    from sms.sms_provider_clients.failover import AsyncFailoverProvider
+
+    return AsyncFailoverProvider(router)
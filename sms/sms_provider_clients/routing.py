@@ -0,0 +1,197 @@
+"""
+Weighted routing between provider accounts that can deliver the same destinations.
+
+Every call and every delivery report is counted per account in Redis buckets of
+``BUCKET_SECONDS``, so all workers share the numbers of the last ``WINDOW_SECONDS``. Each
+process reads them every ``REFRESH_SECONDS`` and weights an account by
+
+    success_rate ** SUCCESS_EXPONENT / p95_latency ** LATENCY_EXPONENT
+
+with exponents per traffic class: express traffic follows latency, standard traffic follows
+delivery. Every account keeps ``MIN_SHARE`` of the traffic, so a recovered account is noticed.
+Accounts with an open circuit breaker are skipped as in ``FailoverProvider``.
+"""
+
+import bisect
+import copy
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from sms.sms_provider_clients import STANDARD_TRAFFIC
+from sms.sms_provider_clients.failover import FailoverProvider, ProviderRoute
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+KEY_TEMPLATE = "{prefix}:{name}:{bucket}"
+# Upper bounds of the latency histogram, in seconds; the last bucket is open ended
+LATENCY_BOUNDS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _latency_field(duration: float) -> str:
+    return f"lat:{bisect.bisect_left(LATENCY_BOUNDS, duration)}"
+
+
+def _p95(histogram: list[int]) -> float | None:
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = 0.95 * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            break
+    # The open ended bucket counts as twice the largest bound
+    return LATENCY_BOUNDS[index] if index < len(LATENCY_BOUNDS) else LATENCY_BOUNDS[-1] * 2
+
+
+class ProviderStats:
+    """Rolling per-account call and delivery counts, shared through Redis."""
+
+    def __init__(self, prefix: str = "routing", options: dict | None = None, client=None):
+        self.prefix = prefix
+        self.options = {**settings.SMS_ROUTING, **(options or {})}
+        self.redis = client or redis_conn
+        self._snapshot = {}
+        self._snapshot_until = 0.0
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, bucket: int) -> str:
+        return KEY_TEMPLATE.format(prefix=self.prefix, name=name, bucket=bucket)
+
+    def _current_bucket(self) -> int:
+        return int(time.time() // self.options["BUCKET_SECONDS"])
+
+    def _increment(self, name: str, fields: dict[str, int]) -> None:
+        key = self._key(name, self._current_bucket())
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for field, amount in fields.items():
+                pipe.hincrby(key, field, amount)
+            pipe.expire(key, self.options["WINDOW_SECONDS"] + self.options["BUCKET_SECONDS"])
+            pipe.execute()
+        except RedisError:
+            logger.warning("Routing stats of %s not recorded", name, exc_info=True)
+
+    def record_call(self, name: str, failed: bool, duration: float) -> None:
+        self._increment(name, {"calls": 1, "ok": int(not failed), _latency_field(duration): 1})
+
+    def record_deliveries(self, name: str, delivered: int, undelivered: int) -> None:
+        self._increment(name, {"delivered": delivered, "undelivered": undelivered})
+
+    def _load(self, names: list[str]) -> dict[str, dict]:
+        current = self._current_bucket()
+        buckets = range(
+            current, current - self.options["WINDOW_SECONDS"] // self.options["BUCKET_SECONDS"], -1
+        )
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            for bucket in buckets:
+                pipe.hgetall(self._key(name, bucket))
+        rows = iter(pipe.execute())
+
+        snapshot = {}
+        for name in names:
+            totals = {}
+            for _ in buckets:
+                for field, value in next(rows).items():
+                    field = field.decode() if isinstance(field, bytes) else field
+                    totals[field] = totals.get(field, 0) + int(value)
+            histogram = [totals.get(f"lat:{i}", 0) for i in range(len(LATENCY_BOUNDS) + 1)]
+            snapshot[name] = {
+                "calls": totals.get("calls", 0),
+                "ok": totals.get("ok", 0),
+                "delivered": totals.get("delivered", 0),
+                "undelivered": totals.get("undelivered", 0),
+                "p95": _p95(histogram),
+            }
+        return snapshot
+
+    def snapshot(self, names: list[str]) -> dict[str, dict]:
+        """Stats of ``names``, read from Redis at most once per ``REFRESH_SECONDS``."""
+        with self._lock:
+            if time.monotonic() < self._snapshot_until and set(names) <= set(self._snapshot):
+                return self._snapshot
+        try:
+            snapshot = self._load(names)
+        except RedisError:
+            logger.warning("Routing stats could not be loaded", exc_info=True)
+            snapshot = {name: {} for name in names}
+        with self._lock:
+            self._snapshot = snapshot
+            self._snapshot_until = time.monotonic() + self.options["REFRESH_SECONDS"]
+        return snapshot
+
+
+def success_rate(stats: dict) -> float:
+    """Share of calls accepted times share of reports delivered, smoothed towards 1."""
+    accepted = (stats.get("ok", 0) + 1) / (stats.get("calls", 0) + 1)
+    reports = stats.get("delivered", 0) + stats.get("undelivered", 0)
+    delivered = (stats.get("delivered", 0) + 1) / (reports + 1)
+    return accepted * delivered
+
+
+def compute_weights(snapshot: dict[str, dict], traffic: str, options: dict) -> dict[str, float]:
+    exponents = options["EXPONENTS"][traffic]
+    scores = {}
+    for name, stats in snapshot.items():
+        latency = stats.get("p95") or options["PRIOR_LATENCY_SECONDS"]
+        scores[name] = success_rate(stats) ** exponents["SUCCESS"] / latency ** exponents["LATENCY"]
+    total = sum(scores.values())
+    floor = options["MIN_SHARE"]
+    shares = {name: max(score / total, floor) for name, score in scores.items()}
+    total = sum(shares.values())
+    return {name: share / total for name, share in shares.items()}
+
+
+class WeightedRouter(FailoverProvider):
+    def __init__(
+        self, routes: list[ProviderRoute], stats: ProviderStats, traffic: str = STANDARD_TRAFFIC
+    ):
+        super().__init__(routes)
+        self.stats = stats
+        self.traffic = traffic
+        self._views = {traffic: self}
+
+    def for_traffic(self, traffic: str) -> "WeightedRouter":
+        view = self._views.get(traffic)
+        if view is None:
+            # Shares routes, stats and the view cache; only the traffic class differs
+            view = copy.copy(self)
+            view.traffic = traffic
+            self._views[traffic] = view
+        return view
+
+    def weights(self) -> dict[str, float]:
+        names = [route.name for route in self.routes]
+        return compute_weights(self.stats.snapshot(names), self.traffic, self.stats.options)
+
+    def _candidates(self) -> list[ProviderRoute]:
+        weights = self.weights()
+        # Weighted shuffle: the first route is drawn by weight, the others follow as fallbacks
+        return sorted(
+            self.routes,
+            key=lambda route: random.random() ** (1 / weights[route.name]),
+            reverse=True,
+        )
+
+    def _record(self, route: ProviderRoute, permit: str, failed: bool, duration: float) -> None:
+        super()._record(route, permit, failed, duration)
+        self.stats.record_call(route.name, failed, duration)
+
+
+def record_delivery_reports(counts: dict[str, tuple[int, int]]) -> None:
+    """Count ``{account: (delivered, undelivered)}`` towards the routing weights."""
+    if not settings.SMS_WEIGHTED_ROUTING_ENABLED:
+        return
+    stats = ProviderStats()
+    for name, (delivered, undelivered) in counts.items():
+        stats.record_deliveries(name, delivered, undelivered)
@@ -1,62 +1,258 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
 from celery import shared_task
 from django.conf import settings
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
 from django.utils.timezone import now
 
+from sms.metrics import count_status_changes, observe_queue_wait, time_provider_call
 from sms.models import SMS, SMSStatus
-from sms.services import (
-    deliver_sms,
-    fail_sms,
-    get_magfa_sms_to_check_status,
-    get_sms_by_mid,
-    get_sms_with_over_24_hours_of_sent_status,
-)
-from sms.sms_provider_clients.magfa import MagfaProvider
-from sms.utils import get_client_api
+from sms.partitions import rotate_partitions
+from sms.reconciliation import expire_sent_sms, reconcile_statuses
+from sms.sender_pools import line_capacity, wait_for_line_capacity
+from sms.utils import get_client_api, get_provider_account
+
+logger = logging.getLogger(__name__)
+
+# A send task can be delivered twice (outbox relay retries, broker redelivery); tasks that
+# load their SMS skip the ones that already reached the provider
+ALREADY_SENT_STATUSES = (SMSStatus.SENT, SMSStatus.DELIVERED)
+
+
+def load_sms(sms_ids) -> list[SMS]:
+    """SMS with ``sms_ids``, looked up in the partitions of the status check window first.
+
+    Older partitions are only read for ids the recent ones do not hold.
+    """
+    cut_off = now() - timedelta(hours=settings.SMS_STATUS_CHECK_WINDOW_HOURS)
+    sms_list = list(SMS.objects.filter(id__in=sms_ids, created_at__gte=cut_off))
+    missing = set(sms_ids) - {sms.id for sms in sms_list}
+    if missing:
+        sms_list += SMS.objects.filter(id__in=missing, created_at__lt=cut_off)
+    return sms_list
+
+
+def _bounded_by_created_at(sms_list: list[SMS]):
+    """SMS queryset limited to the ``created_at`` range of ``sms_list``, to prune partitions."""
+    created_at = [sms.created_at for sms in sms_list]
+    if None in created_at:
+        return SMS.objects.all()
+    return SMS.objects.filter(created_at__range=(min(created_at), max(created_at)))
+
+
+def _apply_send_result(
+    sms: SMS,
+    top_level_status,
+    msg_info: dict | None,
+    provider: str | None = None,
+    sender: str | None = None,
+) -> None:
+    if top_level_status != 0:
+        sms.status = SMSStatus.FAILED
+        sms.service_error = f"API Status: {top_level_status}"
+    elif not msg_info:
+        sms.status = SMSStatus.FAILED
+        sms.service_error = "API Anomaly: Status 0 but no message info"
+    elif msg_info.get("status") == 0:
+        sms.status = SMSStatus.SENT
+        sms.message_id = msg_info.get("id")
+        # A failover client names the account that took the message and the line it used
+        sms.provider = provider or get_provider_account(sms.sender) or ""
+        sms.sender = sender or sms.sender
+        sms.service_error = ""
+    else:
+        sms.status = SMSStatus.FAILED
+        sms.service_error = f"Msg Status: {msg_info.get('status')}"
 
 
 def _send_sms_internal(sms: SMS) -> None:
-    api = get_client_api(sms.sender)
+    api = get_client_api(sms.sender, sms.is_express)
+    # Raises before the row changes, so a busy line only re-queues the SMS
+    wait_for_line_capacity(sms.sender, sms.segments)
+    observe_queue_wait([sms])
 
     try:
-        response = api.send_sms(
-            sender=sms.sender,
-            destination=sms.receiver,
-            message=sms.content,
-            uid=sms.id,
+        with time_provider_call(sms.sender, "send_sms") as call:
+            response = api.send_sms(
+                sender=sms.sender,
+                destination=sms.receiver,
+                message=sms.content,
+                uid=sms.id,
+            )
+            call["provider"] = response.get("provider")
+        messages_list = response.get("messages") or [None]
+        _apply_send_result(
+            sms,
+            response.get("status"),
+            messages_list[0],
+            response.get("provider"),
+            response.get("sender"),
         )
 
-        top_level_status = response.get("status")
-
-        if top_level_status == 0:
-            messages_list = response.get("messages", [])
-
-            if messages_list and len(messages_list) > 0:
-                msg_info = messages_list[0]
-                inner_status = msg_info.get("status")
-
-                if inner_status == 0:
-                    sms.status = SMSStatus.SENT
-                    sms.message_id = msg_info.get("id")
-                    sms.service_error = None
-                else:
-                    sms.status = SMSStatus.FAILED
-                    sms.service_error = f"Msg Status: {inner_status}"
-            else:
-                sms.status = SMSStatus.FAILED
-                sms.service_error = "API Anomaly: Status 0 but no message info"
-
-        else:
-            sms.status = SMSStatus.FAILED
-            sms.service_error = f"API Status: {top_level_status}"
-
     except Exception as e:
         sms.status = SMSStatus.FAILED
         sms.service_error = str(e)
         raise
     finally:
-        sms.last_attempt_time = now()
-        sms.attempts_num += 1
-        sms.save()
+        sms.last_attempt_at = now()
+        _write_send_result(sms)
+
+
+def _write_send_result(sms: SMS) -> None:
+    """Write the columns a send attempt changes with one UPDATE."""
+    changes = {
+        "status": sms.status,
+        "service_error": sms.service_error,
+        "last_attempt_at": sms.last_attempt_at,
+        # Counted in SQL, so a task built from a message payload never writes a stale count
+        "attempts_num": F("attempts_num") + 1,
+        "modified_at": sms.last_attempt_at,
+    }
+    if sms.status == SMSStatus.SENT:
+        changes["message_id"] = sms.message_id
+        changes["provider"] = sms.provider
+        changes["sender"] = sms.sender
+    _bounded_by_created_at([sms]).filter(pk=sms.pk).update(**changes)
+    sms.attempts_num += 1
+    count_status_changes([sms])
+
+
+def build_send_payload(sms: SMS) -> dict:
+    """Fields a send task needs, so the worker can send without loading the SMS row."""
+    return {
+        "sender": sms.sender,
+        "receiver": sms.receiver,
+        "content": sms.content,
+        "is_express": sms.is_express,
+        "segments": sms.segments,
+        # Only used to measure how long the SMS waited in the queue
+        "created_at": sms.created_at.isoformat(),
+    }
+
+
+def _get_sms_to_send(sms_id: int, payload: dict | None) -> SMS | None:
+    if payload is None:
+        # Messages queued before payloads were added carry only the id
+        sms_list = load_sms([sms_id])
+        if not sms_list:
+            raise SMS.DoesNotExist(f"SMS {sms_id} does not exist")
+        sms = sms_list[0]
+        return None if sms.status in ALREADY_SENT_STATUSES else sms
+    fields = dict(payload)
+    created_at = fields.pop("created_at", None)
+    sms = SMS(id=sms_id, status=SMSStatus.IN_QUEUE, **fields)
+    sms.created_at = parse_datetime(created_at) if created_at else None
+    return sms
+
+
+def _match_message_results(sms_list: list[SMS], messages_list: list[dict]) -> list[dict | None]:
+    by_uid = {
+        int(msg_info["userId"]): msg_info
+        for msg_info in messages_list
+        if msg_info.get("userId") is not None
+    }
+    if by_uid:
+        return [by_uid.get(sms.id) for sms in sms_list]
+    if len(messages_list) == len(sms_list):
+        # The provider keeps the request order when it does not echo our uids back
+        return messages_list
+    return [None] * len(sms_list)
+
+
+def _send_sms_group(sms_list: list[SMS]) -> None:
+    """Send SMS sharing one sender with a single provider call."""
+    api = get_client_api(sms_list[0].sender, sms_list[0].is_express)
+    wait_for_line_capacity(sms_list[0].sender, sum(sms.segments for sms in sms_list))
+    attempt_time = now()
+    observe_queue_wait(sms_list)
+
+    try:
+        with time_provider_call(sms_list[0].sender, "send_multiple_sms") as call:
+            response = api.send_multiple_sms(
+                sender=sms_list[0].sender,
+                destinations=[sms.receiver for sms in sms_list],
+                messages=[sms.content for sms in sms_list],
+                uids=[sms.id for sms in sms_list],
+            )
+            call["provider"] = response.get("provider")
+        top_level_status = response.get("status")
+        results = _match_message_results(sms_list, response.get("messages") or [])
+        for sms, msg_info in zip(sms_list, results, strict=True):
+            _apply_send_result(
+                sms,
+                top_level_status,
+                msg_info,
+                response.get("provider"),
+                response.get("sender"),
+            )
+
+    except Exception as e:
+        for sms in sms_list:
+            sms.status = SMSStatus.FAILED
+            sms.service_error = str(e)
+        raise
+    finally:
+        for sms in sms_list:
+            sms.last_attempt_at = attempt_time
+            sms.attempts_num += 1
+            sms.modified_at = attempt_time
+        _bounded_by_created_at(sms_list).bulk_update(
+            sms_list,
+            [
+                "status",
+                "message_id",
+                "provider",
+                "sender",
+                "service_error",
+                "last_attempt_at",
+                "attempts_num",
+                "modified_at",
+            ],
+        )
+        count_status_changes(sms_list)
+
+
+def _split_by_segments(sms_list: list[SMS], max_segments: int) -> list[list[SMS]]:
+    chunks, chunk_segments = [[]], 0
+    for sms in sms_list:
+        if chunks[-1] and chunk_segments + sms.segments > max_segments:
+            chunks.append([])
+            chunk_segments = 0
+        chunks[-1].append(sms)
+        chunk_segments += sms.segments
+    return chunks
+
+
+def send_sms_groups(sms_list: list[SMS]) -> tuple[list[SMS], list[SMS]]:
+    """Send ``sms_list`` with one provider call per sender; return ``(attempted, errored)``.
+
+    A sender's SMS are split over more calls when they exceed the provider's segments per call
+    or the per-second cap of the sender line.
+    Errored SMS are the ones whose provider call raised, so they are worth retrying.
+    """
+    groups = defaultdict(list)
+    for sms in sms_list:
+        groups[sms.sender].append(sms)
+
+    attempted, errored = [], []
+    for sender, sender_sms in groups.items():
+        max_segments = min(
+            settings.SMS_PROVIDER_MAX_SEGMENTS_PER_CALL,
+            line_capacity(sender) or settings.SMS_PROVIDER_MAX_SEGMENTS_PER_CALL,
+        )
+        for group in _split_by_segments(sender_sms, max_segments):
+            try:
+                _send_sms_group(group)
+                attempted.extend(group)
+            except Exception:
+                logger.exception(
+                    "Provider call failed for %s SMS from %s", len(group), group[0].sender
+                )
+                errored.extend(group)
+    return attempted, errored
 
 
 @shared_task(
@@ -66,8 +262,10 @@ def _send_sms_internal(sms: SMS) -> None:
     retry_backoff=True,
     autoretry_for=(Exception,),
 )
-def send_normal_sms(self, sms_id: int) -> bool:
-    sms = SMS.objects.get(pk=sms_id)
+def send_normal_sms(self, sms_id: int, payload: dict | None = None) -> bool:
+    sms = _get_sms_to_send(sms_id, payload)
+    if sms is None:
+        return False
     _send_sms_internal(sms)
     return True
 
@@ -79,26 +277,42 @@ def send_normal_sms(self, sms_id: int) -> bool:
     retry_backoff=True,
     autoretry_for=(Exception,),
 )
-def send_express_sms(self, sms_id: int) -> bool:
-    sms = SMS.objects.get(pk=sms_id)
+def send_express_sms(self, sms_id: int, payload: dict | None = None) -> bool:
+    sms = _get_sms_to_send(sms_id, payload)
+    if sms is None:
+        return False
     _send_sms_internal(sms)
     return True
 
 
-def check_sent_sms_status_for_magfa():
-    for sms in get_sms_with_over_24_hours_of_sent_status():
-        fail_sms(sms)
-    list_of_sms = get_magfa_sms_to_check_status()
-    for i in range(0, list_of_sms.count(), 100):
-        api = MagfaProvider(settings.MAGFA_USERNAME, settings.MAGFA_PASSWORD, settings.MAGFA_DOMAIN)
-        mids = list(list_of_sms[i : i + 100].values_list("message_id", flat=True))
-        try:
-            response = api.get_statuses(mids)
-            for message_data in response.get("dlrs"):
-                sms = get_sms_by_mid(message_data.get("mid"))
-                if message_data.get("status") == -1:
-                    fail_sms(sms)
-                elif message_data.get("status") in [1, 2]:
-                    deliver_sms(sms)
-        except Exception:
-            pass
+def _send_sms_batch(sms_ids: list[int], single_task) -> int:
+    attempted, errored = send_sms_groups(
+        [sms for sms in load_sms(sms_ids) if sms.status not in ALREADY_SENT_STATUSES]
+    )
+    for sms in errored:
+        # Hand the failed message to the single-message task so it keeps its retry policy
+        single_task.delay(sms.id)
+    return len(attempted)
+
+
+@shared_task(bind=True, queue="standard_sms_sender")
+def send_normal_sms_batch(self, sms_ids: list[int]) -> int:
+    return _send_sms_batch(sms_ids, send_normal_sms)
+
+
+@shared_task(bind=True, queue="express_sms_sender")
+def send_express_sms_batch(self, sms_ids: list[int]) -> int:
+    return _send_sms_batch(sms_ids, send_express_sms)
+
+
+@shared_task(queue="maintenance")
+def rotate_sms_partitions() -> dict:
+    created, removed = rotate_partitions()
+    return {"created": created, "removed": removed}
+
+
+@shared_task(queue="maintenance")
+def check_sent_sms_status_for_magfa() -> dict:
+    expired = expire_sent_sms()
+    checked = reconcile_statuses()
+    return {"expired": expired, "checked": checked}
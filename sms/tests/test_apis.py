@@ -1,11 +1,16 @@
+import json
 from unittest.mock import Mock, patch
 
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from account.models import User
 from sms.models import SMS, SMSStatus
+from sms.rate_limit import OverCapacityError
+from sms.tasks import build_send_payload
 
 
 class SendSMSAPITestCase(APITestCase):
@@ -53,7 +58,7 @@ class SendSMSAPITestCase(APITestCase):
         self.assertEqual(self.user.balance, initial_balance - 1000)
 
         # Verify task was called
-        mock_normal_sms.delay.assert_called_once_with(sms.id)
+        mock_normal_sms.delay.assert_called_once_with(sms.id, payload=build_send_payload(sms))
 
     @patch("sms.tasks.send_express_sms")
     def test_send_sms_api_success_express(self, mock_express_sms):
@@ -86,7 +91,7 @@ class SendSMSAPITestCase(APITestCase):
         self.assertEqual(self.user.balance, initial_balance - 1500)
 
         # Verify express task was called
-        mock_express_sms.delay.assert_called_once_with(sms.id)
+        mock_express_sms.delay.assert_called_once_with(sms.id, payload=build_send_payload(sms))
 
     def test_send_sms_api_insufficient_funds(self):
         """Test send SMS API with insufficient funds"""
@@ -110,6 +115,28 @@ class SendSMSAPITestCase(APITestCase):
         sms_count = SMS.objects.filter(user=self.user).count()
         self.assertEqual(sms_count, 0)
 
+    @patch("sms.views.consume_send_tokens")
+    def test_send_sms_api_rate_limited(self, mock_consume_tokens):
+        """Test that an over-limit user gets 429 with Retry-After before any SMS is created"""
+        mock_consume_tokens.return_value = (False, 3)
+
+        data = {
+            "user_id": self.user.id,
+            "receiver": "09120000001",
+            "content": "Test message",
+            "is_express": False,
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertEqual(response.data["error"], "Rate limit exceeded")
+        mock_consume_tokens.assert_called_once_with(self.user.id, tokens=1)
+        self.assertEqual(SMS.objects.count(), 0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000)
+
     def test_send_sms_api_user_not_found(self):
         """Test send SMS API with non-existent user"""
         data = {
@@ -250,3 +277,291 @@ class SendSMSAPITestCase(APITestCase):
                 status.HTTP_200_OK,
                 f"Receiver {receiver} should be valid",
             )
+
+
+class BulkSendSMSAPITestCase(APITestCase):
+    """Test cases for the bulk Send SMS API endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 10000
+        self.user.save()
+        self.url = reverse("sms:send_bulk_sms")
+
+    @patch("sms.tasks.send_normal_sms_batch")
+    def test_send_bulk_sms_api_success(self, mock_batch_task):
+        """Test successful bulk SMS send via API"""
+        mock_task = Mock()
+        mock_task.id = "task-bulk"
+        mock_batch_task.delay = Mock(return_value=mock_task)
+
+        data = {
+            "user_id": self.user.id,
+            "messages": [
+                {"receiver": "09120000001", "content": "First"},
+                {"receiver": "09120000002", "content": "Second"},
+                {"receiver": "09120000003", "content": "Third"},
+            ],
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["sms_ids"]), 3)
+        self.assertEqual(response.data["task_ids"], ["task-bulk"])
+
+        sms_list = SMS.objects.filter(id__in=response.data["sms_ids"]).order_by("id")
+        self.assertEqual(
+            [sms.receiver for sms in sms_list], ["09120000001", "09120000002", "09120000003"]
+        )
+        self.assertTrue(all(sms.status == SMSStatus.IN_QUEUE for sms in sms_list))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 7000)
+        mock_batch_task.delay.assert_called_once_with(response.data["sms_ids"])
+
+    @override_settings(SMS_BULK_TASK_BATCH_SIZE=2)
+    @patch("sms.tasks.send_express_sms_batch")
+    def test_send_bulk_sms_api_enqueues_batches(self, mock_batch_task):
+        """Test that bulk SMS are enqueued in batches of the configured size"""
+        mock_batch_task.delay = Mock(side_effect=[Mock(id="task-1"), Mock(id="task-2")])
+
+        data = {
+            "user_id": self.user.id,
+            "messages": [{"receiver": f"0912000000{i}", "content": "Express"} for i in range(3)],
+            "is_express": True,
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["task_ids"], ["task-1", "task-2"])
+        self.assertEqual(mock_batch_task.delay.call_count, 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000 - 3 * 1500)
+
+    def test_send_bulk_sms_api_insufficient_funds(self):
+        """Test bulk SMS API when the total cost exceeds the balance"""
+        data = {
+            "user_id": self.user.id,
+            "messages": [{"receiver": "09120000001", "content": "Test"}] * 11,
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Insufficient funds")
+        self.assertEqual(SMS.objects.filter(user=self.user).count(), 0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000)
+
+    @patch("sms.views.consume_send_tokens")
+    def test_send_bulk_sms_api_rate_limited(self, mock_consume_tokens):
+        """Test that bulk requests take one token per message"""
+        mock_consume_tokens.return_value = (False, 5)
+
+        data = {
+            "user_id": self.user.id,
+            "messages": [{"receiver": "09120000001", "content": "Test"}] * 4,
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "5")
+        mock_consume_tokens.assert_called_once_with(self.user.id, tokens=4)
+        self.assertEqual(SMS.objects.count(), 0)
+
+    @patch("sms.views.consume_send_tokens", side_effect=OverCapacityError(2))
+    def test_send_bulk_sms_api_over_capacity(self, mock_consume_tokens):
+        """Test that a bulk request larger than the per-minute limit is rejected as too large"""
+        data = {
+            "user_id": self.user.id,
+            "messages": [{"receiver": "09120000001", "content": "Test"}] * 4,
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn("2 segments per minute", response.data["error"])
+        self.assertEqual(SMS.objects.count(), 0)
+
+    def test_send_bulk_sms_api_invalid_message(self):
+        """Test bulk SMS API rejects the whole request when one message is invalid"""
+        data = {
+            "user_id": self.user.id,
+            "messages": [
+                {"receiver": "09120000001", "content": "Valid"},
+                {"receiver": "invalid-phone", "content": "Invalid"},
+            ],
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("messages", response.data)
+        self.assertEqual(SMS.objects.count(), 0)
+
+    def test_send_bulk_sms_api_empty_messages(self):
+        """Test bulk SMS API with an empty message list"""
+        data = {"user_id": self.user.id, "messages": []}
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_send_bulk_sms_api_user_not_found(self):
+        """Test bulk SMS API with non-existent user"""
+        data = {
+            "user_id": 99999,
+            "messages": [{"receiver": "09120000001", "content": "Test"}],
+        }
+
+        response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SMSReportCursorAPITestCase(APITestCase):
+    """Test cases for the cursor paginated SMS report endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.other_user = User.objects.create_user(username="otheruser", password="testpass123")
+        self.url = reverse("sms:sms_report_cursor")
+        for user in (self.user, self.other_user):
+            SMS.objects.bulk_create(
+                [
+                    SMS(
+                        user=user,
+                        sender="100002",
+                        receiver=f"0912000{i:04d}",
+                        content="Test",
+                        cost=1000,
+                    )
+                    for i in range(5)
+                ]
+            )
+
+    def test_report_pages_through_all_user_sms(self):
+        """Test following next links returns every SMS of the user once, newest first"""
+        response = self.client.get(self.url, {"user_id": self.user.id, "page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+
+        ids = [item["id"] for item in response.data["results"]]
+        next_url = response.data["next"]
+        while next_url:
+            response = self.client.get(next_url)
+            ids.extend(item["id"] for item in response.data["results"])
+            next_url = response.data["next"]
+
+        expected_ids = list(
+            SMS.objects.filter(user=self.user)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected_ids)
+
+    def test_report_page_has_no_count_query(self):
+        """Test a page is fetched without COUNT(*) or OFFSET"""
+        with self.assertNumQueries(1) as queries:
+            self.client.get(self.url, {"user_id": self.user.id, "page_size": 2})
+
+        sql = queries.captured_queries[0]["sql"].upper()
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_report_pages_through_rows_created_together(self):
+        """Test rows sharing created_at are split across pages by id without OFFSET"""
+        SMS.objects.filter(user=self.user).update(created_at=timezone.now())
+        expected_ids = list(
+            SMS.objects.filter(user=self.user).order_by("-id").values_list("id", flat=True)
+        )
+
+        response = self.client.get(self.url, {"user_id": self.user.id, "page_size": 2})
+        ids = [item["id"] for item in response.data["results"]]
+        pages = [response]
+        while response.data["next"]:
+            with self.assertNumQueries(1) as queries:
+                response = self.client.get(response.data["next"])
+            self.assertNotIn("OFFSET", queries.captured_queries[0]["sql"].upper())
+            ids.extend(item["id"] for item in response.data["results"])
+            pages.append(response)
+        self.assertEqual(ids, expected_ids)
+
+        response = self.client.get(pages[-1].data["previous"])
+        self.assertEqual(response.data["results"], pages[-2].data["results"])
+
+    def test_report_rejects_invalid_cursor(self):
+        """Test a cursor whose position cannot be parsed is a 404"""
+        response = self.client.get(self.url, {"user_id": self.user.id, "cursor": "cD1mb28="})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_report_requires_user_id(self):
+        """Test the report rejects requests without user_id"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SMSReportExportAPITestCase(APITestCase):
+    """Test cases for the streaming SMS report export endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.url = reverse("sms:sms_report_export")
+        self.sms_list = SMS.objects.bulk_create(
+            [
+                SMS(
+                    user=self.user,
+                    sender="100002",
+                    receiver=f"0912000000{i}",
+                    content=f"Test, {i}",
+                    cost=1000,
+                    status=SMSStatus.SENT if i % 2 else SMSStatus.FAILED,
+                )
+                for i in range(4)
+            ]
+        )
+
+    def _content(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        """Test CSV export streams a header and one row per SMS"""
+        response = self.client.get(self.url, {"user_id": self.user.id}, HTTP_ACCEPT="text/csv")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = self._content(response).splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "message_id", "receiver"])
+        self.assertEqual(len(lines), 5)
+        self.assertIn('"Test, 3"', lines[1])
+
+    def test_export_ndjson_with_filters(self):
+        """Test NDJSON export applies the report filters"""
+        response = self.client.get(
+            self.url,
+            {"user_id": self.user.id, "status": SMSStatus.SENT, "file_format": "ndjson"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all(row["status"] == SMSStatus.SENT for row in rows))
+        self.assertEqual(rows[0]["content"], "Test, 3")
+
+    def test_export_requires_user_id(self):
+        """Test the export rejects requests without user_id"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_unknown_format(self):
+        """Test the export rejects unsupported file formats"""
+        response = self.client.get(self.url, {"user_id": self.user.id, "file_format": "xlsx"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import httpx
+from django.test import SimpleTestCase, TestCase
+
+from account.models import User
+from sms.async_worker import AsyncSmsSender
+from sms.models import SMS, SMSStatus
+from sms.sender_pools import SenderLineBusyError
+from sms.sms_provider_clients import STANDARD_TRAFFIC
+from sms.sms_provider_clients.magfa import AsyncMagfaProvider
+from sms.tasks import send_normal_sms
+
+
+class AsyncMagfaProviderTestCase(SimpleTestCase):
+    def _provider(self, handler):
+        provider = AsyncMagfaProvider("user", "pass", "domain", endpoint="https://magfa.test/api/")
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return provider
+
+    async def test_send_multiple_sms(self):
+        """Test per-recipient messages are posted in one request"""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"status": 0, "messages": []})
+
+        provider = self._provider(handler)
+        response = await provider.send_multiple_sms("3000111", ["0912", "0913"], ["A", "B"], [1, 2])
+        await provider.aclose()
+
+        self.assertEqual(response["status"], 0)
+        self.assertEqual(str(requests[0].url), "https://magfa.test/api/send")
+        payload = json.loads(requests[0].content)
+        self.assertEqual(payload["messages"], ["A", "B"])
+        self.assertEqual(payload["senders"], ["3000111", "3000111"])
+
+    async def test_request_error(self):
+        """Test transport errors are reported as a provider status like the sync client"""
+
+        def handler(request):
+            raise httpx.ConnectError("refused")
+
+        provider = self._provider(handler)
+        response = await provider.send_sms("3000111", "0912", "Hi", 1)
+        await provider.aclose()
+
+        self.assertEqual(response["status"], -100)
+
+
+class AsyncSmsSenderTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.sms = SMS.objects.create(
+            user=self.user,
+            sender="3000111",
+            receiver="09120000000",
+            content="Hi",
+            cost=1000,
+            status=SMSStatus.IN_QUEUE,
+        )
+        self.sender = AsyncSmsSender(MagicMock(), ["standard_sms_sender"], concurrency=10)
+        self.api = AsyncMock()
+        self.api.for_traffic = Mock(return_value=self.api)
+        self.sender.clients["magfa"] = self.api
+        patcher = patch("sms.async_worker.await_line_capacity")
+        self.mock_await_line_capacity = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _handle(self, sms_ids, message):
+        self.sender.semaphore = asyncio.Semaphore(10)
+        await self.sender._handle(message, (send_normal_sms, sms_ids, 0), delay=0)
+
+    async def test_send_updates_sms(self):
+        """Test a sent SMS is recorded like in the Celery task"""
+        self.api.send_sms.return_value = {"status": 0, "messages": [{"status": 0, "id": 777}]}
+        message = Mock()
+
+        await self._handle([self.sms.id], message)
+
+        await self.sms.arefresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.SENT)
+        self.assertEqual(self.sms.message_id, 777)
+        self.assertEqual(self.sms.attempts_num, 1)
+        self.assertIsNotNone(self.sms.last_attempt_at)
+        self.sender._run_actions()
+        message.ack.assert_called_once()
+
+    async def test_send_records_failover_account(self):
+        """Test the account a failover client reports is stored like in the Celery task"""
+        self.api.send_sms.return_value = {
+            "status": 0,
+            "messages": [{"status": 0, "id": 778}],
+            "provider": "magfa_backup",
+        }
+        await self._handle([self.sms.id], Mock())
+
+        await self.sms.arefresh_from_db()
+        self.assertEqual(self.sms.provider, "magfa_backup")
+        self.assertEqual(self.sms.attempts_num, 1)
+
+    @patch("sms.async_worker.retry_send")
+    async def test_failed_send_is_retried(self, mock_retry_send):
+        """Test a raising send is re-queued from the connection thread and still acked"""
+        self.api.send_sms.side_effect = ConnectionError("reset")
+        message = Mock()
+
+        with self.assertLogs("sms.async_worker", "ERROR"):
+            await self._handle([self.sms.id], message)
+
+        await self.sms.arefresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.FAILED)
+        self.assertEqual(self.sms.service_error, "reset")
+        mock_retry_send.assert_not_called()
+        self.sender._run_actions()
+        mock_retry_send.assert_called_once_with(send_normal_sms, self.sms.id, 0)
+        message.ack.assert_called_once()
+
+    async def test_send_takes_line_capacity(self):
+        """Test the sender line cap is taken and the traffic class picked before sending"""
+        self.api.send_sms.return_value = {"status": 0, "messages": [{"status": 0, "id": 779}]}
+
+        await self._handle([self.sms.id], Mock())
+
+        self.mock_await_line_capacity.assert_awaited_once_with("3000111", 1)
+        self.api.for_traffic.assert_called_once_with(STANDARD_TRAFFIC)
+
+    @patch("sms.async_worker.retry_send")
+    async def test_busy_line_leaves_sms_untouched(self, mock_retry_send):
+        """Test a busy line re-queues the SMS without recording an attempt"""
+        self.mock_await_line_capacity.side_effect = SenderLineBusyError("busy")
+
+        with self.assertLogs("sms.async_worker", "ERROR"):
+            await self._handle([self.sms.id], Mock())
+
+        self.api.send_sms.assert_not_called()
+        await self.sms.arefresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.IN_QUEUE)
+        self.assertEqual(self.sms.attempts_num, 0)
+        self.sender._run_actions()
+        mock_retry_send.assert_called_once_with(send_normal_sms, self.sms.id, 0)
+
+    @patch("sms.async_worker.retry_send")
+    async def test_unknown_sender_fails_once(self, mock_retry_send):
+        """Test an SMS whose sender has no provider account fails without a retry"""
+        self.sms.sender = "100001"
+        await self.sms.asave(update_fields=["sender"])
+
+        await self._handle([self.sms.id], Mock())
+
+        await self.sms.arefresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.FAILED)
+        self.assertIn("100001", self.sms.service_error)
+        self.assertEqual(self.sms.attempts_num, 1)
+        self.sender._run_actions()
+        mock_retry_send.assert_not_called()
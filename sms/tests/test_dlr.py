@@ -0,0 +1,217 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from account.models import User
+from billing.models import Transaction, TransactionType
+from sms.dlr import apply_delivery_reports, process_delivery_reports
+from sms.models import SMS, SMSStatus
+from sms.sms_provider_clients import SmsProvider
+from sms.tasks import send_sms_groups
+
+STUB_DELIVERED = 10
+STUB_FAILED = 20
+
+
+def map_stub_status(dlr_status):
+    return {STUB_DELIVERED: SMSStatus.DELIVERED, STUB_FAILED: SMSStatus.FAILED}.get(dlr_status)
+
+
+class StubProvider(SmsProvider):
+    """Local provider that accepts every message and numbers them from 7000."""
+
+    def __init__(self):
+        self.next_mid = 7000
+
+    def _accept(self, uids):
+        messages = []
+        for uid in uids:
+            messages.append({"status": 0, "id": self.next_mid, "userId": uid})
+            self.next_mid += 1
+        return {"status": 0, "messages": messages}
+
+    def send_sms(self, sender, destination, message, uid):
+        return self._accept([uid])
+
+    def send_bulk_sms(self, sender, destinations, message, uids):
+        return self._accept(uids)
+
+    def send_multiple_sms(self, sender, destinations, messages, uids):
+        return self._accept(uids)
+
+    def check_status(self, batch_id):
+        return {"status": 0, "dlrs": []}
+
+
+@override_settings(
+    SMS_PROVIDER_ACCOUNTS={
+        "stub": {"STATUS_MAPPER": "sms.tests.test_dlr.map_stub_status", "DLR_TOKEN": "secret"}
+    }
+)
+class DeliveryReportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("sms:delivery_report", kwargs={"provider": "stub"})
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender="3000111",
+                receiver=f"0912000000{i}",
+                content=f"Message {i}",
+                cost=1000,
+                status=SMSStatus.IN_QUEUE,
+            )
+            for i in range(3)
+        ]
+
+    def _send_with_stub(self):
+        with (
+            patch("sms.tasks.get_client_api", return_value=StubProvider()),
+            patch("sms.tasks.get_provider_account", return_value="stub"),
+        ):
+            send_sms_groups(self.sms_list)
+        for sms in self.sms_list:
+            sms.refresh_from_db()
+
+    def _push(self, data, token="secret"):
+        with patch("sms.dlr.redis_conn") as mock_redis_conn:
+            response = self.client.post(self.url, data, format="json", HTTP_X_DLR_TOKEN=token)
+        buffered = [
+            json.loads(raw_report)
+            for call in mock_redis_conn.rpush.call_args_list
+            for raw_report in call.args[1:]
+        ]
+        return response, buffered
+
+    def test_send_records_provider(self):
+        """Test sent SMS store the provider account next to the message id"""
+        self._send_with_stub()
+
+        self.assertEqual([sms.provider for sms in self.sms_list], ["stub"] * 3)
+        self.assertEqual([sms.message_id for sms in self.sms_list], [7000, 7001, 7002])
+
+    def test_pushed_batch_is_applied(self):
+        """Test a pushed batch of reports is buffered and applied with refunds"""
+        self._send_with_stub()
+
+        response, buffered = self._push(
+            [
+                {"mid": self.sms_list[0].message_id, "status": STUB_DELIVERED},
+                {"mid": self.sms_list[1].message_id, "status": STUB_FAILED},
+                {"mid": self.sms_list[2].message_id, "status": 0},
+            ]
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data, {"received": 3})
+        self.assertEqual({report["provider"] for report in buffered}, {"stub"})
+
+        counts, unmatched = apply_delivery_reports(buffered)
+
+        self.assertEqual(counts, {SMSStatus.DELIVERED: 1, SMSStatus.FAILED: 1})
+        self.assertEqual(unmatched, [])
+        statuses = [SMS.objects.get(id=sms.id).status for sms in self.sms_list]
+        self.assertEqual(statuses, [SMSStatus.DELIVERED, SMSStatus.FAILED, SMSStatus.SENT])
+        self.assertTrue(
+            Transaction.objects.filter(
+                sms=self.sms_list[1], type=TransactionType.REFUND, amount=1000
+            ).exists()
+        )
+
+    def test_single_report_is_accepted(self):
+        """Test a single report object is accepted like a batch of one"""
+        response, buffered = self._push({"mid": 7000, "status": STUB_DELIVERED})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(buffered), 1)
+        self.assertEqual(buffered[0]["mid"], 7000)
+
+    def test_reports_are_scoped_to_provider(self):
+        """Test a message id of another provider is not matched"""
+        self._send_with_stub()
+        SMS.objects.filter(id=self.sms_list[0].id).update(provider="magfa")
+
+        counts, unmatched = apply_delivery_reports(
+            [
+                {
+                    "provider": "stub",
+                    "mid": self.sms_list[0].message_id,
+                    "status": STUB_DELIVERED,
+                    "ts": time.time(),
+                }
+            ]
+        )
+
+        self.assertEqual(counts[SMSStatus.DELIVERED], 0)
+        self.assertEqual(len(unmatched), 1)
+
+    @patch("sms.services.SENDER_PREFIX_ACCOUNTS", {"3000": "stub"})
+    def test_sms_sent_before_provider_was_recorded(self):
+        """Test a report matches an SMS without a provider through its sender prefix"""
+        SMS.objects.filter(id=self.sms_list[0].id).update(
+            status=SMSStatus.SENT, message_id=9001, provider=""
+        )
+
+        counts, unmatched = apply_delivery_reports(
+            [{"provider": "stub", "mid": 9001, "status": STUB_DELIVERED, "ts": time.time()}]
+        )
+
+        self.assertEqual(counts[SMSStatus.DELIVERED], 1)
+        self.assertEqual(unmatched, [])
+
+    def test_invalid_token_is_rejected(self):
+        """Test callbacks without the provider token are rejected"""
+        response, buffered = self._push({"mid": 7000, "status": 1}, token="wrong")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(buffered, [])
+
+    def test_unknown_provider(self):
+        """Test callbacks for an unknown provider return 404"""
+        url = reverse("sms:delivery_report", kwargs={"provider": "unknown"})
+        response = self.client.post(url, {"mid": 1, "status": 1}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_report(self):
+        """Test malformed reports return 400 and buffer nothing"""
+        response, buffered = self._push([{"mid": "abc", "status": 1}])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(buffered, [])
+
+    @override_settings(SMS_DLR_UNMATCHED_TTL_SECONDS=300)
+    @patch("sms.dlr._claim_script")
+    @patch("sms.dlr.redis_conn")
+    def test_process_requeues_recent_unmatched(self, mock_redis_conn, mock_claim_script):
+        """Test unmatched reports are retried until they expire"""
+        self._send_with_stub()
+        pipe = MagicMock()
+        mock_redis_conn.pipeline.return_value = pipe
+        recent = {"provider": "stub", "mid": 1, "status": STUB_DELIVERED, "ts": time.time()}
+        expired = {"provider": "stub", "mid": 2, "status": STUB_DELIVERED, "ts": time.time() - 600}
+        applied = {
+            "provider": "stub",
+            "mid": self.sms_list[0].message_id,
+            "status": STUB_DELIVERED,
+            "ts": time.time(),
+        }
+        mock_claim_script.return_value = [
+            json.dumps(report) for report in (recent, expired, applied)
+        ]
+
+        result = process_delivery_reports()
+
+        self.assertEqual(result["received"], 3)
+        self.assertEqual(result["requeued"], 1)
+        self.assertEqual(result[SMSStatus.DELIVERED], 1)
+        requeued = [json.loads(call.args[1]) for call in pipe.rpush.call_args_list]
+        self.assertEqual([report["mid"] for report in requeued], [1])
+        pipe.delete.assert_called_once_with("dlr:processing")
+        pipe.execute.assert_called_once()
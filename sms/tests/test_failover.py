@@ -0,0 +1,301 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from account.models import User
+from sms.models import SMS, SMSStatus
+from sms.sms_provider_clients.circuit_breaker import CLOSED, OPEN, PROBE, CircuitBreaker
+from sms.sms_provider_clients.failover import (
+    AsyncFailoverProvider,
+    FailoverProvider,
+    ProviderRoute,
+    ProviderUnavailableError,
+)
+from sms.sms_provider_clients.registry import (
+    build_async_provider_client,
+    get_provider_client,
+    reset_provider_clients,
+)
+from sms.tasks import _send_sms_internal
+from sms.tests.test_provider_clients import TEST_PROVIDER_ACCOUNTS
+
+SEND_RESPONSE = {"status": 0, "messages": [{"status": 0, "id": 4321}]}
+
+
+def _route(name, permit=CLOSED, sender=None):
+    breaker = MagicMock()
+    breaker.allow_request.return_value = permit
+    return ProviderRoute(name=name, client=MagicMock(), breaker=breaker, sender=sender)
+
+
+class FailoverProviderTestCase(SimpleTestCase):
+    @patch("sms.sms_provider_clients.failover.wait_for_line_capacity")
+    def test_open_breaker_routes_to_fallback(self, mock_wait_for_line_capacity):
+        """Test calls skip an account whose breaker is open and use the fallback's line"""
+        primary = _route("magfa", permit=None)
+        fallback = _route("magfa_backup", sender="3000999")
+        fallback.client.send_sms.return_value = SEND_RESPONSE
+
+        response = FailoverProvider([primary, fallback]).send_sms("3000111", "0912", "Hi", 7)
+
+        primary.client.send_sms.assert_not_called()
+        fallback.client.send_sms.assert_called_once_with(
+            sender="3000999", destination="0912", message="Hi", uid=7
+        )
+        self.assertEqual(response["provider"], "magfa_backup")
+        self.assertEqual(response["sender"], "3000999")
+        mock_wait_for_line_capacity.assert_called_once_with("3000999", 1)
+        fallback.breaker.record.assert_called_once()
+        self.assertEqual(fallback.breaker.record.call_args.args[:2], (CLOSED, False))
+
+    @patch("sms.sms_provider_clients.failover.wait_for_line_capacity")
+    def test_primary_line_is_not_capped_again(self, mock_wait_for_line_capacity):
+        """Test calls sent from the SMS sender leave the cap to the caller"""
+        primary = _route("magfa")
+        primary.client.send_multiple_sms.return_value = SEND_RESPONSE
+
+        response = FailoverProvider([primary]).send_multiple_sms(
+            "3000111", ["0912", "0913"], ["Hi", "x" * 200], [7, 8]
+        )
+
+        self.assertEqual(response["sender"], "3000111")
+        mock_wait_for_line_capacity.assert_not_called()
+
+    def test_failed_call_is_recorded_not_repeated(self):
+        """Test a raising call counts as a failure and is not sent again elsewhere"""
+        primary = _route("magfa")
+        primary.client.send_multiple_sms.side_effect = ConnectionError("reset")
+        fallback = _route("magfa_backup")
+
+        with self.assertRaises(ConnectionError):
+            FailoverProvider([primary, fallback]).send_multiple_sms(
+                "3000111", ["0912"], ["Hi"], [7]
+            )
+
+        self.assertEqual(primary.breaker.record.call_args.args[:2], (CLOSED, True))
+        fallback.client.send_multiple_sms.assert_not_called()
+
+    def test_error_status_counts_as_failure(self):
+        """Test provider error statuses are recorded as failed calls"""
+        primary = _route("magfa")
+        primary.client.send_sms.return_value = {"status": -100, "error": "Request Error"}
+
+        FailoverProvider([primary]).send_sms("3000111", "0912", "Hi", 7)
+
+        self.assertTrue(primary.breaker.record.call_args.args[1])
+
+    def test_every_breaker_open(self):
+        """Test calls fail fast when no account is available"""
+        with self.assertRaises(ProviderUnavailableError):
+            FailoverProvider([_route("magfa", permit=None)]).send_sms("3000111", "0912", "Hi", 7)
+
+    def test_status_lookups_stay_on_primary(self):
+        """Test status lookups never go to a fallback account"""
+        primary = _route("magfa")
+        primary.client.get_statuses.return_value = {"status": 0, "dlrs": []}
+        fallback = _route("magfa_backup")
+
+        FailoverProvider([primary, fallback]).get_statuses([1, 2])
+
+        primary.client.get_statuses.assert_called_once_with([1, 2])
+        fallback.client.get_statuses.assert_not_called()
+
+
+def _async_route(name, permit=CLOSED, sender=None):
+    route = _route(name, permit, sender)
+    route.client = AsyncMock()
+    return route
+
+
+class AsyncFailoverProviderTestCase(SimpleTestCase):
+    @patch("sms.sms_provider_clients.failover.await_line_capacity")
+    async def test_open_breaker_routes_to_fallback(self, mock_await_line_capacity):
+        """Test async calls skip an open breaker and wait on the fallback's line"""
+        primary = _async_route("magfa", permit=None)
+        fallback = _async_route("magfa_backup", sender="3000999")
+        fallback.client.send_sms.return_value = SEND_RESPONSE
+
+        response = await AsyncFailoverProvider(FailoverProvider([primary, fallback])).send_sms(
+            "3000111", "0912", "Hi", 7
+        )
+
+        primary.client.send_sms.assert_not_called()
+        fallback.client.send_sms.assert_awaited_once_with(
+            sender="3000999", destination="0912", message="Hi", uid=7
+        )
+        self.assertEqual(response["provider"], "magfa_backup")
+        self.assertEqual(response["sender"], "3000999")
+        mock_await_line_capacity.assert_awaited_once_with("3000999", 1)
+        self.assertEqual(fallback.breaker.record.call_args.args[:2], (CLOSED, False))
+
+    async def test_failed_call_is_recorded(self):
+        """Test a raising async call is recorded as a failure like a sync one"""
+        primary = _async_route("magfa")
+        primary.client.send_sms.side_effect = ConnectionError("reset")
+
+        with self.assertRaises(ConnectionError):
+            await AsyncFailoverProvider(FailoverProvider([primary])).send_sms(
+                "3000111", "0912", "Hi", 7
+            )
+
+        self.assertEqual(primary.breaker.record.call_args.args[:2], (CLOSED, True))
+
+    async def test_every_breaker_open(self):
+        """Test async calls fail fast when no account is available"""
+        provider = AsyncFailoverProvider(FailoverProvider([_async_route("magfa", permit=None)]))
+
+        with self.assertRaises(ProviderUnavailableError):
+            await provider.send_sms("3000111", "0912", "Hi", 7)
+
+
+@override_settings(
+    SMS_CIRCUIT_BREAKER={
+        "WINDOW_SECONDS": 10,
+        "MIN_CALLS": 20,
+        "ERROR_RATE": 0.5,
+        "SLOW_CALL_SECONDS": 5,
+        "SLOW_RATE": 0.5,
+        "OPEN_SECONDS": 30,
+        "PROBE_TIMEOUT_SECONDS": 15,
+        "STATE_CACHE_SECONDS": 60,
+    }
+)
+class CircuitBreakerTestCase(SimpleTestCase):
+    @patch("sms.sms_provider_clients.circuit_breaker.redis_conn")
+    def test_state_is_cached(self, mock_redis_conn):
+        """Test the shared state is read from Redis once per cache period"""
+        mock_redis_conn.mget.return_value = [None, None]
+        breaker = CircuitBreaker("magfa")
+
+        self.assertEqual(breaker.allow_request(), CLOSED)
+        self.assertEqual(breaker.allow_request(), CLOSED)
+
+        mock_redis_conn.mget.assert_called_once_with("circuit:magfa:open", "circuit:magfa:tripped")
+
+    @patch("sms.sms_provider_clients.circuit_breaker._record_script")
+    @patch("sms.sms_provider_clients.circuit_breaker.redis_conn")
+    def test_opening_blocks_calls(self, mock_redis_conn, mock_record_script):
+        """Test a call that trips the breaker closes it to this process at once"""
+        mock_redis_conn.mget.return_value = [None, None]
+        mock_record_script.return_value = 1
+        breaker = CircuitBreaker("magfa")
+        self.assertEqual(breaker.allow_request(), CLOSED)
+
+        breaker.record(CLOSED, failed=False, duration=7)
+
+        args = mock_record_script.call_args.kwargs["args"]
+        self.assertEqual(args[:2], [0, 1])
+        keys = mock_record_script.call_args.kwargs["keys"]
+        self.assertEqual(len(keys), 12)
+        self.assertEqual(keys[-2:], ["circuit:magfa:open", "circuit:magfa:tripped"])
+        self.assertEqual(breaker.state(), OPEN)
+        self.assertIsNone(breaker.allow_request())
+
+    @patch("sms.sms_provider_clients.circuit_breaker.redis_conn")
+    def test_half_open_lets_one_probe_through(self, mock_redis_conn):
+        """Test only the caller that wins the probe key is allowed once the breaker cools down"""
+        mock_redis_conn.mget.return_value = [None, b"1"]
+        mock_redis_conn.set.side_effect = [True, None]
+        breaker = CircuitBreaker("magfa")
+
+        self.assertEqual(breaker.allow_request(), PROBE)
+        self.assertIsNone(breaker.allow_request())
+
+    @patch("sms.sms_provider_clients.circuit_breaker.redis_conn")
+    def test_good_probe_closes_breaker(self, mock_redis_conn):
+        """Test a successful probe clears the tripped state"""
+        pipe = mock_redis_conn.pipeline.return_value
+        breaker = CircuitBreaker("magfa")
+
+        breaker.record(PROBE, failed=False, duration=0.1)
+
+        pipe.delete.assert_any_call("circuit:magfa:tripped")
+        pipe.set.assert_not_called()
+        self.assertEqual(breaker.state(), CLOSED)
+
+    @patch("sms.sms_provider_clients.circuit_breaker.redis_conn")
+    def test_bad_probe_opens_breaker_again(self, mock_redis_conn):
+        """Test a failed probe opens the breaker for another period"""
+        pipe = mock_redis_conn.pipeline.return_value
+        breaker = CircuitBreaker("magfa")
+
+        breaker.record(PROBE, failed=True, duration=0.1)
+
+        pipe.set.assert_called_once_with("circuit:magfa:open", 1, ex=30)
+        self.assertEqual(breaker.state(), OPEN)
+
+    @patch("sms.sms_provider_clients.circuit_breaker.redis_conn")
+    def test_redis_failure_lets_calls_through(self, mock_redis_conn):
+        """Test an unreachable Redis never blocks sending"""
+        mock_redis_conn.mget.side_effect = RedisConnectionError("down")
+
+        self.assertEqual(CircuitBreaker("magfa").allow_request(), CLOSED)
+
+
+class FailoverRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_provider_clients()
+        self.addCleanup(reset_provider_clients)
+
+    @override_settings(
+        SMS_PROVIDER_ACCOUNTS={
+            **TEST_PROVIDER_ACCOUNTS,
+            "magfa_backup": {
+                **TEST_PROVIDER_ACCOUNTS["magfa"],
+                "OPTIONS": {**TEST_PROVIDER_ACCOUNTS["magfa"]["OPTIONS"], "sender": "3000999"},
+            },
+        },
+        SMS_PROVIDER_FALLBACKS={"magfa": ["magfa_backup"]},
+    )
+    def test_fallbacks_wrap_the_account(self):
+        """Test an account with fallbacks is served by a failover client"""
+        client = get_provider_client("magfa")
+
+        self.assertIsInstance(client, FailoverProvider)
+        self.assertEqual([route.name for route in client.routes], ["magfa", "magfa_backup"])
+        self.assertEqual([route.sender for route in client.routes], [None, "3000999"])
+
+    @override_settings(
+        SMS_PROVIDER_ACCOUNTS={
+            "magfa": {
+                **TEST_PROVIDER_ACCOUNTS["magfa"],
+                "ASYNC_CLASS": "sms.sms_provider_clients.magfa.AsyncMagfaProvider",
+            },
+        },
+        SMS_CIRCUIT_BREAKER_ENABLED=True,
+        SMS_PROVIDER_FALLBACKS={},
+    )
+    def test_async_client_gets_the_breaker(self):
+        """Test the asyncio sender's client is wrapped like the sync one"""
+        client = build_async_provider_client("magfa")
+
+        self.assertIsInstance(client, AsyncFailoverProvider)
+        self.assertEqual([route.name for route in client.router.routes], ["magfa"])
+
+
+class FailoverSendTestCase(TestCase):
+    @patch("sms.tasks.get_client_api")
+    def test_sms_records_serving_account(self, mock_get_client_api):
+        """Test an SMS sent by a fallback account is attributed to it and its line"""
+        user = User.objects.create_user(username="testuser", password="testpass123")
+        sms = SMS.objects.create(
+            user=user,
+            sender="3000111",
+            receiver="09120000000",
+            content="Test",
+            cost=1000,
+            status=SMSStatus.IN_QUEUE,
+        )
+        mock_get_client_api.return_value.send_sms.return_value = {
+            **SEND_RESPONSE,
+            "provider": "magfa_backup",
+            "sender": "3000999",
+        }
+
+        _send_sms_internal(sms)
+
+        sms.refresh_from_db()
+        self.assertEqual(sms.status, SMSStatus.SENT)
+        self.assertEqual(sms.provider, "magfa_backup")
+        self.assertEqual(sms.sender, "3000999")
@@ -0,0 +1,235 @@
+import json
+import threading
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.urls import reverse
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from account.models import User
+from sms.models import SMS
+from SmsHub.idempotency import DONE, PENDING, _fingerprint
+
+IDEMPOTENCY_OPTIONS = {
+    "TTL_SECONDS": 86400,
+    "LOCK_SECONDS": 30,
+    "WAIT_SECONDS": 0,
+    "POLL_INTERVAL": 0,
+}
+
+
+class _FakeRedis:
+    """Keeps keys in a dict; enough of SET NX, GET and DELETE for the idempotency checks."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode()
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@override_settings(IDEMPOTENCY=IDEMPOTENCY_OPTIONS)
+class SendSMSIdempotencyTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 10000
+        self.user.save()
+        self.url = reverse("sms:send_sms")
+        self.data = {"user_id": self.user.id, "receiver": "09120000001", "content": "Hi"}
+        self.redis = _FakeRedis()
+        patcher = patch("SmsHub.idempotency.redis_conn", self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, data=None, key="key-1"):
+        return self.client.post(
+            self.url, data or self.data, format="json", headers={"Idempotency-Key": key}
+        )
+
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.tasks.send_normal_sms")
+    def test_repeated_key_replays_response(self, mock_normal_sms, mock_consume_tokens):
+        """Test a retried request gets the first response without charging or sending again"""
+        mock_normal_sms.delay.return_value.id = "task-123"
+
+        first = self._post()
+        with self.assertNumQueries(0):
+            second = self._post()
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(SMS.objects.count(), 1)
+        mock_normal_sms.delay.assert_called_once()
+        mock_consume_tokens.assert_called_once()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 9000)
+
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.tasks.send_normal_sms")
+    def test_distinct_keys_are_separate_requests(self, mock_normal_sms, mock_consume_tokens):
+        """Test different keys send different SMS"""
+        mock_normal_sms.delay.return_value.id = "task-123"
+
+        self._post(key="key-1")
+        self._post(key="key-2")
+
+        self.assertEqual(SMS.objects.count(), 2)
+
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.tasks.send_normal_sms")
+    def test_keys_are_scoped_to_user(self, mock_normal_sms, mock_consume_tokens):
+        """Test two users sending with the same key each get their own request"""
+        mock_normal_sms.delay.return_value.id = "task-123"
+        other = User.objects.create_user(username="other", password="testpass123")
+        other.balance = 10000
+        other.save()
+
+        first = self._post()
+        second = self._post(data={**self.data, "user_id": other.id})
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Idempotent-Replayed", second)
+        self.assertNotEqual(second.data["sms_id"], first.data["sms_id"])
+
+    @patch("SmsHub.idempotency._refresh_claim_script")
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.views.submit_sms")
+    def test_slow_request_keeps_its_claim(
+        self, mock_submit_sms, mock_consume_tokens, mock_refresh_script
+    ):
+        """Test the pending claim is extended while a view runs past LOCK_SECONDS"""
+        refreshed = threading.Event()
+        mock_refresh_script.side_effect = lambda **kwargs: refreshed.set() or 1
+
+        def slow_submit(**kwargs):
+            self.assertTrue(refreshed.wait(5))
+            return SMS(id=1), "task-123"
+
+        mock_submit_sms.side_effect = slow_submit
+
+        with override_settings(IDEMPOTENCY={**IDEMPOTENCY_OPTIONS, "LOCK_SECONDS": 0.03}):
+            response = self._post()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        refresh = mock_refresh_script.call_args.kwargs
+        self.assertEqual(refresh["keys"], [f"idempotency:send_sms:{self.user.id}:key-1"])
+        self.assertEqual(json.loads(refresh["args"][0])["state"], PENDING)
+
+    @patch("sms.views.submit_sms")
+    def test_key_reused_with_other_body(self, mock_submit_sms):
+        """Test a key sent with a different body is rejected"""
+        self.redis.data[f"idempotency:send_sms:{self.user.id}:key-1"] = json.dumps(
+            {"state": DONE, "fingerprint": "other", "status": 200, "data": {}}
+        ).encode()
+
+        response = self._post()
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        mock_submit_sms.assert_not_called()
+
+    @patch("sms.views.submit_sms")
+    def test_duplicate_waits_for_first_request(self, mock_submit_sms):
+        """Test a duplicate of a request in progress returns its response once stored"""
+        key = f"idempotency:send_sms:{self.user.id}:key-1"
+        fingerprint = _fingerprint(self.data)
+        self.redis.data[key] = json.dumps({"state": PENDING, "fingerprint": fingerprint}).encode()
+        done = {"state": DONE, "fingerprint": fingerprint, "status": 200, "data": {"sms_id": 7}}
+
+        def finish_first_request(seconds):
+            self.redis.data[key] = json.dumps(done).encode()
+
+        with (
+            override_settings(IDEMPOTENCY={**IDEMPOTENCY_OPTIONS, "WAIT_SECONDS": 5}),
+            patch("SmsHub.idempotency.time.sleep", side_effect=finish_first_request),
+        ):
+            response = self._post()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"sms_id": 7})
+        mock_submit_sms.assert_not_called()
+
+    @patch("sms.views.submit_sms")
+    def test_duplicate_gives_up_after_wait(self, mock_submit_sms):
+        """Test a duplicate of a request still running after the wait gets a 409"""
+        self.redis.data[f"idempotency:send_sms:{self.user.id}:key-1"] = json.dumps(
+            {"state": PENDING, "fingerprint": _fingerprint(self.data)}
+        ).encode()
+
+        response = self._post()
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("Retry-After", response)
+        mock_submit_sms.assert_not_called()
+
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.views.submit_sms", side_effect=RuntimeError("broker down"))
+    def test_server_errors_release_key(self, mock_submit_sms, mock_consume_tokens):
+        """Test a failed request is not stored, so a retry with the same key runs again"""
+        self.assertEqual(self._post().status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(self._post().status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        self.assertEqual(mock_submit_sms.call_count, 2)
+        self.assertEqual(self.redis.data, {})
+
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.tasks.send_normal_sms")
+    def test_redis_failure_runs_request(self, mock_normal_sms, mock_consume_tokens):
+        """Test requests are served without the check while Redis is down"""
+        mock_normal_sms.delay.return_value.id = "task-123"
+
+        with patch.object(self.redis, "set", side_effect=RedisConnectionError()):
+            response = self._post()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(SMS.objects.count(), 1)
+
+    def test_list_body_is_rejected_without_claim(self):
+        """Test a JSON array body gets the view's 400 and claims no key"""
+        response = self._post(data=[self.data])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.redis.data, {})
+
+    def test_key_too_long(self):
+        """Test keys longer than 255 characters are rejected"""
+        response = self._post(key="k" * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(IDEMPOTENCY=IDEMPOTENCY_OPTIONS)
+class ChargeIdempotencyTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.url = reverse("billing:charge")
+        patcher = patch("SmsHub.idempotency.redis_conn", _FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("billing.views.get_user_balance", return_value=5000)
+    @patch("billing.views.create_charge_transaction")
+    def test_repeated_charge_is_applied_once(self, mock_charge, mock_get_balance):
+        """Test a retried charge returns the first response and charges once"""
+        data = {"user_id": self.user.id, "amount": 5000}
+        headers = {"Idempotency-Key": "charge-1"}
+
+        first = self.client.post(self.url, data, format="json", headers=headers)
+        second = self.client.post(self.url, data, format="json", headers=headers)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, {"user_id": self.user.id, "total_balance": 5000})
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        mock_charge.assert_called_once()
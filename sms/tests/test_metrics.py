@@ -0,0 +1,178 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from account.models import User
+from sms.metrics import SERVICE_CALL_SECONDS, time_provider_call, timed
+from sms.models import SMS, SMSStatus
+from sms.reconciliation import apply_status_updates
+from sms.tasks import build_send_payload, send_express_sms, send_sms_groups
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class SendMetricsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.sms = SMS.objects.create(
+            user=self.user,
+            sender="3000111",
+            receiver="09120000000",
+            content="Test",
+            cost=1500,
+            status=SMSStatus.IN_QUEUE,
+            is_express=True,
+        )
+
+    @patch("sms.tasks.get_client_api")
+    def test_send_task_records_provider_call_and_status(self, mock_get_client_api):
+        """Test a send records its provider latency, its queue wait and the new status"""
+        mock_get_client_api.return_value.send_sms.return_value = {
+            "status": 0,
+            "messages": [{"status": 0, "id": 4321}],
+        }
+        SMS.objects.filter(id=self.sms.id).update(created_at=timezone.now() - timedelta(minutes=2))
+        self.sms.refresh_from_db()
+        calls = _sample(
+            "smshub_provider_request_seconds_count", provider="magfa", operation="send_sms"
+        )
+        waited = _sample("smshub_sms_queue_wait_seconds_sum", express="true")
+        sent = _sample(
+            "smshub_sms_status_changes_total",
+            status=SMSStatus.SENT,
+            provider="magfa",
+            express="true",
+        )
+
+        send_express_sms(self.sms.id, payload=build_send_payload(self.sms))
+
+        self.assertEqual(
+            _sample(
+                "smshub_provider_request_seconds_count", provider="magfa", operation="send_sms"
+            ),
+            calls + 1,
+        )
+        self.assertGreaterEqual(
+            _sample("smshub_sms_queue_wait_seconds_sum", express="true") - waited, 120
+        )
+        self.assertEqual(
+            _sample(
+                "smshub_sms_status_changes_total",
+                status=SMSStatus.SENT,
+                provider="magfa",
+                express="true",
+            ),
+            sent + 1,
+        )
+
+    @patch("sms.tasks.get_client_api")
+    def test_group_send_counts_each_sms(self, mock_get_client_api):
+        """Test a grouped provider call is timed once and counts every SMS it failed"""
+        mock_get_client_api.return_value.send_multiple_sms.return_value = {"status": 18}
+        other = SMS.objects.create(
+            user=self.user,
+            sender="3000111",
+            receiver="09120000001",
+            content="Test",
+            cost=1500,
+            status=SMSStatus.IN_QUEUE,
+            is_express=True,
+        )
+        calls = _sample(
+            "smshub_provider_request_seconds_count",
+            provider="magfa",
+            operation="send_multiple_sms",
+        )
+        failed = _sample(
+            "smshub_sms_status_changes_total",
+            status=SMSStatus.FAILED,
+            provider="magfa",
+            express="true",
+        )
+
+        send_sms_groups([self.sms, other])
+
+        self.assertEqual(
+            _sample(
+                "smshub_provider_request_seconds_count",
+                provider="magfa",
+                operation="send_multiple_sms",
+            ),
+            calls + 1,
+        )
+        self.assertEqual(
+            _sample(
+                "smshub_sms_status_changes_total",
+                status=SMSStatus.FAILED,
+                provider="magfa",
+                express="true",
+            ),
+            failed + 2,
+        )
+
+    def test_status_updates_counted_after_commit(self):
+        """Test delivery reports are counted only once their transaction commits"""
+        SMS.objects.filter(id=self.sms.id).update(status=SMSStatus.SENT, provider="magfa")
+        labels = {"status": SMSStatus.DELIVERED, "provider": "magfa", "express": "true"}
+        delivered = _sample("smshub_sms_status_changes_total", **labels)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_status_updates({self.sms.id: SMSStatus.DELIVERED})
+        self.assertEqual(_sample("smshub_sms_status_changes_total", **labels), delivered)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(_sample("smshub_sms_status_changes_total", **labels), delivered + 1)
+
+
+class TimedTestCase(SimpleTestCase):
+    def test_labels_are_resolved_per_call(self):
+        """Test a timed function records a sample under its labels when it is called"""
+
+        @timed(SERVICE_CALL_SECONDS, "timed_test")
+        def operation():
+            return "done"
+
+        count = _sample("smshub_service_call_seconds_count", operation="timed_test")
+
+        self.assertEqual(operation(), "done")
+        self.assertEqual(
+            _sample("smshub_service_call_seconds_count", operation="timed_test"), count + 1
+        )
+
+
+class TimeProviderCallTestCase(SimpleTestCase):
+    def test_serving_account_labels_the_call(self):
+        """Test a call served by a fallback account is timed under that account"""
+        count = _sample(
+            "smshub_provider_request_seconds_count", provider="magfa_backup", operation="test_op"
+        )
+
+        with time_provider_call("3000111", "test_op") as call:
+            call["provider"] = "magfa_backup"
+
+        self.assertEqual(
+            _sample(
+                "smshub_provider_request_seconds_count",
+                provider="magfa_backup",
+                operation="test_op",
+            ),
+            count + 1,
+        )
+
+
+class MetricsEndpointTestCase(TestCase):
+    def test_metrics_endpoint_exposes_sms_metrics(self):
+        """Test /metrics serves the Prometheus text format"""
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(b"smshub_provider_request_seconds", response.content)
+        self.assertIn(b"smshub_sms_status_changes_total", response.content)
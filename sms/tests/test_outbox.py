@@ -0,0 +1,134 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from account.models import User
+from sms.models import SMS, SMSOutbox, SMSStatus
+from sms.outbox import relay_outbox
+from sms.tasks import send_normal_sms, send_normal_sms_batch
+
+
+@override_settings(SMS_OUTBOX_ENABLED=True)
+class OutboxAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 100000
+        self.user.save()
+
+    @patch("sms.tasks.send_normal_sms")
+    def test_send_writes_outbox_instead_of_publishing(self, mock_normal_sms):
+        """Test the send API commits an outbox row and returns its task id"""
+        response = self.client.post(
+            reverse("sms:send_sms"),
+            {"user_id": self.user.id, "receiver": "09120000001", "content": "Test"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entry = SMSOutbox.objects.get()
+        self.assertEqual(response.data["task_id"], str(entry.task_id))
+        self.assertEqual(entry.sms_ids, [response.data["sms_id"]])
+        self.assertFalse(entry.is_express)
+        self.assertEqual(SMS.objects.get(id=response.data["sms_id"]).status, SMSStatus.IN_QUEUE)
+        mock_normal_sms.delay.assert_not_called()
+
+    @override_settings(SMS_BULK_TASK_BATCH_SIZE=2)
+    def test_bulk_send_writes_one_row_per_batch(self):
+        """Test bulk sends write one outbox row per task batch"""
+        messages = [{"receiver": f"0912000000{i}", "content": f"Message {i}"} for i in range(5)]
+
+        response = self.client.post(
+            reverse("sms:send_bulk_sms"),
+            {"user_id": self.user.id, "messages": messages},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entries = list(SMSOutbox.objects.order_by("id"))
+        self.assertEqual([len(entry.sms_ids) for entry in entries], [2, 2, 1])
+        self.assertEqual(response.data["task_ids"], [str(entry.task_id) for entry in entries])
+
+    def test_insufficient_funds_writes_nothing(self):
+        """Test a failed charge leaves neither SMS nor outbox rows"""
+        self.user.balance = 0
+        self.user.save()
+
+        response = self.client.post(
+            reverse("sms:send_sms"),
+            {"user_id": self.user.id, "receiver": "09120000001", "content": "Test"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(SMSOutbox.objects.exists())
+
+
+class OutboxRelayTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender="3000111",
+                receiver=f"0912000000{i}",
+                content="Test",
+                cost=1000,
+                status=SMSStatus.IN_QUEUE,
+                is_express=i == 0,
+            )
+            for i in range(3)
+        ]
+        self.express_entry = SMSOutbox.objects.create(
+            sms_ids=[self.sms_list[0].id], is_express=True
+        )
+        self.batch_entry = SMSOutbox.objects.create(
+            sms_ids=[self.sms_list[1].id, self.sms_list[2].id]
+        )
+
+    @patch("sms.tasks.send_normal_sms_batch")
+    @patch("sms.tasks.send_express_sms")
+    def test_relay_publishes_and_deletes(self, mock_express_sms, mock_normal_batch):
+        """Test rows are published with their task ids over one producer"""
+        relayed = relay_outbox()
+
+        self.assertEqual(relayed, 2)
+        mock_express_sms.apply_async.assert_called_once()
+        args, kwargs = mock_express_sms.apply_async.call_args
+        self.assertEqual(args, ((self.sms_list[0].id,),))
+        self.assertEqual(kwargs["task_id"], str(self.express_entry.task_id))
+        batch_args, batch_kwargs = mock_normal_batch.apply_async.call_args
+        self.assertEqual(batch_args, (([self.sms_list[1].id, self.sms_list[2].id],),))
+        self.assertIs(kwargs["producer"], batch_kwargs["producer"])
+        self.assertFalse(SMSOutbox.objects.exists())
+
+    @patch("sms.tasks.send_normal_sms_batch")
+    @patch("sms.tasks.send_express_sms")
+    def test_relay_keeps_rows_when_publish_fails(self, mock_express_sms, mock_normal_batch):
+        """Test a broker error leaves every row of the batch for the next run"""
+        mock_normal_batch.apply_async.side_effect = ConnectionError("broker down")
+
+        with self.assertRaises(ConnectionError):
+            relay_outbox()
+
+        self.assertEqual(SMSOutbox.objects.count(), 2)
+
+    @patch("sms.tasks.send_express_sms")
+    def test_relay_respects_batch_size(self, mock_express_sms):
+        """Test only batch_size rows are relayed per call, oldest first"""
+        self.assertEqual(relay_outbox(batch_size=1), 1)
+
+        self.assertEqual(list(SMSOutbox.objects.all()), [self.batch_entry])
+
+    @patch("sms.tasks.get_client_api")
+    def test_duplicate_task_skips_sent_sms(self, mock_get_client_api):
+        """Test a task published twice does not send an SMS again"""
+        sms = self.sms_list[1]
+        SMS.objects.filter(id=sms.id).update(status=SMSStatus.SENT)
+
+        self.assertFalse(send_normal_sms.apply(args=(sms.id,)).get())
+        self.assertEqual(send_normal_sms_batch.apply(args=([sms.id],)).get(), 0)
+
+        mock_get_client_api.assert_not_called()
@@ -0,0 +1,113 @@
+from datetime import date
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from sms.partitions import (
+    create_partitions,
+    is_partitioned,
+    partition_name,
+    partition_start,
+    period_bounds,
+    remove_old_partitions,
+    rotate_partitions,
+)
+
+
+def _connection():
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    return connection, cursor
+
+
+class PartitionHelpersTestCase(SimpleTestCase):
+    def test_period_bounds(self):
+        """Test daily and weekly partition bounds"""
+        self.assertEqual(
+            period_bounds(date(2025, 1, 8), "day"), (date(2025, 1, 8), date(2025, 1, 9))
+        )
+        self.assertEqual(
+            period_bounds(date(2025, 1, 8), "week"), (date(2025, 1, 6), date(2025, 1, 13))
+        )
+
+    def test_partition_names(self):
+        """Test partition names round-trip to their start date"""
+        self.assertEqual(partition_name(date(2025, 1, 6)), "SMS_p20250106")
+        self.assertEqual(partition_start("SMS_p20250106"), date(2025, 1, 6))
+        self.assertIsNone(partition_start("SMS_legacy"))
+        self.assertIsNone(partition_start("SMS_default"))
+
+    @override_settings(SMS_PARTITION_INTERVAL="day")
+    @patch("sms.partitions.list_partitions", return_value=["SMS_p20250108"])
+    def test_create_partitions_skips_existing(self, mock_list_partitions):
+        """Test only missing partitions of the upcoming periods are created"""
+        connection, cursor = _connection()
+
+        created = create_partitions(2, today=date(2025, 1, 8), connection=connection)
+
+        self.assertEqual(created, ["SMS_p20250109", "SMS_p20250110"])
+        sql = cursor.execute.call_args_list[0].args[0]
+        self.assertIn('PARTITION OF "SMS"', sql)
+        self.assertIn("FROM ('2025-01-09 00:00:00+00') TO ('2025-01-10 00:00:00+00')", sql)
+
+    @override_settings(SMS_PARTITION_INTERVAL="day")
+    @patch("sms.partitions.transaction.atomic")
+    @patch("sms.partitions.list_partitions", return_value=["SMS_default", "SMS_p20250108"])
+    def test_create_partitions_moves_default_rows(self, mock_list_partitions, mock_atomic):
+        """Test rows the default partition holds for a new range are moved into it"""
+        connection, cursor = _connection()
+        cursor.fetchone.return_value = (1,)
+
+        created = create_partitions(1, today=date(2025, 1, 8), connection=connection)
+
+        self.assertEqual(created, ["SMS_p20250109"])
+        executed = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertIn('SELECT 1 FROM "SMS_default"', executed[0])
+        self.assertIn('DELETE FROM "SMS_default"', executed[2])
+        self.assertIn('PARTITION OF "SMS"', executed[3])
+        self.assertEqual(executed[4], 'INSERT INTO "SMS" SELECT * FROM "SMS_moving"')
+        self.assertEqual(
+            cursor.execute.call_args_list[2].args[1],
+            ["2025-01-09 00:00:00+00", "2025-01-10 00:00:00+00"],
+        )
+        mock_atomic.assert_called_once_with(using=connection.alias)
+
+    @override_settings(SMS_PARTITION_INTERVAL="day")
+    @patch(
+        "sms.partitions.list_partitions",
+        return_value=["SMS_default", "SMS_legacy", "SMS_p20250101", "SMS_p20250105"],
+    )
+    def test_remove_old_partitions(self, mock_list_partitions):
+        """Test partitions older than the retention are detached and dropped"""
+        connection, cursor = _connection()
+
+        removed = remove_old_partitions(
+            retention_days=5, drop=True, today=date(2025, 1, 8), connection=connection
+        )
+
+        self.assertEqual(removed, ["SMS_p20250101"])
+        executed = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(
+            executed,
+            ['ALTER TABLE "SMS" DETACH PARTITION "SMS_p20250101"', 'DROP TABLE "SMS_p20250101"'],
+        )
+
+    def test_remove_old_partitions_keeps_all_without_retention(self):
+        """Test a retention of 0 keeps every partition"""
+        connection, cursor = _connection()
+
+        self.assertEqual(remove_old_partitions(retention_days=0, connection=connection), [])
+        cursor.execute.assert_not_called()
+
+
+class PartitionRotationTestCase(TestCase):
+    def test_rotation_is_noop_without_postgres_partitioning(self):
+        """Test rotation does nothing on a plain SMS table"""
+        self.assertFalse(is_partitioned())
+        self.assertEqual(rotate_partitions(), ([], []))
+
+        out = StringIO()
+        call_command("rotate_sms_partitions", stdout=out)
+        self.assertIn("not partitioned", out.getvalue())
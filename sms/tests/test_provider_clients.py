@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from sms.sms_provider_clients.http import KeepAliveHTTPAdapter, build_http_session
+from sms.sms_provider_clients.magfa import MagfaProvider
+from sms.sms_provider_clients.registry import get_provider_client, reset_provider_clients
+from sms.utils import get_client_api
+
+TEST_PROVIDER_ACCOUNTS = {
+    "magfa": {
+        "CLASS": "sms.sms_provider_clients.magfa.MagfaProvider",
+        "OPTIONS": {
+            "username": "user",
+            "password": "pass",
+            "domain": "domain",
+            "endpoint": "https://magfa.test/api/",
+        },
+    },
+}
+
+
+@override_settings(SMS_PROVIDER_ACCOUNTS=TEST_PROVIDER_ACCOUNTS)
+class ProviderClientRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_provider_clients()
+        self.addCleanup(reset_provider_clients)
+
+    def test_client_is_reused(self):
+        """Test the same client is returned for repeated lookups"""
+        client = get_provider_client("magfa")
+        self.assertIsInstance(client, MagfaProvider)
+        self.assertIs(get_provider_client("magfa"), client)
+        self.assertIs(get_client_api("3000123"), client)
+
+    def test_client_is_rebuilt_after_fork(self):
+        """Test a forked process does not reuse the parent's client"""
+        client = get_provider_client("magfa")
+        with patch("sms.sms_provider_clients.registry.os.getpid", return_value=-1):
+            self.assertIsNot(get_provider_client("magfa"), client)
+
+    def test_unknown_sender_prefix(self):
+        """Test no client is returned for an unknown sender prefix"""
+        self.assertIsNone(get_client_api("100001"))
+
+    @override_settings(SMS_PROVIDER_HTTP={"POOL_MAXSIZE": 32, "READ_TIMEOUT": 5})
+    def test_http_options_are_applied(self):
+        """Test pool size and timeouts come from SMS_PROVIDER_HTTP"""
+        client = get_provider_client("magfa")
+        adapter = client.session.get_adapter("https://magfa.test/api/send")
+        self.assertIsInstance(adapter, KeepAliveHTTPAdapter)
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(client.timeout, (3.05, 5))
+        self.assertEqual(client.base_url, "https://magfa.test/api")
+
+
+class MagfaProviderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = MagfaProvider("user", "pass", "domain", sender="3000999")
+        self.addCleanup(self.client.close)
+
+    def test_send_bulk_sms_uses_given_sender(self):
+        """Test the sender passed to send_bulk_sms is used over the default one"""
+        with patch.object(self.client.session, "request") as mock_request:
+            mock_request.return_value.json.return_value = {"status": 0}
+            self.client.send_bulk_sms("3000111", ["0912", "0913"], "Hi", [1, 2])
+
+        _, kwargs = mock_request.call_args
+        self.assertEqual(kwargs["json"]["senders"], ["3000111", "3000111"])
+        self.assertEqual(kwargs["timeout"], self.client.timeout)
+
+    def test_send_retries_are_limited_to_get(self):
+        """Test POST requests are never retried on read errors"""
+        session, _ = build_http_session()
+        retries = session.get_adapter("https://magfa.test").max_retries
+        self.assertEqual(retries.allowed_methods, frozenset({"GET"}))
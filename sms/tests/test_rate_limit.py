@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from redis.exceptions import RedisError
+
+from account.models import User
+from sms.rate_limit import OverCapacityError, consume_send_tokens
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+
+    @patch("sms.rate_limit._token_bucket_script")
+    def test_consume_send_tokens_allowed(self, mock_script):
+        """Test that a request within the bucket is allowed"""
+        mock_script.return_value = [1, 0]
+
+        allowed, retry_after = consume_send_tokens(self.user.id, tokens=3)
+
+        self.assertTrue(allowed)
+        self.assertIsNone(retry_after)
+        mock_script.assert_called_once_with(
+            keys=[f"rate_limit_bucket:{self.user.id}", f"rate_limit_per_minute:{self.user.id}"],
+            args=[3],
+        )
+
+    @patch("sms.rate_limit._token_bucket_script")
+    def test_consume_send_tokens_rejected(self, mock_script):
+        """Test that an empty bucket returns the wait time rounded up to seconds"""
+        mock_script.return_value = [0, 1200]
+
+        allowed, retry_after = consume_send_tokens(self.user.id)
+
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 2)
+
+    @patch("sms.rate_limit._token_bucket_script")
+    def test_consume_send_tokens_over_capacity(self, mock_script):
+        """Test that a request larger than the bucket raises with the bucket capacity"""
+        mock_script.return_value = [-2, 2000]
+
+        with self.assertRaises(OverCapacityError) as cm:
+            consume_send_tokens(self.user.id, tokens=5000)
+
+        self.assertEqual(cm.exception.capacity, 2000)
+
+    @patch("sms.rate_limit.redis_conn")
+    @patch("sms.rate_limit._token_bucket_script")
+    def test_consume_send_tokens_loads_limit(self, mock_script, mock_redis):
+        """Test that the user's limit is cached in Redis when the script cannot find it"""
+        mock_script.side_effect = [[-1, 0], [1, 0]]
+
+        allowed, _ = consume_send_tokens(self.user.id)
+
+        self.assertTrue(allowed)
+        mock_redis.set.assert_called_once_with(
+            f"rate_limit_per_minute:{self.user.id}", 2000, ex=3600
+        )
+        self.assertEqual(mock_script.call_count, 2)
+
+    @patch("sms.rate_limit._token_bucket_script")
+    def test_consume_send_tokens_unknown_user(self, mock_script):
+        """Test that an unknown user is let through so the view can return 404"""
+        mock_script.return_value = [-1, 0]
+
+        allowed, _ = consume_send_tokens(99999)
+
+        self.assertTrue(allowed)
+        mock_script.assert_called_once()
+
+    @patch("sms.rate_limit._token_bucket_script")
+    def test_consume_send_tokens_redis_down(self, mock_script):
+        """Test that Redis errors do not block sending"""
+        mock_script.side_effect = RedisError("down")
+
+        with self.assertLogs("sms.rate_limit", level="WARNING"):
+            allowed, _ = consume_send_tokens(self.user.id)
+
+        self.assertTrue(allowed)
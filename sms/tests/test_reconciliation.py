@@ -0,0 +1,219 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from account.models import User
+from billing.models import Transaction, TransactionType
+from sms.models import SMS, SMSStatus
+from sms.reconciliation import (
+    apply_status_updates,
+    expire_sent_sms,
+    map_magfa_status,
+    reconcile_statuses,
+)
+
+
+class ReconciliationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.other_user = User.objects.create_user(username="otheruser", password="testpass123")
+        self.sms_list = [
+            SMS.objects.create(
+                user=self.user if i % 2 == 0 else self.other_user,
+                sender="3000111",
+                receiver=f"0912000000{i}",
+                content="Test",
+                cost=1000,
+                status=SMSStatus.SENT,
+                message_id=100 + i,
+            )
+            for i in range(6)
+        ]
+
+    def _statuses(self):
+        return [
+            SMS.objects.get(id=sms.id).status
+            for sms in sorted(self.sms_list, key=lambda sms: sms.id)
+        ]
+
+    def test_map_magfa_status(self):
+        """Test Magfa delivery statuses map to SMS statuses"""
+        self.assertEqual(map_magfa_status(-1), SMSStatus.FAILED)
+        self.assertEqual(map_magfa_status(1), SMSStatus.DELIVERED)
+        self.assertEqual(map_magfa_status(2), SMSStatus.DELIVERED)
+        self.assertIsNone(map_magfa_status(0))
+
+    def test_apply_status_updates_refunds_per_user(self):
+        """Test failed SMS are refunded with one balance update per user"""
+        updates = {
+            self.sms_list[0].id: SMSStatus.FAILED,
+            self.sms_list[1].id: SMSStatus.FAILED,
+            self.sms_list[2].id: SMSStatus.FAILED,
+            self.sms_list[3].id: SMSStatus.DELIVERED,
+        }
+
+        counts = apply_status_updates(updates)
+
+        self.assertEqual(counts, {SMSStatus.DELIVERED: 1, SMSStatus.FAILED: 3})
+        self.user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.user.balance, 2000)
+        self.assertEqual(self.other_user.balance, 1000)
+        self.assertEqual(Transaction.objects.filter(type=TransactionType.REFUND).count(), 3)
+
+    def test_apply_status_updates_skips_final_statuses(self):
+        """Test SMS no longer in SENT are neither changed nor refunded twice"""
+        SMS.objects.filter(id=self.sms_list[0].id).update(status=SMSStatus.FAILED)
+
+        counts = apply_status_updates({self.sms_list[0].id: SMSStatus.FAILED})
+
+        self.assertEqual(counts[SMSStatus.FAILED], 0)
+        self.assertFalse(Transaction.objects.filter(type=TransactionType.REFUND).exists())
+
+    @patch("billing.services.redis_conn")
+    @patch("sms.reconciliation.record_delivery_reports")
+    def test_delivery_reports_count_towards_routing(
+        self, mock_record_delivery_reports, mock_redis_conn
+    ):
+        """Test applied reports are counted per account that reports statuses"""
+        SMS.objects.filter(id__in=[sms.id for sms in self.sms_list[:3]]).update(provider="magfa")
+        SMS.objects.filter(id=self.sms_list[3].id).update(provider="other")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_status_updates(
+                {
+                    self.sms_list[0].id: SMSStatus.DELIVERED,
+                    self.sms_list[1].id: SMSStatus.DELIVERED,
+                    self.sms_list[2].id: SMSStatus.FAILED,
+                    self.sms_list[3].id: SMSStatus.FAILED,
+                }
+            )
+
+        mock_record_delivery_reports.assert_called_once_with({"magfa": (2, 1)})
+
+    @patch("billing.services.redis_conn")
+    @patch("sms.reconciliation.record_delivery_reports")
+    def test_expiry_does_not_count_towards_routing(
+        self, mock_record_delivery_reports, mock_redis_conn
+    ):
+        """Test SMS failed by expiry are not counted as undelivered by their account"""
+        SMS.objects.filter(id=self.sms_list[0].id).update(
+            created_at=timezone.now() - timedelta(hours=30), provider="magfa"
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = expire_sent_sms()
+
+        self.assertEqual(result[SMSStatus.FAILED], 1)
+        mock_record_delivery_reports.assert_not_called()
+
+    @patch("sms.reconciliation.get_provider_client")
+    def test_reconcile_pages_through_every_sms(self, mock_get_provider_client):
+        """Test every SENT SMS is checked even though statuses change between pages"""
+        api = mock_get_provider_client.return_value
+        api.get_statuses.side_effect = lambda mids: {
+            "status": 0,
+            "dlrs": [{"mid": mid, "status": 1 if mid % 3 else -1} for mid in mids],
+        }
+
+        result = reconcile_statuses(batch_size=2, concurrency=2)
+
+        self.assertEqual(api.get_statuses.call_count, 3)
+        self.assertEqual(result["checked"], 6)
+        self.assertEqual(result[SMSStatus.FAILED], 2)
+        self.assertEqual(result[SMSStatus.DELIVERED], 4)
+        self.assertEqual(result["errors"], [])
+        self.assertFalse(SMS.objects.filter(status=SMSStatus.SENT).exists())
+
+    @patch("sms.reconciliation.get_provider_client")
+    def test_reconcile_records_batch_errors(self, mock_get_provider_client):
+        """Test a failing batch is recorded and the other batches still apply"""
+        api = mock_get_provider_client.return_value
+        api.get_statuses.side_effect = [
+            ConnectionError("timeout"),
+            {"status": 0, "dlrs": [{"mid": 102, "status": 1}, {"mid": 103, "status": 0}]},
+            {"status": 18},
+        ]
+
+        with self.assertLogs("sms.reconciliation", "ERROR"):
+            result = reconcile_statuses(batch_size=2, concurrency=1)
+
+        self.assertEqual(result["checked"], 2)
+        self.assertEqual(result[SMSStatus.DELIVERED], 1)
+        self.assertEqual(len(result["errors"]), 2)
+        self.assertEqual(result["errors"][0]["first_id"], self.sms_list[0].id)
+        self.assertEqual(result["errors"][0]["error"], "timeout")
+        self.assertEqual(
+            self._statuses(),
+            [SMSStatus.SENT, SMSStatus.SENT, SMSStatus.DELIVERED] + [SMSStatus.SENT] * 3,
+        )
+
+    def test_expire_sent_sms(self):
+        """Test SMS left in SENT past the check window are failed and refunded"""
+        now = timezone.now()
+        SMS.objects.filter(id=self.sms_list[0].id).update(created_at=now - timedelta(hours=30))
+        SMS.objects.filter(id=self.sms_list[1].id).update(created_at=now - timedelta(hours=60))
+
+        result = expire_sent_sms(batch_size=1)
+
+        self.assertEqual(result[SMSStatus.FAILED], 1)
+        self.sms_list[0].refresh_from_db()
+        self.assertEqual(self.sms_list[0].status, SMSStatus.FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 1000)
+
+    @patch("sms.reconciliation.get_provider_client")
+    def test_reconcile_polls_each_account(self, mock_get_provider_client):
+        """Test SMS a fallback account sent are checked through that account's client"""
+        SMS.objects.filter(id__in=[sms.id for sms in self.sms_list[:2]]).update(
+            provider="magfa_backup"
+        )
+        clients = {}
+
+        def get_client(account):
+            api = clients.setdefault(account, MagicMock())
+            api.get_statuses.side_effect = lambda mids: {
+                "status": 0,
+                "dlrs": [{"mid": mid, "status": 1} for mid in mids],
+            }
+            return api
+
+        mock_get_provider_client.side_effect = get_client
+        accounts = {
+            **settings.SMS_PROVIDER_ACCOUNTS,
+            "magfa_backup": {"STATUS_MAPPER": "sms.reconciliation.map_magfa_status"},
+        }
+
+        with override_settings(SMS_PROVIDER_ACCOUNTS=accounts):
+            result = reconcile_statuses(batch_size=10)
+
+        self.assertEqual(result[SMSStatus.DELIVERED], 6)
+        clients["magfa_backup"].get_statuses.assert_called_once_with([100, 101])
+        clients["magfa"].get_statuses.assert_called_once_with([102, 103, 104, 105])
+
+    def test_expire_skips_accounts_without_status_reports(self):
+        """Test SMS of an account that cannot report statuses are not failed"""
+        SMS.objects.filter(id=self.sms_list[0].id).update(
+            created_at=timezone.now() - timedelta(hours=30), provider="magfa_backup"
+        )
+
+        result = expire_sent_sms()
+
+        self.assertEqual(result[SMSStatus.FAILED], 0)
+        self.sms_list[0].refresh_from_db()
+        self.assertEqual(self.sms_list[0].status, SMSStatus.SENT)
+
+    @patch("sms.reconciliation.get_provider_client")
+    def test_checkstatus_command(self, mock_get_provider_client):
+        """Test the checkstatus command reports the run"""
+        mock_get_provider_client.return_value.get_statuses.return_value = {"status": 0, "dlrs": []}
+        out = StringIO()
+
+        call_command("checkstatus", stdout=out)
+
+        self.assertIn("Checked 6 SMS: 0 delivered, 0 failed, 0 failed batches", out.getvalue())
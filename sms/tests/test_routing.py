@@ -0,0 +1,215 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from sms.sms_provider_clients import EXPRESS_TRAFFIC, STANDARD_TRAFFIC
+from sms.sms_provider_clients.circuit_breaker import CLOSED
+from sms.sms_provider_clients.failover import ProviderRoute
+from sms.sms_provider_clients.registry import get_provider_client, reset_provider_clients
+from sms.sms_provider_clients.routing import (
+    LATENCY_BOUNDS,
+    ProviderStats,
+    WeightedRouter,
+    _p95,
+    compute_weights,
+    record_delivery_reports,
+)
+from sms.tests.test_provider_clients import TEST_PROVIDER_ACCOUNTS
+from sms.utils import get_client_api
+
+ROUTING_OPTIONS = {
+    "WINDOW_SECONDS": 60,
+    "BUCKET_SECONDS": 5,
+    "REFRESH_SECONDS": 5,
+    "MIN_SHARE": 0.05,
+    "PRIOR_LATENCY_SECONDS": 0.5,
+    "EXPONENTS": {
+        EXPRESS_TRAFFIC: {"LATENCY": 2, "SUCCESS": 1},
+        STANDARD_TRAFFIC: {"LATENCY": 1, "SUCCESS": 2},
+    },
+}
+SEND_RESPONSE = {"status": 0, "messages": [{"status": 0, "id": 4321}]}
+
+
+def _route(name):
+    breaker = MagicMock()
+    breaker.allow_request.return_value = CLOSED
+    client = MagicMock()
+    client.send_sms.return_value = SEND_RESPONSE
+    return ProviderRoute(name=name, client=client, breaker=breaker)
+
+
+def _stats(snapshot):
+    stats = MagicMock()
+    stats.options = ROUTING_OPTIONS
+    stats.snapshot.return_value = snapshot
+    return stats
+
+
+class WeightsTestCase(SimpleTestCase):
+    def test_p95_of_histogram(self):
+        """Test the p95 is the bound of the bucket holding the 95th percentile call"""
+        histogram = [0] * (len(LATENCY_BOUNDS) + 1)
+        histogram[1] = 90
+        histogram[4] = 10
+
+        self.assertEqual(_p95(histogram), LATENCY_BOUNDS[4])
+        self.assertIsNone(_p95([0] * len(histogram)))
+
+    def test_traffic_classes_weigh_latency_and_success_differently(self):
+        """Test express traffic favours the fast account and standard the reliable one"""
+        snapshot = {
+            "fast": {"calls": 100, "ok": 60, "p95": 0.1},
+            "reliable": {"calls": 100, "ok": 100, "p95": 0.15},
+        }
+
+        express = compute_weights(snapshot, EXPRESS_TRAFFIC, ROUTING_OPTIONS)
+        standard = compute_weights(snapshot, STANDARD_TRAFFIC, ROUTING_OPTIONS)
+
+        self.assertGreater(express["fast"], express["reliable"])
+        self.assertGreater(standard["reliable"], standard["fast"])
+        self.assertAlmostEqual(sum(express.values()), 1)
+
+    def test_failed_deliveries_lower_the_weight(self):
+        """Test undelivered reports count against an account"""
+        snapshot = {
+            "magfa": {"calls": 100, "ok": 100, "delivered": 50, "undelivered": 50, "p95": 0.1},
+            "magfa_backup": {"calls": 100, "ok": 100, "delivered": 100, "p95": 0.1},
+        }
+
+        weights = compute_weights(snapshot, STANDARD_TRAFFIC, ROUTING_OPTIONS)
+
+        self.assertLess(weights["magfa"], weights["magfa_backup"])
+
+    def test_every_account_keeps_a_minimum_share(self):
+        """Test a failing account keeps enough traffic to notice its recovery"""
+        snapshot = {
+            "broken": {"calls": 1000, "ok": 0, "p95": 10},
+            "healthy": {"calls": 1000, "ok": 1000, "p95": 0.05},
+        }
+
+        weights = compute_weights(snapshot, STANDARD_TRAFFIC, ROUTING_OPTIONS)
+
+        self.assertGreaterEqual(weights["broken"], 0.045)
+
+    def test_unknown_accounts_share_evenly(self):
+        """Test accounts without numbers start with equal weights"""
+        weights = compute_weights({"a": {}, "b": {}}, EXPRESS_TRAFFIC, ROUTING_OPTIONS)
+
+        self.assertEqual(weights, {"a": 0.5, "b": 0.5})
+
+
+class WeightedRouterTestCase(SimpleTestCase):
+    def test_traffic_follows_weights(self):
+        """Test most calls go to the heavier account and every call is counted"""
+        first, second = _route("magfa"), _route("magfa_backup")
+        stats = _stats(
+            {
+                "magfa": {"calls": 100, "ok": 100, "p95": 2.5},
+                "magfa_backup": {"calls": 100, "ok": 100, "p95": 0.05},
+            }
+        )
+        router = WeightedRouter([first, second], stats)
+
+        served = [router.send_sms("3000111", "0912", "Hi", uid)["provider"] for uid in range(200)]
+
+        self.assertGreater(served.count("magfa_backup"), 150)
+        self.assertEqual(stats.record_call.call_count, 200)
+        self.assertEqual(second.breaker.record.call_count, served.count("magfa_backup"))
+
+    def test_open_breaker_is_skipped(self):
+        """Test the drawn account is skipped while its breaker is open"""
+        first, second = _route("magfa"), _route("magfa_backup")
+        second.breaker.allow_request.return_value = None
+        stats = _stats({"magfa": {}, "magfa_backup": {"calls": 100, "ok": 100, "p95": 0.01}})
+
+        for uid in range(20):
+            response = WeightedRouter([first, second], stats).send_sms("3000111", "0912", "Hi", uid)
+            self.assertEqual(response["provider"], "magfa")
+        second.client.send_sms.assert_not_called()
+
+    def test_traffic_views_share_routes(self):
+        """Test a traffic class view reuses the routes and is built once"""
+        router = WeightedRouter([_route("magfa")], _stats({"magfa": {}}))
+
+        express = router.for_traffic(EXPRESS_TRAFFIC)
+
+        self.assertEqual(express.traffic, EXPRESS_TRAFFIC)
+        self.assertIs(express.routes, router.routes)
+        self.assertIs(router.for_traffic(EXPRESS_TRAFFIC), express)
+        self.assertIs(express.for_traffic(STANDARD_TRAFFIC), router)
+
+
+@override_settings(SMS_ROUTING=ROUTING_OPTIONS)
+class ProviderStatsTestCase(SimpleTestCase):
+    def test_snapshot_sums_window_buckets(self):
+        """Test counts of every bucket in the window are added up and cached"""
+        client = MagicMock()
+        pipe = client.pipeline.return_value
+        pipe.execute.return_value = [
+            {b"calls": b"3", b"ok": b"2", b"lat:1": b"3", b"delivered": b"1"}
+        ] * 12
+        stats = ProviderStats(client=client)
+
+        snapshot = stats.snapshot(["magfa"])
+        stats.snapshot(["magfa"])
+
+        self.assertEqual(pipe.hgetall.call_count, 12)
+        self.assertEqual(snapshot["magfa"]["calls"], 36)
+        self.assertEqual(snapshot["magfa"]["ok"], 24)
+        self.assertEqual(snapshot["magfa"]["delivered"], 12)
+        self.assertEqual(snapshot["magfa"]["p95"], LATENCY_BOUNDS[1])
+        pipe.execute.assert_called_once()
+
+    def test_redis_failure_routes_evenly(self):
+        """Test an unreachable Redis leaves every account with the prior weight"""
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = RedisConnectionError("down")
+
+        snapshot = ProviderStats(client=client).snapshot(["magfa", "magfa_backup"])
+
+        self.assertEqual(snapshot, {"magfa": {}, "magfa_backup": {}})
+
+    @override_settings(SMS_WEIGHTED_ROUTING_ENABLED=True)
+    @patch("sms.sms_provider_clients.routing.redis_conn")
+    def test_delivery_reports_are_counted(self, mock_redis_conn):
+        """Test delivery reports are added to the account's current bucket"""
+        pipe = mock_redis_conn.pipeline.return_value
+
+        record_delivery_reports({"magfa": (8, 2)})
+
+        pipe.hincrby.assert_any_call(pipe.hincrby.call_args.args[0], "delivered", 8)
+        pipe.hincrby.assert_any_call(pipe.hincrby.call_args.args[0], "undelivered", 2)
+        self.assertTrue(pipe.hincrby.call_args.args[0].startswith("routing:magfa:"))
+
+    @patch("sms.sms_provider_clients.routing.redis_conn")
+    def test_delivery_reports_ignored_when_disabled(self, mock_redis_conn):
+        """Test nothing is written while weighted routing is off"""
+        record_delivery_reports({"magfa": (8, 2)})
+
+        mock_redis_conn.pipeline.assert_not_called()
+
+
+class WeightedRoutingRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_provider_clients()
+        self.addCleanup(reset_provider_clients)
+
+    @override_settings(
+        SMS_PROVIDER_ACCOUNTS={
+            **TEST_PROVIDER_ACCOUNTS,
+            "magfa_backup": TEST_PROVIDER_ACCOUNTS["magfa"],
+        },
+        SMS_PROVIDER_FALLBACKS={"magfa": ["magfa_backup"]},
+        SMS_WEIGHTED_ROUTING_ENABLED=True,
+        SMS_ROUTING=ROUTING_OPTIONS,
+    )
+    @patch("sms.utils.get_provider_account", return_value="magfa")
+    def test_express_sms_use_the_express_view(self, mock_get_provider_account):
+        """Test the client of an express SMS weighs accounts for express traffic"""
+        client = get_provider_client("magfa")
+
+        self.assertIsInstance(client, WeightedRouter)
+        self.assertEqual(get_client_api("3000111", is_express=True).traffic, EXPRESS_TRAFFIC)
+        self.assertIs(get_client_api("3000111"), client)
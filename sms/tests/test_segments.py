@@ -0,0 +1,135 @@
+import random
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from account.models import User
+from sms.models import SMS
+from sms.segments import (
+    GSM_7,
+    GSM_EXTENSION,
+    SEGMENT_UNITS,
+    UCS_2,
+    SegmentInfo,
+    count_segments,
+    segment_info,
+)
+from sms.services import create_bulk_sms_and_deduct_balance, create_sms_and_deduct_balance
+from sms.tasks import send_sms_groups
+
+PERSIAN_WORD = "سلام "
+
+
+class SegmentInfoTestCase(SimpleTestCase):
+    def test_gsm_text(self):
+        """Test GSM text fits 160 characters in one SMS and 153 in each part"""
+        self.assertEqual(segment_info("a" * 160), SegmentInfo(GSM_7, 160, 1))
+        self.assertEqual(segment_info("a" * 161), SegmentInfo(GSM_7, 161, 2))
+        self.assertEqual(count_segments("a" * 306), 2)
+        self.assertEqual(count_segments("a" * 307), 3)
+
+    def test_extension_characters_take_two_septets(self):
+        """Test characters sent with an escape count twice"""
+        self.assertEqual(segment_info("{" * 80), SegmentInfo(GSM_7, 160, 1))
+        self.assertEqual(segment_info("€" * 81), SegmentInfo(GSM_7, 162, 2))
+
+    def test_persian_text_is_ucs2(self):
+        """Test non-GSM text fits 70 characters in one SMS and 67 in each part"""
+        self.assertEqual(segment_info(PERSIAN_WORD * 14), SegmentInfo(UCS_2, 70, 1))
+        self.assertEqual(segment_info("a" * 70 + "س"), SegmentInfo(UCS_2, 71, 2))
+        self.assertEqual(count_segments("س" * 134), 2)
+        self.assertEqual(count_segments("س" * 135), 3)
+        # The longest content the API accepts
+        self.assertEqual(count_segments("س" * 480), 8)
+
+    def test_wide_characters_are_not_split(self):
+        """Test a two-unit character that would straddle parts moves to the next one"""
+        self.assertEqual(segment_info("😀" * 35), SegmentInfo(UCS_2, 70, 1))
+        self.assertEqual(count_segments("a" * 65 + "😀" + "b" * 67), 2)
+        self.assertEqual(count_segments("a" * 66 + "😀" + "b" * 66), 3)
+        self.assertEqual(count_segments("a" * 152 + "{" + "b" * 152), 3)
+
+    def test_matches_character_walk(self):
+        """Test random texts split exactly as filling parts one character at a time would"""
+        rng = random.Random(1)
+        for _ in range(500):
+            alphabet = rng.choice(["ab{€", "ab😀", "سa😀"])
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 480)))
+            encoding = segment_info(text).encoding
+            segments, used = 1, 0
+            for char in text:
+                width = 2 if char in GSM_EXTENSION or char == "😀" else 1
+                if used + width > SEGMENT_UNITS[encoding][1]:
+                    segments, used = segments + 1, 0
+                used += width
+            units = sum(2 if char in GSM_EXTENSION or char == "😀" else 1 for char in text)
+            if units <= SEGMENT_UNITS[encoding][0]:
+                segments = 1
+            self.assertEqual(count_segments(text), segments, text)
+
+
+class SegmentPricingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 100000
+        self.user.save()
+
+    def test_multipart_sms_is_charged_per_segment(self):
+        """Test a three-part SMS stores its segments and costs three times the price"""
+        sms = create_sms_and_deduct_balance(self.user, "س" * 140, "09120000001")
+
+        self.assertEqual(sms.segments, 3)
+        self.assertEqual(sms.cost, 3000)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 97000)
+
+    def test_bulk_sms_are_charged_per_segment(self):
+        """Test every SMS of a bulk request is priced by its own segments"""
+        sms_list = create_bulk_sms_and_deduct_balance(
+            self.user,
+            [
+                {"receiver": "09120000001", "content": "Hi"},
+                {"receiver": "09120000002", "content": "a" * 200},
+            ],
+            is_express=True,
+        )
+
+        self.assertEqual([sms.segments for sms in sms_list], [1, 2])
+        self.assertEqual([sms.cost for sms in sms_list], [1500, 3000])
+
+    @patch("sms.views.consume_send_tokens", return_value=(True, None))
+    @patch("sms.views.submit_sms")
+    def test_send_api_rate_limits_by_segments(self, mock_submit_sms, mock_consume_tokens):
+        """Test the send API takes one rate limit token per segment"""
+        mock_submit_sms.return_value = (SMS(id=1), "task-id")
+
+        response = APIClient().post(
+            reverse("sms:send_sms"),
+            {"user_id": self.user.id, "receiver": "09120000001", "content": "س" * 100},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_consume_tokens.assert_called_once_with(self.user.id, tokens=2)
+        self.assertEqual(mock_submit_sms.call_args.kwargs["segments"], 2)
+
+
+class SegmentBatchingTestCase(TestCase):
+    @override_settings(SMS_PROVIDER_MAX_SEGMENTS_PER_CALL=4)
+    @patch("sms.tasks._send_sms_group")
+    def test_batches_are_split_by_segments(self, mock_send_sms_group):
+        """Test one sender's SMS are split over calls of at most the provider's segments"""
+        sms_list = [
+            SMS(id=i, sender="3000111", receiver="0912", content="x", segments=segments)
+            for i, segments in enumerate([2, 2, 3, 1, 8], start=1)
+        ]
+
+        attempted, errored = send_sms_groups(sms_list)
+
+        calls = [[sms.id for sms in call.args[0]] for call in mock_send_sms_group.call_args_list]
+        self.assertEqual(calls, [[1, 2], [3, 4], [5]])
+        self.assertEqual(len(attempted), 5)
+        self.assertEqual(errored, [])
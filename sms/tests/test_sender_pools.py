@@ -0,0 +1,197 @@
+from collections import Counter
+from itertools import count
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from account.models import User
+from sms.models import SMS, SenderLine, SenderPool, SenderPoolStrategy, SMSStatus
+from sms.sender_pools import (
+    SenderLineBusyError,
+    _weighted_schedule,
+    allocate_senders,
+    reset_pool_table,
+    wait_for_line_capacity,
+)
+from sms.services import create_bulk_sms_and_deduct_balance, create_sms_and_deduct_balance
+from sms.tasks import _send_sms_internal, send_sms_groups
+
+
+def _counter_incrby():
+    counters = {}
+
+    def incrby(key, amount):
+        counters[key] = counters.get(key, 0) + amount
+        return counters[key]
+
+    return incrby
+
+
+class WeightedScheduleTestCase(SimpleTestCase):
+    def test_lines_get_slots_by_weight(self):
+        """Test every line gets slots in proportion to its cap"""
+        schedule = _weighted_schedule([30, 10, 20])
+
+        self.assertEqual(Counter(schedule), {0: 3, 1: 1, 2: 2})
+
+    def test_lines_are_interleaved(self):
+        """Test slots of one line are spread instead of grouped"""
+        self.assertEqual(_weighted_schedule([20, 20]), (0, 1))
+        self.assertEqual(_weighted_schedule([50, 10, 10]), (0, 0, 1, 0, 2, 0, 0))
+
+    def test_long_schedules_are_scaled_down(self):
+        """Test coprime weights do not build an unbounded schedule"""
+        schedule = _weighted_schedule([997, 1009, 1])
+
+        self.assertLessEqual(len(schedule), 1000)
+        self.assertIn(2, schedule)
+
+
+class SenderPoolTestCase(TestCase):
+    def setUp(self):
+        reset_pool_table()
+        self.addCleanup(reset_pool_table)
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.user.balance = 100000
+        self.user.save()
+
+    def _pool(self, name, caps, strategy=SenderPoolStrategy.ROUND_ROBIN, is_shared=False):
+        pool = SenderPool.objects.create(name=name, strategy=strategy, is_shared=is_shared)
+        for index, cap in enumerate(caps):
+            SenderLine.objects.create(pool=pool, number=f"3000{name}{index}", max_per_second=cap)
+        return pool
+
+    def test_default_sender_without_pools(self):
+        """Test users without any pool send from the default sender"""
+        self.assertEqual(allocate_senders(self.user, [1, 2]), ["100002", "100002"])
+
+    @patch("sms.sender_pools.redis_conn")
+    def test_round_robin_pool(self, mock_redis_conn):
+        """Test a round-robin pool cycles its lines across requests"""
+        mock_redis_conn.incrby.side_effect = _counter_incrby()
+        self.user.sender_pool = self._pool("1", [10, 10])
+        self.user.save()
+
+        senders = allocate_senders(self.user, [1, 1, 1]) + allocate_senders(self.user, [1])
+
+        self.assertEqual(senders, ["300010", "300011", "300010", "300011"])
+
+    @patch("sms.sender_pools.redis_conn")
+    def test_shared_pool_is_the_fallback(self, mock_redis_conn):
+        """Test users without their own pool send from the shared pool"""
+        mock_redis_conn.incrby.side_effect = _counter_incrby()
+        self._pool("1", [10])
+        self._pool("2", [10], is_shared=True)
+
+        self.assertEqual(allocate_senders(self.user, [1]), ["300020"])
+
+    @patch("sms.sender_pools.redis_conn")
+    def test_inactive_lines_are_skipped(self, mock_redis_conn):
+        """Test a pool without active lines falls back to the default sender"""
+        mock_redis_conn.incrby.side_effect = _counter_incrby()
+        self.user.sender_pool = self._pool("1", [10])
+        self.user.save()
+        SenderLine.objects.update(is_active=False)
+
+        self.assertEqual(allocate_senders(self.user, [1]), ["100002"])
+
+    @patch("sms.sender_pools.redis_conn")
+    def test_least_loaded_pool(self, mock_redis_conn):
+        """Test a least-loaded pool fills the lines with the most spare capacity first"""
+        mock_redis_conn.mget.return_value = [b"8", None]
+        self.user.sender_pool = self._pool("1", [10, 10], SenderPoolStrategy.LEAST_LOADED)
+        self.user.save()
+
+        senders = allocate_senders(self.user, [2, 2, 2, 2, 2])
+
+        self.assertEqual(Counter(senders), {"300011": 4, "300010": 1})
+        pipe = mock_redis_conn.pipeline.return_value
+        amounts = sorted(call.args[1] for call in pipe.incrby.call_args_list)
+        self.assertEqual(amounts, [2, 8])
+
+    @patch("sms.sender_pools.redis_conn")
+    def test_bulk_sms_are_spread_over_lines(self, mock_redis_conn):
+        """Test a bulk request gives every SMS its own line and prices it"""
+        mock_redis_conn.incrby.side_effect = _counter_incrby()
+        self.user.sender_pool = self._pool("1", [20, 10])
+        self.user.save()
+
+        sms_list = create_bulk_sms_and_deduct_balance(
+            self.user,
+            [{"receiver": f"0912000000{i}", "content": "Hi"} for i in range(6)],
+        )
+
+        self.assertEqual(Counter(sms.sender for sms in sms_list), {"300010": 4, "300011": 2})
+        self.assertEqual(sum(sms.cost for sms in sms_list), 6000)
+
+    @patch("sms.sender_pools.redis_conn")
+    def test_single_sms_uses_pool(self, mock_redis_conn):
+        """Test a single SMS is sent from the user's pool"""
+        mock_redis_conn.incrby.side_effect = _counter_incrby()
+        self.user.sender_pool = self._pool("1", [10])
+        self.user.save()
+
+        sms = create_sms_and_deduct_balance(self.user, "Hi", "09120000001")
+
+        self.assertEqual(sms.sender, "300010")
+
+
+class SenderLineCapTestCase(TestCase):
+    def setUp(self):
+        reset_pool_table()
+        self.addCleanup(reset_pool_table)
+        pool = SenderPool.objects.create(name="capped")
+        SenderLine.objects.create(pool=pool, number="3000999", max_per_second=3)
+
+    @override_settings(SMS_SENDER_POOL={"REFRESH_SECONDS": 5, "MAX_WAIT_SECONDS": 0})
+    @patch("sms.sender_pools._take_line_capacity_script", return_value=0)
+    def test_busy_line_raises(self, mock_take_script):
+        """Test a line that stays at its cap raises instead of sending"""
+        with self.assertRaises(SenderLineBusyError):
+            wait_for_line_capacity("3000999", 1)
+
+        self.assertEqual(mock_take_script.call_args.kwargs["args"], [1, 3])
+
+    @patch("sms.sender_pools._take_line_capacity_script")
+    def test_numbers_outside_pools_are_not_capped(self, mock_take_script):
+        """Test senders outside every pool send without a cap check"""
+        wait_for_line_capacity("100002", 1)
+
+        mock_take_script.assert_not_called()
+
+    @override_settings(SMS_SENDER_POOL={"REFRESH_SECONDS": 5, "MAX_WAIT_SECONDS": 0})
+    @patch("sms.sender_pools._take_line_capacity_script", return_value=0)
+    @patch("sms.tasks.get_client_api")
+    def test_busy_line_leaves_sms_untouched(self, mock_get_client_api, mock_take_script):
+        """Test a send on a busy line raises for a retry without recording an attempt"""
+        user = User.objects.create_user(username="testuser", password="testpass123")
+        sms = SMS.objects.create(
+            user=user,
+            sender="3000999",
+            receiver="09120000001",
+            content="Hi",
+            cost=1000,
+            status=SMSStatus.IN_QUEUE,
+        )
+
+        with self.assertRaises(SenderLineBusyError):
+            _send_sms_internal(sms)
+
+        mock_get_client_api.return_value.send_sms.assert_not_called()
+        sms.refresh_from_db()
+        self.assertEqual(sms.status, SMSStatus.IN_QUEUE)
+        self.assertEqual(sms.attempts_num, 0)
+
+    @patch("sms.tasks._send_sms_group")
+    def test_groups_are_split_at_the_line_cap(self, mock_send_sms_group):
+        """Test one provider call never carries more segments than the line's cap"""
+        ids = count(1)
+        sms_list = [
+            SMS(id=next(ids), sender=sender, receiver="0912", content="x", segments=segments)
+            for sender, segments in [("3000999", 2), ("3000999", 1), ("3000999", 2), ("100002", 5)]
+        ]
+
+        send_sms_groups(sms_list)
+
+        calls = [[sms.id for sms in call.args[0]] for call in mock_send_sms_group.call_args_list]
+        self.assertEqual(calls, [[1, 2], [3], [4]])
@@ -11,15 +11,18 @@ from sms.models import SMS, SMSStatus
 from sms.services import (
     _calculate_sms_cost,
     _get_sender_number,
+    create_bulk_sms_and_deduct_balance,
     create_sms,
     create_sms_and_deduct_balance,
     deliver_sms,
     fail_sms,
-    get_magfa_sms_to_check_status,
     get_sms_by_mid,
+    get_sms_to_check_status,
     get_sms_with_over_24_hours_of_sent_status,
+    send_bulk_sms,
     send_sms,
 )
+from sms.tasks import build_send_payload
 
 
 class SMSServicesTestCase(TestCase):
@@ -30,12 +33,12 @@ class SMSServicesTestCase(TestCase):
 
     def test_calculate_sms_cost_normal(self):
         """Test calculating cost for normal SMS"""
-        cost = _calculate_sms_cost("Test message", "100001", "09120000001", is_express=False)
+        cost = _calculate_sms_cost("Test message", "09120000001", is_express=False)
         self.assertEqual(cost, 1000)
 
     def test_calculate_sms_cost_express(self):
         """Test calculating cost for express SMS"""
-        cost = _calculate_sms_cost("Test message", "100001", "09120000001", is_express=True)
+        cost = _calculate_sms_cost("Test message", "09120000001", is_express=True)
         self.assertEqual(cost, 1500)
 
     def test_get_sender_number(self):
@@ -145,6 +148,54 @@ class SMSServicesTestCase(TestCase):
         self.user.refresh_from_db()
         self.assertEqual(self.user.balance, 500)
 
+    def test_create_bulk_sms_and_deduct_balance(self):
+        """Test creating several SMS and deducting their total cost"""
+        messages = [
+            {"receiver": "09120000001", "content": "First"},
+            {"receiver": "09120000002", "content": "Second"},
+        ]
+
+        sms_list = create_bulk_sms_and_deduct_balance(self.user, messages, is_express=True)
+
+        self.assertEqual(len(sms_list), 2)
+        self.assertTrue(all(sms.id is not None for sms in sms_list))
+        self.assertTrue(all(sms.is_express and sms.cost == 1500 for sms in sms_list))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 10000 - 3000)
+        self.assertEqual(
+            Transaction.objects.filter(
+                user=self.user, type=TransactionType.SMS_DEDUCTION, sms__in=sms_list
+            ).count(),
+            2,
+        )
+
+    def test_create_bulk_sms_and_deduct_balance_insufficient_funds(self):
+        """Test that no SMS is created when the bulk total exceeds the balance"""
+        messages = [{"receiver": "09120000001", "content": "Test"}] * 11
+
+        with self.assertRaises(InsufficientFundsError):
+            create_bulk_sms_and_deduct_balance(self.user, messages)
+
+        self.assertEqual(SMS.objects.filter(user=self.user).count(), 0)
+
+    @patch("sms.tasks.send_express_sms_batch")
+    @patch("sms.tasks.send_normal_sms_batch")
+    def test_send_bulk_sms(self, mock_normal_batch, mock_express_batch):
+        """Test that bulk SMS are queued per type in batches"""
+        sms_list = [
+            create_sms(self.user, "Test", "100001", f"0912000000{i}", 1000, is_express=i == 0)
+            for i in range(3)
+        ]
+        mock_normal_batch.delay = Mock(return_value=Mock())
+        mock_express_batch.delay = Mock(return_value=Mock())
+
+        tasks = send_bulk_sms(sms_list)
+
+        self.assertEqual(len(tasks), 2)
+        mock_normal_batch.delay.assert_called_once_with([sms_list[1].id, sms_list[2].id])
+        mock_express_batch.delay.assert_called_once_with([sms_list[0].id])
+        self.assertEqual(SMS.objects.filter(user=self.user, status=SMSStatus.IN_QUEUE).count(), 3)
+
     @patch("sms.tasks.send_normal_sms")
     @patch("sms.tasks.send_express_sms")
     def test_send_sms_normal(self, mock_express_sms, mock_normal_sms):
@@ -168,7 +219,7 @@ class SMSServicesTestCase(TestCase):
         self.assertEqual(sms.status, SMSStatus.IN_QUEUE)
 
         # Verify correct task was called
-        mock_normal_sms.delay.assert_called_once_with(sms.id)
+        mock_normal_sms.delay.assert_called_once_with(sms.id, payload=build_send_payload(sms))
         mock_express_sms.delay.assert_not_called()
         self.assertEqual(result, mock_task)
 
@@ -195,7 +246,7 @@ class SMSServicesTestCase(TestCase):
         self.assertEqual(sms.status, SMSStatus.IN_QUEUE)
 
         # Verify correct task was called
-        mock_express_sms.delay.assert_called_once_with(sms.id)
+        mock_express_sms.delay.assert_called_once_with(sms.id, payload=build_send_payload(sms))
         mock_normal_sms.delay.assert_not_called()
         self.assertEqual(result, mock_task)
 
@@ -220,7 +271,7 @@ class SMSServicesTestCase(TestCase):
 
         sms.refresh_from_db()
         self.assertEqual(sms.status, SMSStatus.IN_QUEUE)
-        mock_normal_sms.delay.assert_called_once_with(sms.id)
+        mock_normal_sms.delay.assert_called_once_with(sms.id, payload=build_send_payload(sms))
 
     @patch("sms.tasks.send_normal_sms")
     def test_send_sms_forced(self, mock_normal_sms):
@@ -243,7 +294,7 @@ class SMSServicesTestCase(TestCase):
 
         sms.refresh_from_db()
         self.assertEqual(sms.status, SMSStatus.IN_QUEUE)
-        mock_normal_sms.delay.assert_called_once_with(sms.id)
+        mock_normal_sms.delay.assert_called_once_with(sms.id, payload=build_send_payload(sms))
 
     @patch("sms.tasks.send_normal_sms")
     def test_send_sms_raises_error_for_invalid_status(self, mock_normal_sms):
@@ -265,7 +316,7 @@ class SMSServicesTestCase(TestCase):
         self.assertIn("already added to queue", str(context.exception))
         mock_normal_sms.delay.assert_not_called()
 
-    def test_get_magfa_sms_to_check_status(self):
+    def test_get_sms_to_check_status(self):
         """Test getting Magfa SMS to check status"""
         now = timezone.now()
 
@@ -313,11 +364,29 @@ class SMSServicesTestCase(TestCase):
         )
         SMS.objects.filter(id=sms4.id).update(created_at=now - timedelta(hours=12))
 
-        result = get_magfa_sms_to_check_status()
+        result = get_sms_to_check_status("magfa")
 
         self.assertEqual(result.count(), 1)
         self.assertEqual(result.first().id, sms1.id)
 
+    def test_sms_to_check_status_by_account(self):
+        """Test SMS a fallback account sent are checked with that account only"""
+        sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender=sender,
+                receiver="09120000001",
+                content="Test",
+                cost=1000,
+                status=SMSStatus.SENT,
+                provider=provider,
+            )
+            for sender, provider in [("30001234", "magfa"), ("30009999", "magfa_backup")]
+        ]
+
+        self.assertEqual(list(get_sms_to_check_status("magfa")), [sms_list[0]])
+        self.assertEqual(list(get_sms_to_check_status("magfa_backup")), [sms_list[1]])
+
     def test_get_sms_with_over_24_hours_of_sent_status(self):
         """Test getting SMS with over 24 hours of SENT status"""
         now = timezone.now()
@@ -0,0 +1,303 @@
+from datetime import timedelta
+from unittest.mock import MagicMock, Mock, patch
+
+from django.db import DatabaseError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from account.models import User
+from sms.batching import SmsBatchConsumer
+from sms.models import SMS, SMSStatus
+from sms.tasks import (
+    _get_sms_to_send,
+    _send_sms_internal,
+    _write_send_result,
+    build_send_payload,
+    load_sms,
+    send_express_sms,
+    send_normal_sms,
+    send_normal_sms_batch,
+    send_sms_groups,
+)
+
+
+class SendSMSGroupsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.sms_list = [
+            SMS.objects.create(
+                user=self.user,
+                sender=sender,
+                receiver=f"0912000000{i}",
+                content=f"Message {i}",
+                cost=1000,
+                status=SMSStatus.IN_QUEUE,
+            )
+            for i, sender in enumerate(["3000111", "3000111", "3000222"])
+        ]
+
+    @patch("sms.tasks.get_client_api")
+    def test_one_provider_call_per_sender(self, mock_get_client_api):
+        """Test SMS are grouped by sender and matched to results by uid"""
+        api = mock_get_client_api.return_value
+
+        def send_multiple_sms(sender, destinations, messages, uids):
+            return {
+                "status": 0,
+                "messages": [
+                    {
+                        "status": 0 if uid != self.sms_list[1].id else 14,
+                        "id": uid + 500,
+                        "userId": uid,
+                    }
+                    for uid in reversed(uids)
+                ],
+            }
+
+        api.send_multiple_sms.side_effect = send_multiple_sms
+
+        attempted, errored = send_sms_groups(self.sms_list)
+
+        self.assertEqual(api.send_multiple_sms.call_count, 2)
+        first_call = api.send_multiple_sms.call_args_list[0].kwargs
+        self.assertEqual(first_call["messages"], ["Message 0", "Message 1"])
+        self.assertEqual(len(attempted), 3)
+        self.assertEqual(errored, [])
+        for sms in self.sms_list:
+            sms.refresh_from_db()
+            self.assertEqual(sms.attempts_num, 1)
+            self.assertIsNotNone(sms.last_attempt_at)
+        self.assertEqual(self.sms_list[0].status, SMSStatus.SENT)
+        self.assertEqual(self.sms_list[0].message_id, self.sms_list[0].id + 500)
+        self.assertEqual(self.sms_list[1].status, SMSStatus.FAILED)
+        self.assertEqual(self.sms_list[1].service_error, "Msg Status: 14")
+        self.assertEqual(self.sms_list[2].status, SMSStatus.SENT)
+
+    @patch("sms.tasks.get_client_api")
+    def test_results_matched_by_position_without_uids(self, mock_get_client_api):
+        """Test results without uids are matched by their position"""
+        mock_get_client_api.return_value.send_multiple_sms.return_value = {
+            "status": 0,
+            "messages": [{"status": 0, "id": 901}, {"status": 0, "id": 902}],
+        }
+
+        send_sms_groups(self.sms_list[:2])
+
+        self.sms_list[1].refresh_from_db()
+        self.assertEqual(self.sms_list[1].message_id, 902)
+
+    @patch("sms.tasks.get_client_api")
+    def test_provider_error_marks_group_errored(self, mock_get_client_api):
+        """Test a raising provider call fails only the SMS of that sender"""
+        api = mock_get_client_api.return_value
+        api.send_multiple_sms.side_effect = [
+            ConnectionError("timeout"),
+            {"status": 0, "messages": [{"status": 0, "id": 903}]},
+        ]
+
+        attempted, errored = send_sms_groups(self.sms_list)
+
+        self.assertEqual(attempted, self.sms_list[2:])
+        self.assertEqual(errored, self.sms_list[:2])
+        self.sms_list[0].refresh_from_db()
+        self.assertEqual(self.sms_list[0].status, SMSStatus.FAILED)
+        self.assertEqual(self.sms_list[0].service_error, "timeout")
+
+    @patch("sms.tasks.send_normal_sms")
+    @patch("sms.tasks.get_client_api")
+    def test_batch_task_hands_errors_to_single_task(self, mock_get_client_api, mock_single_task):
+        """Test the batch task re-queues SMS whose provider call raised"""
+        mock_get_client_api.return_value.send_multiple_sms.side_effect = ConnectionError()
+
+        sent_count = send_normal_sms_batch([sms.id for sms in self.sms_list[:2]])
+
+        self.assertEqual(sent_count, 0)
+        self.assertEqual(mock_single_task.delay.call_count, 2)
+
+
+class SendSMSTaskTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.sms = SMS.objects.create(
+            user=self.user,
+            sender="3000111",
+            receiver="09120000000",
+            content="Your code is 1234",
+            cost=1500,
+            status=SMSStatus.IN_QUEUE,
+            is_express=True,
+        )
+
+    @patch("sms.tasks.get_client_api")
+    def test_payload_task_skips_lookup(self, mock_get_client_api):
+        """Test a task with a payload sends without loading the SMS and writes one UPDATE"""
+        api = mock_get_client_api.return_value
+        api.send_sms.return_value = {"status": 0, "messages": [{"status": 0, "id": 4321}]}
+
+        with self.assertNumQueries(1):
+            self.assertTrue(send_express_sms(self.sms.id, payload=build_send_payload(self.sms)))
+
+        api.send_sms.assert_called_once_with(
+            sender="3000111",
+            destination="09120000000",
+            message="Your code is 1234",
+            uid=self.sms.id,
+        )
+        self.sms.refresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.SENT)
+        self.assertEqual(self.sms.message_id, 4321)
+        self.assertEqual(self.sms.provider, "magfa")
+        self.assertEqual(self.sms.attempts_num, 1)
+        self.assertIsNotNone(self.sms.last_attempt_at)
+        self.assertEqual(self.sms.cost, 1500)
+
+    @patch("sms.tasks.get_client_api")
+    def test_task_without_payload_loads_sms(self, mock_get_client_api):
+        """Test messages queued with only an SMS id are still sent"""
+        mock_get_client_api.return_value.send_sms.return_value = {
+            "status": 0,
+            "messages": [{"status": 0, "id": 4321}],
+        }
+
+        self.assertTrue(send_normal_sms(self.sms.id))
+
+        self.sms.refresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.SENT)
+        self.assertIsNotNone(self.sms.last_attempt_at)
+
+    def test_load_sms_falls_back_to_old_partitions(self):
+        """Test SMS created before the status check window are still found by id"""
+        old_sms = SMS.objects.create(
+            user=self.user, sender="3000111", receiver="09120000001", content="Hi", cost=1000
+        )
+        SMS.objects.filter(id=old_sms.id).update(created_at=timezone.now() - timedelta(days=3))
+
+        with self.assertNumQueries(2):
+            sms_list = load_sms([self.sms.id, old_sms.id])
+
+        self.assertEqual({sms.id for sms in sms_list}, {self.sms.id, old_sms.id})
+        with self.assertNumQueries(1):
+            load_sms([self.sms.id])
+
+    def test_send_result_update_is_bounded_by_created_at(self):
+        """Test the result of a payload send updates the row by id and creation time"""
+        sms = _get_sms_to_send(self.sms.id, build_send_payload(self.sms))
+        sms.status = SMSStatus.SENT
+        sms.last_attempt_at = timezone.now()
+
+        with CaptureQueriesContext(connection) as queries:
+            _write_send_result(sms)
+
+        self.assertIn('"created_at" BETWEEN', queries[0]["sql"])
+        self.sms.refresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.SENT)
+
+    @patch("sms.tasks.get_client_api")
+    def test_failed_attempt_is_counted(self, mock_get_client_api):
+        """Test a raising provider call records the error and counts the attempt"""
+        mock_get_client_api.return_value.send_sms.side_effect = ConnectionError("reset")
+        SMS.objects.filter(id=self.sms.id).update(attempts_num=2)
+        sms = _get_sms_to_send(self.sms.id, build_send_payload(self.sms))
+
+        with self.assertRaises(ConnectionError):
+            _send_sms_internal(sms)
+
+        self.sms.refresh_from_db()
+        self.assertEqual(self.sms.status, SMSStatus.FAILED)
+        self.assertEqual(self.sms.service_error, "reset")
+        self.assertEqual(self.sms.attempts_num, 3)
+        self.assertIsNone(self.sms.message_id)
+
+
+class SmsBatchConsumerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.consumer = SmsBatchConsumer(
+            MagicMock(), "standard_sms_sender", max_size=3, max_wait_ms=50
+        )
+
+    def _message(self, task_name, args, retries=0, eta=None):
+        message = Mock()
+        message.headers = {"task": task_name, "id": "task-id", "retries": retries, "eta": eta}
+        return [args, {}, {}], message
+
+    def _create_sms(self):
+        return SMS.objects.create(
+            user=self.user, sender="3000111", receiver="09120000000", content="Hi", cost=1000
+        )
+
+    def test_batch_is_due_when_full(self):
+        """Test a batch is due once max_size SMS ids are buffered"""
+        self.consumer.on_message(*self._message(send_normal_sms.name, [1]))
+        self.assertFalse(self.consumer._batch_is_due())
+        self.consumer.on_message(*self._message(send_normal_sms_batch.name, [[2, 3]]))
+        self.assertTrue(self.consumer._batch_is_due())
+
+    def test_messages_with_future_eta_are_held(self):
+        """Test retries are not sent before their ETA"""
+        eta = (timezone.now() + timedelta(minutes=1)).isoformat()
+        self.consumer.on_message(*self._message(send_normal_sms.name, [1], eta=eta))
+
+        self.assertEqual(self.consumer.pending, [])
+        self.assertEqual(len(self.consumer.scheduled), 1)
+
+    @patch("sms.batching.send_normal_sms.apply_async")
+    @patch("sms.batching.send_sms_groups")
+    def test_flush_acks_and_retries_errors(self, mock_send_sms_groups, mock_apply_async):
+        """Test flushing sends once, retries errored SMS and acks every message"""
+        sent, errored = self._create_sms(), self._create_sms()
+        mock_send_sms_groups.return_value = ([sent], [errored])
+        body, first_message = self._message(send_normal_sms.name, [sent.id])
+        self.consumer.on_message(body, first_message)
+        body, second_message = self._message(send_normal_sms.name, [errored.id], retries=1)
+        self.consumer.on_message(body, second_message)
+
+        self.assertEqual(self.consumer.flush(), 1)
+
+        mock_send_sms_groups.assert_called_once()
+        self.assertEqual(mock_apply_async.call_args.args, ((errored.id,),))
+        self.assertEqual(mock_apply_async.call_args.kwargs["retries"], 2)
+        first_message.ack.assert_called_once()
+        second_message.ack.assert_called_once()
+        self.assertEqual(self.consumer.pending, [])
+
+    @patch("sms.batching.send_normal_sms.apply_async")
+    @patch("sms.batching.send_sms_groups", side_effect=DatabaseError("write failed"))
+    def test_failed_flush_retries_whole_batch(self, mock_send_sms_groups, mock_apply_async):
+        """Test a flush that raises re-queues every SMS of the batch and keeps the loop alive"""
+        first, second = self._create_sms(), self._create_sms()
+        body, message = self._message(send_normal_sms_batch.name, [[first.id, second.id]])
+        self.consumer.on_message(body, message)
+
+        with self.assertLogs("sms.batching", level="ERROR"):
+            self.assertEqual(self.consumer.flush(), 0)
+
+        retried = {call.args[0][0] for call in mock_apply_async.call_args_list}
+        self.assertEqual(retried, {first.id, second.id})
+        message.ack.assert_called_once()
+        self.assertEqual(self.consumer.pending, [])
+
+    @patch("sms.batching.send_normal_sms.apply_async")
+    @patch("sms.batching.send_sms_groups")
+    def test_flush_gives_up_after_max_retries(self, mock_send_sms_groups, mock_apply_async):
+        """Test an SMS is not re-queued once it used all retries"""
+        sms = self._create_sms()
+        mock_send_sms_groups.return_value = ([], [sms])
+        self.consumer.on_message(
+            *self._message(send_normal_sms.name, [sms.id], retries=send_normal_sms.max_retries)
+        )
+
+        self.consumer.flush()
+
+        mock_apply_async.assert_not_called()
+
+    def test_other_tasks_run_in_process(self):
+        """Test tasks other than SMS sends are executed and acked"""
+        body, message = self._message("sms.tasks.other", [1])
+
+        self.consumer.on_message(body, message)
+
+        self.consumer.app.tasks.get.return_value.apply.assert_called_once()
+        message.ack.assert_called_once()
+        self.assertEqual(self.consumer.pending, [])
@@ -1,10 +1,21 @@
 from django.urls import path
 
-from sms.views import SendSMSView, SMSReportView
+from sms.views import (
+    BulkSendSMSView,
+    DeliveryReportView,
+    SendSMSView,
+    SMSReportCursorView,
+    SMSReportExportView,
+    SMSReportView,
+)
 
 app_name = "sms"
 
 urlpatterns = [
     path("v1/send", SendSMSView.as_view(), name="send_sms"),
+    path("v1/send/bulk", BulkSendSMSView.as_view(), name="send_bulk_sms"),
     path("v1/report", SMSReportView.as_view(), name="sms_report"),
+    path("v2/report", SMSReportCursorView.as_view(), name="sms_report_cursor"),
+    path("v1/dlr/<str:provider>", DeliveryReportView.as_view(), name="delivery_report"),
+    path("v1/report/export", SMSReportExportView.as_view(), name="sms_report_export"),
 ]
@@ -1,14 +1,24 @@
-from rest_framework import settings
+from sms.sms_provider_clients import EXPRESS_TRAFFIC, STANDARD_TRAFFIC
+from sms.sms_provider_clients.registry import get_provider_client
 
-from sms.sms_provider_clients.magfa import MagfaProvider
+# Sender number prefix -> provider account owning the numbers
+SENDER_PREFIX_ACCOUNTS = {
+    "3000": "magfa",
+    # TODO "5000": Arad sms account
+}
 
 
-def get_client_api(sender: str):
-    if sender.startswith("3000"):
-        return MagfaProvider(
-            settings.MAGFA_USERNAME, settings.MAGFA_PASSWORD, settings.MAGFA_DOMAIN, sender
-        )
-    elif sender.startswith("5000"):
-        # TODO return Arad sms client
-        return None
+def get_provider_account(sender: str) -> str | None:
+    for prefix, account in SENDER_PREFIX_ACCOUNTS.items():
+        if sender.startswith(prefix):
+            return account
     return None
+
+
+def get_client_api(sender: str, is_express: bool = False):
+    account = get_provider_account(sender)
+    if not account:
+        return None
+    return get_provider_client(account).for_traffic(
+        EXPRESS_TRAFFIC if is_express else STANDARD_TRAFFIC
+    )
@@ -1,20 +1,52 @@
-from drf_spectacular.utils import OpenApiResponse, extend_schema
+import hmac
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
 from rest_framework import status
-from rest_framework.generics import ListAPIView, get_object_or_404
+from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from account.cache import get_cached_user
 from account.models import User
 from billing.exceptions import InsufficientFundsError
+from sms.dlr import buffer_delivery_reports
+from sms.exports import iter_report_csv, iter_report_ndjson
 from sms.filters import SMSReportFilterSet
+from sms.metrics import API_REQUEST_SECONDS, timed
 from sms.models import SMS
+from sms.pagination import SMSReportCursorPagination
+from sms.rate_limit import OverCapacityError, consume_send_tokens
+from sms.reconciliation import get_status_mapper
 from sms.serializers import (
+    BulkSendSMSResponseSerializer,
+    BulkSendSMSSerializer,
+    DeliveryReportResponseSerializer,
+    DeliveryReportSerializer,
     ErrorResponseSerializer,
     SendSMSResponseSerializer,
     SendSMSSerializer,
     SMSReportSerializer,
 )
-from sms.services import create_sms_and_deduct_balance, send_sms
+from sms.services import submit_bulk_sms, submit_sms
+from SmsHub.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+
+
+def _rate_limit_exceeded_response(retry_after: int) -> Response:
+    return Response(
+        {"error": "Rate limit exceeded"},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def _over_capacity_response(error: OverCapacityError) -> Response:
+    return Response(
+        {"error": f"{error}; split it into smaller requests"},
+        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
 
 
 class SendSMSView(APIView):
@@ -26,29 +58,118 @@ class SendSMSView(APIView):
                 response=ErrorResponseSerializer, description="Validation or business error"
             ),
             404: OpenApiResponse(response=ErrorResponseSerializer, description="User not found"),
+            409: OpenApiResponse(
+                response=ErrorResponseSerializer,
+                description="A request with the same Idempotency-Key is still in progress",
+            ),
+            422: OpenApiResponse(
+                response=ErrorResponseSerializer,
+                description="Idempotency-Key reused with a different request body",
+            ),
+            413: OpenApiResponse(
+                response=ErrorResponseSerializer,
+                description="More segments than the user may send per minute",
+            ),
+            429: OpenApiResponse(
+                response=ErrorResponseSerializer, description="User rate limit exceeded"
+            ),
             500: OpenApiResponse(
                 response=ErrorResponseSerializer, description="Unexpected server error"
             ),
         },
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
         description="Submit an SMS for sending and receive asynchronous task details.",
     )
+    @timed(API_REQUEST_SECONDS, "send_sms")
+    @idempotent("send_sms")
     def post(self, request):
         serializer = SendSMSSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         validated_data = serializer.validated_data
 
-        user = get_object_or_404(User, id=validated_data["user_id"])
         try:
-            sms = create_sms_and_deduct_balance(
+            allowed, retry_after = consume_send_tokens(
+                validated_data["user_id"], tokens=validated_data["segments"]
+            )
+        except OverCapacityError as e:
+            return _over_capacity_response(e)
+        if not allowed:
+            return _rate_limit_exceeded_response(retry_after)
+
+        try:
+            user = get_cached_user(validated_data["user_id"])
+        except User.DoesNotExist:
+            raise Http404("No User matches the given query.") from None
+        try:
+            sms, task_id = submit_sms(
                 user=user,
                 content=validated_data["content"],
                 receiver=validated_data["receiver"],
                 is_express=validated_data["is_express"],
+                segments=validated_data["segments"],
             )
-            task = send_sms(sms)
             response_payload = {
                 "sms_id": sms.id,
-                "task_id": task.id,
+                "task_id": task_id,
+            }
+            return Response(response_payload, status=status.HTTP_200_OK)
+        except InsufficientFundsError:
+            return Response({"error": "Insufficient funds"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class BulkSendSMSView(APIView):
+    @extend_schema(
+        request=BulkSendSMSSerializer,
+        responses={
+            200: BulkSendSMSResponseSerializer,
+            400: OpenApiResponse(
+                response=ErrorResponseSerializer, description="Validation or business error"
+            ),
+            404: OpenApiResponse(response=ErrorResponseSerializer, description="User not found"),
+            413: OpenApiResponse(
+                response=ErrorResponseSerializer,
+                description="More segments than the user may send per minute",
+            ),
+            429: OpenApiResponse(
+                response=ErrorResponseSerializer, description="User rate limit exceeded"
+            ),
+            500: OpenApiResponse(
+                response=ErrorResponseSerializer, description="Unexpected server error"
+            ),
+        },
+        description="Submit a list of SMS in one request, charged with a single ledger operation.",
+    )
+    @timed(API_REQUEST_SECONDS, "send_bulk_sms")
+    def post(self, request):
+        serializer = BulkSendSMSSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+
+        try:
+            allowed, retry_after = consume_send_tokens(
+                validated_data["user_id"],
+                tokens=sum(message["segments"] for message in validated_data["messages"]),
+            )
+        except OverCapacityError as e:
+            return _over_capacity_response(e)
+        if not allowed:
+            return _rate_limit_exceeded_response(retry_after)
+
+        try:
+            user = get_cached_user(validated_data["user_id"])
+        except User.DoesNotExist:
+            raise Http404("No User matches the given query.") from None
+        try:
+            sms_list, task_ids = submit_bulk_sms(
+                user=user,
+                messages=validated_data["messages"],
+                is_express=validated_data["is_express"],
+            )
+            response_payload = {
+                "sms_ids": [sms.id for sms in sms_list],
+                "task_ids": task_ids,
             }
             return Response(response_payload, status=status.HTTP_200_OK)
         except InsufficientFundsError:
@@ -61,3 +182,77 @@ class SMSReportView(ListAPIView):
     serializer_class = SMSReportSerializer
     queryset = SMS.objects.all()
     filterset_class = SMSReportFilterSet
+
+
+class SMSReportCursorView(SMSReportView):
+    pagination_class = SMSReportCursorPagination
+
+
+class SMSReportExportView(GenericAPIView):
+    queryset = SMS.objects.all()
+    filterset_class = SMSReportFilterSet
+    export_formats = {
+        "csv": ("text/csv", iter_report_csv),
+        "ndjson": ("application/x-ndjson", iter_report_ndjson),
+    }
+
+    def perform_content_negotiation(self, request, force=False):
+        # Clients asking for text/csv must not get a 406; errors still render as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    @extend_schema(
+        parameters=[OpenApiParameter("file_format", str, enum=["csv", "ndjson"], default="csv")],
+        responses={
+            (200, "text/csv"): OpenApiTypes.STR,
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            400: OpenApiResponse(response=ErrorResponseSerializer, description="Invalid filters"),
+        },
+        description="Stream every SMS matching the report filters as CSV or NDJSON.",
+    )
+    def get(self, request):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in self.export_formats:
+            return Response(
+                {"error": f"Unsupported file_format: {file_format}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+
+        content_type, iter_rows = self.export_formats[file_format]
+        response = StreamingHttpResponse(iter_rows(queryset), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="sms-report.{file_format}"'
+        return response
+
+
+class DeliveryReportView(APIView):
+    @extend_schema(
+        request=DeliveryReportSerializer(many=True),
+        parameters=[OpenApiParameter("X-DLR-Token", str, OpenApiParameter.HEADER, required=True)],
+        responses={
+            202: DeliveryReportResponseSerializer,
+            400: OpenApiResponse(description="Invalid delivery reports"),
+            403: OpenApiResponse(response=ErrorResponseSerializer, description="Invalid token"),
+            404: OpenApiResponse(response=ErrorResponseSerializer, description="Unknown provider"),
+        },
+        description="Receive one delivery report or a list of them pushed by a provider.",
+    )
+    def post(self, request, provider):
+        if get_status_mapper(provider) is None:
+            return Response({"error": "Unknown provider"}, status=status.HTTP_404_NOT_FOUND)
+        expected_token = settings.SMS_PROVIDER_ACCOUNTS[provider].get("DLR_TOKEN")
+        token = request.headers.get("X-DLR-Token", "")
+        if not expected_token or not hmac.compare_digest(token, expected_token):
+            return Response({"error": "Invalid token"}, status=status.HTTP_403_FORBIDDEN)
+
+        many = isinstance(request.data, list)
+        if many and len(request.data) > settings.SMS_DLR_MAX_BATCH_SIZE:
+            return Response(
+                {"error": f"At most {settings.SMS_DLR_MAX_BATCH_SIZE} reports per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = DeliveryReportSerializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        reports = serializer.validated_data if many else [serializer.validated_data]
+
+        buffer_delivery_reports(provider, reports)
+        return Response({"received": len(reports)}, status=status.HTTP_202_ACCEPTED)
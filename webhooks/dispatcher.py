@@ -0,0 +1,247 @@
+"""
+Dispatcher for outgoing SMS status webhooks.
+
+Events wait in one Redis list per user. The dispatcher claims up to ``WEBHOOK_BATCH_SIZE`` of
+a user's events, POSTs them as one signed JSON body and removes them only after a 2xx reply;
+a failed batch is sent again with exponential backoff. Each user has at most one request in
+flight while requests to different users run concurrently over one pooled session, so a slow
+endpoint only ever holds its own thread. The host is resolved again before every POST and a
+batch bound for a non-public address fails like any other. The connection is opened to the
+address that was checked, with the name kept for the Host header and TLS, so a name rebound
+to the internal network after registration, even between the check and the connect, is never
+called.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from redis.exceptions import LockError
+
+from sms.sms_provider_clients.http import KeepAliveHTTPAdapter, build_http_session
+from webhooks.models import WebhookEndpoint
+from webhooks.services import (
+    PENDING_USERS_KEY,
+    UnsafeWebhookURLError,
+    get_events_key,
+    redis_conn,
+    resolve_public_address,
+)
+
+logger = logging.getLogger(__name__)
+
+PROCESSING_KEY_TEMPLATE = "webhook:processing:{user_id}"
+LOCK_KEY_TEMPLATE = "webhook:lock:{user_id}"
+RETRY_KEY = "webhook:retry"
+ATTEMPTS_KEY = "webhook:attempts"
+SIGNATURE_HEADER = "X-SmsHub-Signature"
+
+_claim_script = redis_conn.register_script(
+    """
+    if redis.call('LLEN', KEYS[2]) == 0 then
+        local entries = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+        for i = 1, #entries do
+            redis.call('RPUSH', KEYS[2], entries[i])
+        end
+        if #entries > 0 then
+            redis.call('LTRIM', KEYS[1], #entries, -1)
+        end
+    end
+    return redis.call('LRANGE', KEYS[2], 0, -1)
+    """
+)
+
+
+class PublicAddressAdapter(KeepAliveHTTPAdapter):
+    """Connects to the address ``resolve_public_address`` checked instead of resolving the
+    name again; the name is still sent as Host and used for TLS SNI and verification."""
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        host_params, pool_kwargs = self.build_connection_pool_key_attributes(request, verify, cert)
+        hostname = host_params["host"]
+        host_params["host"] = resolve_public_address(request.url)
+        if host_params["scheme"] == "https":
+            pool_kwargs["server_hostname"] = hostname
+            pool_kwargs["assert_hostname"] = hostname
+        return self.poolmanager.connection_from_host(**host_params, pool_kwargs=pool_kwargs)
+
+    def add_headers(self, request, **kwargs):
+        request.headers.setdefault("Host", urlsplit(request.url).netloc.rpartition("@")[2])
+
+
+def sign_payload(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class WebhookDispatcher:
+    def __init__(self, concurrency: int | None = None, batch_size: int | None = None):
+        self.concurrency = concurrency or settings.WEBHOOK_DISPATCHER_CONCURRENCY
+        self.batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+        self.session, self.timeout = build_http_session(
+            # One pool per customer host, each large enough for every worker thread
+            {
+                **settings.WEBHOOK_HTTP,
+                "POOL_CONNECTIONS": self.concurrency,
+                "POOL_MAXSIZE": self.concurrency,
+            },
+            adapter_class=PublicAddressAdapter,
+        )
+        # A proxy would resolve the name itself, past the address check
+        self.session.trust_env = False
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.in_flight = {}  # user_id -> Future
+        self.should_stop = False
+
+    def _schedule(self, user_id: int, delay: float) -> None:
+        redis_conn.zadd(RETRY_KEY, {user_id: time.time() + delay})
+
+    def _due_user_ids(self) -> list[int]:
+        free = self.concurrency - len(self.in_flight)
+        if free <= 0:
+            return []
+        due = redis_conn.zrangebyscore(RETRY_KEY, "-inf", time.time(), start=0, num=free)
+        if due:
+            redis_conn.zrem(RETRY_KEY, *due)
+        if len(due) < free:
+            popped = redis_conn.spop(PENDING_USERS_KEY, free - len(due)) or []
+            if popped:
+                # Users backing off keep their schedule; new events wait for the retry
+                pipe = redis_conn.pipeline(transaction=False)
+                for user_id in popped:
+                    pipe.zscore(RETRY_KEY, user_id)
+                scores = pipe.execute()
+                due += [user_id for user_id, score in zip(popped, scores) if score is None]
+        return list(dict.fromkeys(int(user_id) for user_id in due))
+
+    def _post(self, endpoint: WebhookEndpoint, events: list[dict]) -> bool:
+        body = json.dumps({"events": events}).encode()
+        try:
+            response = self.session.post(
+                endpoint.url,
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    SIGNATURE_HEADER: sign_payload(endpoint.secret, body),
+                },
+                timeout=self.timeout,
+                allow_redirects=False,
+            )
+        except UnsafeWebhookURLError as e:
+            logger.warning("Webhook to %s refused: %s", endpoint.url, e)
+            return False
+        except requests.RequestException as e:
+            logger.warning("Webhook to %s failed: %s", endpoint.url, e)
+            return False
+        if not 200 <= response.status_code < 300:
+            logger.warning("Webhook to %s returned %s", endpoint.url, response.status_code)
+            return False
+        return True
+
+    def _finish_batch(self, user_id: int, processing_key: str) -> None:
+        pipe = redis_conn.pipeline(transaction=True)
+        pipe.delete(processing_key)
+        pipe.hdel(ATTEMPTS_KEY, user_id)
+        pipe.llen(get_events_key(user_id))
+        if pipe.execute()[-1]:
+            redis_conn.sadd(PENDING_USERS_KEY, user_id)
+
+    def deliver(self, user_id: int, endpoint: WebhookEndpoint | None) -> None:
+        """Send one batch of the events of ``user_id``."""
+        lock = redis_conn.lock(
+            LOCK_KEY_TEMPLATE.format(user_id=user_id), timeout=settings.WEBHOOK_LOCK_TIMEOUT
+        )
+        if not lock.acquire(blocking=False):
+            # Another dispatcher has this user in flight
+            self._schedule(user_id, settings.WEBHOOK_POLL_INTERVAL)
+            return
+        try:
+            events_key = get_events_key(user_id)
+            processing_key = PROCESSING_KEY_TEMPLATE.format(user_id=user_id)
+            if endpoint is None:
+                # Removed or deactivated after the events were queued
+                redis_conn.delete(events_key, processing_key)
+                redis_conn.hdel(ATTEMPTS_KEY, user_id)
+                return
+
+            raw_events = _claim_script(keys=[events_key, processing_key], args=[self.batch_size])
+            if not raw_events:
+                return
+            if self._post(endpoint, [json.loads(raw_event) for raw_event in raw_events]):
+                self._finish_batch(user_id, processing_key)
+                return
+
+            attempts = redis_conn.hincrby(ATTEMPTS_KEY, user_id, 1)
+            if attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                logger.error(
+                    "Dropping %s webhook events of user %s after %s attempts",
+                    len(raw_events),
+                    user_id,
+                    attempts,
+                )
+                self._finish_batch(user_id, processing_key)
+                return
+            self._schedule(
+                user_id,
+                get_exponential_backoff_interval(
+                    factor=2,
+                    retries=attempts,
+                    maximum=settings.WEBHOOK_RETRY_BACKOFF_MAX,
+                    full_jitter=True,
+                ),
+            )
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+    def _reap(self) -> None:
+        for user_id, future in list(self.in_flight.items()):
+            if not future.done():
+                continue
+            del self.in_flight[user_id]
+            if future.exception() is not None:
+                logger.error(
+                    "Webhook delivery for user %s crashed",
+                    user_id,
+                    exc_info=future.exception(),
+                )
+                self._schedule(user_id, settings.WEBHOOK_POLL_INTERVAL)
+
+    def run_once(self) -> int:
+        """Start deliveries for due users without waiting for them; return how many started."""
+        self._reap()
+        user_ids = self._due_user_ids()
+        if not user_ids:
+            return 0
+        endpoints = {
+            endpoint.user_id: endpoint
+            for endpoint in WebhookEndpoint.objects.filter(user_id__in=user_ids, is_active=True)
+        }
+        started = 0
+        for user_id in user_ids:
+            if user_id in self.in_flight:
+                # New events arrived while a batch is in flight; look again shortly
+                self._schedule(user_id, settings.WEBHOOK_POLL_INTERVAL)
+                continue
+            self.in_flight[user_id] = self.executor.submit(
+                self.deliver, user_id, endpoints.get(user_id)
+            )
+            started += 1
+        return started
+
+    def run(self) -> None:
+        try:
+            while not self.should_stop:
+                if not self.run_once():
+                    time.sleep(settings.WEBHOOK_POLL_INTERVAL)
+        finally:
+            self.executor.shutdown(wait=True)
+            self.session.close()
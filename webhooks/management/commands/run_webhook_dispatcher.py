@@ -0,0 +1,27 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webhooks.dispatcher import WebhookDispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued SMS status events to customer webhooks in per-user batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.WEBHOOK_DISPATCHER_CONCURRENCY
+        )
+        parser.add_argument("--batch-size", type=int, default=settings.WEBHOOK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        dispatcher = WebhookDispatcher(options["concurrency"], options["batch_size"])
+
+        def stop(signum, frame):
+            dispatcher.should_stop = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f"Dispatching webhooks with concurrency {options['concurrency']}")
+        dispatcher.run()
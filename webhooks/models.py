@@ -0,0 +1,28 @@
+import secrets
+
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+def generate_secret() -> str:
+    return secrets.token_hex(32)
+
+
+class WebhookEndpoint(models.Model):
+    user = models.OneToOneField(
+        User, verbose_name="کاربر", on_delete=models.CASCADE, related_name="webhook_endpoint"
+    )
+    url = models.URLField(max_length=500, verbose_name="آدرس Callback")
+    secret = models.CharField(max_length=64, default=generate_secret, verbose_name="کلید امضا")
+    is_active = models.BooleanField(default=True, verbose_name="فعال")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ایجاد")
+    modified_at = models.DateTimeField(auto_now=True, verbose_name="تاریخ آخرین تغییر")
+
+    class Meta:
+        verbose_name = "Webhook"
+        verbose_name_plural = "Webhookها"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.url}"
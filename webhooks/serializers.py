@@ -0,0 +1,30 @@
+from django.core.validators import URLValidator
+from rest_framework import serializers
+
+from webhooks.models import WebhookEndpoint
+from webhooks.services import UnsafeWebhookURLError, resolve_public_address
+
+
+class WebhookEndpointSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    url = serializers.URLField(max_length=500, validators=[URLValidator(schemes=["http", "https"])])
+
+    def validate_url(self, value):
+        try:
+            resolve_public_address(value)
+        except UnsafeWebhookURLError as e:
+            raise serializers.ValidationError(str(e)) from None
+        return value
+
+
+class WebhookEndpointResponseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookEndpoint
+        fields = ["user_id", "url", "is_active", "created_at", "modified_at"]
+
+
+class WebhookEndpointCreatedResponseSerializer(WebhookEndpointResponseSerializer):
+    """Carries the signing secret, which is only shown when the endpoint is created."""
+
+    class Meta(WebhookEndpointResponseSerializer.Meta):
+        fields = [*WebhookEndpointResponseSerializer.Meta.fields, "secret"]
@@ -0,0 +1,107 @@
+import ipaddress
+import json
+import logging
+import socket
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from account.models import User
+from webhooks.models import WebhookEndpoint
+
+logger = logging.getLogger(__name__)
+
+redis_conn = get_redis_connection("default")
+
+EVENTS_KEY_TEMPLATE = "webhook:events:{user_id}"
+PENDING_USERS_KEY = "webhook:pending_users"
+
+
+class UnsafeWebhookURLError(ValueError):
+    """The webhook URL points at an address SmsHub must not call, such as its own network."""
+
+
+def get_events_key(user_id: int) -> str:
+    return EVENTS_KEY_TEMPLATE.format(user_id=user_id)
+
+
+def resolve_public_address(url: str) -> str:
+    """Resolve the host of ``url`` and return the address to connect to.
+
+    Raises ``UnsafeWebhookURLError`` unless every address the host resolves to is public;
+    private, loopback, link-local and other reserved ranges are refused.
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        address_infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise UnsafeWebhookURLError(f"{parts.hostname} could not be resolved") from e
+    addresses = [ipaddress.ip_address(sockaddr[0]) for *_, sockaddr in address_infos]
+    if not settings.WEBHOOK_ALLOW_PRIVATE_URLS:
+        for address in addresses:
+            if address.version == 6 and address.ipv4_mapped:
+                address = address.ipv4_mapped
+            if not address.is_global or address.is_multicast:
+                raise UnsafeWebhookURLError(f"{parts.hostname} resolves to non-public {address}")
+    return str(addresses[0])
+
+
+@transaction.atomic
+def register_webhook_endpoint(user: User, url: str) -> tuple[WebhookEndpoint, bool]:
+    """Create or replace the callback URL of ``user``; the signing secret is kept.
+
+    Returns the endpoint and whether it was created.
+    """
+    return WebhookEndpoint.objects.update_or_create(
+        user=user, defaults={"url": url, "is_active": True}
+    )
+
+
+def _push_events(events_by_user: dict[int, list[str]]) -> None:
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        for user_id, events in events_by_user.items():
+            pipe.rpush(get_events_key(user_id), *events)
+        pipe.sadd(PENDING_USERS_KEY, *events_by_user)
+        pipe.execute()
+    except RedisError:
+        # Webhooks are best effort: the statuses are committed and the report still has them
+        logger.exception("Could not queue webhook events for users %s", list(events_by_user))
+
+
+def emit_sms_status_events(sms_list) -> None:
+    """Queue a status event for every SMS whose user has an active webhook endpoint.
+
+    Events are pushed once the surrounding transaction commits, so a rollback emits nothing.
+    """
+    subscribed = set(
+        WebhookEndpoint.objects.filter(
+            user_id__in={sms.user_id for sms in sms_list}, is_active=True
+        ).values_list("user_id", flat=True)
+    )
+    if not subscribed:
+        return
+
+    occurred_at = now().isoformat()
+    events_by_user = defaultdict(list)
+    for sms in sms_list:
+        if sms.user_id in subscribed:
+            events_by_user[sms.user_id].append(
+                json.dumps(
+                    {
+                        "id": uuid.uuid4().hex,
+                        "type": "sms.status",
+                        "sms_id": sms.id,
+                        "status": sms.status,
+                        "occurred_at": occurred_at,
+                    }
+                )
+            )
+    transaction.on_commit(lambda: _push_events(events_by_user))
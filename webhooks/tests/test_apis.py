@@ -0,0 +1,128 @@
+import socket
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from account.models import User
+from webhooks.models import WebhookEndpoint
+
+
+def _resolves_to(address):
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    return [(family, socket.SOCK_STREAM, 6, "", (address, 443))]
+
+
+class WebhookEndpointAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.url = reverse("webhooks:webhook_endpoint")
+        patcher = patch(
+            "webhooks.services.socket.getaddrinfo", return_value=_resolves_to("93.184.216.34")
+        )
+        self.mock_getaddrinfo = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_register_endpoint(self):
+        """Test registering a webhook returns its signing secret once"""
+        response = self.client.post(
+            self.url,
+            {"user_id": self.user.id, "url": "https://example.com/hooks/sms"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["url"], "https://example.com/hooks/sms")
+        self.assertEqual(len(response.data["secret"]), 64)
+        self.assertTrue(response.data["is_active"])
+
+    def test_replace_endpoint_keeps_secret(self):
+        """Test registering again replaces the URL and keeps the secret"""
+        endpoint = WebhookEndpoint.objects.create(
+            user=self.user, url="https://old.example.com", is_active=False
+        )
+
+        response = self.client.post(
+            self.url, {"user_id": self.user.id, "url": "https://new.example.com"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("secret", response.data)
+        old_secret = endpoint.secret
+        endpoint.refresh_from_db()
+        self.assertEqual(endpoint.secret, old_secret)
+        self.assertEqual(endpoint.url, "https://new.example.com")
+        self.assertTrue(endpoint.is_active)
+
+    def test_register_invalid_url(self):
+        """Test registering a URL that is not http(s)"""
+        response = self.client.post(
+            self.url, {"user_id": self.user.id, "url": "ftp://example.com"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_register_private_url(self):
+        """Test URLs resolving to private, loopback or link-local addresses are refused"""
+        for address in ["10.0.0.5", "127.0.0.1", "169.254.169.254", "::1", "::ffff:127.0.0.1"]:
+            self.mock_getaddrinfo.return_value = _resolves_to(address)
+
+            response = self.client.post(
+                self.url, {"user_id": self.user.id, "url": "https://example.com"}, format="json"
+            )
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, address)
+        self.assertFalse(WebhookEndpoint.objects.exists())
+
+    def test_register_unresolvable_url(self):
+        """Test a host that does not resolve is refused"""
+        self.mock_getaddrinfo.side_effect = socket.gaierror()
+
+        response = self.client.post(
+            self.url, {"user_id": self.user.id, "url": "https://nowhere.invalid"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_URLS=True)
+    def test_register_private_url_when_allowed(self):
+        """Test private URLs are accepted when WEBHOOK_ALLOW_PRIVATE_URLS is set"""
+        self.mock_getaddrinfo.return_value = _resolves_to("10.0.0.5")
+
+        response = self.client.post(
+            self.url, {"user_id": self.user.id, "url": "http://10.0.0.5:8080/hooks"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_register_user_not_found(self):
+        """Test registering a webhook for a non-existent user"""
+        response = self.client.post(
+            self.url, {"user_id": 99999, "url": "https://example.com"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_and_delete_endpoint(self):
+        """Test reading and removing a registered webhook"""
+        WebhookEndpoint.objects.create(user=self.user, url="https://example.com")
+
+        response = self.client.get(self.url, {"user_id": self.user.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["user_id"], self.user.id)
+        self.assertNotIn("secret", response.data)
+
+        response = self.client.delete(f"{self.url}?user_id={self.user.id}")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(WebhookEndpoint.objects.filter(user=self.user).exists())
+
+        response = self.client.get(self.url, {"user_id": self.user.id})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_without_user_id(self):
+        """Test reading a webhook without user_id"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,293 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock, patch
+
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from account.models import User
+from sms.models import SMS, SMSStatus
+from sms.reconciliation import apply_status_updates
+from sms.services import deliver_sms
+from webhooks.dispatcher import (
+    ATTEMPTS_KEY,
+    RETRY_KEY,
+    SIGNATURE_HEADER,
+    PublicAddressAdapter,
+    WebhookDispatcher,
+    sign_payload,
+)
+from webhooks.models import WebhookEndpoint
+from webhooks.services import PENDING_USERS_KEY, UnsafeWebhookURLError, emit_sms_status_events
+
+
+def _event(sms_id, sms_status=SMSStatus.DELIVERED):
+    return json.dumps({"id": f"e{sms_id}", "sms_id": sms_id, "status": sms_status}).encode()
+
+
+class EmitEventsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.other_user = User.objects.create_user(username="otheruser", password="testpass123")
+        WebhookEndpoint.objects.create(user=self.user, url="https://example.com/hooks")
+        self.sms_list = [
+            SMS.objects.create(
+                user=user,
+                sender="3000111",
+                receiver="09120000000",
+                content="Test",
+                cost=1000,
+                status=SMSStatus.SENT,
+                message_id=100 + i,
+            )
+            for i, user in enumerate([self.user, self.user, self.other_user])
+        ]
+
+    @patch("webhooks.services.redis_conn")
+    def test_events_queued_per_subscribed_user_after_commit(self, mock_redis_conn):
+        """Test events of subscribed users are pushed to their list once committed"""
+        pipe = mock_redis_conn.pipeline.return_value
+        for sms in self.sms_list:
+            sms.status = SMSStatus.DELIVERED
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            emit_sms_status_events(self.sms_list)
+        pipe.rpush.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+
+        pipe.rpush.assert_called_once()
+        key, *events = pipe.rpush.call_args.args
+        self.assertEqual(key, f"webhook:events:{self.user.id}")
+        self.assertEqual(
+            [json.loads(event)["sms_id"] for event in events],
+            [self.sms_list[0].id, self.sms_list[1].id],
+        )
+        pipe.sadd.assert_called_once_with(PENDING_USERS_KEY, self.user.id)
+
+    @patch("webhooks.services.redis_conn")
+    def test_deliver_sms_emits_event(self, mock_redis_conn):
+        """Test deliver_sms emits a status event"""
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver_sms(self.sms_list[0])
+
+        _, event = mock_redis_conn.pipeline.return_value.rpush.call_args.args
+        self.assertEqual(json.loads(event)["status"], SMSStatus.DELIVERED)
+
+    @patch("billing.services.redis_conn")
+    @patch("webhooks.services.redis_conn")
+    def test_status_reconciliation_emits_events(self, mock_redis_conn, mock_billing_redis_conn):
+        """Test bulk status updates emit one event per changed SMS"""
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_status_updates(
+                {
+                    self.sms_list[0].id: SMSStatus.FAILED,
+                    self.sms_list[2].id: SMSStatus.DELIVERED,
+                }
+            )
+
+        _, event = mock_redis_conn.pipeline.return_value.rpush.call_args.args
+        self.assertEqual(json.loads(event)["sms_id"], self.sms_list[0].id)
+        self.assertEqual(json.loads(event)["status"], SMSStatus.FAILED)
+
+    @patch("webhooks.services.redis_conn")
+    def test_no_events_without_endpoint(self, mock_redis_conn):
+        """Test nothing is queued for users without an active webhook"""
+        with self.captureOnCommitCallbacks(execute=True):
+            emit_sms_status_events([self.sms_list[2]])
+
+        mock_redis_conn.pipeline.assert_not_called()
+
+
+@override_settings(WEBHOOK_MAX_ATTEMPTS=3, WEBHOOK_POLL_INTERVAL=0.5)
+class WebhookDispatcherTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass123")
+        self.endpoint = WebhookEndpoint.objects.create(
+            user=self.user, url="https://example.com/hooks"
+        )
+        self.dispatcher = WebhookDispatcher(concurrency=4, batch_size=10)
+        self.dispatcher.session = MagicMock()
+        self.addCleanup(self.dispatcher.executor.shutdown)
+
+    @patch("webhooks.dispatcher._claim_script")
+    @patch("webhooks.dispatcher.redis_conn")
+    def test_batch_posted_signed_and_released(self, mock_redis_conn, mock_claim_script):
+        """Test a claimed batch is posted as one signed request and removed on success"""
+        mock_claim_script.return_value = [_event(1), _event(2)]
+        self.dispatcher.session.post.return_value.status_code = 200
+        pipe = mock_redis_conn.pipeline.return_value
+        pipe.execute.return_value = [1, 0, 3]
+
+        self.dispatcher.deliver(self.user.id, self.endpoint)
+
+        post = self.dispatcher.session.post.call_args
+        self.assertEqual(post.args, ("https://example.com/hooks",))
+        body = post.kwargs["data"]
+        self.assertEqual([event["sms_id"] for event in json.loads(body)["events"]], [1, 2])
+        self.assertEqual(
+            post.kwargs["headers"][SIGNATURE_HEADER], sign_payload(self.endpoint.secret, body)
+        )
+        pipe.delete.assert_called_once_with(f"webhook:processing:{self.user.id}")
+        pipe.hdel.assert_called_once_with(ATTEMPTS_KEY, self.user.id)
+        # More events are waiting, so the user is marked pending again
+        mock_redis_conn.sadd.assert_called_once_with(PENDING_USERS_KEY, self.user.id)
+
+    @patch("webhooks.dispatcher._claim_script")
+    @patch("webhooks.dispatcher.redis_conn")
+    def test_failed_batch_is_retried_with_backoff(self, mock_redis_conn, mock_claim_script):
+        """Test a failing endpoint keeps the batch and schedules a retry"""
+        mock_claim_script.return_value = [_event(1)]
+        self.dispatcher.session.post.side_effect = requests.ConnectionError("refused")
+        mock_redis_conn.hincrby.return_value = 1
+
+        self.dispatcher.deliver(self.user.id, self.endpoint)
+
+        mock_redis_conn.zadd.assert_called_once()
+        self.assertEqual(mock_redis_conn.zadd.call_args.args[0], RETRY_KEY)
+        mock_redis_conn.pipeline.assert_not_called()
+
+    @patch("webhooks.dispatcher._claim_script")
+    @patch("webhooks.dispatcher.redis_conn")
+    def test_refused_address_is_retried(self, mock_redis_conn, mock_claim_script):
+        """Test a batch whose host now resolves to an internal address fails like any other"""
+        mock_claim_script.return_value = [_event(1)]
+        mock_redis_conn.hincrby.return_value = 1
+        self.dispatcher.session.post.side_effect = UnsafeWebhookURLError("non-public")
+
+        with self.assertLogs("webhooks.dispatcher", "WARNING"):
+            self.dispatcher.deliver(self.user.id, self.endpoint)
+
+        mock_redis_conn.zadd.assert_called_once()
+
+    @patch("webhooks.dispatcher._claim_script")
+    @patch("webhooks.dispatcher.redis_conn")
+    def test_batch_dropped_after_max_attempts(self, mock_redis_conn, mock_claim_script):
+        """Test a batch is given up after WEBHOOK_MAX_ATTEMPTS failures"""
+        mock_claim_script.return_value = [_event(1)]
+        self.dispatcher.session.post.return_value.status_code = 500
+        mock_redis_conn.hincrby.return_value = 3
+        mock_redis_conn.pipeline.return_value.execute.return_value = [1, 1, 0]
+
+        self.dispatcher.deliver(self.user.id, self.endpoint)
+
+        mock_redis_conn.zadd.assert_not_called()
+        mock_redis_conn.pipeline.return_value.delete.assert_called_once()
+
+    @patch("webhooks.dispatcher._claim_script")
+    @patch("webhooks.dispatcher.redis_conn")
+    def test_user_locked_elsewhere_is_rescheduled(self, mock_redis_conn, mock_claim_script):
+        """Test a user in flight on another dispatcher is only rescheduled"""
+        mock_redis_conn.lock.return_value.acquire.return_value = False
+
+        self.dispatcher.deliver(self.user.id, self.endpoint)
+
+        mock_claim_script.assert_not_called()
+        mock_redis_conn.zadd.assert_called_once()
+
+    @patch("webhooks.dispatcher._claim_script")
+    @patch("webhooks.dispatcher.redis_conn")
+    def test_slow_endpoint_does_not_block_others(self, mock_redis_conn, mock_claim_script):
+        """Test deliveries to other users finish while one endpoint hangs"""
+        other_user = User.objects.create_user(username="otheruser", password="testpass123")
+        WebhookEndpoint.objects.create(user=other_user, url="https://fast.example.com")
+        mock_redis_conn.zrangebyscore.return_value = []
+        mock_redis_conn.spop.return_value = [str(self.user.id).encode(), str(other_user.id)]
+        mock_redis_conn.pipeline.return_value.execute.side_effect = [
+            [None, None],
+            [1, 0, 0],
+            [1, 0, 0],
+        ]
+        mock_claim_script.return_value = [_event(1)]
+
+        release_slow = threading.Event()
+        fast_done = threading.Event()
+
+        def post(url, **kwargs):
+            if url == "https://example.com/hooks":
+                release_slow.wait(5)
+            else:
+                fast_done.set()
+            return MagicMock(status_code=200)
+
+        self.dispatcher.session.post.side_effect = post
+
+        self.assertEqual(self.dispatcher.run_once(), 2)
+
+        self.assertTrue(fast_done.wait(5))
+        self.assertFalse(self.dispatcher.in_flight[self.user.id].done())
+        release_slow.set()
+        self.dispatcher.in_flight[self.user.id].result(5)
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    hosts = []
+
+    def do_POST(self):
+        self.hosts.append(self.headers["Host"])
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class PublicAddressAdapterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), _RecordingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        _RecordingHandler.hosts = []
+        self.session = requests.Session()
+        self.session.mount("http://", PublicAddressAdapter())
+        self.addCleanup(self.session.close)
+        self.url = f"http://hooks.example.com:{self.server.server_port}/sms"
+
+    def _getaddrinfo(self, addresses):
+        """Resolve hooks.example.com to each of ``addresses`` in turn; other hosts as usual."""
+        lookups = iter(addresses)
+        real_getaddrinfo = socket.getaddrinfo
+        self.lookups = 0
+
+        def getaddrinfo(host, port, *args, **kwargs):
+            if host != "hooks.example.com":
+                return real_getaddrinfo(host, port, *args, **kwargs)
+            self.lookups += 1
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(lookups), port))]
+
+        return patch("webhooks.services.socket.getaddrinfo", side_effect=getaddrinfo)
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_URLS=True)
+    def test_connects_to_the_checked_address(self):
+        """Test the connection goes to the address resolved once and keeps the host name"""
+        # A second lookup would send the request to an unroutable address
+        with self._getaddrinfo(["127.0.0.1", "203.0.113.1"]):
+            response = self.session.post(self.url, data=b"{}", timeout=(0.5, 5))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(_RecordingHandler.hosts, [f"hooks.example.com:{self.server.server_port}"])
+        self.assertEqual(self.lookups, 1)
+
+    def test_private_address_is_not_connected(self):
+        """Test a host resolving to an internal address is refused before connecting"""
+        with self._getaddrinfo(["127.0.0.1"]), self.assertRaises(UnsafeWebhookURLError):
+            self.session.post(self.url, data=b"{}", timeout=(0.5, 5))
+
+        self.assertEqual(_RecordingHandler.hosts, [])
+
+    def test_tls_keeps_the_host_name(self):
+        """Test HTTPS pools connect to the checked address and verify the host name"""
+        adapter = PublicAddressAdapter()
+        request = requests.Request("POST", "https://hooks.example.com/sms").prepare()
+
+        with self._getaddrinfo(["93.184.216.34"]):
+            pool = adapter.get_connection_with_tls_context(request, verify=True)
+
+        self.assertEqual(pool.host, "93.184.216.34")
+        self.assertEqual(pool.conn_kw["server_hostname"], "hooks.example.com")
+        self.assertEqual(pool.assert_hostname, "hooks.example.com")
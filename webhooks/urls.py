@@ -0,0 +1,9 @@
+from django.urls import path
+
+from webhooks.views import WebhookEndpointView
+
+app_name = "webhooks"
+
+urlpatterns = [
+    path("v1/endpoint", WebhookEndpointView.as_view(), name="webhook_endpoint"),
+]
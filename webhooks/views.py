@@ -0,0 +1,82 @@
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
+from rest_framework import status
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from account.models import User
+from sms.serializers import ErrorResponseSerializer
+from webhooks.models import WebhookEndpoint
+from webhooks.serializers import (
+    WebhookEndpointCreatedResponseSerializer,
+    WebhookEndpointResponseSerializer,
+    WebhookEndpointSerializer,
+)
+from webhooks.services import register_webhook_endpoint
+
+USER_ID_PARAMETER = OpenApiParameter("user_id", int, required=True)
+
+
+class WebhookEndpointView(APIView):
+    def _get_endpoint(self, request):
+        user_id = request.query_params.get("user_id", "")
+        if not user_id.isdigit():
+            return None
+        return get_object_or_404(WebhookEndpoint, user_id=int(user_id))
+
+    @extend_schema(
+        request=WebhookEndpointSerializer,
+        responses={
+            200: WebhookEndpointResponseSerializer,
+            201: WebhookEndpointCreatedResponseSerializer,
+            400: OpenApiResponse(description="Invalid or non-public callback URL"),
+            404: OpenApiResponse(response=ErrorResponseSerializer, description="User not found"),
+        },
+        description=(
+            "Register or replace the URL that receives batched SMS status events. Every POST "
+            "to it is signed in the X-SmsHub-Signature header with the secret returned only "
+            "when the webhook is first registered; replacing the URL keeps that secret."
+        ),
+    )
+    def post(self, request):
+        serializer = WebhookEndpointSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = get_object_or_404(User, id=serializer.validated_data["user_id"])
+        endpoint, created = register_webhook_endpoint(user, serializer.validated_data["url"])
+        if created:
+            return Response(
+                WebhookEndpointCreatedResponseSerializer(endpoint).data,
+                status=status.HTTP_201_CREATED,
+            )
+        return Response(WebhookEndpointResponseSerializer(endpoint).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[USER_ID_PARAMETER],
+        responses={
+            200: WebhookEndpointResponseSerializer,
+            400: OpenApiResponse(response=ErrorResponseSerializer, description="Missing user_id"),
+            404: OpenApiResponse(description="No webhook registered"),
+        },
+        description="Return the webhook registered for a user.",
+    )
+    def get(self, request):
+        endpoint = self._get_endpoint(request)
+        if endpoint is None:
+            return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(WebhookEndpointResponseSerializer(endpoint).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[USER_ID_PARAMETER],
+        responses={
+            204: None,
+            400: OpenApiResponse(response=ErrorResponseSerializer, description="Missing user_id"),
+            404: OpenApiResponse(description="No webhook registered"),
+        },
+        description="Remove the webhook of a user; queued events are discarded.",
+    )
+    def delete(self, request):
+        endpoint = self._get_endpoint(request)
+        if endpoint is None:
+            return Response({"error": "user_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        endpoint.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)